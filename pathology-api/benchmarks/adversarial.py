@@ -0,0 +1,56 @@
+"""
+Measures the worst case cost of ingesting pathological request payloads, such as
+deeply nested, very wide or very long JSON, through the stages of post_result with the
+configured Limits. Each payload is measured at the size limit, where it is processed,
+and beyond it, where it should be rejected. The time taken should stay bounded by the
+size limit regardless of the shape of the payload.
+
+Usage: python -m benchmarks.adversarial
+"""
+
+import time
+
+from pathology_api import config
+from pathology_api.exception import ValidationError
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.handler import handle_request, prescreen_request
+from pathology_api.ingest import Limits, decode_body, parse_bundle
+
+from benchmarks.corpus import adversarial_payloads
+
+_REPEATS = 3
+
+
+def _ingest(body: bytes, limits: Limits) -> str:
+    try:
+        limits.check_content_length(str(len(body)))
+        bundle = parse_bundle(
+            decode_body(body, limits=limits),
+            retain_encoded=config.lazy_resources(),
+            prescreen=prescreen_request,
+            limits=limits,
+        )
+        dump_json(handle_request(bundle))
+    except ValidationError as e:
+        return f"{type(e).__name__}: {e.message[:40]}"
+    except Exception as e:  # noqa: BLE001 - reported as the outcome of the payload
+        return f"{type(e).__name__}: {str(e)[:40]}"
+    return "processed"
+
+
+def main() -> None:
+    limits = Limits.from_config()
+    print(f"limits: {limits}")
+    print(f"{'payload':<16} {'size':>10} {'best time':>13}  outcome")
+    for size in (limits.max_body_bytes - 1_024, limits.max_body_bytes * 2):
+        for name, body in adversarial_payloads(size).items():
+            best = float("inf")
+            for _ in range(_REPEATS):
+                start = time.perf_counter()
+                outcome = _ingest(body, limits)
+                best = min(best, time.perf_counter() - start)
+            print(f"{name:<16} {len(body):>10} {best * 1_000:>10.3f} ms  {outcome}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Compares the size of response Bundles, and the time taken to compress them, for each
+encoding supported by response compression.
+
+Usage: python -m benchmarks.compression
+"""
+
+import functools
+import timeit
+
+from pathology_api.compression import compress_body, supported_encodings
+
+from benchmarks.corpus import document_bundle_json
+
+_ENTRY_COUNTS = (10, 100, 1_000)
+_REPEATS = 15
+
+
+def main() -> None:
+    print(f"{'entries':>6} {'encoding':<10} {'bytes':>10} {'best time':>13}")
+    for entry_count in _ENTRY_COUNTS:
+        body = document_bundle_json(entry_count)
+        print(f"{entry_count:>6} {'identity':<10} {len(body):>10}")
+
+        number = max(1, 2_000 // entry_count)
+        for encoding in supported_encodings():
+            compressed, _ = compress_body(body, encoding)
+            timings = timeit.repeat(
+                functools.partial(compress_body, body, encoding),
+                number=number,
+                repeat=_REPEATS,
+            )
+            best_ms = min(timings) / number * 1_000
+            print(
+                f"{entry_count:>6} {encoding:<10} {len(compressed):>10} "
+                f"{best_ms:>10.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Generators for the request payloads utilised by the benchmarks."""
+
+import json
+from typing import Any
+
+
+def _observation(index: int) -> dict[str, Any]:
+    return {
+        "resourceType": "Observation",
+        "id": f"observation-{index}",
+        "status": "final",
+        "category": [
+            {
+                "coding": [
+                    {
+                        "system": "http://terminology.hl7.org/CodeSystem/"
+                        "observation-category",
+                        "code": "laboratory",
+                        "display": "Laboratory",
+                    }
+                ]
+            }
+        ],
+        "code": {
+            "coding": [
+                {
+                    "system": "http://snomed.info/sct",
+                    "code": "1000731000000107",
+                    "display": "Serum C reactive protein level",
+                }
+            ]
+        },
+        "subject": {"reference": "Patient"},
+        "specimen": {"reference": "Specimen"},
+        "effectiveDateTime": "2024-01-01T12:00:00+00:00",
+        "issued": "2024-01-01T14:00:00+00:00",
+        "valueQuantity": {
+            "value": index % 250,
+            "unit": "mg/L",
+            "system": "http://unitsofmeasure.org",
+            "code": "mg/L",
+        },
+        "referenceRange": [
+            {
+                "high": {
+                    "value": 5,
+                    "unit": "mg/L",
+                    "system": "http://unitsofmeasure.org",
+                    "code": "mg/L",
+                }
+            }
+        ],
+    }
+
+
+def document_bundle(observation_count: int) -> dict[str, Any]:
+    """
+    Create a document Bundle containing a Composition and the provided number of
+    Observation entries.
+    """
+    return {
+        "resourceType": "Bundle",
+        "type": "document",
+        "entry": [
+            {
+                "fullUrl": "composition",
+                "resource": {
+                    "resourceType": "Composition",
+                    "subject": {
+                        "identifier": {
+                            "system": "https://fhir.nhs.uk/Id/nhs-number",
+                            "value": "9999999999",
+                        }
+                    },
+                },
+            },
+            *(
+                {"fullUrl": f"observation-{index}", "resource": _observation(index)}
+                for index in range(observation_count)
+            ),
+        ],
+    }
+
+
+def document_bundle_json(observation_count: int) -> bytes:
+    """Create the raw JSON bytes of a document Bundle. See document_bundle."""
+    return json.dumps(document_bundle(observation_count)).encode()
+
+
+def _bundle_containing(resource_content: bytes) -> bytes:
+    return (
+        b'{"resourceType": "Bundle", "type": "document", "entry": ['
+        b'{"fullUrl": "composition", "resource": {"resourceType": "Composition", '
+        b'"subject": {"identifier": {"system": "https://fhir.nhs.uk/Id/nhs-number", '
+        b'"value": "9999999999"}}}}, '
+        b'{"fullUrl": "observation", "resource": {"resourceType": "Observation", '
+        + resource_content
+        + b"}}]}"
+    )
+
+
+def adversarial_payloads(size: int) -> dict[str, bytes]:
+    """
+    Create pathological request payloads, each of approximately the provided size in
+    bytes, keyed by a description of the payload.
+    """
+    entry = b'{"fullUrl": "o", "resource": {"resourceType": "Observation"}}, '
+    return {
+        "deep nesting": _bundle_containing(
+            b'"extension": ' + b"[" * (size // 2) + b"]" * (size // 2)
+        ),
+        # Nesting without any long run of opening brackets.
+        "nested siblings": _bundle_containing(
+            b'"extension": ' + b"[[]" * (size // 4) + b"]" * (size // 4)
+        ),
+        "wide array": _bundle_containing(
+            b'"component": [' + b"0, " * (size // 3) + b"0]"
+        ),
+        "long string": _bundle_containing(b'"note": "' + b"a" * size + b'"'),
+        "escaped string": _bundle_containing(
+            b'"note": "' + b'\\"[' * (size // 3) + b'"'
+        ),
+        "many keys": _bundle_containing(
+            b", ".join(b'"k%d": 0' % index for index in range(size // 16))
+        ),
+        "many entries": _bundle_containing(b'"status": "final"').replace(
+            b'"entry": [', b'"entry": [' + entry * (size // len(entry)), 1
+        ),
+    }
@@ -0,0 +1,80 @@
+"""
+Compares the ingest of a request body via json.loads, via the pydantic-core JSON
+validator, and via parse_bundle, both eagerly (the pydantic-core JSON parser) and
+retaining the JSON of opaque resources, each either whole or incrementally.
+
+Usage: python -m benchmarks.ingest
+"""
+
+import json
+import timeit
+import tracemalloc
+from collections.abc import Callable
+
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.ingest import parse_bundle
+
+from benchmarks.corpus import document_bundle_json
+
+_ENTRY_COUNTS = (10, 100, 1_000)
+_REPEATS = 15
+
+
+def _parse_via_json_loads(body: bytes) -> Bundle:
+    return Bundle.model_validate(json.loads(body), by_alias=True)
+
+
+def _parse_via_validate_json(body: bytes) -> Bundle:
+    return Bundle.model_validate_json(body, by_alias=True)
+
+
+def _parse_retaining_encoded(body: bytes) -> Bundle:
+    return parse_bundle(body, retain_encoded=True)
+
+
+def _parse_incrementally(body: bytes) -> Bundle:
+    return parse_bundle(body, incremental=True)
+
+
+def _parse_incrementally_retaining_encoded(body: bytes) -> Bundle:
+    return parse_bundle(body, retain_encoded=True, incremental=True)
+
+
+def _peak_memory(func: Callable[[bytes], Bundle], body: bytes) -> int:
+    tracemalloc.start()
+    try:
+        func(body)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(
+    name: str, func: Callable[[bytes], Bundle], body: bytes, entry_count: int
+) -> None:
+    number = max(1, 2_000 // entry_count)
+    timings = timeit.repeat(lambda: func(body), number=number, repeat=_REPEATS)
+    best_ms = min(timings) / number * 1_000
+    peak_kib = _peak_memory(func, body) / 1024
+    print(f"{entry_count:>6} {name:<18} {best_ms:>10.3f} ms {peak_kib:>12.1f} KiB")
+
+
+def main() -> None:
+    print(f"{'entries':>6} {'path':<18} {'best time':>13} {'peak memory':>16}")
+    for entry_count in _ENTRY_COUNTS:
+        body = document_bundle_json(entry_count)
+        _measure("json.loads", _parse_via_json_loads, body, entry_count)
+        _measure("validate_json", _parse_via_validate_json, body, entry_count)
+        _measure("parse_bundle", parse_bundle, body, entry_count)
+        _measure("parse_bundle_lazy", _parse_retaining_encoded, body, entry_count)
+        _measure("incremental", _parse_incrementally, body, entry_count)
+        _measure(
+            "incremental_lazy",
+            _parse_incrementally_retaining_encoded,
+            body,
+            entry_count,
+        )
+
+
+if __name__ == "__main__":
+    main()
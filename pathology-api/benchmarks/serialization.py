@@ -0,0 +1,48 @@
+"""
+Compares serialising a response Bundle via model_dump_json against dump_json, and
+against dump_json for a Bundle parsed retaining the JSON of its opaque resources.
+
+Usage: python -m benchmarks.serialization
+"""
+
+import timeit
+from collections.abc import Callable
+
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.ingest import parse_bundle
+
+from benchmarks.corpus import document_bundle, document_bundle_json
+
+_ENTRY_COUNTS = (10, 100, 1_000)
+_REPEATS = 15
+
+
+def _dump_via_model_dump_json(bundle: Bundle) -> bytes:
+    return bundle.model_dump_json(by_alias=True, exclude_none=True).encode()
+
+
+def _measure(
+    name: str, func: Callable[[Bundle], bytes], bundle: Bundle, entry_count: int
+) -> None:
+    number = max(1, 2_000 // entry_count)
+    timings = timeit.repeat(lambda: func(bundle), number=number, repeat=_REPEATS)
+    best_ms = min(timings) / number * 1_000
+    print(f"{entry_count:>6} {name:<16} {best_ms:>10.3f} ms")
+
+
+def main() -> None:
+    print(f"{'entries':>6} {'path':<16} {'best time':>13}")
+    for entry_count in _ENTRY_COUNTS:
+        bundle = Bundle.model_validate(document_bundle(entry_count))
+        _measure("model_dump_json", _dump_via_model_dump_json, bundle, entry_count)
+        _measure("dump_json", dump_json, bundle, entry_count)
+
+        lazy_bundle = parse_bundle(
+            document_bundle_json(entry_count), retain_encoded=True
+        )
+        _measure("dump_json_lazy", dump_json, lazy_bundle, entry_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-from collections.abc import Callable
-from functools import reduce
-from json import JSONDecodeError
+import email.utils
+import functools
+import uuid
+from collections.abc import Callable, Mapping
+from http import HTTPStatus
 from typing import Any
 
 import pydantic
@@ -9,16 +11,76 @@ from aws_lambda_powertools.event_handler import (
     Response,
 )
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from pathology_api.exception import ValidationError
-from pathology_api.fhir.r4.resources import Bundle, OperationOutcome
-from pathology_api.handler import handle_request
+from pathology_api import config
+from pathology_api.compression import compress_body
+from pathology_api.concurrency import map_concurrently
+from pathology_api.deadline import Deadline, DeadlineExceededError
+from pathology_api.exception import (
+    PayloadTooLargeError,
+    RequestInProgressError,
+    UnsupportedMediaTypeError,
+    ValidationError,
+)
+from pathology_api.fhir.r4.resources import BatchResponse, Bundle, OperationOutcome
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.handler import (
+    error_outcome,
+    forward_result,
+    handle_document,
+    handle_request,
+    prescreen_request,
+    validate_request,
+)
+from pathology_api.idempotency import Idempotency, StoredResponse, idempotency_key
+from pathology_api.ingest import (
+    Limits,
+    decode_body,
+    parse_batch,
+    parse_bundle,
+    parses_incrementally,
+    screen_bundle,
+)
 from pathology_api.logging import get_logger
+from pathology_api.mns import publisher_from_config
+from pathology_api.oauth import provider_from_config
+from pathology_api.pdm import PDMError, client_from_config
+from pathology_api.preferences import (
+    ReturnPreference,
+    parse_prefer,
+    return_preference,
+)
+from pathology_api.resilience import DependencyUnavailableError
+from pathology_api.submissions import Submission, Submissions
+from pathology_api.validation_cache import (
+    ValidationCache,
+    ValidationOutcome,
+    content_key,
+)
+from pathology_api.work_queue import MessageTooLargeError, QueuedMessage
 
 _logger = get_logger(__name__)
 
 app = APIGatewayHttpResolver()
 
-type _ExceptionHandler[T: Exception] = Callable[[T], Response[str]]
+# Created once per Lambda instance, so that records and outcomes held in memory persist
+# between requests.
+_idempotency = Idempotency.from_config()
+_validation_cache = ValidationCache(
+    config.validation_cache_size(), config.validation_cache_max_bytes()
+)
+_submissions = Submissions.from_config()
+# Likewise, so that access tokens are cached, and connections to PDM and MNS are kept
+# alive, between requests.
+_token_provider = provider_from_config()
+_token = _token_provider.token if _token_provider is not None else None
+_pdm_client = client_from_config(_token)
+_mns_publisher = publisher_from_config(_token)
+
+# The time, in seconds, clients are asked to wait before retrieving the status of a
+# submission still being processed again.
+_STATUS_RETRY_AFTER_SECONDS = 5
+
+type _ExceptionHandler[T: Exception] = Callable[[T], Response[str | bytes]]
 
 
 def _exception_handler[T: Exception](
@@ -30,7 +92,7 @@ def _exception_handler[T: Exception](
     """
 
     def decorator(func: _ExceptionHandler[T]) -> _ExceptionHandler[T]:
-        def wrapper(exception: T) -> Response[str]:
+        def wrapper(exception: T) -> Response[str | bytes]:
             return func(exception)
 
         app.exception_handler(exception_type)(wrapper)
@@ -39,61 +101,184 @@ def _exception_handler[T: Exception](
     return decorator
 
 
-def _with_default_headers(status_code: int, body: pydantic.BaseModel) -> Response[str]:
-    return Response(
+def _fhir_response(
+    status_code: int,
+    body: pydantic.BaseModel,
+    headers: Mapping[str, str] | None = None,
+) -> StoredResponse:
+    return StoredResponse(
         status_code=status_code,
-        headers={"Content-Type": "application/fhir+json"},
-        body=body.model_dump_json(by_alias=True, exclude_none=True),
+        headers={
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+            **(headers or {}),
+        },
+        body=dump_json(body),
     )
 
 
+def _encoded_response(response: StoredResponse) -> Response[str | bytes]:
+    """
+    Create the Response returned for a StoredResponse, compressing its body if accepted
+    by the current request.
+    """
+    headers = dict(response.headers)
+    if response.body is None:
+        return Response(status_code=response.status_code, headers=headers)
+
+    encoded, content_encoding = compress_body(
+        response.body,
+        accept_encoding=app.current_event.headers.get("accept-encoding"),
+        min_size=config.min_compression_bytes(),
+    )
+    if content_encoding is None:
+        return Response(
+            status_code=response.status_code, headers=headers, body=encoded.decode()
+        )
+
+    # Bytes bodies are base64 encoded for API Gateway by the resolver.
+    headers["Content-Encoding"] = content_encoding
+    return Response(status_code=response.status_code, headers=headers, body=encoded)
+
+
+def _with_default_headers(
+    status_code: int,
+    body: pydantic.BaseModel,
+    headers: Mapping[str, str] | None = None,
+) -> Response[str | bytes]:
+    return _encoded_response(_fhir_response(status_code, body, headers))
+
+
+def _created_headers(bundle: Bundle, path: str) -> dict[str, str]:
+    """
+    Create the headers describing a Bundle created by a request, as returned by a FHIR
+    create interaction.
+    Args:
+        bundle: The created Bundle.
+        path: The path the Bundle was created via.
+    Returns:
+        The Location, ETag and, if the Bundle defines when it was last updated,
+        Last-Modified headers.
+    """
+    headers = {
+        "Location": f"{path.rstrip('/')}/{bundle.id}",
+        # Bundles are not versioned, so each is tagged with its unique id.
+        "ETag": f'W/"{bundle.id}"',
+    }
+    if bundle.meta is not None and bundle.meta.last_updated is not None:
+        headers["Last-Modified"] = email.utils.formatdate(
+            bundle.meta.last_updated.timestamp(), usegmt=True
+        )
+    return headers
+
+
 @_exception_handler(ValidationError)
-def handle_validation_error(exception: ValidationError) -> Response[str]:
+def handle_validation_error(exception: ValidationError) -> Response[str | bytes]:
     # LOG014: False positive, we are within an exception handler here.
     _logger.info(
         "ValidationError encountered: %s",
         exception,
         exc_info=True,  # noqa: LOG014
     )
-    return _with_default_headers(
-        status_code=400,
-        body=OperationOutcome.create_validation_error(exception.message),
+    return _with_default_headers(*error_outcome(exception))
+
+
+@_exception_handler(PayloadTooLargeError)
+def handle_payload_too_large_error(
+    exception: PayloadTooLargeError,
+) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.info(
+        "PayloadTooLargeError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
     )
+    return _with_default_headers(*error_outcome(exception))
+
+
+@_exception_handler(UnsupportedMediaTypeError)
+def handle_unsupported_media_type_error(
+    exception: UnsupportedMediaTypeError,
+) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.info(
+        "UnsupportedMediaTypeError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
+    )
+    return _with_default_headers(*error_outcome(exception))
+
+
+@_exception_handler(RequestInProgressError)
+def handle_request_in_progress_error(
+    exception: RequestInProgressError,
+) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.info(
+        "RequestInProgressError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
+    )
+    return _with_default_headers(*error_outcome(exception))
 
 
 @_exception_handler(pydantic.ValidationError)
 def handle_pydantic_validation_error(
     exception: pydantic.ValidationError,
-) -> Response[str]:
+) -> Response[str | bytes]:
     # LOG014: False positive, we are within an exception handler here.
     _logger.info(
         "Pydantic ValidationError encountered: %s",
         exception,
         exc_info=True,  # noqa: LOG014
     )
+    return _with_default_headers(*error_outcome(exception))
 
-    operation_outcome = OperationOutcome.create_validation_error(
-        reduce(
-            lambda acc, e: acc + f"{str(e['loc'])} - {e['msg']} \n",
-            exception.errors(),
-            "",
-        )
+
+@_exception_handler(PDMError)
+def handle_pdm_error(exception: PDMError) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.warning(
+        "PDMError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
+    )
+    return _with_default_headers(*error_outcome(exception))
+
+
+@_exception_handler(DependencyUnavailableError)
+def handle_dependency_unavailable_error(
+    exception: DependencyUnavailableError,
+) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.warning(
+        "DependencyUnavailableError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
     )
     return _with_default_headers(
-        status_code=400,
-        body=operation_outcome,
+        *error_outcome(exception),
+        headers={"Retry-After": str(exception.retry_after)},
+    )
+
+
+@_exception_handler(DeadlineExceededError)
+def handle_deadline_exceeded_error(
+    exception: DeadlineExceededError,
+) -> Response[str | bytes]:
+    # LOG014: False positive, we are within an exception handler here.
+    _logger.warning(
+        "DeadlineExceededError encountered: %s",
+        exception,
+        exc_info=True,  # noqa: LOG014
     )
+    return _with_default_headers(*error_outcome(exception))
 
 
 @_exception_handler(Exception)
-def handle_exception(exception: Exception) -> Response[str]:
+def handle_exception(exception: Exception) -> Response[str | bytes]:
     _logger.exception("Unhandled Exception encountered: %s", exception)
-    return _with_default_headers(
-        status_code=500,
-        body=OperationOutcome.create_server_error(
-            "An unexpected error has occurred. Please try again later."
-        ),
-    )
+    return _with_default_headers(*error_outcome(exception))
 
 
 @app.get("/_status")
@@ -103,30 +288,430 @@ def status() -> Response[str]:
 
 
 @app.post("/FHIR/R4/Bundle")
-def post_result() -> Response[str]:
+def post_result() -> Response[str | bytes]:
     _logger.debug("Post result endpoint called.")
+    return _idempotent_response(_create_result)
 
-    try:
-        payload = app.current_event.json_body
-    except JSONDecodeError as e:
-        raise ValidationError("Invalid payload provided.") from e
 
-    _logger.debug("Payload received: %s", payload)
+@app.post("/FHIR/R4")
+def post_batch() -> Response[str | bytes]:
+    _logger.debug("Post batch endpoint called.")
+    return _idempotent_response(_create_batch_result)
+
 
-    if payload is None:
-        raise ValidationError(
-            "Resources must be provided as a bundle of type 'document'"
+@app.get("/FHIR/R4/_async/<submission_id>")
+def get_submission_status(submission_id: str) -> Response[str | bytes]:
+    _logger.debug("Submission status endpoint called.")
+    record = _submissions.status(submission_id)
+    if record is None:
+        return _with_default_headers(
+            404,
+            OperationOutcome.create_not_found(
+                f"Submission {submission_id} could not be found."
+            ),
         )
 
-    bundle = Bundle.model_validate(payload, by_alias=True)
+    if record.response is None:
+        return _with_default_headers(
+            202,
+            OperationOutcome.create_information(
+                f"Submission {submission_id} is still being processed."
+            ),
+            headers={"Retry-After": str(_STATUS_RETRY_AFTER_SECONDS)},
+        )
 
-    response = handle_request(bundle)
+    # Once processed, the response the request would have been responded to with.
+    return _encoded_response(record.response)
 
-    return _with_default_headers(
-        status_code=200,
-        body=response,
+
+def _request_deadline() -> Deadline | None:
+    """The deadline of the current request, if the invocation reported one."""
+    deadline = app.context.get("deadline")
+    return deadline if isinstance(deadline, Deadline) else None
+
+
+def _idempotent_response(
+    create: Callable[[], StoredResponse],
+) -> Response[str | bytes]:
+    """
+    Create the Response to the current request via create, unless a response has
+    already been created for a request with the same X-Request-ID and body.
+    """
+    event = app.current_event
+    Limits.from_config().check_content_length(event.headers.get("content-length"))
+
+    key = _request_key()
+    if key is None:
+        # X-Request-ID is optional, requests without one are processed each time.
+        return _encoded_response(create())
+
+    # Repeated requests are returned the stored response uncompressed, so that it is
+    # compressed as accepted by the repeated request.
+    return _encoded_response(_idempotency.run(key, create, _request_deadline()))
+
+
+def _request_key() -> str | None:
+    """The idempotency key of the current request, if it provided an X-Request-ID."""
+    event = app.current_event
+    request_id = event.headers.get("x-request-id")
+    return idempotency_key(request_id, event.body) if request_id is not None else None
+
+
+def _bundle_id(key: str | None) -> str | None:
+    """
+    The id of the Bundle created for the request identified by key, derived from it
+    so that a repeated request, such as one retried once PDM has failed, writes the
+    same resources to PDM rather than duplicating them. None, leaving a new id to be
+    assigned, if the request is not identified.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key)) if key is not None else None
+
+
+def _create_result() -> StoredResponse:
+    event = app.current_event
+    limits = Limits.from_config()
+
+    body = decode_body(
+        event.body,
+        is_base64_encoded=bool(event.is_base64_encoded),
+        limits=limits,
+        content_encoding=event.headers.get("content-encoding"),
+    )
+
+    # Only the size of the payload is logged, as logging payloads of up to the maximum
+    # size is itself costly.
+    _logger.debug("Payload received: %s bytes", len(body))
+
+    prefer = event.headers.get("prefer")
+    if config.async_processing() and "respond-async" in parse_prefer(prefer):
+        try:
+            return _submit_result(body, prefer, limits)
+        except MessageTooLargeError:
+            _logger.info("Payload too large to queue, so processed synchronously.")
+
+    return _process_result(
+        body, prefer, limits, _request_deadline(), _bundle_id(_request_key())
+    )
+
+
+def _submit_result(body: bytes, prefer: str | None, limits: Limits) -> StoredResponse:
+    """
+    Queue a request body to be processed asynchronously, once screened, responding
+    with the location its status can be retrieved from.
+    """
+    screen_bundle(body, prescreen=prescreen_request, limits=limits)
+    submission_id = _submissions.submit(body, prefer)
+
+    status_location = f"/FHIR/R4/_async/{submission_id}"
+    return _fhir_response(
+        status_code=202,
+        body=OperationOutcome.create_information(
+            f"Bundle accepted for processing, see {status_location} for its status."
+        ),
+        headers={
+            "Location": status_location,
+            "Preference-Applied": "respond-async",
+        },
+    )
+
+
+def _process_result(
+    body: bytes,
+    prefer: str | None,
+    limits: Limits,
+    deadline: Deadline | None,
+    bundle_id: str | None = None,
+) -> StoredResponse:
+    """
+    Process a decoded request body, creating the response to the request, with the
+    created Bundle given bundle_id, if any. Raises DeadlineExceededError if the
+    deadline is reached before a stage of doing so.
+    """
+    retain_encoded = config.lazy_resources()
+    key = content_key(body, retain_encoded, limits)
+    outcome = _validation_cache.get(key)
+    _logger.info(
+        "Validation cache %s.",
+        "miss" if outcome is None else "hit",
+        extra=_validation_cache.stats(),
+    )
+    if outcome is None:
+        if deadline is not None:
+            deadline.check("validation")
+        bundle = parse_bundle(
+            body,
+            retain_encoded=retain_encoded,
+            prescreen=prescreen_request,
+            limits=limits,
+            incremental=parses_incrementally(body),
+        )
+        outcome = ValidationOutcome(
+            bundle=bundle, report=validate_request(bundle, deadline)
+        )
+        _validation_cache.put(key, outcome, size=len(body))
+
+    preference = return_preference(prefer)
+    response = _forwarded(
+        handle_request(outcome.bundle, outcome.report, bundle_id=bundle_id), deadline
     )
 
+    headers = _created_headers(response, "/FHIR/R4/Bundle")
+    if preference is not None:
+        headers["Preference-Applied"] = f"return={preference}"
+
+    match preference:
+        case "minimal":
+            # The created Bundle is described by the headers alone, so is not
+            # serialised.
+            return StoredResponse(status_code=200, headers=headers)
+        case "OperationOutcome":
+            return _fhir_response(
+                status_code=200,
+                body=OperationOutcome.create_information(
+                    f"Bundle {response.id} created."
+                ),
+                headers=headers,
+            )
+        case _:
+            if deadline is not None:
+                deadline.check("serialisation")
+            return _fhir_response(
+                status_code=200,
+                body=response,
+                headers=headers,
+            )
+
+
+def _create_batch_result() -> StoredResponse:
+    event = app.current_event
+    limits = Limits.from_config()
+
+    body = decode_body(
+        event.body,
+        is_base64_encoded=bool(event.is_base64_encoded),
+        limits=limits,
+        content_encoding=event.headers.get("content-encoding"),
+    )
+    _logger.debug("Batch received: %s bytes", len(body))
+
+    entries = parse_batch(body, config.batch_max_entries(), limits=limits)
+    preference = return_preference(event.headers.get("prefer"))
+    deadline = _request_deadline()
+    key = _request_key()
+    max_workers = max(1, min(len(entries), config.batch_max_workers()))
+    # Entries are forwarded to PDM at once, so share the requests it may be sent.
+    max_pdm_requests = max(1, config.pdm_max_concurrent_requests() // max_workers)
+
+    def create(index: int, entry: Any) -> Bundle:
+        bundle_id = _bundle_id(f"{key}/{index}" if key is not None else None)
+        return _forwarded(
+            handle_document(
+                _batch_document(entry),
+                limits=limits,
+                deadline=deadline,
+                bundle_id=bundle_id,
+            ),
+            deadline,
+            max_pdm_requests,
+        )
+
+    # Entries reached after the deadline each fail, rather than the whole batch, so
+    # that the outcome of those already created is still returned.
+    results = map_concurrently(
+        lambda item: create(*item),
+        list(enumerate(entries)),
+        max_workers=max_workers,
+    )
+    response = BatchResponse.create(
+        bundle_id=str(uuid.uuid4()),
+        entries=[_batch_response_entry(result, preference) for result in results],
+    )
+    if deadline is not None:
+        deadline.check("serialisation")
+
+    headers = {"Preference-Applied": f"return={preference}"} if preference else {}
+    return _fhir_response(status_code=200, body=response, headers=headers)
+
+
+def _forwarded(
+    bundle: Bundle,
+    deadline: Deadline | None,
+    max_pdm_requests: int | None = None,
+) -> Bundle:
+    """
+    Forward a created Bundle to PDM, if configured, across at most max_pdm_requests
+    requests at once, then buffer the MNS event notifying the requesting
+    organisation, if configured, to be published once the invocation ends.
+    """
+    if _pdm_client is not None:
+        forward_result(
+            bundle, _pdm_client, deadline, max_concurrent_requests=max_pdm_requests
+        )
+    if _mns_publisher is not None:
+        _mns_publisher.add_result(bundle)
+    return bundle
+
+
+def _batch_document(entry: Any) -> Any:
+    """Retrieve the document Bundle a batch entry requests to be created."""
+    request = entry.get("request") if isinstance(entry, dict) else None
+    if (
+        not isinstance(request, dict)
+        or request.get("method") != "POST"
+        or request.get("url") != "Bundle"
+    ):
+        raise ValidationError("Batch entries must POST a document Bundle to 'Bundle'.")
+    return entry.get("resource")
+
+
+def _batch_response_entry(
+    result: Bundle | Exception, preference: ReturnPreference | None
+) -> BatchResponse.Entry:
+    if isinstance(result, Exception):
+        status_code, outcome = error_outcome(result)
+        _logger.info(
+            "Batch entry failed with status %s: %s",
+            status_code,
+            result,
+            exc_info=result,
+        )
+        return BatchResponse.Entry(
+            response=BatchResponse.Response(
+                status=_status_line(status_code), outcome=outcome
+            )
+        )
+
+    headers = _created_headers(result, "/FHIR/R4/Bundle")
+    response = BatchResponse.Response(
+        status=_status_line(200),
+        location=headers["Location"],
+        etag=headers["ETag"],
+        lastModified=headers.get("Last-Modified"),
+    )
+    match preference:
+        case "minimal":
+            return BatchResponse.Entry(response=response)
+        case "OperationOutcome":
+            return BatchResponse.Entry(
+                response=response.model_copy(
+                    update={
+                        "outcome": OperationOutcome.create_information(
+                            f"Bundle {result.id} created."
+                        )
+                    }
+                )
+            )
+        case _:
+            return BatchResponse.Entry(resource=result, response=response)
+
+
+def _status_line(status_code: int) -> str:
+    return f"{status_code} {HTTPStatus(status_code).phrase}"
+
+
+def _flush_events(deadline: Deadline | None) -> None:
+    """
+    Publish the MNS events buffered during the invocation, if configured. Events not
+    published by the deadline are spooled to be published later.
+    """
+    if _mns_publisher is not None:
+        _mns_publisher.flush(deadline.expires_at if deadline is not None else None)
+
+
+def _invocation_deadline(context: LambdaContext) -> Deadline | None:
+    return Deadline.from_context(context, reserve=config.deadline_reserve_seconds())
+
 
 def handler(data: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    return app.resolve(data, context)
+    deadline = _invocation_deadline(context)
+    # Cleared by the resolver once the request has been resolved.
+    app.context["deadline"] = deadline
+    try:
+        return app.resolve(data, context)
+    finally:
+        _flush_events(deadline)
+
+
+def _process_submission(
+    submission: Submission, deadline: Deadline | None = None
+) -> StoredResponse:
+    """
+    Process a queued request, creating the response it would have been responded to
+    with synchronously. Exceptions that a retry may resolve are raised, so that the
+    request is processed again, including the deadline being reached.
+    """
+    try:
+        return _process_result(
+            submission.body,
+            submission.prefer,
+            Limits.from_config(),
+            deadline,
+            # Redelivered submissions create the same Bundle.
+            _bundle_id(submission.submission_id),
+        )
+    except Exception as e:
+        status_code, outcome = error_outcome(e)
+        if status_code >= 500:
+            raise
+
+        _logger.info(
+            "Submission failed with status %s: %s", status_code, e, exc_info=True
+        )
+        return _fhir_response(status_code, outcome)
+
+
+def worker_handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+    """
+    Entry point of the worker processing queued requests. Invoked with a batch of SQS
+    messages via an event source mapping, otherwise drains the configured queue.
+    """
+    deadline = _invocation_deadline(context)
+    try:
+        return _process_submissions(event, deadline)
+    finally:
+        _flush_events(deadline)
+
+
+def _process_submissions(
+    event: dict[str, Any], deadline: Deadline | None
+) -> dict[str, Any]:
+    process = functools.partial(_process_submission, deadline=deadline)
+    records = event.get("Records")
+    if records is None:
+        processed = _submissions.drain(
+            process, batch_size=config.async_batch_size(), deadline=deadline
+        )
+        return {"processed": processed}
+
+    failed = _submissions.process(_queued_messages(records), process)
+    # Reported as a partial batch response, so that only failed messages are retried.
+    return {"batchItemFailures": [{"itemIdentifier": m.message_id} for m in failed]}
+
+
+def _queued_messages(records: list[dict[str, Any]]) -> list[QueuedMessage]:
+    """The messages of the SQS records a Lambda was invoked with."""
+    return [
+        QueuedMessage(
+            message_id=record["messageId"],
+            body=record["body"],
+            receipt=record["receiptHandle"],
+        )
+        for record in records
+    ]
+
+
+def mns_retry_handler(event: dict[str, Any], _context: LambdaContext) -> dict[str, Any]:
+    """
+    Entry point publishing MNS events spooled after failing to be published. Invoked
+    with a batch of SQS messages via an event source mapping, otherwise drains the
+    configured spool.
+    """
+    if _mns_publisher is None:
+        return {"published": 0}
+
+    records = event.get("Records")
+    if records is None:
+        return {"published": _mns_publisher.drain_spool()}
+
+    failed = _mns_publisher.republish(_queued_messages(records))
+    return {"batchItemFailures": [{"itemIdentifier": m.message_id} for m in failed]}
@@ -0,0 +1,311 @@
+"""Offline bulk ingestion of NDJSON files of document Bundles."""
+
+import argparse
+import gzip
+import io
+import logging
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pydantic
+
+from pathology_api import config
+from pathology_api.exception import ValidationError
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.handler import error_outcome, handle_request, prescreen_request
+from pathology_api.ingest import Limits, parse_bundle, parses_incrementally
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# Lines are sent to worker processes in chunks, amortising the cost of passing them
+# between processes over many Bundles.
+_DEFAULT_CHUNK_SIZE = 64
+
+
+@dataclass(frozen=True)
+class BulkResult:
+    """
+    The outcome of handling a single line of a bulk ingestion.
+    Attributes:
+        created: Whether a Bundle was created from the line.
+        body: The serialised created Bundle, or OperationOutcome if none was created.
+    """
+
+    created: bool
+    body: bytes
+
+
+@dataclass
+class Progress:
+    """
+    Running totals of a bulk ingestion.
+    Attributes:
+        created: The number of Bundles created.
+        failed: The number of lines from which no Bundle was created.
+        started_at: When the ingestion started, as returned by time.monotonic().
+    """
+
+    created: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return self.created + self.failed
+
+    def throughput(self) -> float:
+        """The number of lines processed per second since the ingestion started."""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Processed {self.processed} bundles ({self.created} created, "
+            f"{self.failed} failed) in {time.monotonic() - self.started_at:.1f}s, "
+            f"{self.throughput():.1f} bundles/s"
+        )
+
+
+def read_lines(path: Path) -> Iterator[bytes]:
+    """
+    Read the non-blank lines of an NDJSON file, via a memory map so that the file is
+    paged in by the operating system rather than copied through a read buffer. Files
+    starting with the gzip magic number are decompressed as they are read.
+    Args:
+        path: The path of the file.
+    Returns:
+        An iterator over each non-blank line, without its line ending.
+    """
+    with path.open("rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            source: io.BufferedIOBase | mmap.mmap = mapped
+            with ExitStack() as stack:
+                if mapped[:2] == _GZIP_MAGIC:
+                    source = stack.enter_context(gzip.GzipFile(fileobj=mapped))
+
+                for line in iter(source.readline, b""):
+                    line = line.strip()
+                    if line:
+                        yield line
+
+
+def process_line(line: bytes, limits: Limits | None = None) -> BulkResult:
+    """
+    Handle a single document Bundle as if sent to POST /FHIR/R4/Bundle.
+    Args:
+        line: The raw JSON bytes of the document Bundle.
+        limits: The limits to check the document Bundle against, if any.
+    Returns:
+        The created Bundle, or an OperationOutcome describing why none was created.
+    Raises:
+        Exception: Any error other than the line being rejected as invalid, so that a
+            defect stops the ingestion rather than being counted as a failed line.
+    """
+    retain_encoded = config.lazy_resources()
+    incremental = parses_incrementally(line)
+    try:
+        bundle = parse_bundle(
+            line,
+            retain_encoded=retain_encoded,
+            prescreen=prescreen_request,
+            limits=limits,
+            incremental=incremental,
+        )
+        return BulkResult(created=True, body=dump_json(handle_request(bundle)))
+    except (ValidationError, pydantic.ValidationError) as e:
+        _, outcome = error_outcome(e)
+        return BulkResult(created=False, body=dump_json(outcome))
+
+
+def _process_chunk(lines: Sequence[bytes]) -> list[BulkResult]:
+    limits = Limits.from_config()
+    return [process_line(line, limits) for line in lines]
+
+
+def _chunks(lines: Iterator[bytes], chunk_size: int) -> Iterator[list[bytes]]:
+    chunk: list[bytes] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process_lines(
+    lines: Iterator[bytes],
+    executor: Executor | None = None,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    max_in_flight: int = 1,
+) -> Iterator[BulkResult]:
+    """
+    Handle each of a sequence of document Bundles, in chunks submitted to an executor.
+    At most max_in_flight chunks are submitted ahead of the result being consumed, so
+    that memory use is bounded however large the input.
+    Args:
+        lines: The raw JSON bytes of each document Bundle.
+        executor: The executor chunks are handled via, or None to handle them on the
+            calling thread.
+        chunk_size: The number of Bundles within each chunk.
+        max_in_flight: The maximum number of chunks submitted and not yet consumed.
+    Returns:
+        An iterator over the result for each Bundle, in the order of lines.
+    """
+    chunks = _chunks(lines, chunk_size)
+    if executor is None:
+        for chunk in chunks:
+            yield from _process_chunk(chunk)
+        return
+
+    pending: deque[Future[list[BulkResult]]] = deque()
+    for chunk in chunks:
+        if len(pending) >= max_in_flight:
+            yield from pending.popleft().result()
+        pending.append(executor.submit(_process_chunk, chunk))
+
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _quiet_logging() -> None:
+    # Per Bundle logging would otherwise outweigh the cost of handling each Bundle.
+    logging.disable(logging.INFO)
+
+
+def _open_output(path: Path) -> io.BufferedIOBase:
+    if path.suffix == ".gz":
+        return gzip.open(path, "wb", compresslevel=6)
+    return path.open("wb")
+
+
+def run(
+    input_path: Path,
+    output_path: Path,
+    workers: int,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    progress_interval: float = 10.0,
+    report: Callable[[Progress], None] | None = None,
+) -> Progress:
+    """
+    Handle each document Bundle within an NDJSON file, writing the result for each to
+    another NDJSON file.
+    Args:
+        input_path: The NDJSON file of document Bundles, optionally gzip compressed.
+        output_path: The NDJSON file results are written to, gzip compressed if its
+            name ends with .gz.
+        workers: The number of processes Bundles are handled across. Bundles are
+            handled within the current process if 1 or fewer.
+        chunk_size: The number of Bundles sent to a process at once.
+        progress_interval: The minimum time, in seconds, between progress reports.
+        report: Called with the progress of the ingestion, at most once per
+            progress_interval and once on completion.
+    Returns:
+        The totals of the ingestion.
+    """
+    progress = Progress()
+    last_report = progress.started_at
+
+    with ExitStack() as stack:
+        output = stack.enter_context(_open_output(output_path))
+        executor = (
+            stack.enter_context(
+                ProcessPoolExecutor(max_workers=workers, initializer=_quiet_logging)
+            )
+            if workers > 1
+            else None
+        )
+
+        for result in process_lines(
+            read_lines(input_path),
+            executor=executor,
+            chunk_size=chunk_size,
+            # Keeps every worker busy whilst results are written.
+            max_in_flight=workers * 2,
+        ):
+            output.write(result.body)
+            output.write(b"\n")
+            if result.created:
+                progress.created += 1
+            else:
+                progress.failed += 1
+
+            now = time.monotonic()
+            if report is not None and now - last_report >= progress_interval:
+                report(progress)
+                last_report = now
+
+    if report is not None:
+        report(progress)
+    return progress
+
+
+def _report(progress: Progress) -> None:
+    print(progress, file=sys.stderr, flush=True)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """
+    Run a bulk ingestion from the command line.
+    Returns:
+        The exit status, 0 if every Bundle was created, otherwise 1.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m pathology_api.bulk",
+        description=(
+            "Handle each document Bundle within an NDJSON file as if sent to "
+            "POST /FHIR/R4/Bundle, writing the created Bundle, or an OperationOutcome "
+            "describing why none was created, for each non-blank line to an NDJSON "
+            "file in the same order."
+        ),
+    )
+    parser.add_argument("input", type=Path, help="NDJSON file, optionally gzipped.")
+    parser.add_argument(
+        "output", type=Path, help="NDJSON results file, gzipped if ending .gz."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.process_cpu_count() or 1,
+        help="Number of worker processes (default: the number of usable CPUs).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=_DEFAULT_CHUNK_SIZE,
+        help="Number of bundles sent to a worker at once.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between progress reports.",
+    )
+    args = parser.parse_args(argv)
+
+    _quiet_logging()
+
+    progress = run(
+        args.input,
+        args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        progress_interval=args.progress_interval,
+        report=_report,
+    )
+    return 0 if progress.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import gzip
+import importlib
+from collections.abc import Callable
+from types import ModuleType
+
+# Compression levels favouring speed over ratio, as responses are compressed on every
+# request within the time budget of the Lambda.
+_GZIP_LEVEL = 1
+_BROTLI_QUALITY = 4
+
+
+def _load_brotli() -> ModuleType | None:
+    # Brotli support is optional, either binding providing the same interface.
+    for name in ("brotli", "brotlicffi"):
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            continue
+    return None
+
+
+def _compressors() -> dict[str, Callable[[bytes], bytes]]:
+    compressors: dict[str, Callable[[bytes], bytes]] = {}
+
+    brotli = _load_brotli()
+    if brotli is not None:
+        compressors["br"] = lambda body: bytes(
+            brotli.compress(body, quality=_BROTLI_QUALITY)
+        )
+
+    compressors["gzip"] = lambda body: gzip.compress(
+        body, compresslevel=_GZIP_LEVEL, mtime=0
+    )
+    return compressors
+
+
+# Ordered by preference, used when a client accepts several encodings equally.
+_COMPRESSORS = _compressors()
+
+
+def supported_encodings() -> tuple[str, ...]:
+    """The encodings responses can be compressed with, in order of preference."""
+    return tuple(_COMPRESSORS)
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """
+    Select the encoding to compress a response with from the Accept-Encoding header
+    of a request, choosing the supported encoding with the highest quality value, and
+    the most preferred of those with equal quality values.
+    Args:
+        accept_encoding: The value of the Accept-Encoding header, if provided.
+    Returns:
+        The encoding to compress the response with, or None if the response should not
+        be compressed.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+
+        quality = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                continue
+        qualities[name] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    best: tuple[float, str] | None = None
+    for encoding in _COMPRESSORS:
+        quality = qualities.get(encoding, wildcard)
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, encoding)
+
+    return best[1] if best is not None else None
+
+
+def compress_body(
+    body: bytes, accept_encoding: str | None, min_size: int = 0
+) -> tuple[bytes, str | None]:
+    """
+    Compress a response body with the encoding negotiated from the Accept-Encoding
+    header of a request.
+    Args:
+        body: The encoded response body.
+        accept_encoding: The value of the Accept-Encoding header, if provided.
+        min_size: The minimum size, in bytes, of a body to compress. Smaller bodies
+            are returned uncompressed, as the saving is outweighed by the cost of
+            compressing them.
+    Returns:
+        The body, and the encoding it was compressed with, or None if the body was not
+        compressed.
+    """
+    if len(body) < min_size:
+        return body, None
+
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+
+    compressed = _COMPRESSORS[encoding](body)
+    # Bodies that do not compress are returned as is rather than grown.
+    if len(compressed) >= len(body):
+        return body, None
+    return compressed, encoding
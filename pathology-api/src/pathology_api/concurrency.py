@@ -0,0 +1,32 @@
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+
+def map_concurrently[T, R](
+    func: Callable[[T], R], items: Iterable[T], max_workers: int
+) -> list[R | Exception]:
+    """
+    Apply a function to each of a set of items independently, across a pool of
+    threads, so that work waiting on I/O for one item does not hold up the others.
+    Exceptions raised for an item are returned in place of its result, rather than
+    stopping the remaining items from being processed.
+    Args:
+        func: The function to apply.
+        items: The items to apply the function to.
+        max_workers: The maximum number of items processed at once. Items are
+            processed sequentially, on the calling thread, if 1 or fewer.
+    Returns:
+        The result, or exception raised, for each item, in the order of the items.
+    """
+
+    def apply(item: T) -> R | Exception:
+        try:
+            return func(item)
+        except Exception as e:
+            return e
+
+    if max_workers <= 1:
+        return [apply(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(apply, items))
@@ -0,0 +1,466 @@
+"""Configuration for the pathology API, provided via environment variables."""
+
+import os
+
+
+def _get_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+def _get_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value is not None and value.strip() else default
+
+
+def _get_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value is not None and value.strip() else default
+
+
+# The seconds in each unit a duration may be suffixed with.
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60}
+
+
+def _get_duration(name: str, default: float) -> float:
+    """Read a duration in seconds, optionally suffixed with a unit, such as "30s"."""
+    value = (os.environ.get(name) or "").strip().lower()
+    if not value:
+        return default
+    if value[-1] in _DURATION_UNITS:
+        return float(value[:-1]) * _DURATION_UNITS[value[-1]]
+    return float(value)
+
+
+def verify_trusted_resources() -> bool:
+    """
+    Whether resources created via a trusted construction path, which skips validation,
+    should be verified to still be valid. Intended for debugging and testing only, as
+    verification reintroduces the cost of validation that the trusted path avoids.
+    Configured via the VERIFY_TRUSTED_RESOURCES environment variable.
+    """
+    return _get_flag("VERIFY_TRUSTED_RESOURCES")
+
+
+def lazy_resources() -> bool:
+    """
+    Whether Resources with no fields inspected by the API should retain the JSON they
+    were received with, only being parsed in full if their content is accessed, and
+    being returned exactly as received. Parsing is slower when enabled, but those
+    Resources are then serialised without being converted back to JSON, so a request
+    is parsed and responded to in less time overall, and with a lower peak memory.
+    Enabled by default, configured via the LAZY_RESOURCES environment variable.
+    """
+    return _get_flag("LAZY_RESOURCES", default=True)
+
+
+def max_body_bytes() -> int:
+    """
+    The maximum size, in bytes, of a request body once decoded. Configured via the
+    MAX_BODY_BYTES environment variable, defaulting to 5 MiB.
+    """
+    return _get_int("MAX_BODY_BYTES", 5 * 1024 * 1024)
+
+
+def max_entries() -> int:
+    """
+    The maximum number of entries within a request Bundle. Configured via the
+    MAX_ENTRIES environment variable, defaulting to 10,000.
+    """
+    return _get_int("MAX_ENTRIES", 10_000)
+
+
+def max_depth() -> int:
+    """
+    The maximum depth to which the JSON of a request body may nest objects and
+    arrays. Configured via the MAX_DEPTH environment variable, defaulting to 64.
+    """
+    return _get_int("MAX_DEPTH", 64)
+
+
+def incremental_parse_bytes() -> int | None:
+    """
+    The size, in bytes, above which a request body is parsed incrementally, validating
+    each entry of the Bundle as it is parsed, rather than parsing the whole body before
+    validating it. Rejects invalid entries earlier within large Bundles, but parses
+    more slowly, and does not lower the memory required, as the body itself is already
+    held whole. Configured via the INCREMENTAL_PARSE_BYTES environment variable. If not
+    configured, bodies are never parsed incrementally.
+    """
+    value = os.environ.get("INCREMENTAL_PARSE_BYTES")
+    return int(value) if value is not None and value.strip() else None
+
+
+def min_compression_bytes() -> int:
+    """
+    The minimum size, in bytes, of a response body to compress when the client
+    accepts a compressed response. Configured via the MIN_COMPRESSION_BYTES environment
+    variable, defaulting to 1 KiB.
+    """
+    return _get_int("MIN_COMPRESSION_BYTES", 1024)
+
+
+def idempotency_table_name() -> str | None:
+    """
+    The name of the DynamoDB table idempotency records are stored within. Configured
+    via the IDEMPOTENCY_TABLE_NAME environment variable. If not configured, records
+    are held in memory by each Lambda instance.
+    """
+    return os.environ.get("IDEMPOTENCY_TABLE_NAME") or None
+
+
+def dynamodb_endpoint_url() -> str | None:
+    """
+    The endpoint of the DynamoDB service, allowing a local stand-in to be used.
+    Configured via the DYNAMODB_ENDPOINT_URL environment variable, defaulting to the
+    endpoint of the current AWS region.
+    """
+    return os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+
+
+def idempotency_cache_size() -> int:
+    """
+    The maximum number of idempotency records held in memory by each Lambda instance,
+    if no DynamoDB table is configured. Configured via the IDEMPOTENCY_CACHE_SIZE
+    environment variable, defaulting to 1,024.
+    """
+    return _get_int("IDEMPOTENCY_CACHE_SIZE", 1024)
+
+
+def idempotency_ttl_seconds() -> int:
+    """
+    The time, in seconds, the response to a request is stored for, to be returned for
+    repeats of the request. Configured via the IDEMPOTENCY_TTL_SECONDS environment
+    variable, defaulting to 1 hour.
+    """
+    return _get_int("IDEMPOTENCY_TTL_SECONDS", 60 * 60)
+
+
+def idempotency_in_progress_seconds() -> int:
+    """
+    The time, in seconds, after which a request still being processed is presumed to
+    have failed, and the longest repeats of it wait for it to complete. Configured via
+    the IDEMPOTENCY_IN_PROGRESS_SECONDS environment variable, defaulting to 30 seconds.
+    """
+    return _get_int("IDEMPOTENCY_IN_PROGRESS_SECONDS", 30)
+
+
+def validation_cache_size() -> int:
+    """
+    The maximum number of validation outcomes cached by each Lambda instance, allowing
+    identical request bodies to skip being parsed and validated again. Configured via
+    the VALIDATION_CACHE_SIZE environment variable, defaulting to 32. A size of 0
+    disables the cache.
+    """
+    return _get_int("VALIDATION_CACHE_SIZE", 32)
+
+
+def validation_cache_max_bytes() -> int:
+    """
+    The maximum total size, in bytes, of the request bodies that the validation
+    outcomes cached by each Lambda instance were validated from, bounding the memory
+    held by their Bundles. Configured via the VALIDATION_CACHE_MAX_BYTES environment
+    variable, defaulting to 8 MiB.
+    """
+    return _get_int("VALIDATION_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+
+
+def batch_max_entries() -> int:
+    """
+    The maximum number of document Bundles within a batch. Configured via the
+    BATCH_MAX_ENTRIES environment variable, defaulting to 100.
+    """
+    return _get_int("BATCH_MAX_ENTRIES", 100)
+
+
+def batch_max_workers() -> int:
+    """
+    The maximum number of document Bundles within a batch handled at once. Configured
+    via the BATCH_MAX_WORKERS environment variable, defaulting to 4.
+    """
+    return _get_int("BATCH_MAX_WORKERS", 4)
+
+
+def async_processing() -> bool:
+    """
+    Whether requests preferring to be responded to asynchronously, via a Prefer header
+    of respond-async, are queued to be processed by a worker, being responded to with
+    202 Accepted once screened. Configured via the ASYNC_PROCESSING environment
+    variable, disabled by default.
+    """
+    return _get_flag("ASYNC_PROCESSING")
+
+
+def async_queue_url() -> str | None:
+    """
+    The URL of the SQS queue requests processed asynchronously are sent to.
+    Configured via the ASYNC_QUEUE_URL environment variable, requiring
+    IDEMPOTENCY_TABLE_NAME to also be configured so that the statuses recorded by the
+    worker are shared with the API. If not configured, requests are queued in memory by
+    each Lambda instance.
+    """
+    return os.environ.get("ASYNC_QUEUE_URL") or None
+
+
+def sqs_endpoint_url() -> str | None:
+    """
+    The endpoint of the SQS service, allowing a local stand-in to be used. Configured
+    via the SQS_ENDPOINT_URL environment variable, defaulting to the endpoint of the
+    current AWS region.
+    """
+    return os.environ.get("SQS_ENDPOINT_URL") or None
+
+
+def async_status_ttl_seconds() -> int:
+    """
+    The time, in seconds, the status of a request processed asynchronously is stored
+    for. Configured via the ASYNC_STATUS_TTL_SECONDS environment variable, defaulting
+    to 1 day.
+    """
+    return _get_int("ASYNC_STATUS_TTL_SECONDS", 24 * 60 * 60)
+
+
+def async_batch_size() -> int:
+    """
+    The maximum number of queued requests received from the queue at once when it is
+    drained by a worker. Configured via the ASYNC_BATCH_SIZE environment variable,
+    defaulting to 10, the most SQS returns at once.
+    """
+    return _get_int("ASYNC_BATCH_SIZE", 10)
+
+
+def pdm_base_url() -> str | None:
+    """
+    The base URL of the Patient Data Manager FHIR API created results are forwarded
+    to. Configured via the PDM_BASE_URL environment variable. If not configured,
+    results are not forwarded.
+    """
+    return os.environ.get("PDM_BASE_URL") or None
+
+
+def pdm_timeout_seconds() -> float:
+    """
+    The maximum time, in seconds, each attempt at a request to PDM waits to connect or
+    to receive data. Configured via the PDM_TIMEOUT_SECONDS environment variable,
+    defaulting to 10.
+    """
+    return _get_float("PDM_TIMEOUT_SECONDS", 10.0)
+
+
+def pdm_max_attempts() -> int:
+    """
+    The maximum number of times a request to PDM is sent, if it fails in a way that a
+    retry may resolve. Configured via the PDM_MAX_ATTEMPTS environment variable,
+    defaulting to 3.
+    """
+    return _get_int("PDM_MAX_ATTEMPTS", 3)
+
+
+def pdm_max_connections() -> int:
+    """
+    The maximum number of connections to PDM kept alive by each Lambda instance.
+    Configured via the PDM_MAX_CONNECTIONS environment variable, defaulting to 10.
+    """
+    return _get_int("PDM_MAX_CONNECTIONS", 10)
+
+
+def pdm_transaction_max_entries() -> int:
+    """
+    The maximum number of entries within each transaction Bundle sent to PDM, a
+    document Bundle with more being split across several. Configured via the
+    PDM_TRANSACTION_MAX_ENTRIES environment variable, defaulting to 100.
+    """
+    return _get_int("PDM_TRANSACTION_MAX_ENTRIES", 100)
+
+
+def pdm_transaction_max_bytes() -> int:
+    """
+    The maximum size, in bytes, of each transaction Bundle sent to PDM, a document
+    Bundle converting to a larger transaction being split across several. Configured
+    via the PDM_TRANSACTION_MAX_BYTES environment variable, defaulting to 1 MiB.
+    """
+    return _get_int("PDM_TRANSACTION_MAX_BYTES", 1024 * 1024)
+
+
+def mns_event_url() -> str | None:
+    """
+    The URL of the Multicast Notification Service endpoint events are published to,
+    notifying GP systems of created results. Configured via the MNS_EVENT_URL
+    environment variable. If not configured, events are not published.
+    """
+    return os.environ.get("MNS_EVENT_URL") or None
+
+
+def mns_max_batch_events() -> int:
+    """
+    The maximum number of events published to MNS in each request, the events for a
+    recipient being split across several requests if there are more. Configured via
+    the MNS_MAX_BATCH_EVENTS environment variable, defaulting to 100.
+    """
+    return _get_int("MNS_MAX_BATCH_EVENTS", 100)
+
+
+def mns_retry_queue_url() -> str | None:
+    """
+    The URL of the SQS queue events that failed to be published to MNS are spooled
+    to, to be published again later. Configured via the MNS_RETRY_QUEUE_URL
+    environment variable. If not configured, events are spooled in memory by each
+    Lambda instance, being lost once it ends, and a warning is logged at startup.
+    """
+    return os.environ.get("MNS_RETRY_QUEUE_URL") or None
+
+
+def apim_token_url() -> str | None:
+    """
+    The URL of the APIM OAuth token endpoint access tokens for downstream services are
+    requested from. Configured via the APIM_TOKEN_URL environment variable. If not
+    configured, requests to downstream services are not authorised.
+    """
+    return os.environ.get("APIM_TOKEN_URL") or None
+
+
+def apim_api_key_name() -> str | None:
+    """
+    The name of the secret holding the API key of the APIM application, the client
+    id tokens are requested as. Configured via the APIM_API_KEY_NAME environment
+    variable.
+    """
+    return os.environ.get("APIM_API_KEY_NAME") or None
+
+
+def apim_private_key_name() -> str | None:
+    """
+    The name of the secret holding the PEM encoded private key client assertions are
+    signed with. Configured via the APIM_PRIVATE_KEY_NAME environment variable.
+    """
+    return os.environ.get("APIM_PRIVATE_KEY_NAME") or None
+
+
+def apim_key_id() -> str | None:
+    """
+    The id, registered with APIM, of the key client assertions are signed with.
+    Configured via the APIM_KEY_ID environment variable.
+    """
+    return os.environ.get("APIM_KEY_ID") or None
+
+
+def apim_token_expiry_threshold_seconds() -> float:
+    """
+    The time before an access token expires from which it is refreshed early, by a
+    single caller whilst others continue to use it. Configured via the
+    APIM_TOKEN_EXPIRY_THRESHOLD environment variable, as seconds optionally suffixed
+    with a unit of s, m or h, defaulting to 30s.
+    """
+    return _get_duration("APIM_TOKEN_EXPIRY_THRESHOLD", 30.0)
+
+
+def secrets_manager_endpoint_url() -> str | None:
+    """
+    The endpoint of the Secrets Manager service, allowing a local stand-in to be used.
+    Configured via the SECRETS_MANAGER_ENDPOINT_URL environment variable, defaulting
+    to the endpoint of the current AWS region.
+    """
+    return os.environ.get("SECRETS_MANAGER_ENDPOINT_URL") or None
+
+
+def circuit_failure_rate_threshold() -> float:
+    """
+    The proportion of recent requests to a downstream service failing at which its
+    circuit breaker opens, rejecting requests to it. Configured via the
+    CIRCUIT_FAILURE_RATE_THRESHOLD environment variable, defaulting to 0.5.
+    """
+    return _get_float("CIRCUIT_FAILURE_RATE_THRESHOLD", 0.5)
+
+
+def circuit_slow_call_seconds() -> float:
+    """
+    The duration, in seconds, beyond which a request to a downstream service is
+    considered slow by its circuit breaker. Configured via the
+    CIRCUIT_SLOW_CALL_SECONDS environment variable, defaulting to 5.
+    """
+    return _get_float("CIRCUIT_SLOW_CALL_SECONDS", 5.0)
+
+
+def circuit_slow_call_rate_threshold() -> float:
+    """
+    The proportion of recent requests to a downstream service being slow at which its
+    circuit breaker opens. Configured via the CIRCUIT_SLOW_CALL_RATE_THRESHOLD
+    environment variable, defaulting to 0.5.
+    """
+    return _get_float("CIRCUIT_SLOW_CALL_RATE_THRESHOLD", 0.5)
+
+
+def circuit_window_size() -> int:
+    """
+    The number of most recent requests to a downstream service its circuit breaker
+    measures failure and slow request rates over. Configured via the
+    CIRCUIT_WINDOW_SIZE environment variable, defaulting to 20.
+    """
+    return _get_int("CIRCUIT_WINDOW_SIZE", 20)
+
+
+def circuit_minimum_calls() -> int:
+    """
+    The number of requests to a downstream service needed before its circuit breaker
+    measures failure and slow request rates. Configured via the CIRCUIT_MINIMUM_CALLS
+    environment variable, defaulting to 10.
+    """
+    return _get_int("CIRCUIT_MINIMUM_CALLS", 10)
+
+
+def circuit_open_seconds() -> float:
+    """
+    The time, in seconds, a circuit breaker stays open before letting requests through
+    to probe whether the downstream service has recovered. Configured via the
+    CIRCUIT_OPEN_SECONDS environment variable, defaulting to 30.
+    """
+    return _get_float("CIRCUIT_OPEN_SECONDS", 30.0)
+
+
+def circuit_half_open_calls() -> int:
+    """
+    The number of probing requests that must succeed for an open circuit breaker to
+    close again. Configured via the CIRCUIT_HALF_OPEN_CALLS environment variable,
+    defaulting to 3.
+    """
+    return _get_int("CIRCUIT_HALF_OPEN_CALLS", 3)
+
+
+def bulkhead_max_wait_seconds() -> float:
+    """
+    The maximum time, in seconds, a request to a downstream service waits for one of
+    the requests already in flight to it to complete, once the maximum are in flight,
+    before being rejected. Configured via the BULKHEAD_MAX_WAIT_SECONDS environment
+    variable, defaulting to 1.
+    """
+    return _get_float("BULKHEAD_MAX_WAIT_SECONDS", 1.0)
+
+
+def pdm_max_concurrent_requests() -> int:
+    """
+    The maximum number of requests to PDM in flight at once from each Lambda
+    instance. Configured via the PDM_MAX_CONCURRENT_REQUESTS environment variable,
+    defaulting to 10.
+    """
+    return _get_int("PDM_MAX_CONCURRENT_REQUESTS", 10)
+
+
+def mns_max_concurrent_requests() -> int:
+    """
+    The maximum number of requests to MNS in flight at once from each Lambda
+    instance. Configured via the MNS_MAX_CONCURRENT_REQUESTS environment variable,
+    defaulting to 4.
+    """
+    return _get_int("MNS_MAX_CONCURRENT_REQUESTS", 4)
+
+
+def deadline_reserve_seconds() -> float:
+    """
+    The time before a Lambda invocation times out that is reserved for responding,
+    so that a request running out of time is given up in time to be responded to
+    cleanly. Configured via the DEADLINE_RESERVE environment variable, as seconds
+    optionally suffixed with a unit of s, m or h, defaulting to 0.5s.
+    """
+    return _get_duration("DEADLINE_RESERVE", 0.5)
@@ -0,0 +1,417 @@
+"""
+Pooled, retrying HTTP clients for the services the API sends requests to, such as
+Patient Data Manager and Multicast Notification Service.
+"""
+
+import contextlib
+import http.client
+import json
+import random
+import ssl
+import threading
+import time
+import urllib.parse
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from typing import Any, ClassVar
+
+from pathology_api.logging import get_logger
+from pathology_api.resilience import CallOutcome, Dependency
+
+_logger = get_logger(__name__)
+
+# Responses to a request that the service may accept if the same request is retried.
+_RETRIABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+# Errors raised when a connection kept alive has since been closed by the server,
+# before any response to a request sent via it has been received.
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+@dataclass(frozen=True)
+class ServiceResponse:
+    """
+    A response received from a service.
+    Attributes:
+        status_code: The status code of the response.
+        headers: The headers of the response.
+        body: The body of the response.
+    """
+
+    status_code: int
+    headers: Mapping[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+    def json(self) -> Any:
+        """The parsed JSON body of the response, or None if it has no body."""
+        return json.loads(self.body) if self.body else None
+
+
+class ServiceError(Exception):
+    """
+    Raised when a request to a service fails, once any retries have been exhausted.
+    Attributes:
+        response: The final response received from the service, if any was received.
+    """
+
+    def __init__(self, message: str, response: ServiceResponse | None = None):
+        super().__init__(message)
+        self.response = response
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How requests to a service are retried.
+    Attributes:
+        max_attempts: The maximum number of times a request is sent.
+        base_delay: The delay, in seconds, before the first retry is capped at.
+        max_delay: The maximum delay, in seconds, before any retry.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.1
+    max_delay: float = 2.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        The delay before retrying a request that has been sent attempt + 1 times. The
+        delay is chosen at random up to an exponentially increasing cap, so that
+        retries from many concurrent clients are spread out rather than synchronised.
+        """
+        cap = min(self.max_delay, self.base_delay * 2**attempt)
+        # S311: Only spreads out retries, so need not be cryptographically secure.
+        return random.uniform(0, cap)  # noqa: S311
+
+
+class _ConnectionPool:
+    """
+    Keep-alive connections to a single origin, reused across requests so that a new
+    TCP connection and TLS handshake are not needed for each. The most recently
+    released connection is reused first, being the least likely to have been closed
+    by the server for being idle.
+    """
+
+    def __init__(
+        self,
+        url: urllib.parse.SplitResult,
+        max_idle: int,
+        ssl_context: ssl.SSLContext | None,
+    ):
+        self._url = url
+        self._max_idle = max_idle
+        # Shared by every connection, so that TLS sessions are resumed.
+        self._ssl_context = ssl_context or ssl.create_default_context()
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self.connections_created = 0
+
+    def acquire(self, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """
+        Take an idle connection, or create a new one if there are none.
+        Returns:
+            The connection, and whether it has previously been used.
+        """
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self.connections_created += 1
+
+        reused = connection is not None
+        if connection is None:
+            connection = self._connect(timeout)
+        else:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+        return connection, reused
+
+    def release(self, connection: http.client.HTTPConnection) -> None:
+        """Return a connection, once its response has been read in full."""
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _connect(self, timeout: float) -> http.client.HTTPConnection:
+        if self._url.scheme == "https":
+            return http.client.HTTPSConnection(
+                self._url.hostname or "",
+                self._url.port,
+                timeout=timeout,
+                context=self._ssl_context,
+            )
+        return http.client.HTTPConnection(
+            self._url.hostname or "", self._url.port, timeout=timeout
+        )
+
+
+class ServiceClient:
+    """
+    Base class for clients of a service's HTTP API. Connections are pooled and kept
+    alive, so a client should be created once and reused for every request, including
+    across warm invocations of a Lambda. Clients are safe to use from multiple threads.
+
+    Requests are retried, after a jittered backoff, on connection errors and on
+    responses indicating the service is unavailable or overloaded. Every request is
+    sent with an X-Request-ID, so that the service treats a retried request as a
+    repeat of the original. Where a Dependency is provided, each attempt is guarded by
+    its circuit breaker and bulkhead.
+    Attributes:
+        service_name: The name of the service, used within errors and logs.
+        error_type: The type of error raised when a request fails.
+        media_type: The media type of requests and responses, by default.
+    """
+
+    service_name: ClassVar[str] = "Service"
+    error_type: ClassVar[type[ServiceError]] = ServiceError
+    media_type: ClassVar[str] = "application/json"
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 10.0,
+        max_idle_connections: int = 10,
+        retry: RetryPolicy | None = None,
+        token_provider: Callable[[], str] | None = None,
+        ssl_context: ssl.SSLContext | None = None,
+        dependency: Dependency | None = None,
+    ):
+        """
+        Args:
+            base_url: The base URL of the service's API.
+            timeout: The maximum time, in seconds, to wait for each attempt at a
+                request to connect or to receive data.
+            max_idle_connections: The maximum number of connections kept alive.
+            retry: How requests are retried, defaulting to RetryPolicy().
+            token_provider: Provides the bearer token requests are authorised with,
+                if the service requires authorisation.
+            ssl_context: The context TLS connections are created with, defaulting to
+                ssl.create_default_context().
+            dependency: Guards each attempt at a request, if provided.
+        """
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ValueError(f"Invalid {self.service_name} base URL: {base_url!r}")
+
+        self._url_path = url.path or "/"
+        self._base_path = url.path.rstrip("/") + "/"
+        self._timeout = timeout
+        self._retry = retry or RetryPolicy()
+        self._token_provider = token_provider
+        self._pool = _ConnectionPool(url, max_idle_connections, ssl_context)
+        self._dependency = dependency
+
+    @property
+    def connections_created(self) -> int:
+        """The number of connections opened by the client, for monitoring."""
+        return self._pool.connections_created
+
+    def close(self) -> None:
+        """Close every connection kept alive by the client."""
+        self._pool.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        request_id: str,
+        body: bytes | None = None,
+        deadline: float | None = None,
+        content_type: str | None = None,
+    ) -> ServiceResponse:
+        """
+        Send a request to the service, retrying it if it may succeed when retried.
+        Args:
+            method: The HTTP method of the request.
+            path: The path of the request, relative to the base URL. If empty, the
+                request is sent to the base URL itself.
+            request_id: Sent as X-Request-ID, identifying the request to the service.
+            body: The body of the request, if any.
+            deadline: The time, as returned by time.monotonic(), by which a response
+                is needed. No attempt is made, or retry scheduled, beyond it.
+            content_type: The media type of the body, defaulting to media_type.
+        Returns:
+            The final response received from the service, which may be an error
+            response that is not worth retrying.
+        Raises:
+            ServiceError: If no response was received, or the service remained
+                unavailable, once every attempt has been made or the deadline has
+                been reached, or if no token could be provided to authorise the
+                request. Raised as the client's error_type.
+            DependencyUnavailableError: If the dependency's circuit is open, or too
+                many requests to it are in flight, so the request was not sent.
+        """
+        headers = {
+            "Accept": self.media_type,
+            "X-Request-ID": request_id,
+        }
+        if body is not None:
+            headers["Content-Type"] = content_type or self.media_type
+
+        request_path = self._base_path + path if path else self._url_path
+        response: ServiceResponse | None = None
+        for attempt in range(self._retry.max_attempts):
+            timeout = self._attempt_timeout(deadline)
+            if timeout is None:
+                break
+
+            if self._token_provider is not None:
+                try:
+                    headers["Authorization"] = f"Bearer {self._token_provider()}"
+                except ServiceError as e:
+                    raise self.error_type(
+                        f"{self.service_name} request {method} {path} could not be "
+                        "authorised."
+                    ) from e
+
+            try:
+                with self._guard() as outcome:
+                    response = self._send(method, request_path, body, headers, timeout)
+                    outcome.failed = response.status_code in _RETRIABLE_STATUSES
+            except (OSError, http.client.HTTPException) as e:
+                _logger.warning(
+                    "%s request failed on attempt %s: %s",
+                    self.service_name,
+                    attempt + 1,
+                    e,
+                )
+                response = None
+            else:
+                if response.status_code not in _RETRIABLE_STATUSES:
+                    return response
+                _logger.warning(
+                    "%s responded with status %s on attempt %s.",
+                    self.service_name,
+                    response.status_code,
+                    attempt + 1,
+                )
+
+            if attempt + 1 < self._retry.max_attempts and not self._backoff(
+                attempt, response, deadline
+            ):
+                break
+
+        raise self.error_type(
+            f"{self.service_name} request {method} {path} failed"
+            + (f" with status {response.status_code}." if response else "."),
+            response=response,
+        )
+
+    def _guard(self) -> contextlib.AbstractContextManager[CallOutcome]:
+        if self._dependency is None:
+            return contextlib.nullcontext(CallOutcome())
+        return self._dependency.call()
+
+    def _attempt_timeout(self, deadline: float | None) -> float | None:
+        """The timeout of the next attempt, or None if the deadline has passed."""
+        if deadline is None:
+            return self._timeout
+
+        remaining = deadline - time.monotonic()
+        return min(self._timeout, remaining) if remaining > 0 else None
+
+    def _backoff(
+        self, attempt: int, response: ServiceResponse | None, deadline: float | None
+    ) -> bool:
+        """
+        Wait before retrying, returning False if the deadline would be exceeded, or
+        the service asked to be retried after longer than the retry policy allows.
+        """
+        delay = self._retry.delay(attempt)
+        retry_after = _retry_after(response) if response is not None else 0.0
+        if retry_after > self._retry.max_delay:
+            return False
+        delay = max(delay, retry_after)
+
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+
+        time.sleep(delay)
+        return True
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None,
+        headers: Mapping[str, str],
+        timeout: float,
+    ) -> ServiceResponse:
+        connection, reused = self._pool.acquire(timeout)
+        try:
+            try:
+                response, will_close = _exchange(
+                    connection, method, path, body, headers
+                )
+            except _STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # Retried immediately on a new connection, as the request was never
+                # received by the service.
+                connection.close()
+                connection, _ = self._pool.acquire(timeout)
+                response, will_close = _exchange(
+                    connection, method, path, body, headers
+                )
+        except BaseException:
+            connection.close()
+            raise
+
+        if will_close:
+            connection.close()
+        else:
+            self._pool.release(connection)
+        return response
+
+
+def _exchange(
+    connection: http.client.HTTPConnection,
+    method: str,
+    path: str,
+    body: bytes | None,
+    headers: Mapping[str, str],
+) -> tuple[ServiceResponse, bool]:
+    """
+    Send a request via a connection, reading the response in full so that the
+    connection can be reused.
+    Returns:
+        The response, and whether the connection has been closed by the server.
+    """
+    connection.request(method, path, body=body, headers=dict(headers))
+    response = connection.getresponse()
+    return (
+        ServiceResponse(
+            status_code=response.status,
+            headers=dict(response.getheaders()),
+            body=response.read(),
+        ),
+        response.will_close,
+    )
+
+
+def _retry_after(response: ServiceResponse) -> float:
+    """The delay requested via a Retry-After header of seconds, if provided."""
+    value = next(
+        (v for k, v in response.headers.items() if k.lower() == "retry-after"), None
+    )
+    try:
+        return max(0.0, float(value)) if value is not None else 0.0
+    except ValueError:
+        return 0.0
@@ -0,0 +1,72 @@
+"""
+Request-scoped deadlines, derived from the time remaining before a Lambda invocation
+times out, so that each stage of handling a request can give up once there is no
+time left for it to complete, rather than overrunning the invocation.
+"""
+
+import time
+from dataclasses import dataclass
+
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+
+class DeadlineExceededError(Exception):
+    """
+    Raised when the deadline of a request is reached before it has been handled.
+    Attributes:
+        stage: The stage of handling the request that could not be completed.
+    """
+
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded before {stage} completed.")
+        self.stage = stage
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """
+    The time by which a request must have been handled.
+    Attributes:
+        expires_at: The time, as returned by time.monotonic(), of the deadline.
+    """
+
+    expires_at: float
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        """Create a Deadline the given number of seconds from now."""
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def from_context(cls, context: LambdaContext, reserve: float) -> "Deadline | None":
+        """
+        Create the Deadline of an invocation, or None if the context reports no
+        remaining time, as is the case outside of Lambda.
+        Args:
+            context: The context of the invocation.
+            reserve: The time, in seconds, before the invocation times out that is
+                reserved for responding once the deadline is reached.
+        """
+        remaining_millis = context.get_remaining_time_in_millis()
+        if remaining_millis <= 0:
+            return None
+        return cls.after(remaining_millis / 1000 - reserve)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def remaining(self) -> float:
+        """The time, in seconds, remaining before the deadline, if any."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, stage: str) -> None:
+        """
+        Check that the deadline has not been reached before a stage begins.
+        Args:
+            stage: The stage about to begin, used within the raised error.
+        Raises:
+            DeadlineExceededError: If the deadline has been reached.
+        """
+        if self.expired:
+            raise DeadlineExceededError(stage)
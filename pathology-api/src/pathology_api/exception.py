@@ -1,9 +1,39 @@
+from collections.abc import Sequence
+
+
 class ValidationError(Exception):
     """
     Custom exception for validation errors in FHIR resources.
     Note that any message here will be provided in the error response returned to users.
     """
 
-    def __init__(self, message: str):
+    def __init__(self, message: str, issues: Sequence[str] | None = None):
+        """
+        Args:
+            message: The message describing the validation error.
+            issues: Each individual issue making up the validation error, where
+                multiple were found. Defaults to only the message.
+        """
         super().__init__(message)
         self.message = message
+        self.issues = list(issues) if issues else [message]
+
+
+class PayloadTooLargeError(ValidationError):
+    """
+    Validation error raised when a request payload exceeds a configured limit on its
+    size.
+    """
+
+
+class UnsupportedMediaTypeError(ValidationError):
+    """
+    Validation error raised when a request payload is provided in an unsupported
+    format or encoding.
+    """
+
+
+class RequestInProgressError(ValidationError):
+    """
+    Validation error raised when a request repeats one that is still being processed.
+    """
@@ -25,7 +25,9 @@ class Meta:
     @classmethod
     def with_last_updated(cls, last_updated: datetime.datetime | None = None) -> "Meta":
         """
-        Create a Meta instance with the provided last_updated timestamp.
+        Create a Meta instance with the provided last_updated timestamp. As Meta is a
+        standard dataclass no validation is completed on creation, so the instance can
+        be provided directly to Resource.create_trusted.
         Args:
             last_updated: The last updated timestamp.
         Returns:
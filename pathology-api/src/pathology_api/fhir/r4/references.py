@@ -0,0 +1,198 @@
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from .resources import Bundle, OpaqueResource, Resource
+
+
+@dataclass(frozen=True)
+class LiteralReference:
+    """
+    A FHIR R4 Literal Reference, see https://hl7.org/fhir/R4/references.html#literal,
+    made from one entry of a Bundle.
+    Attributes:
+        source: The fullUrl of the entry containing the reference.
+        path: The path to the reference within the resource of the source entry, for
+            example "requester" or "section[0].entry[1]".
+        reference: The value of the reference.
+        target: The fullUrl of the entry the reference resolves to, or None if the
+            reference does not resolve to an entry within the Bundle.
+    """
+
+    source: str
+    path: str
+    reference: str
+    target: str | None
+
+
+class ReferenceGraph:
+    """
+    The graph of Literal References between the entries of a Bundle, built via a single
+    walk of its entries. References are resolved against the fullUrl of each entry,
+    either exactly or, for entries with a RESTful fullUrl, via the relative
+    "<resourceType>/<id>" form of that URL. References to contained resources, which
+    begin with "#", are not considered.
+
+    Where multiple entries share a fullUrl, references resolve to the first of them.
+    """
+
+    def __init__(self, bundle: Bundle):
+        entries = bundle.entries or []
+
+        self._resources: dict[str, Resource] = {}
+        self._duplicate_full_urls: list[str] = []
+        relative_urls: dict[str, str] = {}
+        for entry in entries:
+            if entry.full_url in self._resources:
+                self._duplicate_full_urls.append(entry.full_url)
+                continue
+
+            self._resources[entry.full_url] = entry.resource
+            relative_url = _relative_url(entry.full_url, entry.resource)
+            if relative_url is not None:
+                relative_urls.setdefault(relative_url, entry.full_url)
+
+        self._references_from: dict[str, list[LiteralReference]] = {}
+        self._references_to: dict[str, list[LiteralReference]] = {}
+        self._dangling: list[LiteralReference] = []
+        for entry in entries:
+            references = self._references_from.setdefault(entry.full_url, [])
+            for path, value in _find_references(entry.resource):
+                target = value if value in self._resources else relative_urls.get(value)
+                reference = LiteralReference(
+                    source=entry.full_url, path=path, reference=value, target=target
+                )
+
+                references.append(reference)
+                if target is None:
+                    self._dangling.append(reference)
+                else:
+                    self._references_to.setdefault(target, []).append(reference)
+
+        self._cycles = self._find_cycles()
+
+    @property
+    def dangling_references(self) -> list[LiteralReference]:
+        """References that do not resolve to an entry within the Bundle."""
+        return list(self._dangling)
+
+    @property
+    def duplicate_full_urls(self) -> list[str]:
+        """fullUrls shared by multiple entries, once for each additional entry."""
+        return list(self._duplicate_full_urls)
+
+    @property
+    def cycles(self) -> list[list[str]]:
+        """
+        Cycles of references between entries, each provided as the fullUrls of the
+        entries within the cycle, in the order they reference each other.
+        """
+        return [list(cycle) for cycle in self._cycles]
+
+    def references_from(self, full_url: str) -> list[LiteralReference]:
+        """
+        Find the references made by an entry.
+        Args:
+            full_url: The fullUrl of the entry.
+        Returns:
+            The references made by the entry, in the order they appear within its
+            resource.
+        """
+        return list(self._references_from.get(full_url, ()))
+
+    def references_to(self, full_url: str) -> list[LiteralReference]:
+        """
+        Find the references that resolve to an entry.
+        Args:
+            full_url: The fullUrl of the entry.
+        Returns:
+            The references that resolve to the entry.
+        """
+        return list(self._references_to.get(full_url, ()))
+
+    def resolve(self, full_url: str, path: str) -> Resource | None:
+        """
+        Resolve the reference at a given path within the resource of an entry.
+        Args:
+            full_url: The fullUrl of the entry containing the reference.
+            path: The path to the reference within the resource of the entry.
+        Returns:
+            The resource the reference resolves to, or None if there is no reference
+            at the path or the reference does not resolve to an entry.
+        """
+        for reference in self._references_from.get(full_url, ()):
+            if reference.path == path and reference.target is not None:
+                return self._resources[reference.target]
+        return None
+
+    def _find_cycles(self) -> list[tuple[str, ...]]:
+        # An iterative depth first search, so that long chains of references cannot
+        # exceed the recursion limit. Each entry and reference is visited once.
+        cycles: list[tuple[str, ...]] = []
+        visited: set[str] = set()
+        for start in self._references_from:
+            if start in visited:
+                continue
+
+            visited.add(start)
+            path = [start]
+            on_path = {start: 0}
+            stack = [iter(self._references_from[start])]
+            while stack:
+                reference = next(stack[-1], None)
+                if reference is None:
+                    stack.pop()
+                    del on_path[path.pop()]
+                    continue
+
+                target = reference.target
+                if target is None:
+                    continue
+                if target in on_path:
+                    cycles.append(tuple(path[on_path[target] :]))
+                elif target not in visited:
+                    visited.add(target)
+                    on_path[target] = len(path)
+                    path.append(target)
+                    stack.append(iter(self._references_from.get(target, ())))
+        return cycles
+
+
+def _relative_url(full_url: str, resource: Resource) -> str | None:
+    if resource.id is None:
+        return None
+
+    relative_url = f"{resource.resource_type}/{resource.id}"
+    return relative_url if full_url.endswith(f"/{relative_url}") else None
+
+
+def _find_references(resource: Resource) -> Iterator[tuple[str, str]]:
+    if isinstance(resource, OpaqueResource):
+        encoded = resource.encoded_json()
+        # Avoid materialising retained JSON that cannot contain a reference. JSON
+        # including escape sequences is always materialised, as the escapes could
+        # form a reference key.
+        if (
+            encoded is not None
+            and b'"reference"' not in encoded
+            and b"\\" not in encoded
+        ):
+            return
+
+    yield from _find_nested_references(resource.model_extra or {}, "")
+
+
+def _find_nested_references(value: Any, path: str) -> Iterator[tuple[str, str]]:
+    if isinstance(value, dict):
+        reference = value.get("reference")
+        if isinstance(reference, str) and not reference.startswith("#"):
+            yield path, reference
+
+        for key, item in value.items():
+            if key != "reference":
+                yield from _find_nested_references(
+                    item, f"{path}.{key}" if path else key
+                )
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _find_nested_references(item, f"{path}[{index}]")
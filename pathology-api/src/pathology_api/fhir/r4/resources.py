@@ -1,21 +1,54 @@
+import functools
+from collections.abc import Iterator
 from dataclasses import dataclass
-from typing import Annotated, Any, ClassVar, Literal, Self, TypedDict
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    ClassVar,
+    Literal,
+    Self,
+    TypedDict,
+    cast,
+)
 
+import pydantic
+import pydantic_core
 from pydantic import (
     BaseModel,
     ConfigDict,
     Field,
+    GetCoreSchemaHandler,
     SerializeAsAny,
-    ValidatorFunctionWrapHandler,
+    SerializerFunctionWrapHandler,
     field_validator,
-    model_validator,
+    model_serializer,
 )
+from pydantic_core import CoreSchema, core_schema
 
+from pathology_api import config
 from pathology_api.exception import ValidationError
 
 from .elements import LogicalReference, Meta, PatientIdentifier, UUIDIdentifier
 
 
+def _verify_trusted[T: BaseModel](model: T) -> T:
+    """
+    Verify, if configured to do so, that a model created without validation would
+    still pass validation.
+    Raises:
+        AssertionError: If the model is configured to be verified and is not valid.
+    """
+    if config.verify_trusted_resources():
+        try:
+            type(model).model_validate(model.model_dump(by_alias=True), by_alias=True)
+        except (ValidationError, pydantic.ValidationError) as e:
+            raise AssertionError(
+                f"Trusted {type(model).__name__} failed validation: {e}"
+            ) from e
+    return model
+
+
 class Resource(BaseModel):
     """A FHIR R4 Resource base class."""
 
@@ -29,37 +62,64 @@ class Resource(BaseModel):
     meta: Annotated[Meta | None, Field(alias="meta", frozen=True)] = None
     resource_type: str = Field(alias="resourceType", frozen=True)
 
-    def __init_subclass__(cls, resource_type: str, **kwargs: Any) -> None:
-        cls.__resource_types[resource_type] = cls
-        cls.__expected_resource_type[cls] = resource_type
+    def __init_subclass__(cls, resource_type: str | None = None, **kwargs: Any) -> None:
+        # Intermediate base classes that do not define a resource_type are not
+        # registered, and cannot be instantiated directly.
+        if resource_type is not None:
+            cls.__resource_types[resource_type] = cls
+            cls.__expected_resource_type[cls] = resource_type
 
         super().__init_subclass__(**kwargs)
 
-    @model_validator(mode="wrap")
     @classmethod
-    def validate_with_subtype(
-        cls, value: dict[str, Any], handler: ValidatorFunctionWrapHandler
-    ) -> Any:
+    def __get_pydantic_core_schema__(
+        cls, source: type[BaseModel], handler: GetCoreSchemaHandler
+    ) -> CoreSchema:
         """
-        Provides a model validator that instantiates the correct Resource subclass
-        based on its defined resource_type.
+        Provides a schema that validates a top level Resource as a union of every
+        registered Resource subclass, tagged by its defined resource_type, so that the
+        correct subclass is selected and instantiated within pydantic-core.
         """
-        # If we're not currently acting on a top level Resource, and we've not been
-        # provided a generic dictonary object, delegate to the normal handler.
-        if cls != Resource or not isinstance(value, dict):
-            return handler(value)
+        # Subclasses, and the base Resource whilst it is being defined, are validated
+        # via the standard model schema.
+        if source in cls.__expected_resource_type or not cls.__resource_types:
+            return handler(source)
+
+        return core_schema.tagged_union_schema(
+            choices={
+                resource_type: handler.generate_schema(subclass)
+                for resource_type, subclass in cls.__resource_types.items()
+            },
+            discriminator=cls._discriminate_resource_type,
+        )
 
-        if "resourceType" not in value or value["resourceType"] is None:
-            raise ValidationError("resourceType must be provided for each Resource.")
+    @classmethod
+    def _discriminate_resource_type(cls, value: Any) -> str | None:
+        if isinstance(value, Resource):
+            return value.resource_type
 
-        resource_type = value["resourceType"]
+        if not isinstance(value, dict):
+            return None
 
-        subclass = cls.__resource_types.get(resource_type)
-        if subclass is None:
+        resource_type = value.get("resourceType")
+        if resource_type is None:
+            raise ValidationError("resourceType must be provided for each Resource.")
+
+        if resource_type not in cls.__resource_types:
             raise ValidationError(f"Unsupported resourceType: {resource_type}")
 
-        # Instantiate the subclass using the dictionary values.
-        return subclass.model_validate(value)
+        return str(resource_type)
+
+    @classmethod
+    def get_subclass(cls, resource_type: str) -> type["Resource"] | None:
+        """
+        Retrieve the Resource subclass registered for a given resourceType.
+        Args:
+            resource_type: The resourceType to retrieve the subclass for.
+        Returns:
+            The registered subclass, or None if the resourceType is not supported.
+        """
+        return cls.__resource_types.get(resource_type)
 
     @classmethod
     def create(cls, **kwargs: Any) -> Self:
@@ -69,6 +129,30 @@ class Resource(BaseModel):
         """
         return cls(resourceType=cls.__expected_resource_type[cls], **kwargs)
 
+    @classmethod
+    def create_trusted(cls, **kwargs: Any) -> Self:
+        """
+        Create a Resource instance with the correct resourceType from values built by
+        the service itself, without validating them. Only use this where every value
+        provided has already been validated, such as entries from a validated Bundle.
+        If trusted resources are configured to be verified, see
+        config.verify_trusted_resources, the created instance is checked to still be
+        valid.
+        """
+        return _verify_trusted(
+            cls.model_construct(
+                resourceType=cls.__expected_resource_type[cls], **kwargs
+            )
+        )
+
+    def encoded_json(self) -> bytes | None:
+        """
+        Provides the JSON this Resource was created from, if it has been retained and
+        can be written out unchanged in place of serialising the Resource's fields.
+        By default no JSON is retained.
+        """
+        return None
+
     @field_validator("resource_type", mode="after")
     @classmethod
     def _validate_resource_type(cls, value: str) -> str:
@@ -97,11 +181,17 @@ type BundleType = Literal[
 class Bundle(Resource, resource_type="Bundle"):
     """A FHIR R4 Bundle resource."""
 
+    # Deferred so that the Resource union used for its entries is only generated once
+    # every Resource subclass has been registered.
+    model_config = ConfigDict(defer_build=True)
+
     bundle_type: BundleType = Field(alias="type", frozen=True)
     identifier: Annotated[UUIDIdentifier | None, Field(frozen=True)] = None
     entries: list["Bundle.Entry"] | None = Field(None, frozen=True, alias="entry")
 
     class Entry(BaseModel):
+        model_config = ConfigDict(defer_build=True)
+
         full_url: str = Field(..., alias="fullUrl", frozen=True)
         resource: Annotated[SerializeAsAny[Resource], Field(frozen=True)]
 
@@ -114,11 +204,51 @@ class Bundle(Resource, resource_type="Bundle"):
         Returns:
             A list of resources of the specified type.
         """
-        return [
-            entry.resource
-            for entry in self.entries or []
-            if isinstance(entry.resource, t)
-        ]
+        return cast("list[T]", list(self._resources_by_type.get(t, ())))
+
+    def first_of[T: Resource](self, t: type[T]) -> T | None:
+        """
+        Find the first resource of a given type in the bundle entries.
+        Args:
+            t: The resource type to search for.
+        Returns:
+            The first resource of the specified type, or None if there is no such
+            resource.
+        """
+        resources = self._resources_by_type.get(t)
+        return cast("T", resources[0]) if resources else None
+
+    def get_by_full_url(self, full_url: str) -> Resource | None:
+        """
+        Find the resource of the bundle entry with the given fullUrl. If multiple
+        entries share the fullUrl, the resource of the first is returned.
+        Args:
+            full_url: The fullUrl of the entry to search for.
+        Returns:
+            The resource of the matching entry, or None if there is no such entry.
+        """
+        return self._resources_by_full_url.get(full_url)
+
+    # The indexes below are built once per Bundle, on first use, so that each lookup
+    # does not require a scan of every entry. Entries must therefore not be modified
+    # after the Bundle has been queried.
+    @functools.cached_property
+    def _resources_by_type(self) -> dict[type[Resource], list[Resource]]:
+        index: dict[type[Resource], list[Resource]] = {}
+        for entry in self.entries or []:
+            # Resources are indexed against each of their Resource base classes, so
+            # that resources may be found via any type that they are an instance of.
+            for t in type(entry.resource).__mro__:
+                if issubclass(t, Resource):
+                    index.setdefault(t, []).append(entry.resource)
+        return index
+
+    @functools.cached_property
+    def _resources_by_full_url(self) -> dict[str, Resource]:
+        index: dict[str, Resource] = {}
+        for entry in self.entries or []:
+            index.setdefault(entry.full_url, entry.resource)
+        return index
 
     @classmethod
     def empty(cls, bundle_type: BundleType) -> "Bundle":
@@ -126,35 +256,143 @@ class Bundle(Resource, resource_type="Bundle"):
         return cls.create(type=bundle_type, entry=None)
 
 
-class Patient(Resource, resource_type="Patient"):
+class OpaqueResource(Resource):
+    """
+    Base class for Resources whose content, beyond the fields they define, is not
+    interpreted by the service and is held as extra fields.
+
+    An OpaqueResource can retain the JSON it was created from, see retain_encoded_json,
+    in which case its extra fields are only materialised from that JSON when they are
+    first read, and the retained JSON is written out in place of serialising the
+    Resource. Extra fields must not be modified in place whilst JSON is retained;
+    setting or deleting an attribute discards the retained JSON.
+    """
+
+    # Held as slots, rather than private attributes, so that retained JSON is not
+    # considered when comparing Resources.
+    __slots__ = ("_encoded", "_pending")
+
+    def retain_encoded_json(self, encoded: bytes) -> None:
+        """
+        Retain the JSON this Resource was created from. The Resource should have been
+        validated from only the fields it defines, with its remaining content then
+        lazily materialised as extra fields from the retained JSON.
+        Args:
+            encoded: The JSON the Resource was created from.
+        """
+        object.__setattr__(self, "_encoded", encoded)
+        object.__setattr__(self, "_pending", encoded)
+
+    def encoded_json(self) -> bytes | None:
+        return self.__get_slot("_encoded")
+
+    def _materialise(self) -> None:
+        pending = self.__get_slot("_pending")
+        if pending is None:
+            return
+
+        content = pydantic_core.from_json(pending)
+        for name, field in type(self).model_fields.items():
+            content.pop(field.alias or name, None)
+
+        object.__setattr__(self, "__pydantic_extra__", content)
+        object.__setattr__(self, "_pending", None)
+
+    def __get_slot(self, name: str) -> bytes | None:
+        try:
+            value: bytes | None = object.__getattribute__(self, name)
+        except AttributeError:
+            # Slots are not set for Resources that have not retained any JSON.
+            return None
+        return value
+
+    @property
+    def model_extra(self) -> dict[str, Any] | None:
+        self._materialise()
+        return super().model_extra
+
+    @model_serializer(mode="wrap")
+    def _serialize_materialised(self, handler: SerializerFunctionWrapHandler) -> Any:
+        self._materialise()
+        return handler(self)
+
+    if not TYPE_CHECKING:
+        # Only defined outside of type checking so that unknown attributes are not
+        # treated as valid by type checkers.
+        def __getattr__(self, name: str) -> Any:
+            if not name.startswith("_"):
+                self._materialise()
+            return super().__getattr__(name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._discard_encoded()
+        super().__setattr__(name, value)
+
+    def __delattr__(self, name: str) -> None:
+        self._discard_encoded()
+        super().__delattr__(name)
+
+    def _discard_encoded(self) -> None:
+        self._materialise()
+        object.__setattr__(self, "_encoded", None)
+
+    def __eq__(self, other: object) -> bool:
+        self._materialise()
+        if isinstance(other, OpaqueResource):
+            other._materialise()
+        return super().__eq__(other)
+
+    def __copy__(self) -> Self:
+        # Copies do not retain JSON, so all content must have been materialised.
+        self._materialise()
+        return super().__copy__()
+
+    def __deepcopy__(self, memo: dict[int, Any] | None = None) -> Self:
+        self._materialise()
+        return super().__deepcopy__(memo)
+
+    def __getstate__(self) -> dict[Any, Any]:
+        self._materialise()
+        return super().__getstate__()
+
+    def __repr_args__(self) -> Iterator[tuple[str | None, Any]]:
+        # Avoid materialising content solely to provide a representation.
+        if self.__get_slot("_pending") is not None:
+            yield from ((name, getattr(self, name)) for name in type(self).model_fields)
+            yield "encoded_json", f"<{len(self.__get_slot('_pending') or b'')} bytes>"
+            return
+        yield from super().__repr_args__()
+
+
+class Patient(OpaqueResource, resource_type="Patient"):
     """A FHIR R4 Patient resource."""
 
 
-class ServiceRequest(Resource, resource_type="ServiceRequest"):
+class ServiceRequest(OpaqueResource, resource_type="ServiceRequest"):
     """A FHIR R4 ServiceRequest resource."""
 
 
-class DiagnosticReport(Resource, resource_type="DiagnosticReport"):
+class DiagnosticReport(OpaqueResource, resource_type="DiagnosticReport"):
     """A FHIR R4 DiagnosticReport resource."""
 
 
-class Organization(Resource, resource_type="Organization"):
+class Organization(OpaqueResource, resource_type="Organization"):
     """A FHIR R4 Organization resource."""
 
 
-class Practitioner(Resource, resource_type="Practitioner"):
+class Practitioner(OpaqueResource, resource_type="Practitioner"):
     """A FHIR R4 Practitioner resource."""
 
 
-class PractitionerRole(Resource, resource_type="PractitionerRole"):
+class PractitionerRole(OpaqueResource, resource_type="PractitionerRole"):
     """A FHIR R4 PractitionerRole resource."""
 
 
-class Observation(Resource, resource_type="Observation"):
+class Observation(OpaqueResource, resource_type="Observation"):
     """A FHIR R4 Observation resource."""
 
 
-class Specimen(Resource, resource_type="Specimen"):
+class Specimen(OpaqueResource, resource_type="Specimen"):
     """A FHIR R4 Specimen resource."""
 
 
@@ -187,39 +425,136 @@ class OperationOutcome(BaseModel):
     issue: list[Issue] = Field(frozen=True)
 
     @classmethod
-    def create_validation_error(cls, diagnostics: str) -> Self:
+    def create_validation_error(
+        cls, diagnostics: str, *additional_diagnostics: str
+    ) -> Self:
         """
         Create an OperationOutcome with the provided diagnostic as a validation error.
+        The OperationOutcome is built by the service so is not validated on creation.
         Args:
             diagnostics: The diagnostic message for the validation error.
+            additional_diagnostics: Diagnostic messages for any further validation
+                errors, each provided as a separate issue.
         """
 
-        return cls(
-            resourceType="OperationOutcome",
-            issue=[
-                {
-                    "severity": "error",
-                    "code": "invalid",
-                    "diagnostics": diagnostics,
-                }
-            ],
+        return _verify_trusted(
+            cls.model_construct(
+                issue=[
+                    {
+                        "severity": "error",
+                        "code": "invalid",
+                        "diagnostics": message,
+                    }
+                    for message in (diagnostics, *additional_diagnostics)
+                ],
+            )
+        )
+
+    @classmethod
+    def create_information(cls, diagnostics: str) -> Self:
+        """Create an OperationOutcome describing a successful operation."""
+        return cls._create_issue("information", "informational", diagnostics)
+
+    @classmethod
+    def create_not_found(cls, diagnostics: str) -> Self:
+        """Create an OperationOutcome describing a resource that could not be found."""
+        return cls._create_issue("error", "not-found", diagnostics)
+
+    @classmethod
+    def create_transient_error(cls, diagnostics: str) -> Self:
+        """Create an OperationOutcome describing an error that may not recur."""
+        return cls._create_issue("error", "transient", diagnostics)
+
+    @classmethod
+    def create_timeout_error(cls, diagnostics: str) -> Self:
+        """
+        Create an OperationOutcome describing a request that could not be completed in
+        the time available.
+        """
+        return cls._create_issue("error", "timeout", diagnostics)
+
+    @classmethod
+    def _create_issue(
+        cls,
+        severity: Literal["fatal", "error", "warning", "information"],
+        code: str,
+        diagnostics: str,
+    ) -> Self:
+        """
+        Create an OperationOutcome with a single issue. The OperationOutcome is built by
+        the service so is not validated on creation.
+        Args:
+            severity: The severity of the issue.
+            code: The code of the issue.
+            diagnostics: The diagnostic message describing the issue.
+        """
+        return _verify_trusted(
+            cls.model_construct(
+                issue=[{"severity": severity, "code": code, "diagnostics": diagnostics}]
+            )
         )
 
     @classmethod
     def create_server_error(cls, diagnostics: str | None = None) -> Self:
         """
         Create an OperationOutcome with the provided diagnostics as a server error.
+        The OperationOutcome is built by the service so is not validated on creation.
         Args:
             diagnostics: any diagnostics to include with the server error.
         """
 
-        return cls(
-            resourceType="OperationOutcome",
-            issue=[
-                {
-                    "severity": "fatal",
-                    "code": "exception",
-                    "diagnostics": diagnostics,
-                }
-            ],
+        return _verify_trusted(
+            cls.model_construct(
+                issue=[
+                    {
+                        "severity": "fatal",
+                        "code": "exception",
+                        "diagnostics": diagnostics,
+                    }
+                ],
+            )
         )
+
+
+class BatchResponse(BaseModel):
+    """
+    A FHIR R4 Bundle of type batch-response, see
+    https://hl7.org/fhir/R4/http.html#transaction-response.
+
+    Note this class is deliberately not a subclass of Resource, as with
+    OperationOutcome, so that it is not accepted as a valid resource for a client.
+    """
+
+    resource_type: Literal["Bundle"] = Field(
+        "Bundle", alias="resourceType", frozen=True
+    )
+    id: Annotated[str | None, Field(frozen=True)] = None
+    bundle_type: Literal["batch-response"] = Field(
+        "batch-response", alias="type", frozen=True
+    )
+
+    class Response(BaseModel):
+        status: str = Field(frozen=True)
+        location: Annotated[str | None, Field(frozen=True)] = None
+        etag: Annotated[str | None, Field(frozen=True)] = None
+        last_modified: str | None = Field(
+            default=None, alias="lastModified", frozen=True
+        )
+        outcome: Annotated[OperationOutcome | None, Field(frozen=True)] = None
+
+    class Entry(BaseModel):
+        resource: Annotated[Bundle | OperationOutcome | None, Field(frozen=True)] = None
+        response: "BatchResponse.Response" = Field(frozen=True)
+
+    entries: Annotated[list[Entry], Field(alias="entry", frozen=True)] = []
+
+    @classmethod
+    def create(cls, entries: list[Entry], bundle_id: str | None = None) -> Self:
+        """
+        Create a BatchResponse from entries built by the service, so is not validated
+        on creation.
+        Args:
+            entries: The entry for each entry of the batch, in the same order.
+            bundle_id: The id of the BatchResponse.
+        """
+        return _verify_trusted(cls.model_construct(id=bundle_id, entry=entries))
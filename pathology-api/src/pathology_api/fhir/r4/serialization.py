@@ -0,0 +1,129 @@
+import functools
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import pydantic_core
+from pydantic import BaseModel, TypeAdapter
+
+from .resources import Bundle
+
+type _Serializer = Callable[[Any, bool], bytes]
+
+# Options utilised for every FHIR JSON response.
+_DUMP_OPTIONS: dict[str, Any] = {"by_alias": True, "exclude_none": True}
+
+
+def dump_json(model: BaseModel, reuse_encoded: bool = True) -> bytes:
+    """
+    Serialise a FHIR model to application/fhir+json bytes, via a serializer compiled
+    once per model class and written directly to bytes. Unless reuse_encoded, the
+    output is equivalent to model.model_dump_json(by_alias=True, exclude_none=True).
+    Args:
+        model: The model to serialise, such as a Bundle or OperationOutcome.
+        reuse_encoded: Whether Resources within a Bundle that have retained the JSON
+            they were created from, see Resource.encoded_json, should have that JSON
+            written out directly rather than being serialised from their fields. Those
+            Resources are then returned exactly as received, including any null
+            values and whitespace, rather than with exclude_none applied.
+    Returns:
+        The serialised JSON bytes.
+    """
+    return _serializer_for(type(model))(model, reuse_encoded)
+
+
+@functools.cache
+def _serializer_for(model_type: type[BaseModel]) -> _Serializer:
+    if issubclass(model_type, Bundle):
+        return _BundleSerializer(model_type)
+
+    serializer = model_type.__pydantic_serializer__
+
+    def serialize(model: BaseModel, _reuse_encoded: bool) -> bytes:
+        return serializer.to_json(model, **_DUMP_OPTIONS)
+
+    return serialize
+
+
+class _BundleSerializer:
+    """
+    Serializer for a Bundle that writes out the retained JSON of any of its entries
+    directly, serialising the remaining entries in runs via a precompiled list
+    serializer. Bundles without any retained JSON are serialised in a single call.
+    """
+
+    _entries_serializer = TypeAdapter(list[Bundle.Entry]).serializer
+
+    def __init__(self, bundle_type: type[Bundle]):
+        self._serializer = bundle_type.__pydantic_serializer__
+
+    def __call__(self, bundle: Bundle, reuse_encoded: bool) -> bytes:
+        encoded_resources = (
+            [entry.resource.encoded_json() for entry in bundle.entries]
+            if reuse_encoded and bundle.entries
+            else []
+        )
+        if not any(encoded_resources):
+            return self._serializer.to_json(bundle, **_DUMP_OPTIONS)
+
+        # Serialise the entries separately, and then insert them in the position they
+        # would be written by the Bundle model, after its fields but before any extras.
+        extra_fields = set(bundle.model_extra or ())
+        head = self._serializer.to_json(
+            bundle, exclude={"entries", *extra_fields}, **_DUMP_OPTIONS
+        )
+        parts = [head[:-1], b',"entry":[']
+        parts += self._serialize_entries(bundle.entries or [], encoded_resources)
+        parts.append(b"]")
+
+        if extra_fields:
+            extras = self._serializer.to_json(
+                bundle, include=extra_fields, **_DUMP_OPTIONS
+            )
+            if extras != b"{}":
+                parts += [b",", extras[1:-1]]
+        parts.append(b"}")
+
+        return b"".join(parts)
+
+    def _serialize_entries(
+        self,
+        entries: Sequence[Bundle.Entry],
+        encoded_resources: Sequence[bytes | None],
+    ) -> list[bytes]:
+        parts: list[bytes] = []
+        run_start = 0
+        for index, encoded in enumerate(encoded_resources):
+            if encoded is None:
+                continue
+
+            # Entries without retained JSON are serialised together in runs.
+            if run_start < index:
+                parts += [self._serialize_run(entries[run_start:index]), b","]
+
+            parts += [_encode_entry(entries[index].full_url, encoded), b","]
+            run_start = index + 1
+
+        if run_start < len(entries):
+            parts.append(self._serialize_run(entries[run_start:]))
+        else:
+            # Remove the trailing separator.
+            parts.pop()
+
+        return parts
+
+    def _serialize_run(self, entries: Sequence[Bundle.Entry]) -> bytes:
+        serialized = self._entries_serializer.to_json(entries, **_DUMP_OPTIONS)
+        # Remove the enclosing list brackets, so the run can be joined with others.
+        return serialized[1:-1]
+
+
+def _encode_entry(full_url: str, resource: bytes) -> bytes:
+    return b"".join(
+        (
+            b'{"fullUrl":',
+            pydantic_core.to_json(full_url),
+            b',"resource":',
+            resource,
+            b"}",
+        )
+    )
@@ -0,0 +1,300 @@
+from typing import Any
+
+import pytest
+
+from .references import LiteralReference, ReferenceGraph
+from .resources import (
+    Bundle,
+    Composition,
+    Observation,
+    Organization,
+    PractitionerRole,
+    ServiceRequest,
+)
+
+
+def _create_bundle(*entries: tuple[str, dict[str, Any]]) -> Bundle:
+    return Bundle.model_validate(
+        {
+            "resourceType": "Bundle",
+            "type": "document",
+            "entry": [
+                {"fullUrl": full_url, "resource": resource}
+                for full_url, resource in entries
+            ],
+        }
+    )
+
+
+class TestReferenceGraph:
+    _BUNDLE = _create_bundle(
+        (
+            "composition",
+            {
+                "resourceType": "Composition",
+                "section": [{"entry": [{"reference": "observation"}]}],
+            },
+        ),
+        (
+            "service-request",
+            {
+                "resourceType": "ServiceRequest",
+                "requester": {"reference": "practitioner-role"},
+            },
+        ),
+        (
+            "practitioner-role",
+            {
+                "resourceType": "PractitionerRole",
+                "organization": {"reference": "organization"},
+            },
+        ),
+        ("organization", {"resourceType": "Organization"}),
+        (
+            "observation",
+            {
+                "resourceType": "Observation",
+                "basedOn": [{"reference": "service-request"}],
+                "contained": [{"resourceType": "Specimen", "id": "specimen"}],
+                "specimen": {"reference": "#specimen"},
+            },
+        ),
+    )
+
+    def test_references_from(self) -> None:
+        graph = ReferenceGraph(self._BUNDLE)
+
+        assert graph.references_from("observation") == [
+            LiteralReference(
+                source="observation",
+                path="basedOn[0]",
+                reference="service-request",
+                target="service-request",
+            )
+        ]
+        assert graph.references_from("organization") == []
+        assert graph.references_from("unknown") == []
+
+    def test_references_to(self) -> None:
+        graph = ReferenceGraph(self._BUNDLE)
+
+        assert graph.references_to("observation") == [
+            LiteralReference(
+                source="composition",
+                path="section[0].entry[0]",
+                reference="observation",
+                target="observation",
+            )
+        ]
+        assert graph.references_to("composition") == []
+
+    @pytest.mark.parametrize(
+        ("full_url", "path", "expected_type"),
+        [
+            pytest.param(
+                "service-request", "requester", PractitionerRole, id="Requester"
+            ),
+            pytest.param(
+                "practitioner-role", "organization", Organization, id="Organization"
+            ),
+            pytest.param(
+                "composition", "section[0].entry[0]", Observation, id="Nested path"
+            ),
+        ],
+    )
+    def test_resolve(self, full_url: str, path: str, expected_type: type) -> None:
+        graph = ReferenceGraph(self._BUNDLE)
+
+        assert isinstance(graph.resolve(full_url, path), expected_type)
+
+    @pytest.mark.parametrize(
+        ("full_url", "path"),
+        [
+            pytest.param("service-request", "performer", id="No reference at path"),
+            pytest.param("observation", "specimen", id="Contained reference"),
+            pytest.param("unknown", "requester", id="Unknown entry"),
+        ],
+    )
+    def test_resolve_returns_none(self, full_url: str, path: str) -> None:
+        assert ReferenceGraph(self._BUNDLE).resolve(full_url, path) is None
+
+    def test_valid_bundle(self) -> None:
+        graph = ReferenceGraph(self._BUNDLE)
+
+        assert graph.dangling_references == []
+        assert graph.duplicate_full_urls == []
+        assert graph.cycles == []
+
+    def test_empty_bundle(self) -> None:
+        graph = ReferenceGraph(Bundle.empty("document"))
+
+        assert graph.dangling_references == []
+        assert graph.duplicate_full_urls == []
+        assert graph.cycles == []
+
+    def test_dangling_references(self) -> None:
+        bundle = _create_bundle(
+            (
+                "service-request",
+                {
+                    "resourceType": "ServiceRequest",
+                    "requester": {"reference": "practitioner-role"},
+                },
+            ),
+        )
+
+        assert ReferenceGraph(bundle).dangling_references == [
+            LiteralReference(
+                source="service-request",
+                path="requester",
+                reference="practitioner-role",
+                target=None,
+            )
+        ]
+
+    def test_duplicate_full_urls(self) -> None:
+        bundle = _create_bundle(
+            ("organization", {"resourceType": "Organization", "id": "first"}),
+            ("organization", {"resourceType": "Organization", "id": "second"}),
+            (
+                "practitioner-role",
+                {
+                    "resourceType": "PractitionerRole",
+                    "organization": {"reference": "organization"},
+                },
+            ),
+        )
+
+        graph = ReferenceGraph(bundle)
+
+        assert graph.duplicate_full_urls == ["organization"]
+        organization = graph.resolve("practitioner-role", "organization")
+        assert organization is not None
+        assert organization.id == "first"
+
+    def test_resolve_relative_reference(self) -> None:
+        bundle = _create_bundle(
+            (
+                "https://example.org/fhir/Organization/123",
+                {"resourceType": "Organization", "id": "123"},
+            ),
+            (
+                "practitioner-role",
+                {
+                    "resourceType": "PractitionerRole",
+                    "organization": {"reference": "Organization/123"},
+                },
+            ),
+        )
+
+        graph = ReferenceGraph(bundle)
+
+        assert graph.dangling_references == []
+        assert graph.references_to("https://example.org/fhir/Organization/123") == [
+            LiteralReference(
+                source="practitioner-role",
+                path="organization",
+                reference="Organization/123",
+                target="https://example.org/fhir/Organization/123",
+            )
+        ]
+
+    @pytest.mark.parametrize(
+        ("entries", "expected_cycles"),
+        [
+            pytest.param(
+                [("a", "a")],
+                [["a"]],
+                id="Self reference",
+            ),
+            pytest.param(
+                [("a", "b"), ("b", "c"), ("c", "a")],
+                [["a", "b", "c"]],
+                id="Cycle of three",
+            ),
+            pytest.param(
+                [("a", "b"), ("b", "c"), ("c", "b")],
+                [["b", "c"]],
+                id="Cycle not including the first entry",
+            ),
+            pytest.param(
+                [("a", "c"), ("b", "c"), ("c", None)],
+                [],
+                id="Shared target is not a cycle",
+            ),
+        ],
+    )
+    def test_cycles(
+        self,
+        entries: list[tuple[str, str | None]],
+        expected_cycles: list[list[str]],
+    ) -> None:
+        bundle = _create_bundle(
+            *(
+                (
+                    full_url,
+                    {"resourceType": "Observation"}
+                    | ({"hasMember": [{"reference": target}]} if target else {}),
+                )
+                for full_url, target in entries
+            )
+        )
+
+        assert ReferenceGraph(bundle).cycles == expected_cycles
+
+    def test_long_chain_does_not_recurse(self) -> None:
+        length = 5_000
+        bundle = _create_bundle(
+            *(
+                (
+                    f"observation-{index}",
+                    {
+                        "resourceType": "Observation",
+                        "hasMember": [{"reference": f"observation-{index + 1}"}],
+                    },
+                )
+                for index in range(length)
+            )
+        )
+
+        graph = ReferenceGraph(bundle)
+
+        assert graph.cycles == []
+        assert len(graph.dangling_references) == 1
+
+    def test_retained_json_without_references_not_materialised(self) -> None:
+        observation = Observation.model_validate({"resourceType": "Observation"})
+        observation.retain_encoded_json(b'{"resourceType": "Observation"}')
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(fullUrl="observation", resource=observation),
+                Bundle.Entry(fullUrl="composition", resource=Composition.create()),
+            ],
+        )
+
+        graph = ReferenceGraph(bundle)
+
+        assert graph.references_from("observation") == []
+        assert object.__getattribute__(observation, "_pending") is not None
+
+    def test_retained_json_with_references(self) -> None:
+        encoded = (
+            b'{"resourceType": "ServiceRequest", '
+            b'"requester": {"reference": "organization"}}'
+        )
+        service_request = ServiceRequest.model_validate(
+            {"resourceType": "ServiceRequest"}
+        )
+        service_request.retain_encoded_json(encoded)
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(fullUrl="service-request", resource=service_request),
+                Bundle.Entry(fullUrl="organization", resource=Organization.create()),
+            ],
+        )
+
+        graph = ReferenceGraph(bundle)
+
+        assert isinstance(graph.resolve("service-request", "requester"), Organization)
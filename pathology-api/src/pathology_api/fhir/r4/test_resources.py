@@ -1,4 +1,7 @@
+import copy
 import json
+import pickle
+from collections.abc import Callable
 from typing import Any
 
 import pydantic
@@ -7,8 +10,17 @@ from pydantic import BaseModel
 
 from pathology_api.exception import ValidationError
 
-from .elements import LogicalReference, PatientIdentifier
-from .resources import Bundle, Composition, OperationOutcome, Patient, Resource
+from .elements import LogicalReference, Meta, PatientIdentifier
+from .resources import (
+    BatchResponse,
+    Bundle,
+    Composition,
+    Observation,
+    OpaqueResource,
+    OperationOutcome,
+    Patient,
+    Resource,
+)
 
 
 class TestResource:
@@ -40,6 +52,45 @@ class TestResource:
         assert created_composition.subject.identifier.system == expected_system
         assert created_composition.subject.identifier.value == expected_nhs_number
 
+    def test_resource_deserialisation_nested_bundle(self) -> None:
+        example_json = json.dumps(
+            {
+                "resource": {
+                    "resourceType": "Bundle",
+                    "type": "collection",
+                    "entry": [
+                        {
+                            "fullUrl": "patient",
+                            "resource": {"resourceType": "Patient", "active": True},
+                        }
+                    ],
+                }
+            }
+        )
+
+        created_object = self._TestContainer.model_validate_json(example_json)
+        assert isinstance(created_object.resource, Bundle)
+
+        created_bundle = created_object.resource
+        assert created_bundle.entries is not None
+        assert isinstance(created_bundle.entries[0].resource, Patient)
+        assert created_bundle.entries[0].resource.model_extra == {"active": True}
+
+    def test_resource_validation_existing_instance(self) -> None:
+        expected_resource = Patient.create(id="patient")
+
+        created_object = self._TestContainer(resource=expected_resource)
+
+        assert created_object.resource is expected_resource
+
+    def test_resource_deserialisation_not_an_object(self) -> None:
+        with pytest.raises(
+            pydantic.ValidationError,
+            match="1 validation error for _TestContainer\nresource\n  Unable to "
+            "extract tag using discriminator",
+        ):
+            self._TestContainer.model_validate_json('{"resource": "Patient"}')
+
     def test_resource_deserialisation_unknown_resource(self) -> None:
         expected_resource_type = "UnknownResourceType"
         example_json = json.dumps(
@@ -135,6 +186,49 @@ class TestBundle:
         assert bundle.identifier is None
         assert bundle.entries == [expected_entry]
 
+    def test_create_trusted(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("VERIFY_TRUSTED_RESOURCES", "true")
+        expected_entry = Bundle.Entry(
+            fullUrl="full",
+            resource=Composition.create(
+                subject=LogicalReference(
+                    PatientIdentifier.from_nhs_number("nhs_number")
+                )
+            ),
+        )
+        expected_meta = Meta.with_last_updated()
+
+        bundle = Bundle.create_trusted(
+            type="document",
+            meta=expected_meta,
+            entry=[expected_entry],
+        )
+
+        assert bundle.resource_type == "Bundle"
+        assert bundle.bundle_type == "document"
+        assert bundle.meta == expected_meta
+        assert bundle.entries == [expected_entry]
+        assert bundle == Bundle.create(
+            type="document", meta=expected_meta, entry=[expected_entry]
+        )
+
+    def test_create_trusted_invalid_values_not_verified(self) -> None:
+        bundle = Bundle.create_trusted(type="invalid")
+
+        assert str(bundle.bundle_type) == "invalid"
+
+    def test_create_trusted_invalid_values_verified(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("VERIFY_TRUSTED_RESOURCES", "true")
+
+        with pytest.raises(
+            AssertionError,
+            match="Trusted Bundle failed validation: 1 validation error for Bundle\n"
+            "type\n  Input should be 'document'",
+        ):
+            Bundle.create_trusted(type="invalid")
+
     def test_create_without_entries(self) -> None:
         bundle = Bundle.empty("document")
 
@@ -211,6 +305,76 @@ class TestBundle:
         result = bundle.find_resources(Patient)
         assert result == []
 
+    def test_find_resources_by_base_class(self) -> None:
+        patient = Patient.create()
+        observation = Observation.create()
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(fullUrl="patient", resource=patient),
+                Bundle.Entry(fullUrl="composition", resource=self.expected_resource),
+                Bundle.Entry(fullUrl="observation", resource=observation),
+            ],
+        )
+
+        assert bundle.find_resources(OpaqueResource) == [patient, observation]
+        assert bundle.find_resources(Resource) == [
+            patient,
+            self.expected_resource,
+            observation,
+        ]
+
+    def test_find_resources_result_does_not_modify_bundle(self) -> None:
+        bundle = Bundle.create(
+            type="document",
+            entry=[Bundle.Entry(fullUrl="fullUrl", resource=self.expected_resource)],
+        )
+
+        bundle.find_resources(Composition).clear()
+
+        assert bundle.find_resources(Composition) == [self.expected_resource]
+
+    def test_first_of(self) -> None:
+        first = Patient.create(id="first")
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(fullUrl="composition", resource=self.expected_resource),
+                Bundle.Entry(fullUrl="first", resource=first),
+                Bundle.Entry(fullUrl="second", resource=Patient.create(id="second")),
+            ],
+        )
+
+        assert bundle.first_of(Patient) is first
+        assert bundle.first_of(Observation) is None
+
+    def test_first_of_without_entries(self) -> None:
+        assert Bundle.empty("document").first_of(Patient) is None
+
+    @pytest.mark.parametrize(
+        ("full_url", "expected_id"),
+        [
+            pytest.param("patient", "first", id="Duplicate fullUrl returns first"),
+            pytest.param("observation", "observation", id="Unique fullUrl"),
+            pytest.param("unknown", None, id="Unknown fullUrl"),
+        ],
+    )
+    def test_get_by_full_url(self, full_url: str, expected_id: str | None) -> None:
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(fullUrl="patient", resource=Patient.create(id="first")),
+                Bundle.Entry(fullUrl="patient", resource=Patient.create(id="second")),
+                Bundle.Entry(
+                    fullUrl="observation", resource=Observation.create(id="observation")
+                ),
+            ],
+        )
+
+        resource = bundle.get_by_full_url(full_url)
+
+        assert (resource.id if resource else None) == expected_id
+
     def test_deserialise_without_type(self) -> None:
         with pytest.raises(
             pydantic.ValidationError,
@@ -220,7 +384,86 @@ class TestBundle:
             Bundle.model_validate_json('{"resourceType": "Bundle"}')
 
 
+class TestOpaqueResource:
+    _ENCODED = b'{"resourceType": "Observation", "id": "obs", "status": "final"}'
+
+    def _create_retaining(self) -> OpaqueResource:
+        observation = Observation.model_validate(
+            {"resourceType": "Observation", "id": "obs"}
+        )
+        observation.retain_encoded_json(self._ENCODED)
+        return observation
+
+    def test_encoded_json_not_retained(self) -> None:
+        observation = Observation.model_validate(json.loads(self._ENCODED))
+
+        assert observation.encoded_json() is None
+        assert observation.model_extra == {"status": "final"}
+
+    def test_extra_fields_materialised_on_access(self) -> None:
+        observation = self._create_retaining()
+
+        assert observation.encoded_json() == self._ENCODED
+        assert getattr(observation, "status") == "final"  # noqa: B009
+        assert observation.model_extra == {"status": "final"}
+        assert observation.encoded_json() == self._ENCODED
+
+    def test_equal_to_materialised_resource(self) -> None:
+        expected = Observation.model_validate(json.loads(self._ENCODED))
+
+        assert self._create_retaining() == expected
+        assert expected == self._create_retaining()
+
+    def test_model_dump_materialises_extra_fields(self) -> None:
+        observation = self._create_retaining()
+
+        assert observation.model_dump(by_alias=True, exclude_none=True) == json.loads(
+            self._ENCODED
+        )
+
+    def test_setattr_discards_encoded_json(self) -> None:
+        observation = self._create_retaining()
+
+        observation.status = "amended"
+
+        assert observation.encoded_json() is None
+        assert observation.model_dump(by_alias=True, exclude_none=True) == {
+            "resourceType": "Observation",
+            "id": "obs",
+            "status": "amended",
+        }
+
+    @pytest.mark.parametrize(
+        "duplicate",
+        [
+            pytest.param(copy.copy, id="copy"),
+            pytest.param(copy.deepcopy, id="deepcopy"),
+            pytest.param(lambda r: pickle.loads(pickle.dumps(r)), id="pickle"),  # noqa: S301
+        ],
+    )
+    def test_duplicate_materialises_extra_fields(
+        self, duplicate: Callable[[OpaqueResource], OpaqueResource]
+    ) -> None:
+        duplicated = duplicate(self._create_retaining())
+
+        assert duplicated.encoded_json() is None
+        assert duplicated.model_extra == {"status": "final"}
+
+    def test_repr_does_not_materialise(self) -> None:
+        observation = self._create_retaining()
+
+        assert repr(observation) == (
+            "Observation(id='obs', meta=None, resource_type='Observation', "
+            f"encoded_json='<{len(self._ENCODED)} bytes>')"
+        )
+        assert object.__getattribute__(observation, "_pending") is not None
+
+
 class TestOperationOutcome:
+    @pytest.fixture(autouse=True)
+    def _verify_trusted_resources(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("VERIFY_TRUSTED_RESOURCES", "true")
+
     def test_create_validation_error(self) -> None:
         expected_diagnostics = "Invalid patient identifier format"
 
@@ -234,6 +477,60 @@ class TestOperationOutcome:
         assert issue["code"] == "invalid"
         assert issue["diagnostics"] == expected_diagnostics
 
+    def test_create_validation_error_multiple_diagnostics(self) -> None:
+        outcome = OperationOutcome.create_validation_error("first", "second")
+
+        assert [issue["diagnostics"] for issue in outcome.issue] == ["first", "second"]
+        assert all(issue["severity"] == "error" for issue in outcome.issue)
+
+    def test_create_not_found(self) -> None:
+        outcome = OperationOutcome.create_not_found("Submission not found")
+
+        assert outcome.resource_type == "OperationOutcome"
+        assert outcome.issue == [
+            {
+                "severity": "error",
+                "code": "not-found",
+                "diagnostics": "Submission not found",
+            }
+        ]
+
+    def test_create_transient_error(self) -> None:
+        outcome = OperationOutcome.create_transient_error("PDM is unavailable")
+
+        assert outcome.resource_type == "OperationOutcome"
+        assert outcome.issue == [
+            {
+                "severity": "error",
+                "code": "transient",
+                "diagnostics": "PDM is unavailable",
+            }
+        ]
+
+    def test_create_timeout_error(self) -> None:
+        outcome = OperationOutcome.create_timeout_error("Validation not completed")
+
+        assert outcome.resource_type == "OperationOutcome"
+        assert outcome.issue == [
+            {
+                "severity": "error",
+                "code": "timeout",
+                "diagnostics": "Validation not completed",
+            }
+        ]
+
+    def test_create_information(self) -> None:
+        outcome = OperationOutcome.create_information("Bundle created")
+
+        assert outcome.resource_type == "OperationOutcome"
+        assert outcome.issue == [
+            {
+                "severity": "information",
+                "code": "informational",
+                "diagnostics": "Bundle created",
+            }
+        ]
+
     @pytest.mark.parametrize(
         ("diagnostics", "expected_diagnostics"),
         [
@@ -261,3 +558,54 @@ class TestOperationOutcome:
         assert issue["severity"] == "fatal"
         assert issue["code"] == "exception"
         assert issue["diagnostics"] == expected_diagnostics
+
+
+class TestBatchResponse:
+    def test_create(self) -> None:
+        bundle = Bundle.create(id="created", type="document", entry=None)
+        outcome = OperationOutcome.create_validation_error("Invalid document")
+
+        batch_response = BatchResponse.create(
+            bundle_id="batch",
+            entries=[
+                BatchResponse.Entry(
+                    resource=bundle,
+                    response=BatchResponse.Response(
+                        status="200 OK",
+                        location="Bundle/created",
+                        lastModified="2026-01-01T00:00:00Z",
+                    ),
+                ),
+                BatchResponse.Entry(
+                    response=BatchResponse.Response(
+                        status="400 Bad Request", outcome=outcome
+                    )
+                ),
+            ],
+        )
+
+        assert batch_response.model_dump(by_alias=True, exclude_none=True) == {
+            "resourceType": "Bundle",
+            "id": "batch",
+            "type": "batch-response",
+            "entry": [
+                {
+                    "resource": {
+                        "resourceType": "Bundle",
+                        "id": "created",
+                        "type": "document",
+                    },
+                    "response": {
+                        "status": "200 OK",
+                        "location": "Bundle/created",
+                        "lastModified": "2026-01-01T00:00:00Z",
+                    },
+                },
+                {
+                    "response": {
+                        "status": "400 Bad Request",
+                        "outcome": outcome.model_dump(by_alias=True, exclude_none=True),
+                    }
+                },
+            ],
+        }
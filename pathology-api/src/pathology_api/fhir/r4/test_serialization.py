@@ -0,0 +1,166 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from pydantic import BaseModel
+
+from .elements import LogicalReference, Meta, PatientIdentifier, UUIDIdentifier
+from .resources import Bundle, Composition, Observation, OperationOutcome, Patient
+from .serialization import dump_json
+
+
+def _composition_entry() -> Bundle.Entry:
+    return Bundle.Entry(
+        fullUrl="composition",
+        resource=Composition.create(
+            subject=LogicalReference(PatientIdentifier.from_nhs_number("nhs_number"))
+        ),
+    )
+
+
+def _observation_entry(index: int) -> Bundle.Entry:
+    return Bundle.Entry(
+        fullUrl=f"observation-{index}",
+        resource=Observation.model_validate(
+            {
+                "resourceType": "Observation",
+                "status": "final",
+                "valueQuantity": {"value": index, "unit": "mg/L", "comparator": None},
+                "note": [{"text": 'Escaped "text" é'}],
+            }
+        ),
+    )
+
+
+class TestDumpJson:
+    @pytest.mark.parametrize(
+        "model",
+        [
+            pytest.param(Bundle.empty("document"), id="Bundle without entries"),
+            pytest.param(Bundle.create(type="document", entry=[]), id="Empty entries"),
+            pytest.param(
+                Bundle.create(
+                    id="id",
+                    meta=Meta.with_last_updated(),
+                    identifier=UUIDIdentifier(),
+                    type="document",
+                    entry=[
+                        _composition_entry(),
+                        *(_observation_entry(index) for index in range(3)),
+                    ],
+                ),
+                id="Bundle with entries",
+            ),
+            pytest.param(
+                Bundle.model_validate(
+                    {
+                        "resourceType": "Bundle",
+                        "type": "document",
+                        "timestamp": "2024-01-01T12:00:00Z",
+                        "signature": None,
+                        "entry": [
+                            {
+                                "fullUrl": "patient",
+                                "resource": {"resourceType": "Patient"},
+                            }
+                        ],
+                    }
+                ),
+                id="Bundle with extra fields",
+            ),
+            pytest.param(
+                Bundle.model_validate(
+                    {
+                        "resourceType": "Bundle",
+                        "type": "document",
+                        "signature": None,
+                        "entry": [],
+                    }
+                ),
+                id="Bundle with only None extra fields",
+            ),
+            pytest.param(
+                Bundle.create(
+                    type="collection",
+                    entry=[
+                        Bundle.Entry(
+                            fullUrl="bundle",
+                            resource=Bundle.create(
+                                type="document", entry=[_composition_entry()]
+                            ),
+                        )
+                    ],
+                ),
+                id="Nested Bundle",
+            ),
+            pytest.param(
+                OperationOutcome.create_validation_error("diagnostics"),
+                id="Validation OperationOutcome",
+            ),
+            pytest.param(
+                OperationOutcome.create_server_error(),
+                id="Server error OperationOutcome",
+            ),
+        ],
+    )
+    @pytest.mark.parametrize("reuse_encoded", [True, False])
+    def test_dump_json_matches_model_dump_json(
+        self, model: BaseModel, reuse_encoded: bool
+    ) -> None:
+        expected = model.model_dump_json(by_alias=True, exclude_none=True).encode()
+
+        assert dump_json(model, reuse_encoded=reuse_encoded) == expected
+
+    def test_dump_json_writes_encoded_resources(self) -> None:
+        encoded_patient = b'{"resourceType": "Patient",  "active": true}'
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                _composition_entry(),
+                Bundle.Entry(fullUrl="patient", resource=Patient.create()),
+                _observation_entry(0),
+                Bundle.Entry(fullUrl="patient-2", resource=Patient.create()),
+            ],
+        )
+
+        with patch.object(Patient, "encoded_json", return_value=encoded_patient):
+            result = dump_json(bundle)
+
+        entries = json.loads(result)["entry"]
+        assert [entry["fullUrl"] for entry in entries] == [
+            "composition",
+            "patient",
+            "observation-0",
+            "patient-2",
+        ]
+        assert entries[1]["resource"] == {"resourceType": "Patient", "active": True}
+        assert encoded_patient in result
+
+    def test_dump_json_writes_encoded_resources_as_received(self) -> None:
+        encoded_patient = b'{"resourceType": "Patient",  "note": null}'
+        patient = Patient.model_validate({"resourceType": "Patient"})
+        patient.retain_encoded_json(encoded_patient)
+        bundle = Bundle.create(
+            type="document",
+            entry=[Bundle.Entry(fullUrl="patient", resource=patient)],
+        )
+
+        result = dump_json(bundle)
+
+        # Retained JSON is not re-serialised, so null values are not excluded.
+        assert encoded_patient in result
+        assert json.loads(result)["entry"][0]["resource"]["note"] is None
+        assert b"note" not in dump_json(bundle, reuse_encoded=False)
+
+    def test_dump_json_ignores_encoded_resources_when_not_reused(self) -> None:
+        bundle = Bundle.create(
+            type="document",
+            entry=[Bundle.Entry(fullUrl="patient", resource=Patient.create())],
+        )
+
+        with patch.object(Patient, "encoded_json", return_value=b"{}"):
+            result = dump_json(bundle, reuse_encoded=False)
+
+        assert (
+            result == bundle.model_dump_json(by_alias=True, exclude_none=True).encode()
+        )
@@ -1,51 +1,287 @@
 import uuid
-from collections.abc import Callable
+from functools import reduce
+from typing import Any
 
-from pathology_api.exception import ValidationError
+import pydantic
+
+from pathology_api import config
+from pathology_api.concurrency import map_concurrently
+from pathology_api.deadline import Deadline, DeadlineExceededError
+from pathology_api.exception import (
+    PayloadTooLargeError,
+    RequestInProgressError,
+    UnsupportedMediaTypeError,
+    ValidationError,
+)
 from pathology_api.fhir.r4.elements import Meta
-from pathology_api.fhir.r4.resources import Bundle, Composition
+from pathology_api.fhir.r4.resources import Bundle, Composition, OperationOutcome
+from pathology_api.ingest import Limits, validate_bundle
 from pathology_api.logging import get_logger
+from pathology_api.pdm import PDMClient, PDMError
+from pathology_api.resilience import DependencyUnavailableError
+from pathology_api.rules import RuleContext, RuleEngine, RuleReport
+from pathology_api.transaction import TransactionLimits, to_transactions
 
 _logger = get_logger(__name__)
 
+_SINGLE_COMPOSITION = "Document must include a single Composition resource"
+_COMPOSITION_SUBJECT = "Composition does not define a valid subject identifier"
+_BUNDLE_ID = "Bundles cannot be defined with an existing ID"
+_BUNDLE_TYPE = "Resource must be a bundle of type 'document'"
+
+_rules = RuleEngine()
 
-def _validate_composition(bundle: Bundle) -> None:
-    compositions = bundle.find_resources(t=Composition)
-    if len(compositions) != 1:
-        raise ValidationError("Document must include a single Composition resource")
 
-    subject = compositions[0].subject
-    if subject is None:
-        raise ValidationError("Composition does not define a valid subject identifier")
+@_rules.bundle_rule()
+def _validate_single_composition(bundle: Bundle, _: RuleContext) -> None:
+    if len(bundle.find_resources(t=Composition)) != 1:
+        raise ValidationError(_SINGLE_COMPOSITION)
 
 
-def _validate_bundle(bundle: Bundle) -> None:
+@_rules.resource_rule(Composition, fields=("subject",))
+def _validate_composition_subject(composition: Composition, _: RuleContext) -> None:
+    if composition.subject is None:
+        raise ValidationError(_COMPOSITION_SUBJECT)
+
+
+@_rules.bundle_rule()
+def _validate_bundle_id(bundle: Bundle, _: RuleContext) -> None:
     if bundle.id is not None:
-        raise ValidationError("Bundles cannot be defined with an existing ID")
+        raise ValidationError(_BUNDLE_ID)
+
 
+@_rules.bundle_rule()
+def _validate_bundle_type(bundle: Bundle, _: RuleContext) -> None:
     if bundle.bundle_type != "document":
-        raise ValidationError("Resource must be a bundle of type 'document'")
+        raise ValidationError(_BUNDLE_TYPE)
+
+
+def prescreen_request(payload: Any) -> None:
+    """
+    Check the top level invariants of a request against its parsed JSON payload,
+    before a Bundle is validated from it, so that requests failing them are rejected
+    without the cost of building the Bundle. Failures are reported with the same
+    messages, in the same order, as handle_request. Anything that cannot be checked
+    without validating the payload is left to full validation.
+    Args:
+        payload: The parsed JSON payload of the request.
+    Raises:
+        ValidationError: If the payload fails any of the checked invariants.
+    """
+    # Payloads missing required fields are left for full validation to report.
+    if not isinstance(payload, dict) or not {"resourceType", "type"} <= payload.keys():
+        return
+
+    resource_type = payload["resourceType"]
+    if resource_type != "Bundle":
+        raise ValidationError(
+            f"Provided resourceType '{resource_type}' does not match required "
+            "resourceType 'Bundle'."
+        )
+
+    entries = payload.get("entry")
+    if entries is not None and not isinstance(entries, list):
+        return
+
+    # Malformed entries are left for full validation to report where they are.
+    resources: list[dict[str, Any]] = []
+    for entry in entries or []:
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if not isinstance(resource, dict):
+            return
+        resources.append(resource)
+
+    compositions = [
+        resource
+        for resource in resources
+        if resource.get("resourceType") == "Composition"
+    ]
+
+    issues = []
+    if len(compositions) != 1:
+        issues.append(_SINGLE_COMPOSITION)
+    if payload.get("id") is not None:
+        issues.append(_BUNDLE_ID)
+    if payload["type"] != "document":
+        issues.append(_BUNDLE_TYPE)
+    if any(composition.get("subject") is None for composition in compositions):
+        issues.append(_COMPOSITION_SUBJECT)
+
+    if issues:
+        raise ValidationError("\n".join(issues), issues=issues)
 
 
-type ValidationFunction = Callable[[Bundle], None]
-_validation_functions: list[ValidationFunction] = [
-    _validate_composition,
-    _validate_bundle,
-]
+def validate_request(bundle: Bundle, deadline: Deadline | None = None) -> RuleReport:
+    """
+    Validate a request Bundle against the validation rules.
+    Args:
+        bundle: The request Bundle.
+        deadline: The deadline validation must complete by, if any.
+    Returns:
+        The violations of the validation rules found.
+    Raises:
+        DeadlineExceededError: If the deadline is reached before validation completes.
+    """
+    report = _rules.validate(bundle, deadline)
+    _logger.debug("Validation rule timings: %s", report.timings)
+    return report
 
 
-def handle_request(bundle: Bundle) -> Bundle:
-    for validate_function in _validation_functions:
-        validate_function(bundle)
+def handle_request(
+    bundle: Bundle,
+    report: RuleReport | None = None,
+    deadline: Deadline | None = None,
+    bundle_id: str | None = None,
+) -> Bundle:
+    if report is None:
+        report = validate_request(bundle, deadline)
+    report.raise_for_violations()
 
-    _logger.debug("Bundle entries: %s", bundle.entries)
-    return_bundle = Bundle.create(
-        id=str(uuid.uuid4()),
+    # Only a summary of the Bundle is logged, as the representation of every entry is
+    # considerably more costly to produce than validating them.
+    _logger.debug("Bundle entry count: %s", len(bundle.entries or []))
+    # The returned Bundle is built from already validated values, so is not validated
+    # again.
+    # A Bundle id derived from the request keeps the resources written to PDM for a
+    # repeated request the same, see to_transactions.
+    return_bundle = Bundle.create_trusted(
+        id=bundle_id or str(uuid.uuid4()),
         meta=Meta.with_last_updated(),
         identifier=bundle.identifier,
         type=bundle.bundle_type,
         entry=bundle.entries,
     )
-    _logger.debug("Return bundle: %s", return_bundle)
+    _logger.debug("Return bundle: %s", return_bundle.id)
 
     return return_bundle
+
+
+def handle_document(
+    payload: Any,
+    limits: Limits | None = None,
+    deadline: Deadline | None = None,
+    bundle_id: str | None = None,
+) -> Bundle:
+    """
+    Validate and handle a document Bundle from its parsed JSON payload, such as an
+    entry of a batch.
+    Args:
+        payload: The parsed JSON payload of the document Bundle.
+        limits: The limits to check the document Bundle against, if any.
+        deadline: The deadline the document Bundle must be handled by, if any.
+        bundle_id: The id to create the Bundle with, derived from the request, if
+            any, otherwise a new id.
+    Returns:
+        The created Bundle.
+    Raises:
+        ValidationError: If the document Bundle is not valid.
+        PayloadTooLargeError: If the document Bundle exceeds the maximum entries of
+            limits.
+        pydantic.ValidationError: If the payload is not a valid Bundle.
+        DeadlineExceededError: If the deadline is reached before the document Bundle
+            has been validated.
+    """
+    if deadline is not None:
+        deadline.check("validation")
+    bundle = validate_bundle(payload, prescreen=prescreen_request, limits=limits)
+    return handle_request(bundle, deadline=deadline, bundle_id=bundle_id)
+
+
+def forward_result(
+    bundle: Bundle,
+    client: PDMClient,
+    deadline: Deadline | None = None,
+    limits: TransactionLimits | None = None,
+    max_concurrent_requests: int | None = None,
+) -> None:
+    """
+    Forward a created Bundle to PDM, as transaction Bundles sent concurrently, across
+    as many threads as requests PDM may be sent at once, so that the time taken does
+    not grow with the number of entries.
+    Args:
+        bundle: The created Bundle.
+        client: The client PDM is sent the transactions via.
+        deadline: The deadline by which PDM must have responded, if any.
+        limits: The limits each transaction must fit within, defaulting to those
+            configured for the service.
+        max_concurrent_requests: The maximum number of transactions sent at once,
+            defaulting to as many requests as PDM may be sent at once. Lowered when
+            several Bundles are forwarded at once, so that they share that limit.
+    Raises:
+        PDMError: If PDM did not accept every transaction.
+        DeadlineExceededError: If the deadline was reached before PDM accepted every
+            transaction.
+    """
+    if deadline is not None:
+        deadline.check("forwarding to PDM")
+    transactions = to_transactions(bundle, limits or TransactionLimits.from_config())
+    results = map_concurrently(
+        lambda transaction: client.post_transaction(
+            transaction.body,
+            request_id=transaction.request_id,
+            deadline=deadline.expires_at if deadline is not None else None,
+        ),
+        transactions,
+        max_workers=min(
+            len(transactions),
+            max_concurrent_requests or config.pdm_max_concurrent_requests(),
+        ),
+    )
+    # Raised once every transaction has completed, so that none are left in flight.
+    for result in results:
+        if isinstance(result, PDMError) and deadline is not None and deadline.expired:
+            # No attempt is made beyond the deadline, so PDM may not have failed.
+            raise DeadlineExceededError("forwarding to PDM") from result
+        if isinstance(result, Exception):
+            raise result
+
+    _logger.info(
+        "Bundle %s forwarded to PDM in %s transactions.", bundle.id, len(transactions)
+    )
+
+
+def error_outcome(exception: Exception) -> tuple[int, OperationOutcome]:
+    """
+    Describe an exception raised whilst handling a request as an OperationOutcome.
+    Args:
+        exception: The exception raised.
+    Returns:
+        The status code, and the OperationOutcome, to respond with.
+    """
+    match exception:
+        case PayloadTooLargeError():
+            return 413, OperationOutcome.create_validation_error(*exception.issues)
+        case UnsupportedMediaTypeError():
+            return 415, OperationOutcome.create_validation_error(*exception.issues)
+        case RequestInProgressError():
+            return 409, OperationOutcome.create_validation_error(*exception.issues)
+        case ValidationError():
+            return 400, OperationOutcome.create_validation_error(*exception.issues)
+        case DeadlineExceededError():
+            return 504, OperationOutcome.create_timeout_error(
+                "The request could not be completed in the time available, as its "
+                f"deadline was reached before {exception.stage} completed. Please try "
+                "again later."
+            )
+        case DependencyUnavailableError():
+            return 503, OperationOutcome.create_transient_error(
+                f"{exception.dependency} is currently unavailable. Please try again "
+                f"in {exception.retry_after} seconds."
+            )
+        case PDMError():
+            return 502, OperationOutcome.create_server_error(
+                "The result could not be forwarded to Patient Data Manager. "
+                "Please try again later."
+            )
+        case pydantic.ValidationError():
+            return 400, OperationOutcome.create_validation_error(
+                reduce(
+                    lambda acc, e: acc + f"{str(e['loc'])} - {e['msg']} \n",
+                    exception.errors(),
+                    "",
+                )
+            )
+        case _:
+            return 500, OperationOutcome.create_server_error(
+                "An unexpected error has occurred. Please try again later."
+            )
@@ -0,0 +1,382 @@
+import hashlib
+import importlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from typing import Any, Literal, Protocol
+
+from pathology_api import config
+from pathology_api.deadline import Deadline
+from pathology_api.exception import RequestInProgressError
+from pathology_api.logging import get_logger
+
+_logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """
+    A response stored against an idempotency key, so that it can be returned for
+    repeated requests.
+    Attributes:
+        status_code: The status code of the response.
+        headers: The headers of the response.
+        body: The body of the response, if it has one.
+    """
+
+    status_code: int
+    headers: Mapping[str, str] = field(default_factory=dict)
+    body: bytes | None = None
+
+
+@dataclass(frozen=True)
+class IdempotencyRecord:
+    """
+    The state of a request stored against an idempotency key.
+    Attributes:
+        status: Whether the request is still being processed, or has completed.
+        expires_at: The time, in seconds since the epoch, after which the record is
+            disregarded.
+        response: The response to the request, once completed.
+    """
+
+    status: Literal["in_progress", "completed"]
+    expires_at: float
+    response: StoredResponse | None = None
+
+    def is_expired(self, now: float | None = None) -> bool:
+        return self.expires_at <= (time.time() if now is None else now)
+
+
+class IdempotencyStore(Protocol):
+    """A backend storing IdempotencyRecords keyed by idempotency key."""
+
+    def claim(self, key: str, record: IdempotencyRecord) -> IdempotencyRecord | None:
+        """
+        Atomically store a record against a key, only if no unexpired record is
+        already stored against it.
+        Args:
+            key: The idempotency key.
+            record: The record to store.
+        Returns:
+            None if the record was stored, otherwise the unexpired record already stored
+            against the key.
+        """
+
+    def get(self, key: str) -> IdempotencyRecord | None:
+        """Retrieve the unexpired record stored against a key, if any."""
+
+    def put(self, key: str, record: IdempotencyRecord) -> None:
+        """Store a record against a key, replacing any record stored against it."""
+
+    def delete(self, key: str) -> None:
+        """Remove any record stored against a key."""
+
+
+class InMemoryIdempotencyStore:
+    """
+    An IdempotencyStore holding records within the current process, evicting the least
+    recently used records once it holds max_entries. Records are only shared between
+    requests handled by the same Lambda instance.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self._max_entries = max_entries
+        self._records: OrderedDict[str, IdempotencyRecord] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def claim(self, key: str, record: IdempotencyRecord) -> IdempotencyRecord | None:
+        with self._lock:
+            existing = self._records.get(key)
+            if existing is not None and not existing.is_expired():
+                self._records.move_to_end(key)
+                return existing
+
+            self._store(key, record)
+            return None
+
+    def get(self, key: str) -> IdempotencyRecord | None:
+        with self._lock:
+            record = self._records.get(key)
+            if record is None or record.is_expired():
+                return None
+            self._records.move_to_end(key)
+            return record
+
+    def put(self, key: str, record: IdempotencyRecord) -> None:
+        with self._lock:
+            self._store(key, record)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._records.pop(key, None)
+
+    def _store(self, key: str, record: IdempotencyRecord) -> None:
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self._max_entries:
+            self._records.popitem(last=False)
+
+
+class DynamoDBClient(Protocol):
+    """The subset of the low level boto3 DynamoDB client used by the API."""
+
+    def put_item(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+    def get_item(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+    def delete_item(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+
+# DynamoDB items are limited to 400 KB, leaving space for the other attributes.
+_MAX_STORED_BODY_BYTES = 384 * 1024
+
+
+class DynamoDBIdempotencyStore:
+    """
+    An IdempotencyStore holding records within a DynamoDB table, shared between every
+    Lambda instance. The table must have a string partition key named "id", and should
+    enable time to live on the "expiration" attribute so that expired records are
+    removed. Response bodies are stored compressed, and responses too large to store
+    within a DynamoDB item even once compressed are not stored.
+    """
+
+    def __init__(self, client: DynamoDBClient, table_name: str):
+        self._client = client
+        self._table_name = table_name
+
+    def claim(self, key: str, record: IdempotencyRecord) -> IdempotencyRecord | None:
+        try:
+            self._client.put_item(
+                TableName=self._table_name,
+                Item=self._to_item(key, record),
+                # Items are only removed by DynamoDB some time after they expire, so
+                # expired items are overwritten.
+                ConditionExpression=(
+                    "attribute_not_exists(#id) OR #expiration <= :now"
+                ),
+                ExpressionAttributeNames={"#id": "id", "#expiration": "expiration"},
+                ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+            )
+            return None
+        except Exception as e:
+            if not _is_conditional_check_failure(e):
+                raise
+
+        existing = self.get(key)
+        if existing is None:
+            # Removed, or expired, between the claim and the read, so claimed again.
+            return self.claim(key, record)
+        return existing
+
+    def get(self, key: str) -> IdempotencyRecord | None:
+        response = self._client.get_item(
+            TableName=self._table_name,
+            Key={"id": {"S": key}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        if item is None:
+            return None
+
+        # Items are only removed by DynamoDB some time after they expire.
+        record = self._from_item(item)
+        return None if record.is_expired() else record
+
+    def put(self, key: str, record: IdempotencyRecord) -> None:
+        item = self._to_item(key, record)
+        body = item.get("body")
+        if body is not None and len(body["B"]) > _MAX_STORED_BODY_BYTES:
+            _logger.warning(
+                "Response of %s bytes is too large to store.", len(body["B"])
+            )
+            self.delete(key)
+            return
+
+        self._client.put_item(TableName=self._table_name, Item=item)
+
+    def delete(self, key: str) -> None:
+        self._client.delete_item(TableName=self._table_name, Key={"id": {"S": key}})
+
+    @staticmethod
+    def _to_item(key: str, record: IdempotencyRecord) -> dict[str, Any]:
+        item: dict[str, Any] = {
+            "id": {"S": key},
+            "status": {"S": record.status},
+            "expiration": {"N": str(int(record.expires_at))},
+        }
+        if record.response is not None:
+            item["status_code"] = {"N": str(record.response.status_code)}
+            item["headers"] = {"S": json.dumps(dict(record.response.headers))}
+            if record.response.body is not None:
+                item["body"] = {"B": zlib.compress(record.response.body)}
+        return item
+
+    @staticmethod
+    def _from_item(item: Mapping[str, Any]) -> IdempotencyRecord:
+        response = None
+        if "status_code" in item:
+            body = item.get("body")
+            response = StoredResponse(
+                status_code=int(item["status_code"]["N"]),
+                headers=json.loads(item["headers"]["S"]),
+                body=zlib.decompress(body["B"]) if body is not None else None,
+            )
+        return IdempotencyRecord(
+            status=item["status"]["S"],
+            expires_at=float(item["expiration"]["N"]),
+            response=response,
+        )
+
+
+def _is_conditional_check_failure(exception: Exception) -> bool:
+    # botocore raises a ClientError describing the failure within its response.
+    response = getattr(exception, "response", None)
+    return (
+        isinstance(response, Mapping)
+        and response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+    )
+
+
+def store_from_config() -> IdempotencyStore:
+    """
+    Create the IdempotencyStore configured for the service, backed by DynamoDB if a
+    table is configured, otherwise held in memory.
+    """
+    table_name = config.idempotency_table_name()
+    if table_name:
+        # boto3 is provided by the Lambda runtime.
+        boto3 = importlib.import_module("boto3")
+        return DynamoDBIdempotencyStore(
+            boto3.client("dynamodb", endpoint_url=config.dynamodb_endpoint_url()),
+            table_name,
+        )
+    return InMemoryIdempotencyStore(config.idempotency_cache_size())
+
+
+def idempotency_key(request_id: str, body: str | bytes | None) -> str:
+    """
+    Create the idempotency key for a request, combining the request id provided by the
+    client with a fingerprint of the request body, so that a request id reused for a
+    different payload is not treated as a repeat.
+    Args:
+        request_id: The X-Request-ID provided with the request.
+        body: The body of the request, as received.
+    Returns:
+        The idempotency key.
+    """
+    encoded = body.encode() if isinstance(body, str) else body or b""
+    return f"{request_id}#{hashlib.sha256(encoded).hexdigest()}"
+
+
+class Idempotency:
+    """
+    Ensures that requests sharing an idempotency key are only processed once, with
+    repeated requests being returned the response stored for the first. Whilst a
+    request is being processed, repeated requests wait for it to complete rather than
+    processing it again. Requests that raise an exception store no response, so are
+    processed again if repeated.
+    """
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        ttl: float = 3600,
+        in_progress_ttl: float = 30,
+        poll_interval: float = 0.05,
+    ):
+        """
+        Args:
+            store: The backend records are stored within.
+            ttl: The time, in seconds, a response is stored for.
+            in_progress_ttl: The time, in seconds, after which a request still being
+                processed is presumed to have failed, allowing it to be processed
+                again. Repeated requests wait for at most this long.
+            poll_interval: The time, in seconds, between checks of whether a request
+                being waited for has completed.
+        """
+        self._store = store
+        self._ttl = ttl
+        self._in_progress_ttl = in_progress_ttl
+        self._poll_interval = poll_interval
+
+    @classmethod
+    def from_config(cls) -> "Idempotency":
+        """
+        Create the Idempotency configured for the service, backed by the store
+        returned by store_from_config.
+        """
+        return cls(
+            store_from_config(),
+            ttl=config.idempotency_ttl_seconds(),
+            in_progress_ttl=config.idempotency_in_progress_seconds(),
+        )
+
+    def run(
+        self,
+        key: str,
+        func: Callable[[], StoredResponse],
+        deadline: Deadline | None = None,
+    ) -> StoredResponse:
+        """
+        Process a request, unless a request with the same idempotency key has already
+        been processed.
+        Args:
+            key: The idempotency key of the request.
+            func: Processes the request, returning its response.
+            deadline: The deadline of the request, if any. Repeated requests stop
+                waiting once it is reached, even if in_progress_ttl has not elapsed.
+        Returns:
+            The response to the request, either as returned by func or as stored for
+            the first request with the same key.
+        Raises:
+            RequestInProgressError: If a request with the same key is still being
+                processed after waiting for it.
+        """
+        wait = self._in_progress_ttl
+        if deadline is not None:
+            wait = min(wait, deadline.remaining())
+        wait_until = time.monotonic() + wait
+        while True:
+            existing = self._store.claim(
+                key,
+                IdempotencyRecord(
+                    status="in_progress",
+                    expires_at=time.time() + self._in_progress_ttl,
+                ),
+            )
+            if existing is None:
+                break
+
+            if existing.response is not None:
+                _logger.info("Returning stored response for repeated request.")
+                return existing.response
+
+            if time.monotonic() >= wait_until:
+                raise RequestInProgressError(
+                    "A request with the same X-Request-ID is already being processed."
+                )
+            time.sleep(self._poll_interval)
+
+        try:
+            response = func()
+        except BaseException:
+            self._store.delete(key)
+            raise
+
+        self._store.put(
+            key,
+            IdempotencyRecord(
+                status="completed",
+                expires_at=time.time() + self._ttl,
+                response=response,
+            ),
+        )
+        return response
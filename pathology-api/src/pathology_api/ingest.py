@@ -0,0 +1,876 @@
+import base64
+import binascii
+import codecs
+import functools
+import io
+import itertools
+import json
+import re
+import zlib
+from array import array
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Any, BinaryIO
+
+import pydantic
+import pydantic_core
+
+from pathology_api import config
+from pathology_api.exception import (
+    PayloadTooLargeError,
+    UnsupportedMediaTypeError,
+    ValidationError,
+)
+from pathology_api.fhir.r4.resources import Bundle, OpaqueResource, Resource
+
+
+@dataclass(frozen=True)
+class Limits:
+    """
+    Limits applied to a request body, each checked as early as possible so that
+    oversized or pathologically nested payloads are rejected before the cost of
+    processing them is incurred.
+    Attributes:
+        max_body_bytes: The maximum size, in bytes, of the decoded body.
+        max_entries: The maximum number of entries within the Bundle.
+        max_depth: The maximum depth to which objects and arrays may be nested.
+    """
+
+    max_body_bytes: int
+    max_entries: int
+    max_depth: int
+
+    @classmethod
+    def from_config(cls) -> "Limits":
+        """Create the Limits configured for the service."""
+        return cls(
+            max_body_bytes=config.max_body_bytes(),
+            max_entries=config.max_entries(),
+            max_depth=config.max_depth(),
+        )
+
+    def check_content_length(self, content_length: str | None) -> None:
+        """
+        Check the Content-Length of a request, if provided, against max_body_bytes, so
+        that an oversized body can be rejected before it is decoded.
+        Args:
+            content_length: The value of the Content-Length header, if provided.
+        Raises:
+            PayloadTooLargeError: If the Content-Length exceeds max_body_bytes.
+        """
+        if content_length is not None and content_length.strip().isdigit():
+            self.check_body_size(int(content_length))
+
+    def check_body_size(self, size: int) -> None:
+        """
+        Check the size of a request body against max_body_bytes.
+        Args:
+            size: The size of the body, in bytes.
+        Raises:
+            PayloadTooLargeError: If the size exceeds max_body_bytes.
+        """
+        if size > self.max_body_bytes:
+            raise PayloadTooLargeError(
+                f"Request body exceeds the maximum size of {self.max_body_bytes} bytes."
+            )
+
+    def check_entry_count(self, count: int) -> None:
+        """
+        Check the number of entries within a Bundle against max_entries.
+        Args:
+            count: The number of entries.
+        Raises:
+            PayloadTooLargeError: If the count exceeds max_entries.
+        """
+        if count > self.max_entries:
+            raise PayloadTooLargeError(
+                f"Bundle exceeds the maximum of {self.max_entries} entries."
+            )
+
+
+def decode_body(
+    body: str | bytes | None,
+    is_base64_encoded: bool = False,
+    limits: Limits | None = None,
+    content_encoding: str | None = None,
+) -> bytes:
+    """
+    Retrieve the raw bytes of a request body as provided by API Gateway.
+    Args:
+        body: The body of the request, if one was provided.
+        is_base64_encoded: Whether API Gateway has base64 encoded the body.
+        limits: The limits to check the size of the body against, if any. The size of
+            a compressed body is checked both before and whilst it is decompressed.
+        content_encoding: The Content-Encoding of the body, if provided. Bodies
+            encoded via gzip or deflate are decompressed.
+    Returns:
+        The raw bytes of the body, or an empty bytes object if no body was provided.
+    Raises:
+        PayloadTooLargeError: If the body exceeds the maximum size of limits.
+        UnsupportedMediaTypeError: If the body uses an unsupported Content-Encoding.
+        ValidationError: If the body is not valid base64, where base64 encoded, or
+            could not be decompressed.
+    """
+    encodings = _parse_content_encoding(content_encoding)
+    if not body:
+        return b""
+
+    if is_base64_encoded:
+        if limits is not None:
+            # Checked against the decoded size before decoding the body.
+            tail = body[-2:]
+            padding = tail.count("=") if isinstance(tail, str) else tail.count(b"=")
+            limits.check_body_size(len(body) // 4 * 3 - padding)
+        try:
+            decoded = base64.b64decode(body, validate=True)
+        except binascii.Error as e:
+            raise ValidationError("Request body is not valid base64.") from e
+    else:
+        decoded = body.encode() if isinstance(body, str) else body
+        if limits is not None:
+            limits.check_body_size(len(decoded))
+
+    # Encodings are listed in the order they were applied, so are removed in reverse.
+    for encoding in reversed(encodings):
+        decoded = _decompress(decoded, encoding, limits)
+    return decoded
+
+
+_DECOMPRESSION_WBITS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "x-gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+_DECOMPRESSION_CHUNK_SIZE = 64 * 1024
+
+
+def _parse_content_encoding(content_encoding: str | None) -> list[str]:
+    encodings = [
+        encoding.strip().lower() for encoding in (content_encoding or "").split(",")
+    ]
+    encodings = [e for e in encodings if e and e != "identity"]
+
+    unsupported = [e for e in encodings if e not in _DECOMPRESSION_WBITS]
+    if unsupported:
+        raise UnsupportedMediaTypeError(
+            f"Unsupported Content-Encoding: {', '.join(unsupported)}. Supported "
+            f"encodings are gzip and deflate."
+        )
+    return encodings
+
+
+def _decompress(body: bytes, encoding: str, limits: Limits | None) -> bytes:
+    """
+    Decompress body in bounded chunks, checking the size of the output against limits
+    as it is produced, so that a highly compressed body cannot be expanded beyond the
+    maximum size in memory.
+    """
+    wbits = _DECOMPRESSION_WBITS[encoding]
+    # deflate is defined as zlib wrapped data, but is commonly sent as raw deflate data,
+    # which is identified by the absence of a valid zlib header.
+    if encoding == "deflate" and (
+        len(body) < 2 or body[0] & 0x0F != 8 or int.from_bytes(body[:2]) % 31 != 0
+    ):
+        wbits = -zlib.MAX_WBITS
+
+    output = bytearray()
+    remaining = body
+    try:
+        # Each iteration decompresses a single gzip member, of which there may be many.
+        while remaining:
+            decompressor = zlib.decompressobj(wbits)
+            while True:
+                chunk = decompressor.decompress(remaining, _DECOMPRESSION_CHUNK_SIZE)
+                output += chunk
+                if limits is not None:
+                    limits.check_body_size(len(output))
+
+                remaining = decompressor.unconsumed_tail
+                if decompressor.eof or (not remaining and not chunk):
+                    break
+
+            if not decompressor.eof:
+                raise ValidationError("Request body could not be decompressed.")
+            remaining = decompressor.unused_data if wbits > zlib.MAX_WBITS else b""
+    except zlib.error as e:
+        raise ValidationError("Request body could not be decompressed.") from e
+
+    return bytes(output)
+
+
+def parses_incrementally(body: bytes) -> bool:
+    """
+    Whether a request body should be parsed incrementally, see parse_bundle, as it
+    exceeds the configured config.incremental_parse_bytes.
+    """
+    threshold = config.incremental_parse_bytes()
+    return threshold is not None and len(body) > threshold
+
+
+def parse_bundle(
+    body: bytes,
+    retain_encoded: bool = False,
+    prescreen: Callable[[Any], None] | None = None,
+    limits: Limits | None = None,
+    incremental: bool = False,
+) -> Bundle:
+    """
+    Parse and validate a Bundle from the raw JSON bytes of a request body. The body is
+    parsed directly by the pydantic-core JSON parser rather than via the json module.
+    Args:
+        body: The raw JSON bytes of the request body.
+        retain_encoded: Whether entries containing an OpaqueResource should retain
+            the JSON they were provided with, rather than materialising their content.
+            See OpaqueResource.retain_encoded_json.
+        prescreen: A check of the parsed JSON payload completed before the Bundle is
+            validated, raising a ValidationError to reject the payload.
+        limits: The limits to check the nesting depth and number of entries of the
+            payload against, if any. The depth is checked before the body is parsed,
+            and the number of entries before the Bundle is validated.
+        incremental: Whether to parse and validate the entries of the Bundle one at a
+            time, see parse_bundle_stream, rather than parsing the whole payload
+            before validating it. prescreen is given each entry reduced as described
+            by parse_bundle_stream.
+    Returns:
+        The validated Bundle.
+    Raises:
+        ValidationError: If no payload has been provided, the payload is not JSON, or
+            the payload is rejected by prescreen, or the payload nests objects and
+            arrays beyond the maximum depth of limits.
+        PayloadTooLargeError: If the payload exceeds the maximum entries of limits.
+        pydantic.ValidationError: If the payload is not a valid Bundle.
+    """
+    if limits is not None and _exceeds_depth(body, limits.max_depth):
+        raise ValidationError(
+            f"Payload exceeds the maximum nesting depth of {limits.max_depth}."
+        )
+
+    if incremental:
+        # The depth of the whole body has already been checked.
+        return _parse_bundle_stream(
+            _JSONStream(io.BytesIO(body)), retain_encoded, prescreen, limits
+        )
+
+    retained: dict[int, bytes] = {}
+    try:
+        if not body:
+            payload = None
+        elif retain_encoded:
+            payload = _parse_retaining_opaque_resources(body.decode(), retained, limits)
+        else:
+            payload = pydantic_core.from_json(body)
+    except (ValueError, RecursionError) as e:
+        raise ValidationError("Invalid payload provided.") from e
+
+    if payload is None:
+        raise ValidationError(
+            "Resources must be provided as a bundle of type 'document'"
+        )
+
+    bundle = validate_bundle(payload, prescreen=prescreen, limits=limits)
+
+    for index, encoded in retained.items():
+        resource = (bundle.entries or [])[index].resource
+        if isinstance(resource, OpaqueResource):
+            resource.retain_encoded_json(encoded)
+
+    return bundle
+
+
+def validate_bundle(
+    payload: Any,
+    prescreen: Callable[[Any], None] | None = None,
+    limits: Limits | None = None,
+) -> Bundle:
+    """
+    Validate a Bundle from its parsed JSON payload.
+    Args:
+        payload: The parsed JSON payload.
+        prescreen: A check of the payload completed before the Bundle is validated,
+            raising a ValidationError to reject the payload.
+        limits: The limits to check the number of entries of the payload against, if
+            any.
+    Returns:
+        The validated Bundle.
+    Raises:
+        ValidationError: If the payload is rejected by prescreen.
+        PayloadTooLargeError: If the payload exceeds the maximum entries of limits.
+        pydantic.ValidationError: If the payload is not a valid Bundle.
+    """
+    _screen_payload(payload, prescreen, limits)
+
+    # Validating the parsed payload, rather than validating the JSON directly, avoids
+    # pydantic-core converting every extra field of each Resource from its internal
+    # JSON representation individually, which is considerably slower.
+    return Bundle.model_validate(payload, by_alias=True)
+
+
+def screen_bundle(
+    body: bytes,
+    prescreen: Callable[[Any], None] | None = None,
+    limits: Limits | None = None,
+) -> None:
+    """
+    Check the raw JSON bytes of a request body as far as is possible without
+    validating a Bundle from it, so that a request to be processed later can be
+    rejected up front if it will never succeed.
+    Args:
+        body: The raw JSON bytes of the request body.
+        prescreen: A check of the parsed JSON payload, raising a ValidationError to
+            reject the payload.
+        limits: The limits to check the nesting depth and number of entries of the
+            payload against, if any.
+    Raises:
+        ValidationError: If no payload has been provided, the payload is not JSON, or
+            the payload is rejected by prescreen, or the payload nests objects and
+            arrays beyond the maximum depth of limits.
+        PayloadTooLargeError: If the payload exceeds the maximum entries of limits.
+    """
+    if limits is not None and _exceeds_depth(body, limits.max_depth):
+        raise ValidationError(
+            f"Payload exceeds the maximum nesting depth of {limits.max_depth}."
+        )
+
+    try:
+        payload = pydantic_core.from_json(body) if body else None
+    except (ValueError, RecursionError) as e:
+        raise ValidationError("Invalid payload provided.") from e
+
+    if payload is None:
+        raise ValidationError(
+            "Resources must be provided as a bundle of type 'document'"
+        )
+
+    _screen_payload(payload, prescreen, limits)
+
+
+def _screen_payload(
+    payload: Any, prescreen: Callable[[Any], None] | None, limits: Limits | None
+) -> None:
+    if limits is not None:
+        entries = payload.get("entry") if isinstance(payload, dict) else None
+        if isinstance(entries, list):
+            limits.check_entry_count(len(entries))
+
+    if prescreen is not None:
+        prescreen(payload)
+
+
+# The depth at which the Resources of a batch Bundle's entries are nested, within the
+# Bundle object, its entry array and each entry object.
+_BATCH_RESOURCE_DEPTH = 3
+
+
+def parse_batch(
+    body: bytes, max_entries: int, limits: Limits | None = None
+) -> list[Any]:
+    """
+    Parse a batch Bundle from the raw JSON bytes of a request body. Only the batch
+    Bundle itself is checked, with each of its entries left to be validated
+    independently.
+    Args:
+        body: The raw JSON bytes of the request body.
+        max_entries: The maximum number of entries within the batch.
+        limits: The limits to check the nesting depth of the payload against, if any,
+            applied to the Resource of each entry.
+    Returns:
+        The parsed JSON payload of each entry of the batch.
+    Raises:
+        ValidationError: If the payload is not JSON, is not a batch Bundle, or nests
+            objects and arrays beyond the maximum depth of limits.
+        PayloadTooLargeError: If the batch exceeds max_entries.
+    """
+    if limits is not None:
+        max_depth = limits.max_depth + _BATCH_RESOURCE_DEPTH
+        if _exceeds_depth(body, max_depth):
+            raise ValidationError(
+                f"Payload exceeds the maximum nesting depth of {limits.max_depth}."
+            )
+
+    try:
+        payload = pydantic_core.from_json(body) if body else None
+    except (ValueError, RecursionError) as e:
+        raise ValidationError("Invalid payload provided.") from e
+
+    if (
+        not isinstance(payload, dict)
+        or payload.get("resourceType") != "Bundle"
+        or payload.get("type") != "batch"
+    ):
+        raise ValidationError("Resources must be provided as a bundle of type 'batch'")
+
+    entries = payload.get("entry")
+    if entries is None:
+        return []
+    if not isinstance(entries, list):
+        raise ValidationError("Bundle entries must be provided as a list.")
+
+    if len(entries) > max_entries:
+        raise PayloadTooLargeError(
+            f"Batch exceeds the maximum of {max_entries} entries."
+        )
+    return entries
+
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# A property name without any escape sequences, and the separator that follows it.
+_PROPERTY_NAME = re.compile(r'"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*')
+# The delimiter following a value within an object or array.
+_OBJECT_DELIMITER = re.compile(r"[ \t\n\r]*([,}])[ \t\n\r]*")
+_ARRAY_DELIMITER = re.compile(r"[ \t\n\r]*([,\]])[ \t\n\r]*")
+
+
+def _parse_retaining_opaque_resources(
+    text: str, retained: dict[int, bytes], limits: Limits | None
+) -> Any:
+    """
+    Parse a JSON Bundle, replacing the content of each entry containing an
+    OpaqueResource with only the fields that Resource defines, and recording the JSON of
+    that Resource against the index of its entry within retained. Any other JSON is
+    parsed as normal, leaving it to be rejected on validation.
+    """
+
+    def parse_value(key: str, index: int) -> tuple[Any, int]:
+        if key == "entry":
+            return _parse_entries(text, index, retained, limits)
+        return _DECODER.raw_decode(text, index)
+
+    payload, index = _parse_object(text, _skip_whitespace(text, 0), parse_value)
+
+    if _skip_whitespace(text, index) != len(text):
+        raise json.JSONDecodeError("Extra data", text, index)
+    return payload
+
+
+def _parse_entries(
+    text: str, index: int, retained: dict[int, bytes], limits: Limits | None
+) -> tuple[Any, int]:
+    # Where the entry key is repeated the last value is kept, as by json, so anything
+    # retained from the entries of an earlier value no longer applies.
+    retained.clear()
+    if not text.startswith("[", index):
+        return _DECODER.raw_decode(text, index)
+
+    entries: list[Any] = []
+    index = _skip_whitespace(text, index + 1)
+    if text.startswith("]", index):
+        return entries, index + 1
+
+    def parse_value(key: str, index: int) -> tuple[Any, int]:
+        if key == "resource":
+            return _parse_resource(text, index, len(entries), retained)
+        return _DECODER.raw_decode(text, index)
+
+    while True:
+        entry, index = _parse_object(text, index, parse_value)
+        entries.append(entry)
+        # Checked as each entry is parsed, so that parsing stops once exceeded.
+        if limits is not None:
+            limits.check_entry_count(len(entries))
+
+        delimiter, index = _parse_delimiter(_ARRAY_DELIMITER, text, index)
+        if delimiter == "]":
+            return entries, index
+
+
+def _parse_resource(
+    text: str, index: int, entry_index: int, retained: dict[int, bytes]
+) -> tuple[Any, int]:
+    resource, end = _DECODER.raw_decode(text, index)
+    if not isinstance(resource, dict):
+        return resource, end
+
+    resource_type = resource.get("resourceType")
+    subclass = (
+        Resource.get_subclass(resource_type) if isinstance(resource_type, str) else None
+    )
+    if subclass is None or not issubclass(subclass, OpaqueResource):
+        return resource, end
+
+    retained[entry_index] = text[index:end].encode()
+    return {
+        key: resource[key] for key in _defined_fields(subclass) if key in resource
+    }, end
+
+
+@functools.cache
+def _defined_fields(resource_type: type[Resource]) -> frozenset[str]:
+    return frozenset(
+        field.alias or name for name, field in resource_type.model_fields.items()
+    )
+
+
+type _ValueParser = Callable[[str, int], tuple[Any, int]]
+
+
+def _parse_object(text: str, index: int, parse_value: _ValueParser) -> tuple[Any, int]:
+    """
+    Parse a JSON object, utilising parse_value to parse the value of each of its keys.
+    If the value at index is not an object it is parsed as normal.
+    """
+    if not text.startswith("{", index):
+        return _DECODER.raw_decode(text, index)
+
+    result: dict[str, Any] = {}
+    index = _skip_whitespace(text, index + 1)
+    if text.startswith("}", index):
+        return result, index + 1
+
+    while True:
+        key, index = _parse_property_name(text, index)
+        result[key], index = parse_value(key, index)
+
+        delimiter, index = _parse_delimiter(_OBJECT_DELIMITER, text, index)
+        if delimiter == "}":
+            return result, index
+
+
+def _parse_property_name(text: str, index: int) -> tuple[str, int]:
+    match = _PROPERTY_NAME.match(text, index)
+    if match is not None:
+        return match.group(1), match.end()
+
+    # Property names including escape sequences are decoded by the json module.
+    if not text.startswith('"', index):
+        raise json.JSONDecodeError(
+            "Expecting property name enclosed in double quotes", text, index
+        )
+    key, index = _DECODER.raw_decode(text, index)
+
+    index = _skip_whitespace(text, index)
+    if not text.startswith(":", index):
+        raise json.JSONDecodeError("Expecting ':' delimiter", text, index)
+    return key, _skip_whitespace(text, index + 1)
+
+
+def _parse_delimiter(
+    pattern: re.Pattern[str], text: str, index: int
+) -> tuple[str, int]:
+    match = pattern.match(text, index)
+    if match is None:
+        raise json.JSONDecodeError("Expecting ',' delimiter", text, index)
+    return match.group(1), match.end()
+
+
+def _skip_whitespace(text: str, index: int) -> int:
+    match = _WHITESPACE.match(text, index)
+    return match.end() if match else index
+
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class _JSONStream:
+    """
+    A window over the JSON text of a binary stream, from which values are parsed in
+    turn. The stream is read in chunks as more text is needed, and text is discarded
+    once parsed, so that the window only grows to hold the largest single value.
+    Failures to parse are raised as a ValidationError. The size of the stream, and the
+    depth of each value parsed, are checked against limits, if provided.
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        limits: Limits | None = None,
+        chunk_size: int = _STREAM_CHUNK_SIZE,
+    ):
+        self._stream = stream
+        self._limits = limits
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._index = 0
+        self._bytes_read = 0
+        self._exhausted = False
+
+    def peek(self) -> str:
+        """The next non-whitespace character, or an empty string at the end."""
+        while True:
+            self._index = _skip_whitespace(self._text, self._index)
+            if self._index < len(self._text):
+                return self._text[self._index]
+            if not self._read(self._chunk_size):
+                return ""
+
+    def expect(self, characters: str) -> str:
+        """Consume the next non-whitespace character, which must be in characters."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValidationError("Invalid payload provided.")
+        self._index += 1
+        return character
+
+    def parse(self, parse_value: _ValueParser, depth: int = 0) -> Any:
+        """
+        Parse the next value via parse_value, reading further text until it can be
+        parsed in full.
+        Args:
+            parse_value: Parses the value starting at an index of the text.
+            depth: The depth at which the value is nested within the payload.
+        Returns:
+            The parsed value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = parse_value(self._text, self._index)
+            except RecursionError as e:
+                raise ValidationError("Invalid payload provided.") from e
+            except ValueError as e:
+                # The value may be incomplete, only being valid once more is read.
+                # Reading at least as much again as is held keeps the total cost of
+                # parsing a value spanning many chunks linear in its size.
+                if not self._read(len(self._text) - self._index):
+                    raise ValidationError("Invalid payload provided.") from e
+                continue
+
+            # A value ending with the text, such as a number, may continue beyond it.
+            if end == len(self._text) and self._read(self._chunk_size):
+                continue
+
+            if self._limits is not None and _exceeds_depth(
+                self._text[self._index : end].encode(), self._limits.max_depth - depth
+            ):
+                raise ValidationError(
+                    "Payload exceeds the maximum nesting depth of "
+                    f"{self._limits.max_depth}."
+                )
+            self._index = end
+            return value
+
+    def _read(self, size: int) -> bool:
+        if self._exhausted:
+            return False
+
+        data = self._stream.read(max(size, self._chunk_size))
+        self._bytes_read += len(data)
+        if self._limits is not None:
+            self._limits.check_body_size(self._bytes_read)
+
+        self._text = self._text[self._index :]
+        self._index = 0
+        try:
+            self._text += self._decoder.decode(data, final=not data)
+        except UnicodeDecodeError as e:
+            raise ValidationError("Invalid payload provided.") from e
+
+        self._exhausted = not data
+        return bool(data)
+
+
+def parse_bundle_stream(
+    stream: BinaryIO,
+    retain_encoded: bool = False,
+    prescreen: Callable[[Any], None] | None = None,
+    limits: Limits | None = None,
+    chunk_size: int = _STREAM_CHUNK_SIZE,
+) -> Bundle:
+    """
+    Parse and validate a Bundle from a binary stream of JSON, parsing and validating
+    each of its entries as it is read, so that the payload is never held whole. Beyond
+    the Bundle itself, memory is only required for the largest single entry, and
+    parsing stops at the first invalid entry rather than once the whole payload has
+    been read.
+    Args:
+        stream: The stream of JSON bytes.
+        retain_encoded: Whether entries containing an OpaqueResource should retain
+            the JSON they were provided with. See parse_bundle.
+        prescreen: A check of the parsed JSON payload completed once every entry has
+            been validated, but before the Bundle is, raising a ValidationError to
+            reject the payload. As the payload is never held whole, each entry other
+            than the Composition heading the document is reduced to the
+            resourceType of its resource.
+        limits: The limits to check the size, nesting depth and number of entries of
+            the payload against, if any, each checked as the payload is read.
+        chunk_size: The number of bytes read from the stream at once.
+    Returns:
+        The validated Bundle.
+    Raises:
+        ValidationError: If no payload has been provided, the payload is not JSON, the
+            payload is rejected by prescreen, or the payload nests objects and arrays
+            beyond the maximum depth of limits.
+        PayloadTooLargeError: If the payload exceeds the maximum size or entries of
+            limits.
+        pydantic.ValidationError: If the payload is not a valid Bundle, describing
+            only the first invalid entry.
+    """
+    return _parse_bundle_stream(
+        _JSONStream(stream, limits, chunk_size), retain_encoded, prescreen, limits
+    )
+
+
+# The depth at which each value within a Bundle is nested, and at which each entry is
+# nested within the entry array.
+_BUNDLE_VALUE_DEPTH = 1
+_BUNDLE_ENTRY_DEPTH = 2
+
+
+def _parse_bundle_stream(
+    stream: _JSONStream,
+    retain_encoded: bool,
+    prescreen: Callable[[Any], None] | None,
+    limits: Limits | None,
+) -> Bundle:
+    if stream.peek() != "{":
+        # Anything other than an object is parsed as normal, leaving it to be rejected.
+        payload = stream.parse(_DECODER.raw_decode) if stream.peek() else None
+        if payload is None:
+            raise ValidationError(
+                "Resources must be provided as a bundle of type 'document'"
+            )
+        if prescreen is not None:
+            prescreen(payload)
+        return Bundle.model_validate(payload, by_alias=True)
+
+    stream.expect("{")
+    fields: dict[str, Any] = {}
+    screened: dict[str, Any] = {}
+    if stream.peek() == "}":
+        stream.expect("}")
+    else:
+        while True:
+            key = stream.parse(_parse_property_name)
+            if key == "entry":
+                fields[key], screened[key] = _parse_entries_stream(
+                    stream, retain_encoded, limits
+                )
+            else:
+                fields[key] = stream.parse(_DECODER.raw_decode, _BUNDLE_VALUE_DEPTH)
+                screened[key] = fields[key]
+
+            if stream.expect(",}") == "}":
+                break
+
+    if stream.peek():
+        raise ValidationError("Invalid payload provided.")
+
+    if prescreen is not None:
+        prescreen(screened)
+
+    # Validated entries are not validated again by the Bundle.
+    return Bundle.model_validate(fields, by_alias=True)
+
+
+def _parse_entries_stream(
+    stream: _JSONStream, retain_encoded: bool, limits: Limits | None
+) -> tuple[Any, Any]:
+    """
+    Parse and validate the entries of a Bundle, returning them along with each entry
+    reduced as it is to be given to a prescreen.
+    """
+    if stream.peek() != "[":
+        # Parsed as normal, leaving it to be rejected on validation.
+        payload = stream.parse(_DECODER.raw_decode, _BUNDLE_VALUE_DEPTH)
+        return payload, payload
+
+    stream.expect("[")
+    entries: list[Bundle.Entry] = []
+    screened: list[Any] = []
+    if stream.peek() == "]":
+        stream.expect("]")
+        return entries, screened
+
+    while True:
+        retained: dict[int, bytes] = {}
+        payload = stream.parse(
+            _entry_parser(retained) if retain_encoded else _DECODER.raw_decode,
+            _BUNDLE_ENTRY_DEPTH,
+        )
+        if limits is not None:
+            limits.check_entry_count(len(entries) + 1)
+
+        entries.append(_validate_entry(payload, len(entries), retained.get(0)))
+        screened.append(_screened_entry(payload))
+        if stream.expect(",]") == "]":
+            return entries, screened
+
+
+def _screened_entry(payload: Any) -> Any:
+    resource = payload.get("resource") if isinstance(payload, dict) else None
+    if not isinstance(resource, dict):
+        return {}
+    if resource.get("resourceType") == "Composition":
+        return payload
+    return {"resource": {"resourceType": resource.get("resourceType")}}
+
+
+def _entry_parser(retained: dict[int, bytes]) -> _ValueParser:
+    """
+    Create a parser of a single entry, retaining the JSON of any OpaqueResource it
+    contains within retained, against index 0.
+    """
+
+    def parse_entry(text: str, index: int) -> tuple[Any, int]:
+        def parse_value(key: str, index: int) -> tuple[Any, int]:
+            if key == "resource":
+                return _parse_resource(text, index, 0, retained)
+            return _DECODER.raw_decode(text, index)
+
+        return _parse_object(text, index, parse_value)
+
+    return parse_entry
+
+
+def _validate_entry(payload: Any, index: int, encoded: bytes | None) -> Bundle.Entry:
+    try:
+        entry = Bundle.Entry.model_validate(payload, by_alias=True)
+    except pydantic.ValidationError as e:
+        raise _located_within(e, ("entry", index)) from None
+
+    if encoded is not None and isinstance(entry.resource, OpaqueResource):
+        entry.resource.retain_encoded_json(encoded)
+    return entry
+
+
+def _located_within(
+    error: pydantic.ValidationError, location: Sequence[str | int]
+) -> pydantic.ValidationError:
+    """
+    Recreate a ValidationError raised validating part of a Bundle, with each error
+    located as if raised validating the whole Bundle.
+    """
+    return pydantic.ValidationError.from_exception_data(
+        Bundle.__name__,
+        [
+            {
+                "type": pydantic_core.PydanticCustomError(e["type"], e["msg"]),
+                "loc": (*location, *e["loc"]),
+                "input": e["input"],
+            }
+            for e in error.errors(include_url=False)
+        ],
+    )
+
+
+_NON_STRUCTURAL = bytes(b for b in range(256) if b not in b'"[]{}')
+# Maps opening brackets to 1 and closing brackets to -1, as signed bytes.
+_DEPTH_CHANGES = bytes.maketrans(b"[{]}", b"\x01\x01\xff\xff")
+
+
+def _exceeds_depth(body: bytes, max_depth: int) -> bool:
+    """
+    Whether the JSON of body nests objects and arrays beyond max_depth, found without
+    parsing it. Every step is completed by the bytes implementation, or an iterator
+    implemented in C, in time linear in the size of body, rather than per byte in
+    Python. Malformed JSON produces an arbitrary depth, leaving it to be rejected on
+    parsing.
+    """
+    if b"\\" in body:
+        # Escaped backslashes are removed first, so that any backslash remaining before
+        # a quote escapes that quote.
+        body = body.replace(b"\\\\", b"").replace(b'\\"', b"")
+
+    # Reduce the body to its brackets and the quotes delimiting its strings. Removing
+    # adjacent quotes never changes whether a bracket is within a string, so this
+    # leaves quotes only around the, typically few, strings that contain brackets.
+    structure = body.translate(None, _NON_STRUCTURAL).replace(b'""', b"")
+    if b'"' in structure:
+        structure = b"".join(structure.split(b'"')[::2])
+
+    changes = structure.translate(_DEPTH_CHANGES)
+    # A run of opening brackets beyond max_depth is found without summing every change.
+    if b"\x01" * (max_depth + 1) in changes:
+        return True
+    return max(itertools.accumulate(array("b", changes)), default=0) > max_depth
@@ -0,0 +1,424 @@
+"""
+Publishing of events to the Multicast Notification Service (MNS), notifying GP systems
+of created results.
+"""
+
+import json
+import threading
+import uuid
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import pydantic_core
+
+from pathology_api import config
+from pathology_api.concurrency import map_concurrently
+from pathology_api.connections import ServiceClient, ServiceError, ServiceResponse
+from pathology_api.fhir.r4.references import ReferenceGraph
+from pathology_api.fhir.r4.resources import (
+    Bundle,
+    Composition,
+    DiagnosticReport,
+    Organization,
+    ServiceRequest,
+)
+from pathology_api.logging import get_logger
+from pathology_api.resilience import Dependency
+from pathology_api.transaction import written_references
+from pathology_api.work_queue import (
+    MessageTooLargeError,
+    QueuedMessage,
+    WorkQueue,
+    queue_from_config,
+)
+
+_logger = get_logger(__name__)
+
+_ODS_CODE_SYSTEM = "https://fhir.nhs.uk/Id/ods-organization-code"
+
+_EVENT_SOURCE = "uk.nhs.pathology-laboratory-medicine-reporting"
+_EVENT_TYPE = "pathology-laboratory-result-created-1"
+
+# Events are published in the batched mode of the CloudEvents HTTP binding.
+_BATCH_CONTENT_TYPE = "application/cloudevents-batch+json"
+
+
+class MNSError(ServiceError):
+    """
+    Raised when events are not accepted by MNS, once any retries have been exhausted.
+    Attributes:
+        response: The final response received from MNS, if any was received.
+    """
+
+
+class MNSClient(ServiceClient):
+    """
+    A client for the MNS events endpoint. Connections are pooled, and requests
+    retried, as described by ServiceClient.
+    """
+
+    service_name = "MNS"
+    error_type = MNSError
+    media_type = "application/json"
+
+    def publish(
+        self,
+        events: Sequence[Mapping[str, Any]],
+        request_id: str,
+        deadline: float | None = None,
+    ) -> ServiceResponse:
+        """
+        Publish a batch of events in a single request.
+        Args:
+            events: The events, each a CloudEvent in its JSON form.
+            request_id: Identifies the request to MNS, see request.
+            deadline: The time by which a response is needed, see request.
+        Returns:
+            The successful response from MNS.
+        Raises:
+            MNSError: If the events were not accepted.
+        """
+        response = self.request(
+            "POST",
+            "",
+            request_id,
+            body=pydantic_core.to_json(list(events)),
+            deadline=deadline,
+            content_type=_BATCH_CONTENT_TYPE,
+        )
+        if not response.ok:
+            raise MNSError(
+                f"MNS rejected the events with status {response.status_code}.",
+                response=response,
+            )
+        return response
+
+
+@dataclass(frozen=True)
+class MNSEvent:
+    """
+    An event to be published to MNS.
+    Attributes:
+        ods_code: The ODS code of the organisation the event is for.
+        content: The event, as a CloudEvent in its JSON form.
+    """
+
+    ods_code: str
+    content: Mapping[str, Any]
+
+
+def result_event(bundle: Bundle) -> MNSEvent | None:
+    """
+    Create the event notifying the organisation that requested a result that it has
+    been created.
+
+    The organisation is the Organization referenced by the PractitionerRole that
+    requested the ServiceRequest. If the references between them do not resolve, the
+    Bundle's only Organization with an ODS code is used instead. The event refers to
+    the DiagnosticReport, or failing that the Composition, as written to PDM.
+    Args:
+        bundle: The created document Bundle, as returned by handle_request.
+    Returns:
+        The event, or None if the requesting organisation cannot be identified.
+    """
+    ods_code = _requesting_ods_code(bundle)
+    if ods_code is None:
+        return None
+
+    content: dict[str, Any] = {
+        "specversion": "1.0",
+        # Derived from the Bundle, so that a result is only ever notified once.
+        "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"Bundle/{bundle.id}")),
+        "source": _EVENT_SOURCE,
+        "type": _EVENT_TYPE,
+        "filtering": {"generalpractitioner": ods_code},
+    }
+    dataref = _dataref(bundle)
+    if dataref is not None:
+        content["dataref"] = dataref
+    if bundle.meta is not None and bundle.meta.last_updated is not None:
+        content["time"] = bundle.meta.last_updated.isoformat()
+
+    composition = bundle.first_of(Composition)
+    if composition is not None and composition.subject is not None:
+        content["subject"] = composition.subject.identifier.value
+
+    return MNSEvent(ods_code=ods_code, content=content)
+
+
+def _dataref(bundle: Bundle) -> str | None:
+    entries = bundle.entries or []
+    references = written_references(bundle)
+    for resource_type in (DiagnosticReport, Composition):
+        for entry, reference in zip(entries, references, strict=True):
+            if isinstance(entry.resource, resource_type):
+                return reference
+    return None
+
+
+def _requesting_ods_code(bundle: Bundle) -> str | None:
+    graph = ReferenceGraph(bundle)
+    for entry in bundle.entries or []:
+        if not isinstance(entry.resource, ServiceRequest):
+            continue
+
+        role_url = _reference_target(graph, entry.full_url, "requester")
+        if role_url is None:
+            continue
+        organization = graph.resolve(role_url, "organization")
+        if isinstance(organization, Organization):
+            ods_code = _ods_code(organization)
+            if ods_code is not None:
+                return ods_code
+
+    ods_codes = {
+        ods_code
+        for organization in bundle.find_resources(Organization)
+        if (ods_code := _ods_code(organization)) is not None
+    }
+    return ods_codes.pop() if len(ods_codes) == 1 else None
+
+
+def _reference_target(graph: ReferenceGraph, full_url: str, path: str) -> str | None:
+    """The fullUrl of the entry the reference at a path resolves to, if any."""
+    for reference in graph.references_from(full_url):
+        if reference.path == path:
+            return reference.target
+    return None
+
+
+def _ods_code(organization: Organization) -> str | None:
+    identifiers = (organization.model_extra or {}).get("identifier")
+    # Accepted as a single identifier, as well as the list FHIR defines.
+    if isinstance(identifiers, dict):
+        identifiers = [identifiers]
+    if not isinstance(identifiers, list):
+        return None
+
+    for identifier in identifiers:
+        if (
+            isinstance(identifier, dict)
+            and identifier.get("system") == _ODS_CODE_SYSTEM
+            and isinstance(identifier.get("value"), str)
+        ):
+            return str(identifier["value"])
+    return None
+
+
+@dataclass(frozen=True)
+class _Batch:
+    """Events for a single organisation, published in a single request."""
+
+    ods_code: str
+    events: tuple[Mapping[str, Any], ...]
+
+    @property
+    def request_id(self) -> str:
+        # Derived from the events, so that a batch published again is recognised as
+        # a repeat.
+        ids = ",".join(str(event.get("id")) for event in self.events)
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"mns/{self.ods_code}/{ids}"))
+
+    def encode(self) -> str:
+        return json.dumps({"odsCode": self.ods_code, "events": list(self.events)})
+
+    @classmethod
+    def decode(cls, message: str) -> "_Batch":
+        content = json.loads(message)
+        return cls(ods_code=content["odsCode"], events=tuple(content["events"]))
+
+
+class MNSPublisher:
+    """
+    Buffers events to be published to MNS, publishing them in bulk when flushed. Events
+    are grouped by the organisation they are for, each organisation's events being
+    published in as few requests as the maximum batch size allows, rather than one
+    request per event. Events that fail to be published are spooled to a WorkQueue, to
+    be published again later.
+
+    A publisher should be created once and reused, including across warm invocations
+    of a Lambda, so that connections to MNS are kept alive, and flushed before each
+    invocation ends. Publishers are safe to use from multiple threads.
+    """
+
+    def __init__(
+        self,
+        client: MNSClient,
+        spool: WorkQueue,
+        max_batch_events: int = 100,
+        max_workers: int = 4,
+    ):
+        """
+        Args:
+            client: The client events are published via.
+            spool: The queue events that failed to be published are spooled to.
+            max_batch_events: The maximum number of events published in each request.
+            max_workers: The maximum number of requests made at once when flushed.
+        """
+        self._client = client
+        self._spool = spool
+        self._max_batch_events = max(1, max_batch_events)
+        self._max_workers = max_workers
+        self._pending: dict[str, list[Mapping[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """The number of events waiting to be published."""
+        with self._lock:
+            return sum(len(events) for events in self._pending.values())
+
+    def add(self, event: MNSEvent) -> None:
+        """Buffer an event, to be published when the publisher is next flushed."""
+        with self._lock:
+            self._pending.setdefault(event.ods_code, []).append(event.content)
+
+    def add_result(self, bundle: Bundle) -> None:
+        """
+        Buffer the event notifying the requesting organisation of a created result,
+        see result_event. Results whose requesting organisation cannot be identified
+        are logged and not notified.
+        """
+        event = result_event(bundle)
+        if event is None:
+            _logger.warning(
+                "No requesting organisation identified for Bundle %s, so no MNS event "
+                "will be published.",
+                bundle.id,
+            )
+            return
+        self.add(event)
+
+    def flush(self, deadline: float | None = None) -> int:
+        """
+        Publish every buffered event. Batches of events that fail to be published are
+        spooled rather than raised, so that a flush never fails the invocation.
+        Args:
+            deadline: The time, as returned by time.monotonic(), by which every batch
+                must have been published, if any.
+        Returns:
+            The number of events published.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        batches = [
+            _Batch(ods_code, tuple(events[i : i + self._max_batch_events]))
+            for ods_code, events in pending.items()
+            for i in range(0, len(events), self._max_batch_events)
+        ]
+        if not batches:
+            return 0
+
+        results = map_concurrently(
+            lambda batch: self._publish(batch, deadline),
+            batches,
+            max_workers=min(self._max_workers, len(batches)),
+        )
+
+        published = 0
+        for batch, result in zip(batches, results, strict=True):
+            if isinstance(result, Exception):
+                _logger.warning(
+                    "Failed to publish %s MNS events for %s, so spooled: %s",
+                    len(batch.events),
+                    batch.ods_code,
+                    result,
+                )
+                self._spool_batch(batch)
+            else:
+                published += len(batch.events)
+
+        _logger.info("Published %s MNS events in %s requests.", published, len(batches))
+        return published
+
+    def republish(self, messages: Iterable[QueuedMessage]) -> list[QueuedMessage]:
+        """
+        Publish each of a batch of messages received from the spool again.
+        Args:
+            messages: The received messages.
+        Returns:
+            The messages that failed to be published, to be retried.
+        """
+        failed = []
+        for message in messages:
+            try:
+                self._publish(_Batch.decode(message.body), deadline=None)
+            except Exception:
+                _logger.exception("Failed to republish message %s.", message.message_id)
+                failed.append(message)
+        return failed
+
+    def drain_spool(self, batch_size: int = 10) -> int:
+        """
+        Receive and publish messages from the spool again in batches until it is
+        empty, deleting each once published. Messages that fail to be published are
+        left to be received again.
+        Args:
+            batch_size: The maximum number of messages received at once.
+        Returns:
+            The number of messages published.
+        """
+        published = 0
+        while messages := self._spool.receive(batch_size):
+            failed = {message.receipt for message in self.republish(messages)}
+            for message in messages:
+                if message.receipt not in failed:
+                    self._spool.delete(message.receipt)
+                    published += 1
+        return published
+
+    def _publish(self, batch: _Batch, deadline: float | None) -> None:
+        self._client.publish(
+            batch.events, request_id=batch.request_id, deadline=deadline
+        )
+
+    def _spool_batch(self, batch: _Batch) -> None:
+        try:
+            try:
+                self._spool.send(batch.encode())
+            except MessageTooLargeError:
+                if len(batch.events) == 1:
+                    raise
+                # Spooled as a message per event instead.
+                for event in batch.events:
+                    self._spool.send(_Batch(batch.ods_code, (event,)).encode())
+        except Exception:
+            _logger.exception(
+                "Failed to spool %s MNS events for %s.",
+                len(batch.events),
+                batch.ods_code,
+            )
+
+
+def publisher_from_config(
+    token_provider: Callable[[], str] | None = None,
+) -> MNSPublisher | None:
+    """
+    Create the MNSPublisher configured for the service, or None if not configured.
+    Args:
+        token_provider: Provides the bearer token requests are authorised with, if
+            any.
+    """
+    event_url = config.mns_event_url()
+    if not event_url:
+        return None
+
+    retry_queue_url = config.mns_retry_queue_url()
+    if not retry_queue_url:
+        _logger.warning(
+            "MNS_RETRY_QUEUE_URL is not configured, so MNS events that fail to be "
+            "published are spooled in memory, and lost once the Lambda instance ends."
+        )
+
+    return MNSPublisher(
+        MNSClient(
+            event_url,
+            token_provider=token_provider,
+            dependency=Dependency.from_config(
+                "MNS", max_concurrent=config.mns_max_concurrent_requests()
+            ),
+        ),
+        queue_from_config(retry_queue_url),
+        max_batch_events=config.mns_max_batch_events(),
+    )
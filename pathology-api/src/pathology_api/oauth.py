@@ -0,0 +1,290 @@
+"""
+Access tokens for downstream services behind API Management (APIM), obtained via the
+OAuth 2.0 client credentials grant with a signed JWT client assertion.
+"""
+
+import importlib
+import threading
+import time
+import urllib.parse
+import uuid
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, rsa
+
+from pathology_api import config
+from pathology_api.connections import RetryPolicy, ServiceClient, ServiceError
+from pathology_api.logging import get_logger
+
+_logger = get_logger(__name__)
+
+_CLIENT_ASSERTION_TYPE = "urn:ietf:params:oauth:client-assertion-type:jwt-bearer"
+
+# The lifetime, in seconds, of each client assertion, the most APIM accepts.
+_ASSERTION_LIFETIME_SECONDS = 300
+
+# The time, in seconds, after an early refresh fails before another is attempted, so
+# that an unavailable token endpoint is not sent a request per call.
+_REFRESH_RETRY_SECONDS = 1.0
+
+
+class TokenError(ServiceError):
+    """
+    Raised when an access token cannot be obtained.
+    Attributes:
+        response: The final response received from the token endpoint, if any.
+    """
+
+
+class ClientAssertionSigner(Protocol):
+    """Signs the claims of a client assertion, producing a JWT."""
+
+    def sign(self, claims: Mapping[str, Any]) -> str:
+        """
+        Sign a client assertion.
+        Args:
+            claims: The claims of the assertion.
+        Returns:
+            The signed JWT.
+        """
+
+
+class JWTSigner:
+    """
+    A ClientAssertionSigner signing with a private key via PyJWT. The key is parsed
+    once, when the signer is created, rather than for each assertion signed.
+    """
+
+    def __init__(self, private_key: str | bytes, key_id: str, algorithm: str = "RS512"):
+        """
+        Args:
+            private_key: The PEM encoded private key to sign with.
+            key_id: The id of the key, registered with APIM, sent as the kid header.
+            algorithm: The algorithm to sign with.
+        Raises:
+            ValueError: If the private key is not of a type a JWT can be signed with.
+        """
+        if isinstance(private_key, str):
+            private_key = private_key.encode()
+        key = serialization.load_pem_private_key(private_key, password=None)
+        if not isinstance(
+            key,
+            rsa.RSAPrivateKey
+            | ec.EllipticCurvePrivateKey
+            | ed25519.Ed25519PrivateKey
+            | ed448.Ed448PrivateKey,
+        ):
+            raise ValueError(f"Cannot sign a JWT with a {type(key).__name__}.")
+        self._key = key
+        self._key_id = key_id
+        self._algorithm = algorithm
+
+    def sign(self, claims: Mapping[str, Any]) -> str:
+        return jwt.encode(
+            dict(claims),
+            self._key,
+            algorithm=self._algorithm,
+            headers={"kid": self._key_id},
+        )
+
+
+@dataclass(frozen=True)
+class AccessToken:
+    """
+    An access token obtained from the token endpoint.
+    Attributes:
+        value: The access token.
+        expires_at: The time, as returned by the provider's clock, it expires at.
+    """
+
+    value: str
+    expires_at: float
+
+
+class _TokenEndpointClient(ServiceClient):
+    service_name = "APIM token endpoint"
+    error_type = TokenError
+    media_type = "application/json"
+
+
+class TokenProvider:
+    """
+    Provides access tokens for APIM, requesting a new token only when the current one
+    is close to expiring. A provider should be created once and reused, including
+    across warm invocations of a Lambda, so that tokens are cached between requests.
+    Providers are safe to use from multiple threads.
+
+    Once a token is within the expiry threshold of expiring, a single caller requests a
+    new token, whilst concurrent callers continue to be provided the current token
+    rather than waiting on it. The request is made on the caller's thread, rather than
+    in the background, as a Lambda is frozen between invocations, which would leave a
+    background request suspended midway. Callers only all wait where there is no
+    unexpired token, in which case they wait on a single request.
+    """
+
+    def __init__(
+        self,
+        token_url: str,
+        client_id: str,
+        signer: ClientAssertionSigner,
+        expiry_threshold: float = 30.0,
+        timeout: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            token_url: The URL of the token endpoint, also the audience of each
+                client assertion.
+            client_id: The API key of the APIM application, the issuer and subject of
+                each client assertion.
+            signer: Signs each client assertion.
+            expiry_threshold: The time, in seconds, before a token expires from which
+                it is refreshed early.
+            timeout: The maximum time, in seconds, to wait for the token endpoint.
+            clock: The clock token expiry is measured against.
+        """
+        self._token_url = token_url
+        self._client_id = client_id
+        self._signer = signer
+        self._expiry_threshold = expiry_threshold
+        self._clock = clock
+        # A client assertion may only be used once, so a failed request is not
+        # retried with it.
+        self._client = _TokenEndpointClient(
+            token_url, timeout=timeout, retry=RetryPolicy(max_attempts=1)
+        )
+
+        self._token: AccessToken | None = None
+        # Held whilst a token is requested, so that only one request is made at once.
+        self._refresh_lock = threading.Lock()
+        self._next_early_refresh = 0.0
+
+    def token(self) -> str:
+        """
+        Provide an unexpired access token, refreshing it if needed.
+        Raises:
+            TokenError: If there is no unexpired token and one cannot be obtained.
+        """
+        token = self._token
+        now = self._clock()
+        if token is None or now >= token.expires_at:
+            return self._refresh_blocking().value
+
+        if now >= token.expires_at - self._expiry_threshold:
+            return self._refresh_early(token, now).value
+        return token.value
+
+    def _refresh_blocking(self) -> AccessToken:
+        with self._refresh_lock:
+            # Another caller may have obtained a token whilst this one waited.
+            token = self._token
+            if token is not None and self._clock() < token.expires_at:
+                return token
+            return self._refresh()
+
+    def _refresh_early(self, token: AccessToken, now: float) -> AccessToken:
+        """
+        Refresh an unexpired token, unless another caller is already doing so, or an
+        early refresh failed too recently, in which case it is provided as is.
+        """
+        if now < self._next_early_refresh or not self._refresh_lock.acquire(
+            blocking=False
+        ):
+            return token
+        try:
+            # Another caller may have obtained a token since this one was provided.
+            current = self._token
+            if current is not None and current is not token:
+                return current
+            return self._refresh()
+        except ServiceError as e:
+            _logger.warning("Early access token refresh failed: %s", e)
+            self._next_early_refresh = self._clock() + _REFRESH_RETRY_SECONDS
+            return token
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self) -> AccessToken:
+        """Request a new token. Must be called whilst holding the refresh lock."""
+        requested_at = self._clock()
+        body = urllib.parse.urlencode(
+            {
+                "grant_type": "client_credentials",
+                "client_assertion_type": _CLIENT_ASSERTION_TYPE,
+                "client_assertion": self._signer.sign(self._claims()),
+            }
+        ).encode()
+
+        response = self._client.request(
+            "POST",
+            "",
+            request_id=str(uuid.uuid4()),
+            body=body,
+            content_type="application/x-www-form-urlencoded",
+        )
+        if not response.ok:
+            raise TokenError(
+                f"Access token request rejected with status {response.status_code}.",
+                response=response,
+            )
+
+        try:
+            content = response.json()
+            # APIM returns expires_in as a string.
+            token = AccessToken(
+                value=str(content["access_token"]),
+                expires_at=requested_at + float(content["expires_in"]),
+            )
+        except (ValueError, TypeError, KeyError) as e:
+            raise TokenError(
+                "Access token response could not be parsed.", response=response
+            ) from e
+
+        self._token = token
+        _logger.info(
+            "Access token obtained, expiring in %s seconds.", content["expires_in"]
+        )
+        return token
+
+    def _claims(self) -> dict[str, Any]:
+        return {
+            "iss": self._client_id,
+            "sub": self._client_id,
+            "aud": self._token_url,
+            "jti": str(uuid.uuid4()),
+            "exp": int(time.time()) + _ASSERTION_LIFETIME_SECONDS,
+        }
+
+
+def provider_from_config() -> TokenProvider | None:
+    """
+    Create the TokenProvider configured for the service, or None if not configured.
+    The API key and private key are read from Secrets Manager, once, when created.
+    """
+    token_url = config.apim_token_url()
+    api_key_name = config.apim_api_key_name()
+    private_key_name = config.apim_private_key_name()
+    key_id = config.apim_key_id()
+    if not (token_url and api_key_name and private_key_name and key_id):
+        return None
+
+    # boto3 is provided by the Lambda runtime.
+    boto3 = importlib.import_module("boto3")
+    secrets = boto3.client(
+        "secretsmanager", endpoint_url=config.secrets_manager_endpoint_url()
+    )
+
+    def secret(name: str) -> str:
+        value: str = secrets.get_secret_value(SecretId=name)["SecretString"]
+        return value
+
+    return TokenProvider(
+        token_url,
+        client_id=secret(api_key_name),
+        signer=JWTSigner(secret(private_key_name), key_id=key_id),
+        expiry_threshold=config.apim_token_expiry_threshold_seconds(),
+    )
@@ -0,0 +1,98 @@
+"""Client for the Patient Data Manager (PDM) FHIR API, results are forwarded to."""
+
+from collections.abc import Callable
+
+from pathology_api import config
+from pathology_api.connections import (
+    RetryPolicy,
+    ServiceClient,
+    ServiceError,
+    ServiceResponse,
+)
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.resilience import Dependency
+
+# A response received from PDM.
+PDMResponse = ServiceResponse
+
+
+class PDMError(ServiceError):
+    """
+    Raised when a request to PDM fails, once any retries have been exhausted.
+    Attributes:
+        response: The final response received from PDM, if any was received.
+    """
+
+
+class PDMClient(ServiceClient):
+    """
+    A client for the PDM FHIR API, such as
+    https://int.api.service.nhs.uk/patient-data-manager/FHIR/R4/. Connections are
+    pooled, and requests retried, as described by ServiceClient.
+    """
+
+    service_name = "PDM"
+    error_type = PDMError
+    media_type = "application/fhir+json"
+
+    def post_document(
+        self, bundle: Bundle, request_id: str, deadline: float | None = None
+    ) -> PDMResponse:
+        """
+        Create a document Bundle within PDM.
+        Args:
+            bundle: The document Bundle.
+            request_id: Identifies the request to PDM, see request.
+            deadline: The time by which a response is needed, see request.
+        Returns:
+            The successful response from PDM.
+        Raises:
+            PDMError: If the document Bundle was not created.
+        """
+        return self._post("Bundle", dump_json(bundle), request_id, deadline)
+
+    def post_transaction(
+        self, transaction: bytes, request_id: str, deadline: float | None = None
+    ) -> PDMResponse:
+        """
+        Process a transaction Bundle, already serialised as FHIR JSON, within PDM, as
+        for post_document.
+        """
+        return self._post("", transaction, request_id, deadline)
+
+    def _post(
+        self, path: str, body: bytes, request_id: str, deadline: float | None
+    ) -> PDMResponse:
+        response = self.request("POST", path, request_id, body, deadline)
+        if not response.ok:
+            raise PDMError(
+                f"PDM rejected the request with status {response.status_code}.",
+                response=response,
+            )
+        return response
+
+
+def client_from_config(
+    token_provider: Callable[[], str] | None = None,
+) -> PDMClient | None:
+    """
+    Create the PDMClient configured for the service, or None if not configured.
+    Args:
+        token_provider: Provides the bearer token requests are authorised with, if
+            any.
+    """
+    base_url = config.pdm_base_url()
+    if not base_url:
+        return None
+
+    return PDMClient(
+        base_url,
+        timeout=config.pdm_timeout_seconds(),
+        max_idle_connections=config.pdm_max_connections(),
+        retry=RetryPolicy(max_attempts=config.pdm_max_attempts()),
+        token_provider=token_provider,
+        dependency=Dependency.from_config(
+            "PDM", max_concurrent=config.pdm_max_concurrent_requests()
+        ),
+    )
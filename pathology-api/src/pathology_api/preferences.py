@@ -0,0 +1,44 @@
+from typing import Literal
+
+type ReturnPreference = Literal["minimal", "representation", "OperationOutcome"]
+
+_RETURN_PREFERENCES: dict[str, ReturnPreference] = {
+    "minimal": "minimal",
+    "representation": "representation",
+    "operationoutcome": "OperationOutcome",
+}
+
+
+def parse_prefer(prefer: str | None) -> dict[str, str | None]:
+    """
+    Parse the preferences requested via a Prefer header, as defined by RFC 7240.
+    Parameters of each preference are ignored.
+    Args:
+        prefer: The value of the Prefer header, if provided.
+    Returns:
+        The value of each requested preference, or None for preferences requested
+        without a value, keyed by the lower case preference name. Where a preference is
+        requested more than once, the first is used.
+    """
+    preferences: dict[str, str | None] = {}
+    for preference in (prefer or "").split(","):
+        token, _, _ = preference.partition(";")
+        name, separator, value = token.partition("=")
+        name = name.strip().lower()
+        if name and name not in preferences:
+            preferences[name] = value.strip().strip('"') if separator else None
+    return preferences
+
+
+def return_preference(prefer: str | None) -> ReturnPreference | None:
+    """
+    Retrieve the FHIR return preference requested via a Prefer header. See
+    https://hl7.org/fhir/R4/http.html#ops.
+    Args:
+        prefer: The value of the Prefer header, if provided.
+    Returns:
+        The requested return preference, or None if none, or an unrecognised one, was
+        requested.
+    """
+    value = parse_prefer(prefer).get("return")
+    return _RETURN_PREFERENCES.get(value.lower()) if value else None
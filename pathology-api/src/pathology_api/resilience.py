@@ -0,0 +1,367 @@
+"""
+Circuit breakers and bulkheads isolating the API from downstream dependencies that are
+failing or slow, so that requests to them fail fast rather than holding concurrency
+until they time out.
+"""
+
+import contextlib
+import math
+import threading
+import time
+from collections import Counter, deque
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+from pathology_api import config
+from pathology_api.logging import get_logger
+
+_logger = get_logger(__name__)
+
+# The time, in seconds, clients are asked to wait before retrying a request rejected
+# by a full bulkhead, or by a circuit with no probes remaining.
+_BUSY_RETRY_AFTER_SECONDS = 1
+
+
+class DependencyUnavailableError(Exception):
+    """
+    Raised, without a request being sent, when a dependency is presumed unavailable,
+    either as its circuit is open or as too many requests to it are in flight.
+    Attributes:
+        dependency: The name of the dependency.
+        retry_after: The time, in whole seconds, after which a retry may succeed.
+    """
+
+    def __init__(self, dependency: str, reason: str, retry_after: int):
+        super().__init__(f"{dependency} is unavailable: {reason}.")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass(frozen=True)
+class CircuitBreakerPolicy:
+    """
+    When a circuit breaker opens, and how it recovers.
+    Attributes:
+        failure_rate_threshold: The proportion of recent calls failing at which the
+            circuit opens.
+        slow_call_seconds: The duration, in seconds, beyond which a call is slow.
+        slow_call_rate_threshold: The proportion of recent calls being slow at which
+            the circuit opens, whether or not they succeeded.
+        window_size: The number of most recent calls the rates are measured over.
+        minimum_calls: The number of calls needed before the rates are measured.
+        open_seconds: The time, in seconds, the circuit stays open before calls are
+            let through to probe whether the dependency has recovered.
+        half_open_calls: The number of probing calls that must succeed, without
+            being slow, for the circuit to close again.
+    """
+
+    failure_rate_threshold: float = 0.5
+    slow_call_seconds: float = 5.0
+    slow_call_rate_threshold: float = 0.5
+    window_size: int = 20
+    minimum_calls: int = 10
+    open_seconds: float = 30.0
+    half_open_calls: int = 3
+
+    @classmethod
+    def from_config(cls) -> "CircuitBreakerPolicy":
+        """Create the CircuitBreakerPolicy configured for the service."""
+        return cls(
+            failure_rate_threshold=config.circuit_failure_rate_threshold(),
+            slow_call_seconds=config.circuit_slow_call_seconds(),
+            slow_call_rate_threshold=config.circuit_slow_call_rate_threshold(),
+            window_size=config.circuit_window_size(),
+            minimum_calls=config.circuit_minimum_calls(),
+            open_seconds=config.circuit_open_seconds(),
+            half_open_calls=config.circuit_half_open_calls(),
+        )
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker for calls to a single dependency. Whilst closed, calls are let
+    through and their outcomes recorded; once enough recent calls have failed, or been
+    slow, the circuit opens and calls are rejected. After a while the circuit becomes
+    half open, letting a limited number of calls through to probe the dependency,
+    closing if they succeed or opening again if any fail.
+
+    Breakers are safe to use from multiple threads, and should be held for the life of
+    a Lambda instance, so that their state persists between invocations.
+    Attributes:
+        name: The name of the dependency.
+        transitions: The number of times the circuit has moved between each pair of
+            states, keyed as "<from>-><to>", for monitoring.
+        rejected: The number of calls rejected, for monitoring.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: CircuitBreakerPolicy | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.transitions: Counter[str] = Counter()
+        self.rejected = 0
+        self._policy = policy or CircuitBreakerPolicy()
+        self._clock = clock
+        self._state = CircuitState.CLOSED
+        # Each recent call's outcome, as whether it failed and whether it was slow.
+        self._window: deque[tuple[bool, bool]] = deque(maxlen=self._policy.window_size)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._expire_open()
+            return self._state
+
+    def acquire(self) -> None:
+        """
+        Request permission to make a call, which must then be recorded via record.
+        Raises:
+            DependencyUnavailableError: If the circuit is open, or half open with
+                every probing call already made.
+        """
+        with self._lock:
+            self._expire_open()
+            match self._state:
+                case CircuitState.OPEN:
+                    self.rejected += 1
+                    remaining = self._opened_at + self._policy.open_seconds
+                    raise DependencyUnavailableError(
+                        self.name,
+                        "circuit open",
+                        retry_after=max(1, math.ceil(remaining - self._clock())),
+                    )
+                case CircuitState.HALF_OPEN:
+                    probes = self._probes_in_flight + self._probes_succeeded
+                    if probes >= self._policy.half_open_calls:
+                        self.rejected += 1
+                        raise DependencyUnavailableError(
+                            self.name,
+                            "circuit half open",
+                            retry_after=_BUSY_RETRY_AFTER_SECONDS,
+                        )
+                    self._probes_in_flight += 1
+
+    def record(self, duration: float, failed: bool) -> None:
+        """
+        Record the outcome of a call made once permitted by acquire.
+        Args:
+            duration: The time, in seconds, the call took.
+            failed: Whether the call failed in a way indicating the dependency is
+                unhealthy, such as timing out or responding as unavailable.
+        """
+        slow = duration >= self._policy.slow_call_seconds
+        with self._lock:
+            match self._state:
+                case CircuitState.HALF_OPEN:
+                    self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                    if failed or slow:
+                        self._transition(CircuitState.OPEN)
+                        return
+                    self._probes_succeeded += 1
+                    if self._probes_succeeded >= self._policy.half_open_calls:
+                        self._transition(CircuitState.CLOSED)
+                case CircuitState.CLOSED:
+                    self._window.append((failed, slow))
+                    if self._should_open():
+                        self._transition(CircuitState.OPEN)
+                case CircuitState.OPEN:
+                    # Calls permitted before the circuit opened are not considered.
+                    pass
+
+    def stats(self) -> dict[str, Any]:
+        """The state, transition and rejection counts of the circuit, for monitoring."""
+        with self._lock:
+            self._expire_open()
+            return self._stats()
+
+    def _stats(self) -> dict[str, Any]:
+        return {
+            "dependency": self.name,
+            "circuit_state": str(self._state),
+            "circuit_transitions": dict(self.transitions),
+            "circuit_rejected": self.rejected,
+        }
+
+    def _should_open(self) -> bool:
+        calls = len(self._window)
+        if calls < self._policy.minimum_calls:
+            return False
+
+        failures = sum(1 for failed, _ in self._window if failed)
+        slow_calls = sum(1 for _, slow in self._window if slow)
+        return (
+            failures / calls >= self._policy.failure_rate_threshold
+            or slow_calls / calls >= self._policy.slow_call_rate_threshold
+        )
+
+    def _expire_open(self) -> None:
+        if (
+            self._state == CircuitState.OPEN
+            and self._clock() >= self._opened_at + self._policy.open_seconds
+        ):
+            self._transition(CircuitState.HALF_OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        previous, self._state = self._state, state
+        self.transitions[f"{previous}->{state}"] += 1
+        self._window.clear()
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        if state == CircuitState.OPEN:
+            self._opened_at = self._clock()
+
+        # Logged with the circuit's stats, so that transitions and rejections can be
+        # monitored from the logs.
+        _logger.warning(
+            "Circuit for %s moved from %s to %s.",
+            self.name,
+            previous,
+            state,
+            extra={"circuit_previous_state": str(previous), **self._stats()},
+        )
+
+
+class Bulkhead:
+    """
+    Limits the number of calls to a dependency in flight at once, so that a slow
+    dependency cannot occupy every worker. Calls beyond the limit wait briefly for
+    another to complete, then are rejected.
+    Attributes:
+        rejected: The number of calls rejected, for monitoring.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_wait: float = 0.0):
+        """
+        Args:
+            name: The name of the dependency.
+            max_concurrent: The maximum number of calls in flight at once.
+            max_wait: The maximum time, in seconds, a call waits to be let through.
+        """
+        self.name = name
+        self.rejected = 0
+        self._max_wait = max_wait
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def enter(self) -> Iterator[None]:
+        """
+        Hold one of the bulkhead's places for the duration of a call.
+        Raises:
+            DependencyUnavailableError: If no place became free within max_wait.
+        """
+        acquired = (
+            self._semaphore.acquire(timeout=self._max_wait)
+            if self._max_wait > 0
+            else self._semaphore.acquire(blocking=False)
+        )
+        if not acquired:
+            with self._lock:
+                self.rejected += 1
+                rejected = self.rejected
+            _logger.warning(
+                "Bulkhead for %s rejected a call.",
+                self.name,
+                extra={"dependency": self.name, "bulkhead_rejected": rejected},
+            )
+            raise DependencyUnavailableError(
+                self.name,
+                "too many requests in flight",
+                retry_after=_BUSY_RETRY_AFTER_SECONDS,
+            )
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+class CallOutcome:
+    """
+    The outcome of a guarded call, to be marked as failed by the caller where the
+    call completed but indicated the dependency is unhealthy.
+    """
+
+    def __init__(self) -> None:
+        self.failed = False
+
+
+class Dependency:
+    """
+    Guards calls to a downstream dependency with a circuit breaker and a bulkhead. A
+    Dependency should be held for the life of a Lambda instance, typically by the
+    client of the dependency, so that its state persists between invocations.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        policy: CircuitBreakerPolicy | None = None,
+        max_concurrent: int = 10,
+        max_wait: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            name: The name of the dependency.
+            policy: When the circuit breaker opens, and how it recovers.
+            max_concurrent: The maximum number of calls in flight at once.
+            max_wait: The maximum time, in seconds, a call waits for the bulkhead.
+            clock: The clock the circuit breaker's timings are measured against.
+        """
+        self.breaker = CircuitBreaker(name, policy, clock)
+        self.bulkhead = Bulkhead(name, max_concurrent, max_wait)
+        self._clock = clock
+
+    @classmethod
+    def from_config(cls, name: str, max_concurrent: int) -> "Dependency":
+        """
+        Create a Dependency with the circuit breaker policy configured for the
+        service.
+        Args:
+            name: The name of the dependency.
+            max_concurrent: The maximum number of calls in flight at once.
+        """
+        return cls(
+            name,
+            CircuitBreakerPolicy.from_config(),
+            max_concurrent=max_concurrent,
+            max_wait=config.bulkhead_max_wait_seconds(),
+        )
+
+    @contextlib.contextmanager
+    def call(self) -> Iterator[CallOutcome]:
+        """
+        Guard a call to the dependency, recording it as failed if an exception is
+        raised or the yielded CallOutcome is marked as failed.
+        Raises:
+            DependencyUnavailableError: If the call is rejected, without it being made.
+        """
+        with self.bulkhead.enter():
+            self.breaker.acquire()
+            outcome = CallOutcome()
+            started = self._clock()
+            try:
+                yield outcome
+            except BaseException:
+                self.breaker.record(self._clock() - started, failed=True)
+                raise
+            self.breaker.record(self._clock() - started, failed=outcome.failed)
+
+    def stats(self) -> dict[str, Any]:
+        """The state of the circuit breaker and bulkhead, for monitoring."""
+        return {**self.breaker.stats(), "bulkhead_rejected": self.bulkhead.rejected}
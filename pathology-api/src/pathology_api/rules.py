@@ -0,0 +1,247 @@
+import functools
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from pathology_api.deadline import Deadline
+from pathology_api.exception import ValidationError
+from pathology_api.fhir.r4.references import ReferenceGraph
+from pathology_api.fhir.r4.resources import Bundle, OpaqueResource, Resource
+
+
+class RuleContext:
+    """
+    The context a rule is evaluated within, shared between every rule evaluated for a
+    Bundle.
+    Attributes:
+        bundle: The Bundle being validated.
+        full_url: The fullUrl of the entry being validated, or None whilst evaluating
+            a Bundle rule.
+    """
+
+    def __init__(self, bundle: Bundle):
+        self.bundle = bundle
+        self.full_url: str | None = None
+
+    @functools.cached_property
+    def reference_graph(self) -> ReferenceGraph:
+        """The graph of references between entries, built on first use."""
+        return ReferenceGraph(self.bundle)
+
+
+type BundleCheck = Callable[[Bundle, RuleContext], None]
+type ResourceCheck[T: Resource] = Callable[[T, RuleContext], None]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A validation rule. Rules raise a ValidationError for each violation found.
+    Attributes:
+        name: The name of the rule, used when reporting violations and timings.
+        check: The function evaluating the rule.
+        resource_types: The Resource types the rule is evaluated for. Empty for rules
+            evaluated once against the Bundle itself.
+        fields: The fields of the Resource types that the rule reads.
+    """
+
+    name: str
+    check: Callable[[Resource, RuleContext], None]
+    resource_types: tuple[type[Resource], ...] = ()
+    fields: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Violation:
+    """
+    A violation of a rule.
+    Attributes:
+        rule: The name of the rule violated.
+        message: The message describing the violation.
+        full_url: The fullUrl of the entry violating the rule, or None if the rule was
+            evaluated against the Bundle itself.
+    """
+
+    rule: str
+    message: str
+    full_url: str | None = None
+
+
+@dataclass
+class RuleReport:
+    """
+    The outcome of validating a Bundle.
+    Attributes:
+        violations: Every violation found, in the order found.
+        timings: The total time spent evaluating each rule, in seconds, keyed by rule
+            name.
+    """
+
+    violations: list[Violation] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def raise_for_violations(self) -> None:
+        """
+        Raises:
+            ValidationError: Including every violation found, if any were found.
+        """
+        if self.violations:
+            messages = [violation.message for violation in self.violations]
+            raise ValidationError("\n".join(messages), issues=messages)
+
+
+class RuleEngine:
+    """
+    Validates Bundles against a set of registered rules. Rules for Resources are
+    compiled into a table dispatching on the type of each Resource, so each entry of a
+    Bundle is visited once however many rules are registered, and only the rules
+    applicable to its type are evaluated.
+    """
+
+    def __init__(self) -> None:
+        self._bundle_rules: list[Rule] = []
+        self._resource_rules: list[Rule] = []
+        self._dispatch: dict[type[Resource], tuple[Rule, ...]] = {}
+
+    def bundle_rule(
+        self, name: str | None = None
+    ) -> Callable[[BundleCheck], BundleCheck]:
+        """
+        Decorator registering a function as a rule evaluated once against the Bundle
+        being validated.
+        Args:
+            name: The name of the rule. Defaults to the name of the function.
+        """
+
+        def decorator(check: BundleCheck) -> BundleCheck:
+            self._register(
+                Rule(
+                    name=name or check.__name__.lstrip("_"),
+                    check=_unchecked(check),
+                )
+            )
+            return check
+
+        return decorator
+
+    def resource_rule[T: Resource](
+        self,
+        *resource_types: type[T],
+        fields: tuple[str, ...] = (),
+        name: str | None = None,
+    ) -> Callable[[ResourceCheck[T]], ResourceCheck[T]]:
+        """
+        Decorator registering a function as a rule evaluated against each Resource of
+        the provided types within the Bundle being validated.
+        Args:
+            resource_types: The Resource types the rule is evaluated for, including any
+                subclasses.
+            fields: The fields of the Resource types that the rule reads. Fields not
+                defined by a Resource type must only be declared for an
+                OpaqueResource, as reading them materialises its content.
+            name: The name of the rule. Defaults to the name of the function.
+        Raises:
+            ValueError: If no resource types are provided, or a field is not defined by
+                a Resource type that is not an OpaqueResource.
+        """
+        if not resource_types:
+            raise ValueError("A resource rule must apply to at least one type.")
+
+        for resource_type in resource_types:
+            if issubclass(resource_type, OpaqueResource):
+                continue
+
+            defined = {f.alias or n for n, f in resource_type.model_fields.items()}
+            unknown = [f for f in fields if f not in defined]
+            if unknown:
+                raise ValueError(
+                    f"Fields {unknown} are not defined by {resource_type.__name__}."
+                )
+
+        def decorator(check: ResourceCheck[T]) -> ResourceCheck[T]:
+            self._register(
+                Rule(
+                    name=name or check.__name__.lstrip("_"),
+                    check=_unchecked(check),
+                    resource_types=resource_types,
+                    fields=fields,
+                )
+            )
+            return check
+
+        return decorator
+
+    def _register(self, rule: Rule) -> None:
+        if rule.resource_types:
+            self._resource_rules.append(rule)
+        else:
+            self._bundle_rules.append(rule)
+        # Recompiled for each type on next use.
+        self._dispatch.clear()
+
+    def _rules_for(self, resource_type: type[Resource]) -> tuple[Rule, ...]:
+        rules = self._dispatch.get(resource_type)
+        if rules is None:
+            rules = tuple(
+                rule
+                for rule in self._resource_rules
+                if issubclass(resource_type, rule.resource_types)
+            )
+            self._dispatch[resource_type] = rules
+        return rules
+
+    def validate(self, bundle: Bundle, deadline: Deadline | None = None) -> RuleReport:
+        """
+        Validate a Bundle against every registered rule, collecting every violation
+        rather than stopping at the first.
+        Args:
+            bundle: The Bundle to validate.
+            deadline: The deadline validation must complete by, checked before the
+                rules are evaluated for each entry, if any.
+        Returns:
+            The violations found, and the time spent evaluating each rule.
+        Raises:
+            DeadlineExceededError: If the deadline is reached before every rule has
+                been evaluated.
+        """
+        report = RuleReport(
+            timings=dict.fromkeys(
+                (rule.name for rule in self._bundle_rules + self._resource_rules), 0.0
+            )
+        )
+        context = RuleContext(bundle)
+
+        for rule in self._bundle_rules:
+            self._evaluate(rule, bundle, context, report)
+
+        for entry in bundle.entries or []:
+            if deadline is not None:
+                deadline.check("validation")
+            context.full_url = entry.full_url
+            for rule in self._rules_for(type(entry.resource)):
+                self._evaluate(rule, entry.resource, context, report)
+
+        return report
+
+    @staticmethod
+    def _evaluate(
+        rule: Rule, resource: Resource, context: RuleContext, report: RuleReport
+    ) -> None:
+        start = time.perf_counter()
+        try:
+            rule.check(resource, context)
+        except ValidationError as e:
+            report.violations.append(
+                Violation(rule=rule.name, message=e.message, full_url=context.full_url)
+            )
+        finally:
+            report.timings[rule.name] += time.perf_counter() - start
+
+
+def _unchecked[T: Resource](
+    check: Callable[[T, RuleContext], None],
+) -> Callable[[Resource, RuleContext], None]:
+    # Rules are only dispatched Resources of the types they are registered for, so the
+    # narrower parameter type of the check is upheld by the engine rather than the type
+    # checker.
+    return check  # type: ignore[return-value]
@@ -0,0 +1,203 @@
+import base64
+import json
+import time
+import uuid
+import zlib
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+from pathology_api import config
+from pathology_api.deadline import Deadline
+from pathology_api.idempotency import (
+    IdempotencyRecord,
+    IdempotencyStore,
+    StoredResponse,
+    store_from_config,
+)
+from pathology_api.logging import get_logger
+from pathology_api.work_queue import QueuedMessage, WorkQueue, queue_from_config
+
+_logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Submission:
+    """
+    A request queued to be processed asynchronously.
+    Attributes:
+        submission_id: Identifies the submission, and the status of processing it.
+        body: The decoded body of the request.
+        prefer: The value of the Prefer header of the request, if provided.
+    """
+
+    submission_id: str
+    body: bytes
+    prefer: str | None = None
+
+    def encode(self) -> str:
+        """Encode the submission as a message, compressing its body."""
+        return json.dumps(
+            {
+                "id": self.submission_id,
+                "prefer": self.prefer,
+                "body": base64.b64encode(zlib.compress(self.body)).decode(),
+            }
+        )
+
+    @classmethod
+    def decode(cls, message: str) -> "Submission":
+        """Decode a submission from a message created via encode."""
+        content = json.loads(message)
+        return cls(
+            submission_id=content["id"],
+            body=zlib.decompress(base64.b64decode(content["body"])),
+            prefer=content.get("prefer"),
+        )
+
+
+def _status_key(submission_id: str) -> str:
+    # Statuses may share a store with idempotency records, so are kept apart from them.
+    return f"submission#{submission_id}"
+
+
+class Submissions:
+    """
+    Queues requests to be processed asynchronously by a worker, and records the
+    response to each once processed. Whilst a submission is queued or being processed
+    its status is in_progress, becoming completed, with the response the request
+    would have been responded to with synchronously, once processed.
+    """
+
+    def __init__(self, queue: WorkQueue, store: IdempotencyStore, ttl: float = 86400):
+        """
+        Args:
+            queue: The queue submissions are sent to.
+            store: The store the status of each submission is held within.
+            ttl: The time, in seconds, the status of a submission is held for.
+        """
+        self._queue = queue
+        self._store = store
+        self._ttl = ttl
+
+    @classmethod
+    def from_config(cls) -> "Submissions":
+        """
+        Create the Submissions configured for the service.
+        Raises:
+            ValueError: If an SQS queue is configured without a DynamoDB table, as the
+                statuses recorded by the worker would then be held in its memory alone,
+                never to be found by the API.
+        """
+        queue_url = config.async_queue_url()
+        if queue_url and not config.idempotency_table_name():
+            raise ValueError(
+                "IDEMPOTENCY_TABLE_NAME must be configured alongside ASYNC_QUEUE_URL."
+            )
+        return cls(
+            queue_from_config(queue_url),
+            store_from_config(),
+            ttl=config.async_status_ttl_seconds(),
+        )
+
+    def submit(self, body: bytes, prefer: str | None = None) -> str:
+        """
+        Queue a request to be processed.
+        Args:
+            body: The decoded body of the request.
+            prefer: The value of the Prefer header of the request, if provided.
+        Returns:
+            The id of the submission, via which its status can be retrieved.
+        Raises:
+            MessageTooLargeError: If the request is too large to be queued.
+        """
+        submission = Submission(str(uuid.uuid4()), body, prefer)
+        message = submission.encode()
+
+        key = _status_key(submission.submission_id)
+        # Stored before sending, so that the status exists before it can be processed.
+        self._store.put(
+            key,
+            IdempotencyRecord(status="in_progress", expires_at=time.time() + self._ttl),
+        )
+        try:
+            self._queue.send(message)
+        except BaseException:
+            self._store.delete(key)
+            raise
+
+        return submission.submission_id
+
+    def status(self, submission_id: str) -> IdempotencyRecord | None:
+        """The status of a submission, or None if unknown or expired."""
+        return self._store.get(_status_key(submission_id))
+
+    def process(
+        self,
+        messages: Iterable[QueuedMessage],
+        func: Callable[[Submission], StoredResponse],
+    ) -> list[QueuedMessage]:
+        """
+        Process each of a batch of received messages, storing the response to each as
+        the status of its submission. Messages are delivered at least once, so a
+        submission that has already been processed is not processed again.
+        Args:
+            messages: The received messages.
+            func: Processes a submission, returning its response. An exception should
+                only be raised where processing may succeed if retried.
+        Returns:
+            The messages that failed to be processed, to be retried.
+        """
+        failed = []
+        for message in messages:
+            try:
+                submission = Submission.decode(message.body)
+                key = _status_key(submission.submission_id)
+
+                existing = self._store.get(key)
+                if existing is not None and existing.response is not None:
+                    _logger.info("Submission already processed.")
+                    continue
+
+                response = func(submission)
+                self._store.put(
+                    key,
+                    IdempotencyRecord(
+                        status="completed",
+                        expires_at=time.time() + self._ttl,
+                        response=response,
+                    ),
+                )
+            except Exception:
+                _logger.exception("Failed to process message %s.", message.message_id)
+                failed.append(message)
+
+        return failed
+
+    def drain(
+        self,
+        func: Callable[[Submission], StoredResponse],
+        batch_size: int = 10,
+        deadline: Deadline | None = None,
+    ) -> int:
+        """
+        Receive and process messages from the queue in batches until it is empty,
+        deleting each once processed. Messages that fail to be processed are left to
+        be received again.
+        Args:
+            func: Processes a submission, see process.
+            batch_size: The maximum number of messages received at once.
+            deadline: The deadline after which no further messages are received, if
+                any, leaving them for a later invocation.
+        Returns:
+            The number of messages processed successfully.
+        """
+        processed = 0
+        while (deadline is None or not deadline.expired) and (
+            messages := self._queue.receive(batch_size)
+        ):
+            failed = {message.receipt for message in self.process(messages, func)}
+            for message in messages:
+                if message.receipt not in failed:
+                    self._queue.delete(message.receipt)
+                    processed += 1
+        return processed
@@ -0,0 +1,252 @@
+import gzip
+import json
+import logging
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from pathology_api.bulk import (
+    Progress,
+    main,
+    process_line,
+    process_lines,
+    read_lines,
+    run,
+)
+from pathology_api.fhir.r4.elements import LogicalReference, PatientIdentifier
+from pathology_api.fhir.r4.resources import Bundle, Composition
+
+_DOCUMENT = Bundle.create(
+    type="document",
+    entry=[
+        Bundle.Entry(
+            fullUrl="composition",
+            resource=Composition.create(
+                subject=LogicalReference(
+                    PatientIdentifier.from_nhs_number("nhs_number")
+                )
+            ),
+        )
+    ],
+).model_dump_json(by_alias=True, exclude_none=True)
+
+_INVALID_DOCUMENT = json.dumps({"resourceType": "Bundle", "type": "document"})
+
+
+def _write_lines(path: Path, *lines: str, compress: bool = False) -> Path:
+    content = "".join(f"{line}\n" for line in lines).encode()
+    path.write_bytes(gzip.compress(content) if compress else content)
+    return path
+
+
+def _read_results(path: Path) -> list[dict[str, Any]]:
+    content = path.read_bytes()
+    if path.suffix == ".gz":
+        content = gzip.decompress(content)
+    return [json.loads(line) for line in content.splitlines()]
+
+
+class TestReadLines:
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_read_lines(self, tmp_path: Path, compress: bool) -> None:
+        path = _write_lines(
+            tmp_path / "input.ndjson", "{}", "", "  ", '{"a": 1}\r', compress=compress
+        )
+
+        assert list(read_lines(path)) == [b"{}", b'{"a": 1}']
+
+    def test_read_lines_without_trailing_newline(self, tmp_path: Path) -> None:
+        path = tmp_path / "input.ndjson"
+        path.write_bytes(b"{}\n[]")
+
+        assert list(read_lines(path)) == [b"{}", b"[]"]
+
+    def test_read_lines_empty_file(self, tmp_path: Path) -> None:
+        path = tmp_path / "input.ndjson"
+        path.write_bytes(b"")
+
+        assert list(read_lines(path)) == []
+
+
+class TestProcessLine:
+    def test_process_line(self) -> None:
+        result = process_line(_DOCUMENT.encode())
+
+        assert result.created
+        bundle = Bundle.model_validate_json(result.body, by_alias=True)
+        assert bundle.id is not None
+        assert bundle.meta is not None
+
+    @pytest.mark.parametrize(
+        ("line", "expected_diagnostics"),
+        [
+            pytest.param(
+                _INVALID_DOCUMENT.encode(),
+                "Document must include a single Composition resource",
+                id="Invalid document",
+            ),
+            pytest.param(b"{", "Invalid payload provided.", id="Invalid JSON"),
+        ],
+    )
+    def test_process_line_invalid(self, line: bytes, expected_diagnostics: str) -> None:
+        result = process_line(line)
+
+        assert not result.created
+        outcome = json.loads(result.body)
+        assert outcome["resourceType"] == "OperationOutcome"
+        assert outcome["issue"][0]["diagnostics"] == expected_diagnostics
+
+    def test_process_line_unexpected_error(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        def fail(*_args: Any, **_kwargs: Any) -> Bundle:
+            raise RuntimeError("Defect")
+
+        monkeypatch.setattr("pathology_api.bulk.handle_request", fail)
+
+        with pytest.raises(RuntimeError, match="Defect"):
+            process_line(_DOCUMENT.encode())
+
+    def test_process_line_invalid_config(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("INCREMENTAL_PARSE_BYTES", "abc")
+
+        with pytest.raises(ValueError, match="invalid literal for int"):
+            process_line(_DOCUMENT.encode())
+
+
+class TestProcessLines:
+    def test_process_lines_preserves_order(self) -> None:
+        lines = [_DOCUMENT.encode(), b"{", _DOCUMENT.encode(), b"{", b"{"]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(
+                process_lines(
+                    iter(lines), executor=executor, chunk_size=2, max_in_flight=2
+                )
+            )
+
+        assert [result.created for result in results] == [
+            True,
+            False,
+            True,
+            False,
+            False,
+        ]
+
+    def test_process_lines_bounds_work_in_flight(self) -> None:
+        consumed: list[int] = []
+
+        def lines() -> Iterator[bytes]:
+            for index in range(10):
+                consumed.append(index)
+                yield b"{"
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = process_lines(
+                lines(), executor=executor, chunk_size=1, max_in_flight=2
+            )
+            next(results)
+
+            # The chunk returned, and those in flight, plus the next chunk read.
+            assert len(consumed) <= 4
+            assert len(list(results)) == 9
+
+    def test_process_lines_without_executor(self) -> None:
+        results = list(process_lines(iter([b"{", _DOCUMENT.encode()]), chunk_size=1))
+
+        assert [result.created for result in results] == [False, True]
+
+
+class TestRun:
+    @pytest.mark.parametrize(
+        ("workers", "output_name"),
+        [
+            pytest.param(1, "output.ndjson", id="In process"),
+            pytest.param(2, "output.ndjson.gz", id="Process pool, gzipped"),
+        ],
+    )
+    def test_run(self, tmp_path: Path, workers: int, output_name: str) -> None:
+        input_path = _write_lines(
+            tmp_path / "input.ndjson.gz",
+            _DOCUMENT,
+            _INVALID_DOCUMENT,
+            _DOCUMENT,
+            compress=True,
+        )
+        output_path = tmp_path / output_name
+        reports: list[int] = []
+
+        progress = run(
+            input_path,
+            output_path,
+            workers=workers,
+            chunk_size=1,
+            report=lambda p: reports.append(p.processed),
+        )
+
+        assert (progress.created, progress.failed) == (2, 1)
+        assert reports == [3]
+
+        results = _read_results(output_path)
+        assert [result["resourceType"] for result in results] == [
+            "Bundle",
+            "OperationOutcome",
+            "Bundle",
+        ]
+        assert results[0]["id"] != results[2]["id"]
+
+    def test_run_reports_progress(self, tmp_path: Path) -> None:
+        input_path = _write_lines(tmp_path / "input.ndjson", *["{"] * 3)
+        reports: list[int] = []
+
+        run(
+            input_path,
+            tmp_path / "output.ndjson",
+            workers=1,
+            progress_interval=0,
+            report=lambda p: reports.append(p.processed),
+        )
+
+        assert reports == [1, 2, 3, 3]
+
+
+class TestProgress:
+    def test_progress(self) -> None:
+        progress = Progress(created=3, failed=1, started_at=0)
+
+        assert progress.processed == 4
+        assert progress.throughput() > 0
+        assert str(progress).startswith("Processed 4 bundles (3 created, 1 failed)")
+
+
+class TestMain:
+    @pytest.fixture(autouse=True)
+    def _restore_logging(self) -> Iterator[None]:
+        yield
+        logging.disable(logging.NOTSET)
+
+    @pytest.mark.parametrize(
+        ("lines", "expected_status"),
+        [
+            pytest.param([_DOCUMENT], 0, id="All created"),
+            pytest.param([_DOCUMENT, _INVALID_DOCUMENT], 1, id="Some failed"),
+        ],
+    )
+    def test_main(
+        self,
+        tmp_path: Path,
+        capsys: pytest.CaptureFixture[str],
+        lines: list[str],
+        expected_status: int,
+    ) -> None:
+        input_path = _write_lines(tmp_path / "input.ndjson", *lines)
+        output_path = tmp_path / "output.ndjson"
+
+        status = main([str(input_path), str(output_path), "--workers", "1"])
+
+        assert status == expected_status
+        assert len(_read_results(output_path)) == len(lines)
+        assert capsys.readouterr().err.startswith(f"Processed {len(lines)} bundles")
@@ -0,0 +1,84 @@
+import gzip
+from unittest.mock import patch
+
+import pytest
+
+from pathology_api.compression import (
+    compress_body,
+    negotiate_encoding,
+    supported_encodings,
+)
+
+_BODY = b'{"resourceType": "Bundle", "type": "document"}' * 100
+
+
+class TestNegotiateEncoding:
+    @pytest.mark.parametrize(
+        ("accept_encoding", "expected_encoding"),
+        [
+            pytest.param(None, None, id="Not provided"),
+            pytest.param("", None, id="Empty"),
+            pytest.param("identity", None, id="identity"),
+            pytest.param("compress, zstd", None, id="Unsupported encodings"),
+            pytest.param("gzip", "gzip", id="gzip"),
+            pytest.param(" GZIP ", "gzip", id="Case insensitive"),
+            pytest.param("deflate, gzip;q=0.5", "gzip", id="Quality value"),
+            pytest.param("gzip;q=0", None, id="Refused"),
+            pytest.param("gzip;q=invalid", None, id="Invalid quality value"),
+            pytest.param("*", "gzip", id="Wildcard"),
+            pytest.param("*, gzip;q=0", None, id="Wildcard excluding gzip"),
+            pytest.param("*;q=0", None, id="Wildcard refused"),
+        ],
+    )
+    def test_negotiate_encoding(
+        self, accept_encoding: str | None, expected_encoding: str | None
+    ) -> None:
+        with patch("pathology_api.compression._COMPRESSORS", {"gzip": gzip.compress}):
+            assert negotiate_encoding(accept_encoding) == expected_encoding
+
+    @pytest.mark.parametrize(
+        ("accept_encoding", "expected_encoding"),
+        [
+            pytest.param("gzip, br", "br", id="Equal quality prefers br"),
+            pytest.param("gzip, br;q=0.9", "gzip", id="Higher quality preferred"),
+            pytest.param("*", "br", id="Wildcard prefers br"),
+        ],
+    )
+    def test_negotiate_encoding_preference(
+        self, accept_encoding: str, expected_encoding: str
+    ) -> None:
+        compressors = {"br": gzip.compress, "gzip": gzip.compress}
+        with patch("pathology_api.compression._COMPRESSORS", compressors):
+            assert negotiate_encoding(accept_encoding) == expected_encoding
+
+    def test_supported_encodings(self) -> None:
+        assert supported_encodings()[-1] == "gzip"
+
+
+class TestCompressBody:
+    def test_compress_body_gzip(self) -> None:
+        compressed, encoding = compress_body(_BODY, "gzip")
+
+        assert encoding == "gzip"
+        assert gzip.decompress(compressed) == _BODY
+
+    def test_compress_body_brotli(self) -> None:
+        brotli = pytest.importorskip("brotlicffi")
+
+        compressed, encoding = compress_body(_BODY, "br")
+
+        assert encoding == "br"
+        assert brotli.decompress(compressed) == _BODY
+
+    @pytest.mark.parametrize(
+        ("body", "accept_encoding", "min_size"),
+        [
+            pytest.param(_BODY, None, 0, id="Not accepted"),
+            pytest.param(_BODY, "gzip", len(_BODY) + 1, id="Below minimum size"),
+            pytest.param(b"{}", "gzip", 0, id="Not reduced by compression"),
+        ],
+    )
+    def test_compress_body_uncompressed(
+        self, body: bytes, accept_encoding: str | None, min_size: int
+    ) -> None:
+        assert compress_body(body, accept_encoding, min_size) == (body, None)
@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+from pathology_api.concurrency import map_concurrently
+
+
+class TestMapConcurrently:
+    @pytest.mark.parametrize("max_workers", [0, 1, 4])
+    def test_map_concurrently(self, max_workers: int) -> None:
+        def func(item: int) -> int:
+            if item == 2:
+                raise ValueError("Invalid item")
+            return item * 10
+
+        results = map_concurrently(func, range(5), max_workers=max_workers)
+
+        assert results[:2] == [0, 10]
+        assert isinstance(results[2], ValueError)
+        assert results[3:] == [30, 40]
+
+    def test_map_concurrently_processes_items_at_once(self) -> None:
+        barrier = threading.Barrier(3, timeout=5)
+
+        def func(item: int) -> int:
+            # Only passes once every item is being processed at once.
+            barrier.wait()
+            return item
+
+        assert map_concurrently(func, range(3), max_workers=3) == [0, 1, 2]
+
+    def test_map_concurrently_sequential_on_calling_thread(self) -> None:
+        threads = map_concurrently(
+            lambda _: threading.current_thread(), range(3), max_workers=1
+        )
+
+        assert threads == [threading.current_thread()] * 3
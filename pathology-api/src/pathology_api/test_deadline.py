@@ -0,0 +1,42 @@
+import time
+
+import pytest
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from pathology_api.deadline import Deadline, DeadlineExceededError
+
+
+class _Context(LambdaContext):
+    def __init__(self, remaining_millis: int):
+        self._remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self) -> int:  # type: ignore[override]
+        return self._remaining_millis
+
+
+class TestDeadline:
+    def test_from_context(self) -> None:
+        before = time.monotonic()
+
+        deadline = Deadline.from_context(_Context(30_000), reserve=0.5)
+
+        assert deadline is not None
+        assert before + 29.5 <= deadline.expires_at <= time.monotonic() + 29.5
+
+    def test_from_context_without_remaining_time(self) -> None:
+        assert Deadline.from_context(LambdaContext(), reserve=0.5) is None
+
+    def test_from_context_within_reserve(self) -> None:
+        deadline = Deadline.from_context(_Context(100), reserve=0.5)
+
+        assert deadline is not None
+        assert deadline.expired
+        assert deadline.remaining() == 0
+
+    def test_check(self) -> None:
+        Deadline.after(60).check("validation")
+
+        with pytest.raises(DeadlineExceededError, match="validation") as error:
+            Deadline.after(0).check("validation")
+
+        assert error.value.stage == "validation"
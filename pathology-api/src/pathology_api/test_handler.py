@@ -1,19 +1,35 @@
 import datetime
+import json
+from typing import Any
 
 import pytest
+from tests.pdm_stub import StubPDMServer, StubResponse
 
-from pathology_api.exception import ValidationError
+from pathology_api.connections import RetryPolicy
+from pathology_api.deadline import Deadline, DeadlineExceededError
+from pathology_api.exception import PayloadTooLargeError, ValidationError
 from pathology_api.fhir.r4.elements import (
     LogicalReference,
     PatientIdentifier,
 )
-from pathology_api.fhir.r4.resources import Bundle, Composition
-from pathology_api.handler import handle_request
+from pathology_api.fhir.r4.resources import Bundle, Composition, Observation
+from pathology_api.handler import (
+    error_outcome,
+    forward_result,
+    handle_document,
+    handle_request,
+    prescreen_request,
+)
+from pathology_api.ingest import Limits
+from pathology_api.pdm import PDMClient, PDMError
+from pathology_api.transaction import TransactionLimits
 
 
 class TestHandleRequest:
-    def test_handle_request(self) -> None:
+    def test_handle_request(self, monkeypatch: pytest.MonkeyPatch) -> None:
         # Arrange
+        # Verify that the trusted return bundle would still pass validation.
+        monkeypatch.setenv("VERIFY_TRUSTED_RESOURCES", "true")
         bundle = Bundle.create(
             type="document",
             entry=[
@@ -49,6 +65,25 @@ class TestHandleRequest:
 
         assert created_meta.version_id is None
 
+    def test_handle_request_with_bundle_id(self) -> None:
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(
+                    fullUrl="composition",
+                    resource=Composition.create(
+                        subject=LogicalReference(
+                            PatientIdentifier.from_nhs_number("nhs_number")
+                        )
+                    ),
+                )
+            ],
+        )
+
+        result_bundle = handle_request(bundle, bundle_id="bundle-id")
+
+        assert result_bundle.id == "bundle-id"
+
     def test_handle_request_raises_error_when_no_composition_resource(self) -> None:
         bundle = Bundle.create(
             type="document",
@@ -153,3 +188,269 @@ class TestHandleRequest:
             match="Resource must be a bundle of type 'document'",
         ):
             handle_request(bundle)
+
+    def test_handle_request_raises_error_including_every_violation(self) -> None:
+        bundle = Bundle.create(
+            id="id",
+            type="collection",
+            entry=[
+                Bundle.Entry(
+                    fullUrl="composition", resource=Composition.create(subject=None)
+                )
+            ],
+        )
+
+        with pytest.raises(ValidationError) as exc_info:
+            handle_request(bundle)
+
+        assert exc_info.value.issues == [
+            "Bundles cannot be defined with an existing ID",
+            "Resource must be a bundle of type 'document'",
+            "Composition does not define a valid subject identifier",
+        ]
+
+
+class TestHandleDocument:
+    _PAYLOAD = {
+        "resourceType": "Bundle",
+        "type": "document",
+        "entry": [
+            {
+                "fullUrl": "composition",
+                "resource": {
+                    "resourceType": "Composition",
+                    "subject": {
+                        "identifier": {
+                            "system": "https://fhir.nhs.uk/Id/nhs-number",
+                            "value": "nhs_number",
+                        }
+                    },
+                },
+            }
+        ],
+    }
+
+    def test_handle_document(self) -> None:
+        result_bundle = handle_document(self._PAYLOAD)
+
+        assert result_bundle.id is not None
+        assert result_bundle.bundle_type == "document"
+        assert result_bundle.entries is not None
+        assert len(result_bundle.entries) == 1
+
+    def test_handle_document_prescreens_payload(self) -> None:
+        with pytest.raises(
+            ValidationError,
+            match="Document must include a single Composition resource",
+        ):
+            handle_document({"resourceType": "Bundle", "type": "document"})
+
+    def test_handle_document_exceeds_max_entries(self) -> None:
+        with pytest.raises(PayloadTooLargeError):
+            handle_document(
+                self._PAYLOAD,
+                limits=Limits(max_body_bytes=1024, max_entries=0, max_depth=10),
+            )
+
+    def test_handle_document_deadline_exceeded(self) -> None:
+        with pytest.raises(DeadlineExceededError, match="validation"):
+            handle_document(self._PAYLOAD, deadline=Deadline.after(0))
+
+
+class TestForwardResult:
+    def _create_result(self, entries: int = 1) -> Bundle:
+        return handle_request(
+            Bundle.create(
+                type="document",
+                entry=[
+                    Bundle.Entry(
+                        fullUrl="composition",
+                        resource=Composition.create(
+                            subject=LogicalReference(
+                                PatientIdentifier.from_nhs_number("nhs_number")
+                            )
+                        ),
+                    ),
+                    *(
+                        Bundle.Entry(
+                            fullUrl=f"observation-{index}",
+                            resource=Observation.create(),
+                        )
+                        for index in range(1, entries)
+                    ),
+                ],
+            )
+        )
+
+    def test_forward_result(self) -> None:
+        bundle = self._create_result()
+
+        with StubPDMServer() as stub:
+            forward_result(bundle, PDMClient(stub.url))
+
+        (request,) = stub.requests
+        assert request.path.endswith("/FHIR/R4/")
+        transaction = json.loads(request.body)
+        assert transaction["type"] == "transaction"
+        assert [entry["request"]["method"] for entry in transaction["entry"]] == ["PUT"]
+
+    def test_forward_result_split_into_transactions(self) -> None:
+        bundle = self._create_result(entries=5)
+
+        with StubPDMServer() as stub:
+            forward_result(
+                bundle,
+                PDMClient(stub.url),
+                limits=TransactionLimits(max_entries=2, max_bytes=1024 * 1024),
+            )
+
+        assert sorted(
+            len(json.loads(request.body)["entry"]) for request in stub.requests
+        ) == [1, 2, 2]
+        assert len({request.headers["X-Request-ID"] for request in stub.requests}) == 3
+
+    def test_forward_result_rejected(self) -> None:
+        bundle = self._create_result()
+
+        with StubPDMServer() as stub:
+            stub.respond_with(StubResponse(status_code=422))
+            client = PDMClient(stub.url, retry=RetryPolicy(max_attempts=1))
+
+            with pytest.raises(PDMError) as error:
+                forward_result(bundle, client)
+
+        status_code, outcome = error_outcome(error.value)
+        assert status_code == 502
+        assert outcome.issue[0]["code"] == "exception"
+
+    def test_forward_result_deadline_exceeded(self) -> None:
+        bundle = self._create_result()
+
+        with (
+            StubPDMServer() as stub,
+            pytest.raises(DeadlineExceededError) as error,
+        ):
+            forward_result(bundle, PDMClient(stub.url), Deadline.after(0))
+
+        assert stub.requests == []
+        status_code, outcome = error_outcome(error.value)
+        assert status_code == 504
+        assert outcome.issue[0]["code"] == "timeout"
+
+    def test_forward_result_deadline_reached_whilst_waiting(self) -> None:
+        bundle = self._create_result()
+
+        with StubPDMServer() as stub:
+            stub.respond_with(StubResponse(status_code=200, delay=0.5))
+
+            with pytest.raises(DeadlineExceededError, match="forwarding to PDM"):
+                forward_result(bundle, PDMClient(stub.url), Deadline.after(0.1))
+
+
+class TestPrescreenRequest:
+    _COMPOSITION_ENTRY = {
+        "fullUrl": "composition",
+        "resource": {
+            "resourceType": "Composition",
+            "subject": {
+                "identifier": {
+                    "system": "https://fhir.nhs.uk/Id/nhs-number",
+                    "value": "nhs_number",
+                }
+            },
+        },
+    }
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            pytest.param(
+                {"resourceType": "Bundle", "type": "document"},
+                id="No entries",
+            ),
+            pytest.param(
+                {
+                    "resourceType": "Bundle",
+                    "type": "document",
+                    "entry": [_COMPOSITION_ENTRY, _COMPOSITION_ENTRY],
+                },
+                id="Multiple compositions",
+            ),
+            pytest.param(
+                {
+                    "resourceType": "Bundle",
+                    "type": "collection",
+                    "id": "id",
+                    "entry": [
+                        {
+                            "fullUrl": "composition",
+                            "resource": {"resourceType": "Composition"},
+                        }
+                    ],
+                },
+                id="Every invariant",
+            ),
+            pytest.param(
+                {
+                    "resourceType": "Bundle",
+                    "type": "document",
+                    "id": "id",
+                    "entry": [_COMPOSITION_ENTRY],
+                },
+                id="Existing ID",
+            ),
+        ],
+    )
+    def test_prescreen_request_matches_handle_request(
+        self, payload: dict[str, Any]
+    ) -> None:
+        with pytest.raises(ValidationError) as expected:
+            handle_request(Bundle.model_validate(payload))
+
+        with pytest.raises(ValidationError) as prescreened:
+            prescreen_request(payload)
+
+        assert prescreened.value.message == expected.value.message
+        assert prescreened.value.issues == expected.value.issues
+
+    def test_prescreen_request_wrong_resource_type(self) -> None:
+        with pytest.raises(
+            ValidationError,
+            match="Provided resourceType 'Patient' does not match required "
+            "resourceType 'Bundle'.",
+        ):
+            prescreen_request({"resourceType": "Patient", "type": "document"})
+
+    @pytest.mark.parametrize(
+        "payload",
+        [
+            pytest.param(
+                {
+                    "resourceType": "Bundle",
+                    "type": "document",
+                    "entry": [_COMPOSITION_ENTRY],
+                },
+                id="Valid payload",
+            ),
+            pytest.param([], id="Not an object"),
+            pytest.param({}, id="Missing required fields"),
+            pytest.param(
+                {"resourceType": "Bundle", "type": "document", "entry": "invalid"},
+                id="Invalid entries",
+            ),
+            pytest.param(
+                {"resourceType": "Bundle", "type": "document", "entry": [1]},
+                id="Invalid entry",
+            ),
+            pytest.param(
+                {
+                    "resourceType": "Bundle",
+                    "type": "document",
+                    "entry": [{"fullUrl": "composition", "resource": "invalid"}],
+                },
+                id="Invalid entry resource",
+            ),
+        ],
+    )
+    def test_prescreen_request_passes(self, payload: Any) -> None:
+        prescreen_request(payload)
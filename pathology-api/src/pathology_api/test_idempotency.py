@@ -0,0 +1,346 @@
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any
+
+import pytest
+
+from pathology_api.deadline import Deadline
+from pathology_api.exception import RequestInProgressError, ValidationError
+from pathology_api.idempotency import (
+    DynamoDBIdempotencyStore,
+    Idempotency,
+    IdempotencyRecord,
+    InMemoryIdempotencyStore,
+    StoredResponse,
+    idempotency_key,
+)
+
+_RESPONSE = StoredResponse(
+    status_code=200, headers={"Content-Type": "application/fhir+json"}, body=b"{}"
+)
+
+
+def _in_progress(expires_in: float = 60) -> IdempotencyRecord:
+    return IdempotencyRecord(status="in_progress", expires_at=time.time() + expires_in)
+
+
+def _completed(expires_in: float = 60) -> IdempotencyRecord:
+    return IdempotencyRecord(
+        status="completed", expires_at=time.time() + expires_in, response=_RESPONSE
+    )
+
+
+class _ConditionalCheckFailedError(Exception):
+    def __init__(self) -> None:
+        super().__init__("The conditional request failed")
+        self.response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+
+
+class _LocalDynamoDBClient:
+    """
+    A stand-in for a DynamoDB client, supporting only the requests made by
+    DynamoDBIdempotencyStore.
+    """
+
+    def __init__(self) -> None:
+        self.tables: dict[str, dict[str, dict[str, Any]]] = {}
+
+    def put_item(self, **kwargs: Any) -> Mapping[str, Any]:
+        table = self.tables.setdefault(kwargs["TableName"], {})
+        item = kwargs["Item"]
+        key = item["id"]["S"]
+
+        if "ConditionExpression" in kwargs:
+            assert kwargs["ConditionExpression"] == (
+                "attribute_not_exists(#id) OR #expiration <= :now"
+            )
+            now = int(kwargs["ExpressionAttributeValues"][":now"]["N"])
+            existing = table.get(key)
+            if existing is not None and int(existing["expiration"]["N"]) > now:
+                raise _ConditionalCheckFailedError
+
+        table[key] = item
+        return {}
+
+    def get_item(self, **kwargs: Any) -> Mapping[str, Any]:
+        item = self.tables.get(kwargs["TableName"], {}).get(kwargs["Key"]["id"]["S"])
+        return {"Item": item} if item is not None else {}
+
+    def delete_item(self, **kwargs: Any) -> Mapping[str, Any]:
+        self.tables.get(kwargs["TableName"], {}).pop(kwargs["Key"]["id"]["S"], None)
+        return {}
+
+
+class TestInMemoryIdempotencyStore:
+    def test_claim(self) -> None:
+        store = InMemoryIdempotencyStore()
+        record = _in_progress()
+
+        assert store.claim("key", record) is None
+        assert store.claim("key", _in_progress()) == record
+
+    def test_claim_expired_record(self) -> None:
+        store = InMemoryIdempotencyStore()
+        store.put("key", _completed(expires_in=-1))
+
+        assert store.claim("key", _in_progress()) is None
+
+    def test_put_replaces_record(self) -> None:
+        store = InMemoryIdempotencyStore()
+        store.claim("key", _in_progress())
+        completed = _completed()
+
+        store.put("key", completed)
+
+        assert store.claim("key", _in_progress()) == completed
+
+    def test_delete(self) -> None:
+        store = InMemoryIdempotencyStore()
+        store.claim("key", _in_progress())
+
+        store.delete("key")
+        store.delete("unknown")
+
+        assert store.claim("key", _in_progress()) is None
+
+    def test_get(self) -> None:
+        store = InMemoryIdempotencyStore()
+        completed = _completed()
+        store.put("key", completed)
+        store.put("expired", _completed(expires_in=-1))
+
+        assert store.get("key") == completed
+        assert store.get("expired") is None
+        assert store.get("unknown") is None
+
+    def test_evicts_least_recently_used(self) -> None:
+        store = InMemoryIdempotencyStore(max_entries=2)
+        store.put("first", _completed())
+        store.put("second", _completed())
+        # Claiming an existing record marks it as recently used.
+        store.claim("first", _in_progress())
+
+        store.put("third", _completed())
+
+        assert len(store) == 2
+        assert store.claim("first", _in_progress()) is not None
+        assert store.claim("second", _in_progress()) is None
+
+
+class TestDynamoDBIdempotencyStore:
+    def _create_store(self) -> tuple[DynamoDBIdempotencyStore, _LocalDynamoDBClient]:
+        client = _LocalDynamoDBClient()
+        return DynamoDBIdempotencyStore(client, "idempotency"), client
+
+    def test_claim(self) -> None:
+        store, client = self._create_store()
+        record = _in_progress()
+
+        assert store.claim("key", record) is None
+        existing = store.claim("key", _in_progress())
+
+        assert existing is not None
+        assert existing.status == "in_progress"
+        assert existing.expires_at == int(record.expires_at)
+        assert existing.response is None
+        assert client.tables["idempotency"].keys() == {"key"}
+
+    def test_claim_expired_record(self) -> None:
+        store, _ = self._create_store()
+        store.put("key", _completed(expires_in=-1))
+
+        assert store.claim("key", _in_progress()) is None
+
+    def test_get(self) -> None:
+        store, _ = self._create_store()
+        store.put("key", _completed())
+        store.put("expired", _completed(expires_in=-1))
+
+        record = store.get("key")
+
+        assert record is not None
+        assert record.status == "completed"
+        assert record.response == _RESPONSE
+        assert store.get("expired") is None
+        assert store.get("unknown") is None
+
+    @pytest.mark.parametrize(
+        "response",
+        [
+            pytest.param(_RESPONSE, id="With body"),
+            pytest.param(
+                StoredResponse(status_code=200, headers={"Location": "/Bundle/1"}),
+                id="Without body",
+            ),
+        ],
+    )
+    def test_put_stores_response(self, response: StoredResponse) -> None:
+        store, _ = self._create_store()
+        store.claim("key", _in_progress())
+
+        store.put(
+            "key",
+            IdempotencyRecord(
+                status="completed", expires_at=time.time() + 60, response=response
+            ),
+        )
+
+        existing = store.claim("key", _in_progress())
+        assert existing is not None
+        assert existing.status == "completed"
+        assert existing.response == response
+
+    def test_put_compresses_body(self) -> None:
+        store, client = self._create_store()
+        body = b'{"resourceType": "Bundle"}' * 10_000
+
+        store.put(
+            "key",
+            IdempotencyRecord(
+                status="completed",
+                expires_at=time.time() + 60,
+                response=StoredResponse(status_code=200, body=body),
+            ),
+        )
+
+        assert len(client.tables["idempotency"]["key"]["body"]["B"]) < len(body) / 10
+
+    def test_put_response_too_large(self) -> None:
+        store, client = self._create_store()
+        store.claim("key", _in_progress())
+
+        store.put(
+            "key",
+            IdempotencyRecord(
+                status="completed",
+                expires_at=time.time() + 60,
+                response=StoredResponse(status_code=200, body=os.urandom(512 * 1024)),
+            ),
+        )
+
+        assert client.tables["idempotency"] == {}
+
+    def test_claim_raises_other_errors(self) -> None:
+        store, client = self._create_store()
+
+        def put_item(**_: Any) -> Mapping[str, Any]:
+            raise RuntimeError("Unavailable")
+
+        client.put_item = put_item  # type: ignore[method-assign]
+
+        with pytest.raises(RuntimeError, match="Unavailable"):
+            store.claim("key", _in_progress())
+
+
+class TestIdempotency:
+    def test_run_stores_response(self) -> None:
+        idempotency = Idempotency(InMemoryIdempotencyStore())
+        calls: list[str] = []
+
+        def func() -> StoredResponse:
+            calls.append("called")
+            return _RESPONSE
+
+        assert idempotency.run("key", func) == _RESPONSE
+        assert idempotency.run("key", func) == _RESPONSE
+        assert calls == ["called"]
+
+    def test_run_with_different_keys(self) -> None:
+        idempotency = Idempotency(InMemoryIdempotencyStore())
+        calls: list[str] = []
+
+        def func() -> StoredResponse:
+            calls.append("called")
+            return _RESPONSE
+
+        idempotency.run("first", func)
+        idempotency.run("second", func)
+
+        assert calls == ["called", "called"]
+
+    def test_run_response_expires(self) -> None:
+        idempotency = Idempotency(InMemoryIdempotencyStore(), ttl=-1)
+        calls: list[str] = []
+
+        def func() -> StoredResponse:
+            calls.append("called")
+            return _RESPONSE
+
+        idempotency.run("key", func)
+        idempotency.run("key", func)
+
+        assert calls == ["called", "called"]
+
+    def test_run_exception_not_stored(self) -> None:
+        idempotency = Idempotency(InMemoryIdempotencyStore())
+
+        def failing() -> StoredResponse:
+            raise ValidationError("Invalid")
+
+        with pytest.raises(ValidationError, match="Invalid"):
+            idempotency.run("key", failing)
+
+        assert idempotency.run("key", lambda: _RESPONSE) == _RESPONSE
+
+    def test_run_waits_for_request_in_progress(self) -> None:
+        idempotency = Idempotency(InMemoryIdempotencyStore(), poll_interval=0.001)
+        started = threading.Event()
+        release = threading.Event()
+        calls: list[str] = []
+
+        def slow() -> StoredResponse:
+            calls.append("called")
+            started.set()
+            release.wait()
+            return _RESPONSE
+
+        first = threading.Thread(target=idempotency.run, args=("key", slow))
+        first.start()
+        started.wait()
+
+        results: list[StoredResponse] = []
+        second = threading.Thread(
+            target=lambda: results.append(idempotency.run("key", slow))
+        )
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+        assert results == [_RESPONSE]
+        assert calls == ["called"]
+
+    def test_run_request_in_progress_timeout(self) -> None:
+        store = InMemoryIdempotencyStore()
+        store.claim("key", _in_progress())
+        idempotency = Idempotency(store, in_progress_ttl=0.01, poll_interval=0.001)
+
+        with pytest.raises(
+            RequestInProgressError,
+            match="A request with the same X-Request-ID is already being processed.",
+        ):
+            idempotency.run("key", lambda: _RESPONSE)
+
+    def test_run_request_in_progress_stops_at_deadline(self) -> None:
+        store = InMemoryIdempotencyStore()
+        store.claim("key", _in_progress())
+        idempotency = Idempotency(store, in_progress_ttl=30, poll_interval=0.001)
+
+        start = time.monotonic()
+        with pytest.raises(RequestInProgressError):
+            idempotency.run("key", lambda: _RESPONSE, Deadline.after(0.01))
+
+        assert time.monotonic() - start < 1
+
+
+class TestIdempotencyKey:
+    def test_idempotency_key(self) -> None:
+        key = idempotency_key("request", '{"resourceType": "Bundle"}')
+
+        assert key.startswith("request#")
+        assert key == idempotency_key("request", b'{"resourceType": "Bundle"}')
+        assert key != idempotency_key("request", '{"resourceType": "Patient"}')
+        assert key != idempotency_key("other", '{"resourceType": "Bundle"}')
+        assert idempotency_key("request", None) == idempotency_key("request", "")
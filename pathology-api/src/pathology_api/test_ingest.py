@@ -0,0 +1,744 @@
+import base64
+import gzip
+import io
+import json
+import zlib
+from typing import Any
+from unittest.mock import patch
+
+import pydantic
+import pytest
+
+from pathology_api.exception import (
+    PayloadTooLargeError,
+    UnsupportedMediaTypeError,
+    ValidationError,
+)
+from pathology_api.fhir.r4.elements import LogicalReference, PatientIdentifier
+from pathology_api.fhir.r4.resources import Bundle, Composition, Observation
+from pathology_api.fhir.r4.serialization import dump_json
+from pathology_api.ingest import (
+    Limits,
+    decode_body,
+    parse_batch,
+    parse_bundle,
+    parse_bundle_stream,
+    parses_incrementally,
+    screen_bundle,
+)
+
+_LIMITS = Limits(max_body_bytes=16, max_entries=2, max_depth=4)
+
+
+class TestLimits:
+    @pytest.mark.parametrize(
+        "content_length",
+        [
+            pytest.param(None, id="Not provided"),
+            pytest.param("16", id="At limit"),
+            pytest.param("invalid", id="Not a number"),
+        ],
+    )
+    def test_check_content_length(self, content_length: str | None) -> None:
+        _LIMITS.check_content_length(content_length)
+
+    def test_check_content_length_exceeded(self) -> None:
+        with pytest.raises(
+            PayloadTooLargeError,
+            match="Request body exceeds the maximum size of 16 bytes.",
+        ):
+            _LIMITS.check_content_length("17")
+
+    def test_from_config(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("MAX_BODY_BYTES", "1")
+        monkeypatch.setenv("MAX_ENTRIES", "2")
+        monkeypatch.setenv("MAX_DEPTH", "3")
+
+        assert Limits.from_config() == Limits(
+            max_body_bytes=1, max_entries=2, max_depth=3
+        )
+
+
+class TestDecodeBody:
+    @pytest.mark.parametrize(
+        ("body", "is_base64_encoded", "expected_body"),
+        [
+            pytest.param(None, False, b"", id="No body"),
+            pytest.param("", True, b"", id="Empty base64 body"),
+            pytest.param('{"key": "value"}', False, b'{"key": "value"}', id="str"),
+            pytest.param(b'{"key": "value"}', False, b'{"key": "value"}', id="bytes"),
+            pytest.param(
+                base64.b64encode(b'{"key": "value"}').decode(),
+                True,
+                b'{"key": "value"}',
+                id="Base64 encoded",
+            ),
+        ],
+    )
+    def test_decode_body(
+        self,
+        body: str | bytes | None,
+        is_base64_encoded: bool,
+        expected_body: bytes,
+    ) -> None:
+        assert decode_body(body, is_base64_encoded) == expected_body
+
+    @pytest.mark.parametrize(
+        ("body", "is_base64_encoded"),
+        [
+            pytest.param(b"x" * 16, False, id="At limit"),
+            pytest.param(base64.b64encode(b"x" * 16).decode(), True, id="Base64"),
+        ],
+    )
+    def test_decode_body_within_limits(
+        self, body: str | bytes, is_base64_encoded: bool
+    ) -> None:
+        assert decode_body(body, is_base64_encoded, limits=_LIMITS) == b"x" * 16
+
+    @pytest.mark.parametrize(
+        ("body", "is_base64_encoded"),
+        [
+            pytest.param("x" * 17, False, id="str"),
+            pytest.param(b"x" * 17, False, id="bytes"),
+            pytest.param(base64.b64encode(b"x" * 18).decode(), True, id="Base64"),
+        ],
+    )
+    def test_decode_body_exceeds_limits(
+        self, body: str | bytes, is_base64_encoded: bool
+    ) -> None:
+        with pytest.raises(PayloadTooLargeError):
+            decode_body(body, is_base64_encoded, limits=_LIMITS)
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param("not base64!", id="Invalid characters"),
+            pytest.param("eyJrZXk", id="Incorrect padding"),
+        ],
+    )
+    def test_decode_body_invalid_base64(self, body: str) -> None:
+        with pytest.raises(ValidationError, match="not valid base64"):
+            decode_body(body, is_base64_encoded=True)
+
+
+def _raw_deflate(data: bytes) -> bytes:
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class TestDecodeBodyContentEncoding:
+    _BODY = b'{"resourceType": "Bundle", "type": "document"}' * 100
+
+    @pytest.mark.parametrize(
+        ("body", "content_encoding"),
+        [
+            pytest.param(_BODY, None, id="Not provided"),
+            pytest.param(_BODY, "identity", id="identity"),
+            pytest.param(gzip.compress(_BODY), "gzip", id="gzip"),
+            pytest.param(gzip.compress(_BODY), "x-gzip", id="x-gzip"),
+            pytest.param(gzip.compress(_BODY), " GZIP ", id="gzip, case insensitive"),
+            pytest.param(zlib.compress(_BODY), "deflate", id="deflate"),
+            pytest.param(_raw_deflate(_BODY), "deflate", id="Raw deflate"),
+            pytest.param(
+                gzip.compress(zlib.compress(_BODY)),
+                "deflate, gzip",
+                id="Multiple encodings",
+            ),
+            pytest.param(
+                gzip.compress(_BODY[:1000]) + gzip.compress(_BODY[1000:]),
+                "gzip",
+                id="Multiple gzip members",
+            ),
+        ],
+    )
+    def test_decode_body_decompresses(
+        self, body: bytes, content_encoding: str | None
+    ) -> None:
+        limits = Limits(max_body_bytes=len(self._BODY), max_entries=1, max_depth=1)
+
+        assert (
+            decode_body(body, limits=limits, content_encoding=content_encoding)
+            == self._BODY
+        )
+
+    def test_decode_body_decompresses_base64_encoded(self) -> None:
+        body = base64.b64encode(gzip.compress(self._BODY)).decode()
+
+        assert (
+            decode_body(body, is_base64_encoded=True, content_encoding="gzip")
+            == self._BODY
+        )
+
+    @pytest.mark.parametrize(
+        ("body", "content_encoding"),
+        [
+            pytest.param(gzip.compress(b"\0" * 10_000_000), "gzip", id="gzip"),
+            pytest.param(zlib.compress(b"\0" * 10_000_000), "deflate", id="deflate"),
+        ],
+    )
+    def test_decode_body_decompressed_size_exceeded(
+        self, body: bytes, content_encoding: str
+    ) -> None:
+        limits = Limits(max_body_bytes=100_000, max_entries=1, max_depth=1)
+
+        with pytest.raises(
+            PayloadTooLargeError,
+            match="Request body exceeds the maximum size of 100000 bytes.",
+        ):
+            decode_body(body, limits=limits, content_encoding=content_encoding)
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param(b"not compressed", id="Not compressed"),
+            pytest.param(gzip.compress(_BODY)[:-20], id="Truncated"),
+        ],
+    )
+    def test_decode_body_invalid_compressed_body(self, body: bytes) -> None:
+        with pytest.raises(
+            ValidationError, match="Request body could not be decompressed."
+        ):
+            decode_body(body, content_encoding="gzip")
+
+    @pytest.mark.parametrize(
+        ("content_encoding", "expected_message"),
+        [
+            pytest.param("br", "Unsupported Content-Encoding: br.", id="br"),
+            pytest.param(
+                "gzip, compress, zstd",
+                "Unsupported Content-Encoding: compress, zstd.",
+                id="Multiple unsupported",
+            ),
+        ],
+    )
+    def test_decode_body_unsupported_content_encoding(
+        self, content_encoding: str, expected_message: str
+    ) -> None:
+        with pytest.raises(UnsupportedMediaTypeError, match=expected_message):
+            decode_body(self._BODY, content_encoding=content_encoding)
+
+
+class TestParseBundle:
+    def test_parse_bundle(self) -> None:
+        expected_bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(
+                    fullUrl="composition",
+                    resource=Composition.create(
+                        subject=LogicalReference(
+                            PatientIdentifier.from_nhs_number("nhs_number")
+                        )
+                    ),
+                )
+            ],
+        )
+
+        bundle = parse_bundle(expected_bundle.model_dump_json(by_alias=True).encode())
+
+        assert bundle == expected_bundle
+
+    @pytest.mark.parametrize(
+        ("body", "expected_message"),
+        [
+            pytest.param(
+                b"",
+                "Resources must be provided as a bundle of type 'document'",
+                id="Empty body",
+            ),
+            pytest.param(
+                b"null",
+                "Resources must be provided as a bundle of type 'document'",
+                id="null payload",
+            ),
+            pytest.param(b"invalid json", "Invalid payload provided.", id="Not JSON"),
+            pytest.param(
+                b'{"resourceType": "Bundle", "type": "document"',
+                "Invalid payload provided.",
+                id="Truncated JSON",
+            ),
+        ],
+    )
+    def test_parse_bundle_invalid_payload(
+        self, body: bytes, expected_message: str
+    ) -> None:
+        with pytest.raises(ValidationError, match=expected_message):
+            parse_bundle(body)
+
+    def test_parse_bundle_invalid_bundle(self) -> None:
+        with pytest.raises(
+            pydantic.ValidationError,
+            match="1 validation error for Bundle\ntype\n  Field required",
+        ):
+            parse_bundle(b'{"resourceType": "Bundle"}')
+
+    def test_parse_bundle_prescreen_rejects_before_validation(self) -> None:
+        payloads = []
+
+        def prescreen(payload: object) -> None:
+            payloads.append(payload)
+            raise ValidationError("Rejected")
+
+        with (
+            patch.object(Bundle, "model_validate") as model_validate,
+            pytest.raises(ValidationError, match="Rejected"),
+        ):
+            parse_bundle(b'{"resourceType": "Bundle"}', prescreen=prescreen)
+
+        assert payloads == [{"resourceType": "Bundle"}]
+        model_validate.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param(b'{"a": [[{"b": []}]]}', id="Nested objects and arrays"),
+            pytest.param(
+                b'{"a": [["]]]]", [{"b": {}}]]]}', id="Brackets within strings"
+            ),
+            pytest.param(
+                b'{"a": [["\\"]]]]", [{"b": {}}]]]}', id="Escaped quote in string"
+            ),
+        ],
+    )
+    def test_parse_bundle_exceeds_max_depth(self, body: bytes) -> None:
+        with pytest.raises(
+            ValidationError, match="Payload exceeds the maximum nesting depth of 4."
+        ):
+            parse_bundle(body, limits=_LIMITS)
+
+    @pytest.mark.parametrize("retain_encoded", [True, False])
+    @pytest.mark.parametrize(
+        "title",
+        [
+            pytest.param(b"[[{{", id="Brackets within strings"),
+            pytest.param(b'\\"[[{{', id="Escaped quote in string"),
+            pytest.param(b"\\\\", id="Escaped backslash in string"),
+        ],
+    )
+    def test_parse_bundle_within_max_depth(
+        self, title: bytes, retain_encoded: bool
+    ) -> None:
+        body = (
+            b'{"resourceType": "Bundle", "type": "document", "entry": '
+            b'[{"fullUrl": "composition", "resource": {"resourceType": '
+            b'"Composition", "title": "' + title + b'"}}]}'
+        )
+
+        bundle = parse_bundle(body, retain_encoded=retain_encoded, limits=_LIMITS)
+
+        assert bundle.entries is not None
+
+    def test_parse_bundle_exceeds_max_entries(self) -> None:
+        entry = b'{"fullUrl": "composition", "resource": {"resourceType": "Patient"}}'
+        body = (
+            b'{"resourceType": "Bundle", "type": "document", "entry": ['
+            + b", ".join([entry] * 3)
+            + b"]}"
+        )
+
+        with (
+            patch.object(Bundle, "model_validate") as model_validate,
+            pytest.raises(
+                PayloadTooLargeError,
+                match="Bundle exceeds the maximum of 2 entries.",
+            ),
+        ):
+            parse_bundle(body, limits=_LIMITS)
+
+        model_validate.assert_not_called()
+
+    @pytest.mark.parametrize("retain_encoded", [True, False])
+    def test_parse_bundle_beyond_parser_recursion(self, retain_encoded: bool) -> None:
+        body = b'{"entry": [{"resource": ' + b"[" * 100_000 + b"]" * 100_000 + b"}]}"
+
+        with pytest.raises(ValidationError, match="Invalid payload provided."):
+            parse_bundle(body, retain_encoded=retain_encoded)
+
+
+class TestScreenBundle:
+    def test_screen_bundle(self) -> None:
+        checked: list[Any] = []
+
+        screen_bundle(
+            b'{"resourceType": "Bundle", "entry": [{}]}',
+            prescreen=checked.append,
+            limits=_LIMITS,
+        )
+
+        assert checked == [{"resourceType": "Bundle", "entry": [{}]}]
+
+    @pytest.mark.parametrize(
+        ("body", "expected_error", "expected_message"),
+        [
+            pytest.param(
+                b"",
+                ValidationError,
+                "Resources must be provided as a bundle of type 'document'",
+                id="Empty body",
+            ),
+            pytest.param(
+                b"{", ValidationError, "Invalid payload provided.", id="Invalid JSON"
+            ),
+            pytest.param(
+                b"[[[[[[]]]]]]",
+                ValidationError,
+                "Payload exceeds the maximum nesting depth of 4.",
+                id="Too deeply nested",
+            ),
+            pytest.param(
+                b'{"entry": [{}, {}, {}]}',
+                PayloadTooLargeError,
+                "Bundle exceeds the maximum of 2 entries.",
+                id="Too many entries",
+            ),
+        ],
+    )
+    def test_screen_bundle_rejected(
+        self, body: bytes, expected_error: type[Exception], expected_message: str
+    ) -> None:
+        with pytest.raises(expected_error, match=expected_message):
+            screen_bundle(body, limits=_LIMITS)
+
+    def test_screen_bundle_does_not_validate(self) -> None:
+        with patch.object(Bundle, "model_validate") as model_validate_mock:
+            screen_bundle(b'{"resourceType": "Bundle", "type": "searchset"}')
+
+        model_validate_mock.assert_not_called()
+
+
+class TestParseBatch:
+    @staticmethod
+    def _batch(*resources: Any, **fields: Any) -> bytes:
+        return json.dumps(
+            {
+                "resourceType": "Bundle",
+                "type": "batch",
+                "entry": [
+                    {"request": {"method": "POST", "url": "Bundle"}, "resource": r}
+                    for r in resources
+                ],
+            }
+            | fields
+        ).encode()
+
+    def test_parse_batch(self) -> None:
+        documents = [{"resourceType": "Bundle", "type": "document"}, {}]
+
+        entries = parse_batch(self._batch(*documents), max_entries=2)
+
+        assert [entry["resource"] for entry in entries] == documents
+
+    def test_parse_batch_without_entries(self) -> None:
+        assert parse_batch(self._batch(entry=None), max_entries=1) == []
+
+    @pytest.mark.parametrize(
+        ("body", "expected_message"),
+        [
+            pytest.param(b"", "bundle of type 'batch'", id="No payload"),
+            pytest.param(b"{", "Invalid payload provided.", id="Invalid JSON"),
+            pytest.param(b"[]", "bundle of type 'batch'", id="Not an object"),
+            pytest.param(
+                b'{"resourceType": "Bundle", "type": "document"}',
+                "bundle of type 'batch'",
+                id="Document Bundle",
+            ),
+            pytest.param(
+                b'{"resourceType": "Patient", "type": "batch"}',
+                "bundle of type 'batch'",
+                id="Not a Bundle",
+            ),
+            pytest.param(
+                b'{"resourceType": "Bundle", "type": "batch", "entry": {}}',
+                "Bundle entries must be provided as a list.",
+                id="Entries not a list",
+            ),
+        ],
+    )
+    def test_parse_batch_invalid(self, body: bytes, expected_message: str) -> None:
+        with pytest.raises(ValidationError, match=expected_message):
+            parse_batch(body, max_entries=1)
+
+    def test_parse_batch_exceeds_max_entries(self) -> None:
+        with pytest.raises(
+            PayloadTooLargeError, match="Batch exceeds the maximum of 1 entries."
+        ):
+            parse_batch(self._batch({}, {}), max_entries=1)
+
+    def test_parse_batch_depth_applied_to_resources(self) -> None:
+        limits = Limits(max_body_bytes=1024, max_entries=1, max_depth=2)
+
+        parse_batch(self._batch({"a": [1]}), max_entries=1, limits=limits)
+        with pytest.raises(
+            ValidationError, match="Payload exceeds the maximum nesting depth of 2."
+        ):
+            parse_batch(self._batch({"a": [[1]]}), max_entries=1, limits=limits)
+
+
+class TestParseBundleRetainingEncoded:
+    _OBSERVATION = b'{ "resourceType" : "Observation", "status": "final", "id": "obs" }'
+    _BODY = (
+        b'{"resourceType": "Bundle", "type": "document", "entry": ['
+        b'{"fullUrl": "composition", "resource": {"resourceType": "Composition"}}, '
+        b'{"fullUrl": "observation", "resource": ' + _OBSERVATION + b"}\n]}"
+    )
+
+    def test_parse_bundle_retains_encoded_json(self) -> None:
+        bundle = parse_bundle(self._BODY, retain_encoded=True)
+
+        assert bundle.entries is not None
+        composition, observation = (entry.resource for entry in bundle.entries)
+        assert isinstance(composition, Composition)
+        assert composition.encoded_json() is None
+        assert isinstance(observation, Observation)
+        assert observation.encoded_json() == self._OBSERVATION
+
+    def test_parse_bundle_retaining_encoded_matches_eager(self) -> None:
+        lazy = parse_bundle(self._BODY, retain_encoded=True)
+        eager = parse_bundle(self._BODY)
+
+        assert lazy == eager
+        assert lazy.model_dump(by_alias=True) == eager.model_dump(by_alias=True)
+
+    def test_parse_bundle_retaining_encoded_dumps_original_json(self) -> None:
+        bundle = parse_bundle(self._BODY, retain_encoded=True)
+
+        assert self._OBSERVATION in dump_json(bundle)
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param(b"invalid json", id="Not JSON"),
+            pytest.param(b'{"type": "document"} {}', id="Extra data"),
+            pytest.param(b'{"entry": [{"resource": {}},]}', id="Trailing comma"),
+            pytest.param(b'{"entry": [{"resource" {}}]}', id="Missing colon"),
+            pytest.param(b'{"entry": [{resource: {}}]}', id="Unquoted key"),
+        ],
+    )
+    def test_parse_bundle_retaining_encoded_invalid_json(self, body: bytes) -> None:
+        with pytest.raises(ValidationError, match="Invalid payload provided."):
+            parse_bundle(body, retain_encoded=True)
+
+    def test_parse_bundle_retaining_encoded_escaped_keys(self) -> None:
+        body = (
+            b'{"resourceType": "Bundle", "type": "document", "\\u0065ntry": ['
+            b'{"fullUrl": "observation", "resource": ' + self._OBSERVATION + b"}]}"
+        )
+
+        bundle = parse_bundle(body, retain_encoded=True)
+
+        assert bundle.entries is not None
+        assert bundle.entries[0].resource.encoded_json() == self._OBSERVATION
+
+    def test_parse_bundle_retaining_encoded_duplicate_entry_key(self) -> None:
+        body = (
+            b'{"resourceType": "Bundle", "type": "document", "entry": ['
+            b'{"fullUrl": "composition", "resource": {"resourceType": "Composition"}}, '
+            b'{"fullUrl": "observation", "resource": ' + self._OBSERVATION + b"}], "
+            b'"entry": [{"fullUrl": "composition", '
+            b'"resource": {"resourceType": "Composition"}}]}'
+        )
+
+        lazy = parse_bundle(body, retain_encoded=True)
+
+        # The last value of a repeated key is kept, as when retaining nothing.
+        assert lazy == parse_bundle(body)
+        assert lazy.entries is not None
+        assert len(lazy.entries) == 1
+
+
+class TestParseBundleStream:
+    _OBSERVATION = b'{ "resourceType" : "Observation", "status": "final", "id": "obs" }'
+    _BODY = (
+        b'{"resourceType": "Bundle", "type": "document", "entry": ['
+        b'{"fullUrl": "composition", "resource": {"resourceType": "Composition"}}, '
+        b'{"fullUrl": "observation", "resource": ' + _OBSERVATION + b"}\n]}"
+    )
+
+    _PATIENT_ENTRY = b'{"fullUrl": "patient", "resource": {"resourceType": "Patient"}}'
+
+    class _Stream(io.BytesIO):
+        """A stream recording the number of bytes read from it."""
+
+        def __init__(self, content: bytes):
+            super().__init__(content)
+            self.bytes_read = 0
+
+        def read(self, size: int | None = -1) -> bytes:
+            data = super().read(size)
+            self.bytes_read += len(data)
+            return data
+
+    @pytest.mark.parametrize("retain_encoded", [False, True])
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+    def test_parse_bundle_stream_matches_parse_bundle(
+        self, retain_encoded: bool, chunk_size: int
+    ) -> None:
+        expected = parse_bundle(self._BODY, retain_encoded=retain_encoded)
+
+        bundle = parse_bundle_stream(
+            io.BytesIO(self._BODY),
+            retain_encoded=retain_encoded,
+            chunk_size=chunk_size,
+        )
+
+        assert bundle == expected
+        assert dump_json(bundle) == dump_json(expected)
+
+    def test_parse_bundle_stream_retains_encoded_json(self) -> None:
+        bundle = parse_bundle_stream(
+            io.BytesIO(self._BODY), retain_encoded=True, chunk_size=5
+        )
+
+        assert bundle.entries is not None
+        assert bundle.entries[1].resource.encoded_json() == self._OBSERVATION
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param(b"", id="Empty body"),
+            pytest.param(b" null ", id="Null"),
+        ],
+    )
+    def test_parse_bundle_stream_no_payload(self, body: bytes) -> None:
+        with pytest.raises(
+            ValidationError,
+            match="Resources must be provided as a bundle of type 'document'",
+        ):
+            parse_bundle_stream(io.BytesIO(body))
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            pytest.param(b"invalid json", id="Not JSON"),
+            pytest.param(b'{"type": "document"} {}', id="Extra data"),
+            pytest.param(b'{"type": "document",}', id="Trailing comma"),
+            pytest.param(b'{"type": "document", "entry": [', id="Truncated"),
+            pytest.param(b'{"type": "document" "entry": []}', id="Missing comma"),
+            pytest.param(b'{"type": "\xff"}', id="Invalid UTF-8"),
+        ],
+    )
+    def test_parse_bundle_stream_invalid_json(self, body: bytes) -> None:
+        with pytest.raises(ValidationError, match="Invalid payload provided."):
+            parse_bundle_stream(io.BytesIO(body), chunk_size=4)
+
+    def test_parse_bundle_stream_not_an_object(self) -> None:
+        with pytest.raises(pydantic.ValidationError):
+            parse_bundle_stream(io.BytesIO(b"[]"))
+
+    def test_parse_bundle_stream_stops_at_first_invalid_entry(self) -> None:
+        entries = [{"fullUrl": "observation", "resource": {"resourceType": "Patient"}}]
+        body = json.dumps(
+            {
+                "resourceType": "Bundle",
+                "type": "document",
+                "entry": [{"resource": {"resourceType": "Patient"}}] + entries * 1000,
+            }
+        ).encode()
+        stream = self._Stream(body)
+
+        with pytest.raises(pydantic.ValidationError) as exc_info:
+            parse_bundle_stream(stream, chunk_size=64)
+
+        # Located as if the whole Bundle had been validated.
+        assert [error["loc"] for error in exc_info.value.errors()] == [
+            ("entry", 0, "fullUrl")
+        ]
+        assert stream.bytes_read < len(body) / 100
+
+    @pytest.mark.parametrize(
+        ("body", "expected_error", "expected_message"),
+        [
+            pytest.param(
+                b'{"entry": [' + b", ".join([_PATIENT_ENTRY] * 3) + b"]}",
+                PayloadTooLargeError,
+                "Bundle exceeds the maximum of 2 entries.",
+                id="Too many entries",
+            ),
+            pytest.param(
+                b'{"entry": [{"resource": {"a": [[1]]}}]}',
+                ValidationError,
+                "Payload exceeds the maximum nesting depth of 4.",
+                id="Entry too deep",
+            ),
+            pytest.param(
+                b'{"meta": {"a": {"b": {"c": [1]}}}}',
+                ValidationError,
+                "Payload exceeds the maximum nesting depth of 4.",
+                id="Field too deep",
+            ),
+        ],
+    )
+    def test_parse_bundle_stream_exceeds_limits(
+        self, body: bytes, expected_error: type[Exception], expected_message: str
+    ) -> None:
+        limits = Limits(max_body_bytes=1024, max_entries=2, max_depth=4)
+
+        with pytest.raises(expected_error, match=expected_message):
+            parse_bundle_stream(io.BytesIO(body), limits=limits)
+
+    def test_parse_bundle_stream_exceeds_max_body_bytes(self) -> None:
+        limits = Limits(max_body_bytes=16, max_entries=2, max_depth=4)
+        stream = self._Stream(self._BODY)
+
+        with pytest.raises(PayloadTooLargeError):
+            parse_bundle_stream(stream, limits=limits, chunk_size=8)
+
+        assert stream.bytes_read <= 24
+
+    @pytest.mark.parametrize("retain_encoded", [False, True])
+    def test_parse_bundle_stream_prescreen(self, retain_encoded: bool) -> None:
+        screened: list[object] = []
+
+        bundle = parse_bundle_stream(
+            io.BytesIO(self._BODY),
+            retain_encoded=retain_encoded,
+            prescreen=screened.append,
+        )
+
+        assert bundle.entries is not None
+        assert screened == [
+            {
+                "resourceType": "Bundle",
+                "type": "document",
+                "entry": [
+                    {
+                        "fullUrl": "composition",
+                        "resource": {"resourceType": "Composition"},
+                    },
+                    {"resource": {"resourceType": "Observation"}},
+                ],
+            }
+        ]
+
+    def test_parse_bundle_stream_prescreen_rejects(self) -> None:
+        def prescreen(_payload: object) -> None:
+            raise ValidationError("Rejected by prescreen.")
+
+        with pytest.raises(ValidationError, match="Rejected by prescreen."):
+            parse_bundle_stream(io.BytesIO(self._BODY), prescreen=prescreen)
+
+    @pytest.mark.parametrize("retain_encoded", [False, True])
+    def test_parse_bundle_incremental(self, retain_encoded: bool) -> None:
+        bundle = parse_bundle(
+            self._BODY, retain_encoded=retain_encoded, incremental=True
+        )
+
+        assert bundle == parse_bundle(self._BODY)
+
+    @pytest.mark.parametrize(
+        ("threshold", "expected"),
+        [
+            pytest.param(None, False, id="Not configured"),
+            pytest.param(str(len(_BODY)), False, id="At threshold"),
+            pytest.param(str(len(_BODY) - 1), True, id="Beyond threshold"),
+        ],
+    )
+    def test_parses_incrementally(
+        self, monkeypatch: pytest.MonkeyPatch, threshold: str | None, expected: bool
+    ) -> None:
+        if threshold is None:
+            monkeypatch.delenv("INCREMENTAL_PARSE_BYTES", raising=False)
+        else:
+            monkeypatch.setenv("INCREMENTAL_PARSE_BYTES", threshold)
+
+        assert parses_incrementally(self._BODY) == expected
@@ -0,0 +1,310 @@
+import json
+import logging
+import uuid
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from tests.pdm_stub import StubPDMServer, StubResponse
+
+from pathology_api.connections import RetryPolicy
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.ingest import parse_bundle
+from pathology_api.mns import (
+    MNSClient,
+    MNSError,
+    MNSEvent,
+    MNSPublisher,
+    publisher_from_config,
+    result_event,
+)
+from pathology_api.transaction import written_references
+from pathology_api.work_queue import InMemoryWorkQueue
+
+_ODS_CODE_SYSTEM = "https://fhir.nhs.uk/Id/ods-organization-code"
+
+# Retries without waiting, so that tests are not slowed down by backoff.
+_NO_BACKOFF = RetryPolicy(max_attempts=2, base_delay=0, max_delay=0)
+
+
+def _organization(ods_code: str) -> dict[str, Any]:
+    return {
+        "resourceType": "Organization",
+        "identifier": {"system": _ODS_CODE_SYSTEM, "value": ods_code},
+    }
+
+
+def _document(
+    *organizations: dict[str, Any],
+    requester: str = "PractitionerRole",
+    diagnostic_report: bool = False,
+) -> Bundle:
+    entries: list[dict[str, Any]] = [
+        {
+            "fullUrl": "Composition",
+            "resource": {
+                "resourceType": "Composition",
+                "subject": {
+                    "identifier": {
+                        "system": "https://fhir.nhs.uk/Id/nhs-number",
+                        "value": "9727710638",
+                    }
+                },
+            },
+        },
+        {
+            "fullUrl": "ServiceRequest",
+            "resource": {
+                "resourceType": "ServiceRequest",
+                "requester": {"reference": requester},
+            },
+        },
+        {
+            "fullUrl": "PractitionerRole",
+            "resource": {
+                "resourceType": "PractitionerRole",
+                "organization": {"reference": "Organization/0"},
+            },
+        },
+    ]
+    entries.extend(
+        {"fullUrl": f"Organization/{index}", "resource": organization}
+        for index, organization in enumerate(organizations)
+    )
+    if diagnostic_report:
+        entries.append(
+            {
+                "fullUrl": "DiagnosticReport",
+                "resource": {"resourceType": "DiagnosticReport", "status": "final"},
+            }
+        )
+    document = {
+        "resourceType": "Bundle",
+        "id": str(uuid.uuid4()),
+        "type": "document",
+        "entry": entries,
+    }
+    return parse_bundle(json.dumps(document).encode())
+
+
+def _event(ods_code: str) -> MNSEvent:
+    return MNSEvent(ods_code=ods_code, content={"id": str(uuid.uuid4())})
+
+
+@pytest.fixture
+def stub() -> Iterator[StubPDMServer]:
+    with StubPDMServer() as server:
+        yield server
+
+
+class TestResultEvent:
+    def test_result_event(self) -> None:
+        bundle = _document(_organization("A12345"))
+
+        event = result_event(bundle)
+
+        assert event is not None
+        assert event.ods_code == "A12345"
+        assert event.content["specversion"] == "1.0"
+        assert event.content["subject"] == "9727710638"
+        # The Composition, as written to PDM.
+        assert event.content["dataref"] == written_references(bundle)[0]
+        assert event.content["dataref"].startswith("Composition/")
+        assert event.content["filtering"] == {"generalpractitioner": "A12345"}
+
+    def test_result_event_refers_to_diagnostic_report(self) -> None:
+        bundle = _document(_organization("A12345"), diagnostic_report=True)
+
+        event = result_event(bundle)
+
+        assert event is not None
+        assert event.content["dataref"] == written_references(bundle)[-1]
+        assert event.content["dataref"].startswith("DiagnosticReport/")
+
+    def test_result_event_is_deterministic(self) -> None:
+        bundle = _document(_organization("A12345"))
+
+        first = result_event(bundle)
+        second = result_event(bundle)
+
+        assert first is not None
+        assert second is not None
+        assert first.content["id"] == second.content["id"]
+
+    @pytest.mark.parametrize(
+        ("organizations", "requester", "expected_ods_code"),
+        [
+            pytest.param(
+                [_organization("A12345"), _organization("B67890")],
+                "PractitionerRole",
+                "A12345",
+                id="Requesting organisation",
+            ),
+            pytest.param(
+                [
+                    {
+                        "resourceType": "Organization",
+                        "identifier": [
+                            {"system": "https://example.org", "value": "other"},
+                            {"system": _ODS_CODE_SYSTEM, "value": "A12345"},
+                        ],
+                    }
+                ],
+                "PractitionerRole",
+                "A12345",
+                id="List of identifiers",
+            ),
+            pytest.param(
+                [_organization("A12345")],
+                "Unknown",
+                "A12345",
+                id="Unresolved requester with a single organisation",
+            ),
+            pytest.param(
+                [_organization("A12345"), _organization("B67890")],
+                "Unknown",
+                None,
+                id="Unresolved requester with several organisations",
+            ),
+            pytest.param(
+                [{"resourceType": "Organization"}],
+                "PractitionerRole",
+                None,
+                id="No ODS code",
+            ),
+        ],
+    )
+    def test_result_event_recipient(
+        self,
+        organizations: list[dict[str, Any]],
+        requester: str,
+        expected_ods_code: str | None,
+    ) -> None:
+        event = result_event(_document(*organizations, requester=requester))
+
+        assert (event.ods_code if event else None) == expected_ods_code
+
+
+class TestMNSPublisher:
+    def test_flush_groups_by_recipient(self, stub: StubPDMServer) -> None:
+        publisher = MNSPublisher(MNSClient(stub.url), InMemoryWorkQueue())
+        events = [_event("A12345"), _event("B67890"), _event("A12345")]
+        for event in events:
+            publisher.add(event)
+
+        published = publisher.flush()
+
+        assert published == 3
+        assert len(publisher) == 0
+        assert len(stub.requests) == 2
+        published_ids = {
+            request.headers["X-Request-ID"]: [e["id"] for e in json.loads(request.body)]
+            for request in stub.requests
+        }
+        assert sorted(published_ids.values()) == sorted(
+            [
+                [events[0].content["id"], events[2].content["id"]],
+                [events[1].content["id"]],
+            ]
+        )
+        assert {request.headers["Content-Type"] for request in stub.requests} == {
+            "application/cloudevents-batch+json"
+        }
+
+    def test_flush_splits_batches(self, stub: StubPDMServer) -> None:
+        publisher = MNSPublisher(
+            MNSClient(stub.url), InMemoryWorkQueue(), max_batch_events=2
+        )
+        for _ in range(5):
+            publisher.add(_event("A12345"))
+
+        publisher.flush()
+
+        assert sorted(len(json.loads(r.body)) for r in stub.requests) == [1, 2, 2]
+
+    def test_flush_nothing_buffered(self, stub: StubPDMServer) -> None:
+        publisher = MNSPublisher(MNSClient(stub.url), InMemoryWorkQueue())
+
+        assert publisher.flush() == 0
+        assert stub.requests == []
+
+    def test_connections_reused(self, stub: StubPDMServer) -> None:
+        client = MNSClient(stub.url)
+        publisher = MNSPublisher(client, InMemoryWorkQueue())
+
+        for _ in range(3):
+            publisher.add(_event("A12345"))
+            publisher.flush()
+
+        assert len(stub.requests) == 3
+        assert client.connections_created == 1
+
+    def test_add_result(self, stub: StubPDMServer) -> None:
+        publisher = MNSPublisher(MNSClient(stub.url), InMemoryWorkQueue())
+
+        publisher.add_result(_document(_organization("A12345")))
+        publisher.add_result(_document({"resourceType": "Organization"}))
+
+        assert len(publisher) == 1
+
+    def test_failed_events_spooled(self, stub: StubPDMServer) -> None:
+        spool = InMemoryWorkQueue()
+        publisher = MNSPublisher(MNSClient(stub.url, retry=_NO_BACKOFF), spool)
+        stub.respond_with(*[StubResponse(status_code=503)] * 2)
+        event = _event("A12345")
+        publisher.add(event)
+
+        assert publisher.flush() == 0
+
+        assert len(spool) == 1
+        assert publisher.drain_spool() == 1
+        assert len(spool) == 0
+        assert json.loads(stub.requests[-1].body) == [event.content]
+        # Republished as a repeat of the original request.
+        assert len({r.headers["X-Request-ID"] for r in stub.requests}) == 1
+
+    def test_republish_failed(self, stub: StubPDMServer) -> None:
+        spool = InMemoryWorkQueue()
+        publisher = MNSPublisher(MNSClient(stub.url, retry=_NO_BACKOFF), spool)
+        stub.respond_with(*[StubResponse(status_code=503)] * 4)
+        publisher.add(_event("A12345"))
+        publisher.flush()
+
+        failed = publisher.republish(spool.receive(10))
+
+        assert len(failed) == 1
+
+
+class TestMNSClient:
+    def test_publish_rejected(self, stub: StubPDMServer) -> None:
+        client = MNSClient(stub.url)
+        stub.respond_with(StubResponse(status_code=400))
+
+        with pytest.raises(MNSError, match="status 400"):
+            client.publish([{"id": "1"}], request_id="request-id")
+
+
+class TestPublisherFromConfig:
+    def test_not_configured(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("MNS_EVENT_URL", raising=False)
+
+        assert publisher_from_config() is None
+
+    def test_configured(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        caplog: pytest.LogCaptureFixture,
+        stub: StubPDMServer,
+    ) -> None:
+        monkeypatch.setenv("MNS_EVENT_URL", stub.url)
+        monkeypatch.delenv("MNS_RETRY_QUEUE_URL", raising=False)
+
+        with caplog.at_level(logging.WARNING):
+            publisher = publisher_from_config()
+
+        # Without a retry queue, events are spooled in memory.
+        assert "MNS_RETRY_QUEUE_URL is not configured" in caplog.text
+
+        assert publisher is not None
+        publisher.add(_event("A12345"))
+        assert publisher.flush() == 1
@@ -0,0 +1,225 @@
+import itertools
+import time
+import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, x25519
+from tests.pdm_stub import StubPDMServer, StubRequest, StubResponse
+
+from pathology_api.oauth import (
+    JWTSigner,
+    TokenError,
+    TokenProvider,
+    provider_from_config,
+)
+from pathology_api.pdm import PDMClient, PDMError
+
+_PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+_PRIVATE_KEY_PEM = _PRIVATE_KEY.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption(),
+)
+
+
+class _Clock:
+    """A clock that only moves when advanced, so that expiry can be controlled."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _TokenEndpoint:
+    """Responds to token requests with a new token each time, as APIM would."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self._counter = itertools.count(1)
+        self._delay = delay
+
+    def __call__(self, _request: StubRequest) -> StubResponse:
+        time.sleep(self._delay)
+        return StubResponse(
+            status_code=200,
+            body=(
+                f'{{"access_token":"token-{next(self._counter)}",'
+                '"expires_in":"599","token_type":"Bearer"}'
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+
+@pytest.fixture
+def token_endpoint() -> Iterator[StubPDMServer]:
+    with StubPDMServer(responder=_TokenEndpoint()) as server:
+        yield server
+
+
+def _provider(
+    server: StubPDMServer, clock: _Clock | None = None, expiry_threshold: float = 30
+) -> TokenProvider:
+    return TokenProvider(
+        server.url,
+        client_id="api-key",
+        signer=JWTSigner(_PRIVATE_KEY_PEM, key_id="INT-1"),
+        expiry_threshold=expiry_threshold,
+        clock=clock or _Clock(),
+    )
+
+
+class TestJWTSigner:
+    def test_sign(self) -> None:
+        token = JWTSigner(_PRIVATE_KEY_PEM, key_id="INT-1").sign({"sub": "client"})
+
+        assert jwt.get_unverified_header(token)["kid"] == "INT-1"
+        assert jwt.decode(token, _PRIVATE_KEY.public_key(), algorithms=["RS512"]) == {
+            "sub": "client"
+        }
+
+    def test_unsupported_key(self) -> None:
+        private_key = x25519.X25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+
+        with pytest.raises(ValueError, match="X25519PrivateKey"):
+            JWTSigner(private_key, key_id="INT-1")
+
+
+class TestTokenProvider:
+    def test_token_requested(self, token_endpoint: StubPDMServer) -> None:
+        provider = _provider(token_endpoint)
+
+        assert provider.token() == "token-1"
+
+        (request,) = token_endpoint.requests
+        assert request.method == "POST"
+        assert request.path == "/patient-data-manager/FHIR/R4/"
+        assert request.headers["Content-Type"] == "application/x-www-form-urlencoded"
+        form = dict(urllib.parse.parse_qsl(request.body.decode()))
+        assert form["grant_type"] == "client_credentials"
+        assert form["client_assertion_type"] == (
+            "urn:ietf:params:oauth:client-assertion-type:jwt-bearer"
+        )
+
+        assertion = form["client_assertion"]
+        assert jwt.get_unverified_header(assertion)["kid"] == "INT-1"
+        claims = jwt.decode(
+            assertion,
+            _PRIVATE_KEY.public_key(),
+            algorithms=["RS512"],
+            audience=token_endpoint.url,
+        )
+        assert claims["iss"] == claims["sub"] == "api-key"
+        assert claims["exp"] > time.time()
+
+    def test_token_cached(self, token_endpoint: StubPDMServer) -> None:
+        provider = _provider(token_endpoint)
+
+        tokens = {provider.token() for _ in range(5)}
+
+        assert tokens == {"token-1"}
+        assert len(token_endpoint.requests) == 1
+
+    def test_token_refreshed_early(self, token_endpoint: StubPDMServer) -> None:
+        clock = _Clock()
+        provider = _provider(token_endpoint, clock)
+        provider.token()
+
+        clock.now += 580
+
+        assert provider.token() == "token-2"
+        assert provider.token() == "token-2"
+        assert len(token_endpoint.requests) == 2
+
+    def test_expired_token_refreshed(self, token_endpoint: StubPDMServer) -> None:
+        clock = _Clock()
+        provider = _provider(token_endpoint, clock)
+        provider.token()
+
+        clock.now += 600
+
+        assert provider.token() == "token-2"
+
+    def test_concurrent_refreshes_coalesced(self) -> None:
+        with StubPDMServer(responder=_TokenEndpoint(delay=0.1)) as server:
+            provider = _provider(server)
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                tokens = set(executor.map(lambda _: provider.token(), range(8)))
+
+        assert tokens == {"token-1"}
+        assert len(server.requests) == 1
+
+    def test_token_rejected(self, token_endpoint: StubPDMServer) -> None:
+        provider = _provider(token_endpoint)
+        token_endpoint.respond_with(StubResponse(status_code=401))
+
+        with pytest.raises(TokenError, match="status 401"):
+            provider.token()
+
+    def test_concurrent_early_refreshes_coalesced(self) -> None:
+        clock = _Clock()
+        with StubPDMServer(responder=_TokenEndpoint(delay=0.2)) as server:
+            provider = _provider(server, clock)
+            provider.token()
+            clock.now += 580
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                tokens = list(executor.map(lambda _: provider.token(), range(8)))
+
+        # Callers arriving whilst the token is refreshed are provided the current one.
+        assert set(tokens) == {"token-1", "token-2"}
+        assert len(server.requests) == 2
+
+    def test_early_refresh_failure(self, token_endpoint: StubPDMServer) -> None:
+        clock = _Clock()
+        provider = _provider(token_endpoint, clock)
+        provider.token()
+        token_endpoint.respond_with(StubResponse(status_code=500))
+
+        clock.now += 580
+        # The current token continues to be provided until it expires.
+        assert provider.token() == "token-1"
+        # Without another request until the retry interval has passed.
+        assert provider.token() == "token-1"
+        assert len(token_endpoint.requests) == 2
+
+        clock.now += 1
+        assert provider.token() == "token-2"
+
+    def test_authorises_client(self, token_endpoint: StubPDMServer) -> None:
+        provider = _provider(token_endpoint)
+
+        with StubPDMServer() as pdm:
+            client = PDMClient(pdm.url, token_provider=provider.token)
+            client.request("GET", "Bundle/1", request_id="1")
+            client.request("GET", "Bundle/2", request_id="2")
+
+        assert {r.headers["Authorization"] for r in pdm.requests} == {"Bearer token-1"}
+        assert len(token_endpoint.requests) == 1
+
+    def test_client_not_authorised(self, token_endpoint: StubPDMServer) -> None:
+        provider = _provider(token_endpoint)
+        token_endpoint.respond_with(StubResponse(status_code=401))
+
+        with StubPDMServer() as pdm:
+            client = PDMClient(pdm.url, token_provider=provider.token)
+            with pytest.raises(PDMError, match="could not be authorised"):
+                client.request("GET", "Bundle/1", request_id="1")
+
+        assert pdm.requests == []
+
+
+class TestProviderFromConfig:
+    def test_not_configured(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("APIM_TOKEN_URL", raising=False)
+
+        assert provider_from_config() is None
@@ -0,0 +1,233 @@
+import json
+import socket
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from tests.pdm_stub import StubPDMServer, StubResponse
+
+from pathology_api.connections import RetryPolicy
+from pathology_api.fhir.r4.elements import LogicalReference, PatientIdentifier
+from pathology_api.fhir.r4.resources import Bundle, Composition
+from pathology_api.pdm import PDMClient, PDMError, client_from_config
+
+_BUNDLE = Bundle.create(
+    type="document",
+    entry=[
+        Bundle.Entry(
+            fullUrl="composition",
+            resource=Composition.create(
+                subject=LogicalReference(
+                    PatientIdentifier.from_nhs_number("nhs_number")
+                )
+            ),
+        )
+    ],
+)
+
+# Retries without waiting, so that tests are not slowed down by backoff.
+_NO_BACKOFF = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+@pytest.fixture
+def stub() -> Iterator[StubPDMServer]:
+    with StubPDMServer() as server:
+        yield server
+
+
+def _unused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/FHIR/R4/"
+
+
+class TestPDMClient:
+    def test_post_document(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, token_provider=lambda: "token")
+
+        response = client.post_document(_BUNDLE, request_id="request-id")
+
+        assert response.status_code == 201
+        assert response.json()["resourceType"] == "Bundle"
+        (request,) = stub.requests
+        assert request.method == "POST"
+        assert request.path == "/patient-data-manager/FHIR/R4/Bundle"
+        assert request.headers["X-Request-ID"] == "request-id"
+        assert request.headers["Authorization"] == "Bearer token"
+        assert request.headers["Content-Type"] == "application/fhir+json"
+        assert Bundle.model_validate_json(request.body, by_alias=True) == _BUNDLE
+
+    def test_post_transaction(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url)
+
+        client.post_transaction(b"{}", request_id="request-id")
+
+        (request,) = stub.requests
+        assert request.path == "/patient-data-manager/FHIR/R4/"
+        assert request.body == b"{}"
+
+    def test_connections_reused(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url)
+
+        for index in range(5):
+            client.request("GET", f"Bundle/{index}", request_id=str(index))
+
+        assert len(stub.requests) == 5
+        assert client.connections_created == 1
+        assert stub.connections == 1
+
+    def test_concurrent_requests(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, max_idle_connections=2)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(
+                executor.map(
+                    lambda index: client.post_document(_BUNDLE, request_id=str(index)),
+                    range(4),
+                )
+            )
+
+        assert [response.status_code for response in responses] == [201] * 4
+        assert {request.headers["X-Request-ID"] for request in stub.requests} == {
+            "0",
+            "1",
+            "2",
+            "3",
+        }
+
+    def test_stale_connection_replaced(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, retry=RetryPolicy(max_attempts=1))
+        stub.respond_with(StubResponse(status_code=200, disconnect=True))
+        client.request("GET", "Bundle/1", request_id="first")
+
+        response = client.request("GET", "Bundle/2", request_id="second")
+
+        assert response.status_code == 201
+        assert client.connections_created == 2
+        assert [request.path[-1] for request in stub.requests] == ["1", "2"]
+
+    @pytest.mark.parametrize("status_code", [429, 502, 503, 504])
+    def test_retries_unavailable(self, stub: StubPDMServer, status_code: int) -> None:
+        client = PDMClient(stub.url, retry=_NO_BACKOFF)
+        stub.respond_with(
+            StubResponse(status_code=status_code, headers={"Retry-After": "0"}),
+            StubResponse(status_code=status_code),
+        )
+
+        response = client.request("POST", "Bundle", request_id="request-id", body=b"{}")
+
+        assert response.status_code == 201
+        assert len(stub.requests) == 3
+        assert {request.headers["X-Request-ID"] for request in stub.requests} == {
+            "request-id"
+        }
+
+    def test_retries_exhausted(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, retry=_NO_BACKOFF)
+        stub.respond_with(*[StubResponse(status_code=503)] * 3)
+
+        with pytest.raises(PDMError, match="failed with status 503") as error:
+            client.request("GET", "Bundle/1", request_id="request-id")
+
+        assert error.value.response is not None
+        assert error.value.response.status_code == 503
+        assert len(stub.requests) == 3
+
+    def test_client_error_not_retried(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, retry=_NO_BACKOFF)
+        outcome = {"resourceType": "OperationOutcome", "issue": []}
+        stub.respond_with(
+            StubResponse(status_code=400, body=json.dumps(outcome).encode())
+        )
+
+        with pytest.raises(PDMError, match="status 400") as error:
+            client.post_document(_BUNDLE, request_id="request-id")
+
+        assert error.value.response is not None
+        assert error.value.response.json() == outcome
+        assert len(stub.requests) == 1
+
+    def test_retries_connection_errors(self) -> None:
+        client = PDMClient(_unused_url(), retry=_NO_BACKOFF)
+
+        with pytest.raises(PDMError, match="failed.$") as error:
+            client.request("GET", "Bundle/1", request_id="request-id")
+
+        assert error.value.response is None
+        assert client.connections_created == 3
+
+    def test_deadline_passed(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url)
+
+        with pytest.raises(PDMError):
+            client.request(
+                "GET", "Bundle/1", request_id="request-id", deadline=time.monotonic()
+            )
+
+        assert stub.requests == []
+
+    def test_retry_not_scheduled_beyond_deadline(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, retry=RetryPolicy(max_attempts=3))
+        stub.respond_with(StubResponse(status_code=503, headers={"Retry-After": "60"}))
+
+        started = time.monotonic()
+        with pytest.raises(PDMError):
+            client.request(
+                "GET", "Bundle/1", request_id="request-id", deadline=started + 5
+            )
+
+        assert time.monotonic() - started < 5
+        assert len(stub.requests) == 1
+
+    def test_retry_not_scheduled_beyond_max_delay(self, stub: StubPDMServer) -> None:
+        client = PDMClient(stub.url, retry=RetryPolicy(max_attempts=3))
+        stub.respond_with(
+            StubResponse(status_code=503, headers={"Retry-After": "3600"})
+        )
+
+        started = time.monotonic()
+        with pytest.raises(PDMError, match="failed with status 503"):
+            client.request("GET", "Bundle/1", request_id="request-id")
+
+        assert time.monotonic() - started < 2
+        assert len(stub.requests) == 1
+
+    def test_invalid_base_url(self) -> None:
+        with pytest.raises(ValueError, match="Invalid PDM base URL"):
+            PDMClient("pdm.example")
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize(
+        ("attempt", "expected_cap"),
+        [
+            pytest.param(0, 0.1, id="First retry"),
+            pytest.param(2, 0.4, id="Third retry"),
+            pytest.param(10, 2.0, id="Capped"),
+        ],
+    )
+    def test_delay(self, attempt: int, expected_cap: float) -> None:
+        policy = RetryPolicy(base_delay=0.1, max_delay=2.0)
+
+        delays = [policy.delay(attempt) for _ in range(100)]
+
+        assert all(0 <= delay <= expected_cap for delay in delays)
+
+
+class TestClientFromConfig:
+    def test_not_configured(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("PDM_BASE_URL", raising=False)
+
+        assert client_from_config() is None
+
+    def test_configured(
+        self, monkeypatch: pytest.MonkeyPatch, stub: StubPDMServer
+    ) -> None:
+        monkeypatch.setenv("PDM_BASE_URL", stub.url)
+
+        client = client_from_config()
+
+        assert client is not None
+        assert client.request("GET", "Bundle/1", request_id="1").status_code == 201
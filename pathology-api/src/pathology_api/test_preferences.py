@@ -0,0 +1,61 @@
+import pytest
+
+from pathology_api.preferences import (
+    ReturnPreference,
+    parse_prefer,
+    return_preference,
+)
+
+
+class TestParsePrefer:
+    @pytest.mark.parametrize(
+        ("prefer", "expected_preferences"),
+        [
+            pytest.param(None, {}, id="Not provided"),
+            pytest.param("", {}, id="Empty"),
+            pytest.param("return=minimal", {"return": "minimal"}, id="Single"),
+            pytest.param(
+                'Return="minimal"; charset=utf-8, respond-async',
+                {"return": "minimal", "respond-async": None},
+                id="Multiple with parameters",
+            ),
+            pytest.param(
+                "return=minimal, return=representation",
+                {"return": "minimal"},
+                id="Repeated preference",
+            ),
+            pytest.param(" , wait = 10 ,", {"wait": "10"}, id="Whitespace"),
+        ],
+    )
+    def test_parse_prefer(
+        self, prefer: str | None, expected_preferences: dict[str, str | None]
+    ) -> None:
+        assert parse_prefer(prefer) == expected_preferences
+
+
+class TestReturnPreference:
+    @pytest.mark.parametrize(
+        ("prefer", "expected_preference"),
+        [
+            pytest.param(None, None, id="Not provided"),
+            pytest.param("respond-async", None, id="No return preference"),
+            pytest.param("return", None, id="Return without value"),
+            pytest.param("return=unknown", None, id="Unrecognised"),
+            pytest.param("return=minimal", "minimal", id="minimal"),
+            pytest.param(
+                "return=representation", "representation", id="representation"
+            ),
+            pytest.param(
+                "return=OperationOutcome", "OperationOutcome", id="OperationOutcome"
+            ),
+            pytest.param(
+                "return=operationoutcome",
+                "OperationOutcome",
+                id="Case insensitive",
+            ),
+        ],
+    )
+    def test_return_preference(
+        self, prefer: str | None, expected_preference: ReturnPreference | None
+    ) -> None:
+        assert return_preference(prefer) == expected_preference
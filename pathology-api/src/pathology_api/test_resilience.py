@@ -0,0 +1,322 @@
+import logging
+import threading
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from tests.pdm_stub import StubPDMServer, StubResponse
+
+from pathology_api.connections import RetryPolicy
+from pathology_api.pdm import PDMClient, PDMError
+from pathology_api.resilience import (
+    Bulkhead,
+    CircuitBreaker,
+    CircuitBreakerPolicy,
+    CircuitState,
+    Dependency,
+    DependencyUnavailableError,
+)
+
+_POLICY = CircuitBreakerPolicy(
+    failure_rate_threshold=0.5,
+    slow_call_seconds=1.0,
+    slow_call_rate_threshold=0.5,
+    window_size=4,
+    minimum_calls=4,
+    open_seconds=30.0,
+    half_open_calls=2,
+)
+
+
+class _Clock:
+    """A clock that only moves when advanced, so that timings can be controlled."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def stub() -> Iterator[StubPDMServer]:
+    with StubPDMServer() as server:
+        yield server
+
+
+def _call(breaker: CircuitBreaker, duration: float = 0.0, failed: bool = False) -> None:
+    breaker.acquire()
+    breaker.record(duration, failed=failed)
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(_POLICY.minimum_calls):
+        _call(breaker, failed=True)
+    assert breaker.state == CircuitState.OPEN
+
+
+class TestCircuitBreaker:
+    @pytest.mark.parametrize(
+        ("outcomes", "expected_state"),
+        [
+            pytest.param(
+                [(0.0, False), (0.0, False), (0.0, True), (0.0, True)],
+                CircuitState.OPEN,
+                id="Failure rate reached",
+            ),
+            pytest.param(
+                [(0.0, False), (0.0, False), (0.0, False), (0.0, True)],
+                CircuitState.CLOSED,
+                id="Failure rate not reached",
+            ),
+            pytest.param(
+                [(0.0, False), (0.0, False), (1.5, False), (2.0, False)],
+                CircuitState.OPEN,
+                id="Slow call rate reached",
+            ),
+            pytest.param(
+                [(0.0, True), (0.0, True), (0.0, True)],
+                CircuitState.CLOSED,
+                id="Too few calls",
+            ),
+        ],
+    )
+    def test_opens(
+        self, outcomes: list[tuple[float, bool]], expected_state: CircuitState
+    ) -> None:
+        breaker = CircuitBreaker("PDM", _POLICY, clock=_Clock())
+
+        for duration, failed in outcomes:
+            _call(breaker, duration, failed)
+
+        assert breaker.state == expected_state
+
+    def test_open_rejects(self) -> None:
+        clock = _Clock()
+        breaker = CircuitBreaker("PDM", _POLICY, clock=clock)
+        _open(breaker)
+        clock.now += 10.5
+
+        with pytest.raises(DependencyUnavailableError, match="PDM") as error:
+            breaker.acquire()
+
+        assert error.value.retry_after == 20
+        assert breaker.rejected == 1
+
+    def test_half_open_probes_limited(self) -> None:
+        clock = _Clock()
+        breaker = CircuitBreaker("PDM", _POLICY, clock=clock)
+        _open(breaker)
+        clock.now += 30
+
+        assert breaker.state == CircuitState.HALF_OPEN
+        breaker.acquire()
+        breaker.acquire()
+        with pytest.raises(DependencyUnavailableError):
+            breaker.acquire()
+
+    def test_half_open_closes(self) -> None:
+        clock = _Clock()
+        breaker = CircuitBreaker("PDM", _POLICY, clock=clock)
+        _open(breaker)
+        clock.now += 30
+
+        _call(breaker)
+        assert breaker.stats()["circuit_state"] == "half_open"
+        _call(breaker)
+
+        assert breaker.state == CircuitState.CLOSED
+        # The calls made before the circuit opened are no longer considered.
+        _call(breaker, failed=True)
+        assert breaker.state == CircuitState.CLOSED
+
+    @pytest.mark.parametrize(
+        ("duration", "failed"),
+        [
+            pytest.param(0.0, True, id="Failed probe"),
+            pytest.param(1.5, False, id="Slow probe"),
+        ],
+    )
+    def test_half_open_reopens(self, duration: float, failed: bool) -> None:
+        clock = _Clock()
+        breaker = CircuitBreaker("PDM", _POLICY, clock=clock)
+        _open(breaker)
+        clock.now += 30
+
+        _call(breaker, duration, failed)
+
+        assert breaker.state == CircuitState.OPEN
+
+    def test_stats(self) -> None:
+        clock = _Clock()
+        breaker = CircuitBreaker("PDM", _POLICY, clock=clock)
+        _open(breaker)
+        clock.now += 30
+        _call(breaker)
+        _call(breaker)
+
+        assert breaker.stats() == {
+            "dependency": "PDM",
+            "circuit_state": "closed",
+            "circuit_transitions": {
+                "closed->open": 1,
+                "open->half_open": 1,
+                "half_open->closed": 1,
+            },
+            "circuit_rejected": 0,
+        }
+
+    def test_transition_logs_stats(self, caplog: pytest.LogCaptureFixture) -> None:
+        breaker = CircuitBreaker("PDM", _POLICY, clock=_Clock())
+
+        with caplog.at_level(logging.WARNING):
+            _open(breaker)
+
+        (record,) = caplog.records
+        assert record.message == "Circuit for PDM moved from closed to open."
+        assert record.__dict__["circuit_previous_state"] == "closed"
+        assert record.__dict__["circuit_state"] == "open"
+        assert record.__dict__["circuit_transitions"] == {"closed->open": 1}
+        assert record.__dict__["circuit_rejected"] == 0
+
+
+class TestBulkhead:
+    def test_rejects_when_full(self) -> None:
+        bulkhead = Bulkhead("PDM", max_concurrent=1)
+
+        with (
+            bulkhead.enter(),
+            pytest.raises(DependencyUnavailableError, match="in flight"),
+            bulkhead.enter(),
+        ):
+            pass
+
+        assert bulkhead.rejected == 1
+        with bulkhead.enter():
+            pass
+
+    def test_waits_for_place(self) -> None:
+        bulkhead = Bulkhead("PDM", max_concurrent=1, max_wait=5)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold() -> None:
+            with bulkhead.enter():
+                entered.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait()
+        threading.Timer(0.05, release.set).start()
+
+        with bulkhead.enter():
+            pass
+
+        holder.join()
+        assert bulkhead.rejected == 0
+
+    def test_concurrent_rejections_counted(self) -> None:
+        bulkhead = Bulkhead("PDM", max_concurrent=1)
+
+        def reject(_: int) -> None:
+            with pytest.raises(DependencyUnavailableError), bulkhead.enter():
+                pass
+
+        with bulkhead.enter(), ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(reject, range(200)))
+
+        assert bulkhead.rejected == 200
+
+
+class TestDependency:
+    def test_call_records_exceptions(self) -> None:
+        dependency = Dependency("PDM", _POLICY, clock=_Clock())
+
+        for _ in range(_POLICY.minimum_calls):
+            with pytest.raises(TimeoutError), dependency.call():
+                raise TimeoutError
+
+        assert dependency.breaker.state == CircuitState.OPEN
+
+    def test_call_records_outcome(self) -> None:
+        dependency = Dependency("PDM", _POLICY, clock=_Clock())
+
+        for _ in range(_POLICY.minimum_calls):
+            with dependency.call() as outcome:
+                outcome.failed = True
+
+        assert dependency.stats()["circuit_state"] == "open"
+
+
+class TestGuardedClient:
+    """Requests to a stub injecting faults, via a client guarded by a Dependency."""
+
+    def _client(
+        self, stub: StubPDMServer, dependency: Dependency, timeout: float = 5.0
+    ) -> PDMClient:
+        return PDMClient(
+            stub.url,
+            timeout=timeout,
+            retry=RetryPolicy(max_attempts=1),
+            dependency=dependency,
+        )
+
+    def test_timeouts_open_circuit(self, stub: StubPDMServer) -> None:
+        client = self._client(stub, Dependency("PDM", _POLICY), timeout=0.05)
+        stub.respond_with(*[StubResponse(status_code=201, delay=0.2)] * 4)
+
+        for _ in range(4):
+            with pytest.raises(PDMError):
+                client.request("GET", "Bundle/1", request_id="1")
+
+        with pytest.raises(DependencyUnavailableError, match="circuit open"):
+            client.request("GET", "Bundle/1", request_id="1")
+        assert len(stub.requests) == 4
+
+    def test_slow_responses_open_circuit(self, stub: StubPDMServer) -> None:
+        policy = CircuitBreakerPolicy(slow_call_seconds=0.05, minimum_calls=2)
+        client = self._client(stub, Dependency("PDM", policy))
+        stub.respond_with(*[StubResponse(status_code=201, delay=0.1)] * 2)
+
+        for _ in range(2):
+            assert client.request("GET", "Bundle/1", request_id="1").ok
+
+        with pytest.raises(DependencyUnavailableError):
+            client.request("GET", "Bundle/1", request_id="1")
+
+    def test_unavailable_responses_open_circuit(self, stub: StubPDMServer) -> None:
+        client = self._client(stub, Dependency("PDM", _POLICY))
+        stub.respond_with(*[StubResponse(status_code=503)] * 4)
+
+        for _ in range(4):
+            with pytest.raises(PDMError):
+                client.request("GET", "Bundle/1", request_id="1")
+
+        with pytest.raises(DependencyUnavailableError):
+            client.request("GET", "Bundle/1", request_id="1")
+
+    def test_client_errors_do_not_open_circuit(self, stub: StubPDMServer) -> None:
+        dependency = Dependency("PDM", _POLICY)
+        client = self._client(stub, dependency)
+        stub.respond_with(*[StubResponse(status_code=400)] * 4)
+
+        for _ in range(4):
+            client.request("GET", "Bundle/1", request_id="1")
+
+        assert dependency.breaker.state == CircuitState.CLOSED
+
+    def test_recovers(self, stub: StubPDMServer) -> None:
+        clock = _Clock()
+        dependency = Dependency("PDM", _POLICY, clock=clock)
+        client = self._client(stub, dependency)
+        stub.respond_with(*[StubResponse(status_code=503)] * 4)
+        for _ in range(4):
+            with pytest.raises(PDMError):
+                client.request("GET", "Bundle/1", request_id="1")
+
+        clock.now += 30
+        for _ in range(2):
+            assert client.request("GET", "Bundle/1", request_id="1").ok
+
+        assert dependency.breaker.state == CircuitState.CLOSED
@@ -0,0 +1,191 @@
+import pytest
+
+from pathology_api.deadline import Deadline, DeadlineExceededError
+from pathology_api.exception import ValidationError
+from pathology_api.fhir.r4.resources import (
+    Bundle,
+    Composition,
+    Observation,
+    OpaqueResource,
+    Patient,
+    Resource,
+)
+from pathology_api.rules import RuleContext, RuleEngine, Violation
+
+
+def _create_bundle(*resources: Resource, bundle_id: str | None = None) -> Bundle:
+    return Bundle.create(
+        id=bundle_id,
+        type="document",
+        entry=[
+            Bundle.Entry(fullUrl=f"entry-{index}", resource=resource)
+            for index, resource in enumerate(resources)
+        ],
+    )
+
+
+class TestRuleEngine:
+    def test_validate_dispatches_by_resource_type(self) -> None:
+        engine = RuleEngine()
+        visited: list[tuple[str, str | None]] = []
+
+        @engine.resource_rule(Patient)
+        def patient_rule(_patient: Patient, context: RuleContext) -> None:
+            visited.append(("patient", context.full_url))
+
+        @engine.resource_rule(OpaqueResource)
+        def opaque_rule(_resource: OpaqueResource, context: RuleContext) -> None:
+            visited.append(("opaque", context.full_url))
+
+        @engine.bundle_rule()
+        def bundle_rule(_bundle: Bundle, context: RuleContext) -> None:
+            visited.append(("bundle", context.full_url))
+
+        engine.validate(
+            _create_bundle(Patient.create(), Composition.create(), Observation.create())
+        )
+
+        assert visited == [
+            ("bundle", None),
+            ("patient", "entry-0"),
+            ("opaque", "entry-0"),
+            ("opaque", "entry-2"),
+        ]
+
+    def test_validate_collects_every_violation(self) -> None:
+        engine = RuleEngine()
+
+        @engine.bundle_rule(name="bundle-id")
+        def bundle_rule(bundle: Bundle, _: RuleContext) -> None:
+            if bundle.id is not None:
+                raise ValidationError("Bundle has an id")
+
+        @engine.resource_rule(Patient, Observation)
+        def resource_id(resource: Resource, _: RuleContext) -> None:
+            if resource.id is None:
+                raise ValidationError(f"{resource.resource_type} has no id")
+
+        report = engine.validate(
+            _create_bundle(
+                Patient.create(),
+                Observation.create(id="observation"),
+                Observation.create(),
+                bundle_id="bundle",
+            )
+        )
+
+        assert report.violations == [
+            Violation(rule="bundle-id", message="Bundle has an id"),
+            Violation(
+                rule="resource_id", message="Patient has no id", full_url="entry-0"
+            ),
+            Violation(
+                rule="resource_id", message="Observation has no id", full_url="entry-2"
+            ),
+        ]
+
+    def test_validate_records_timings(self) -> None:
+        engine = RuleEngine()
+
+        @engine.resource_rule(Patient)
+        def _patient_rule(patient: Patient, _: RuleContext) -> None:
+            pass
+
+        @engine.resource_rule(Observation)
+        def _unused_rule(observation: Observation, _: RuleContext) -> None:
+            pass
+
+        report = engine.validate(_create_bundle(Patient.create()))
+
+        assert report.timings.keys() == {"patient_rule", "unused_rule"}
+        assert report.timings["patient_rule"] > 0
+        assert report.timings["unused_rule"] == 0
+
+    def test_validate_deadline_exceeded(self) -> None:
+        engine = RuleEngine()
+        visited: list[str] = []
+
+        @engine.resource_rule(Patient)
+        def patient_rule(_patient: Patient, _: RuleContext) -> None:
+            visited.append("patient")
+
+        with pytest.raises(DeadlineExceededError, match="validation"):
+            engine.validate(_create_bundle(Patient.create()), Deadline.after(0))
+
+        assert visited == []
+
+    def test_rule_registered_after_validation(self) -> None:
+        engine = RuleEngine()
+        visited: list[str] = []
+        bundle = _create_bundle(Patient.create())
+
+        engine.validate(bundle)
+
+        @engine.resource_rule(Patient)
+        def patient_rule(_patient: Patient, _: RuleContext) -> None:
+            visited.append("patient")
+
+        engine.validate(bundle)
+
+        assert visited == ["patient"]
+
+    def test_reference_graph_shared_between_rules(self) -> None:
+        engine = RuleEngine()
+        graphs = []
+
+        @engine.bundle_rule()
+        def first_rule(_bundle: Bundle, context: RuleContext) -> None:
+            graphs.append(context.reference_graph)
+
+        @engine.bundle_rule()
+        def second_rule(_bundle: Bundle, context: RuleContext) -> None:
+            graphs.append(context.reference_graph)
+
+        engine.validate(_create_bundle())
+
+        assert graphs[0] is graphs[1]
+
+    def test_resource_rule_requires_resource_type(self) -> None:
+        with pytest.raises(ValueError, match="must apply to at least one type"):
+            RuleEngine().resource_rule()
+
+    @pytest.mark.parametrize(
+        ("resource_type", "fields"),
+        [
+            pytest.param(Composition, ("subject", "id"), id="Defined fields"),
+            pytest.param(Composition, ("resourceType",), id="Aliased field"),
+            pytest.param(Observation, ("status",), id="Opaque extra field"),
+        ],
+    )
+    def test_resource_rule_fields(
+        self, resource_type: type[Resource], fields: tuple[str, ...]
+    ) -> None:
+        RuleEngine().resource_rule(resource_type, fields=fields)
+
+    def test_resource_rule_unknown_field(self) -> None:
+        with pytest.raises(
+            ValueError, match=r"Fields \['section'\] are not defined by Composition."
+        ):
+            RuleEngine().resource_rule(Composition, fields=("subject", "section"))
+
+
+class TestRuleReport:
+    def test_raise_for_violations(self) -> None:
+        engine = RuleEngine()
+
+        @engine.resource_rule(Patient)
+        def patient_rule(patient: Patient, _: RuleContext) -> None:
+            raise ValidationError(f"Invalid patient {patient.id}")
+
+        report = engine.validate(
+            _create_bundle(Patient.create(id="1"), Patient.create(id="2"))
+        )
+
+        with pytest.raises(ValidationError) as exc_info:
+            report.raise_for_violations()
+
+        assert exc_info.value.message == "Invalid patient 1\nInvalid patient 2"
+        assert exc_info.value.issues == ["Invalid patient 1", "Invalid patient 2"]
+
+    def test_raise_for_violations_without_violations(self) -> None:
+        RuleEngine().validate(_create_bundle()).raise_for_violations()
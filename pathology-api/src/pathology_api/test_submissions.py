@@ -0,0 +1,164 @@
+import os
+import time
+
+import pytest
+
+from pathology_api.deadline import Deadline
+from pathology_api.idempotency import (
+    IdempotencyRecord,
+    InMemoryIdempotencyStore,
+    StoredResponse,
+)
+from pathology_api.submissions import Submission, Submissions
+from pathology_api.work_queue import (
+    InMemoryWorkQueue,
+    MessageTooLargeError,
+    QueuedMessage,
+)
+
+_RESPONSE = StoredResponse(
+    status_code=200, headers={"Content-Type": "application/fhir+json"}, body=b"{}"
+)
+
+
+def _create_submissions() -> tuple[Submissions, InMemoryWorkQueue]:
+    queue = InMemoryWorkQueue()
+    return Submissions(queue, InMemoryIdempotencyStore()), queue
+
+
+class TestSubmission:
+    @pytest.mark.parametrize(
+        "submission",
+        [
+            pytest.param(Submission("id", b'{"a": 1}', "return=minimal"), id="Prefer"),
+            pytest.param(Submission("id", b""), id="No prefer"),
+        ],
+    )
+    def test_encode_decode(self, submission: Submission) -> None:
+        assert Submission.decode(submission.encode()) == submission
+
+    def test_encode_compresses_body(self) -> None:
+        body = b'{"resourceType": "Bundle"}' * 1000
+
+        assert len(Submission("id", body).encode()) < len(body) / 10
+
+
+class TestSubmissions:
+    def test_from_config_queue_without_table(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_QUEUE_URL", "https://sqs.example.com/queue")
+        monkeypatch.delenv("IDEMPOTENCY_TABLE_NAME", raising=False)
+
+        with pytest.raises(ValueError, match="IDEMPOTENCY_TABLE_NAME"):
+            Submissions.from_config()
+
+    def test_from_config_in_memory(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.delenv("ASYNC_QUEUE_URL", raising=False)
+        monkeypatch.delenv("IDEMPOTENCY_TABLE_NAME", raising=False)
+
+        assert isinstance(Submissions.from_config(), Submissions)
+
+    def test_submit(self) -> None:
+        submissions, queue = _create_submissions()
+
+        submission_id = submissions.submit(b"{}", "return=minimal")
+
+        record = submissions.status(submission_id)
+        assert record is not None
+        assert record.status == "in_progress"
+        (message,) = queue.receive(1)
+        assert Submission.decode(message.body) == Submission(
+            submission_id, b"{}", "return=minimal"
+        )
+
+    def test_submit_too_large(self) -> None:
+        submissions, queue = _create_submissions()
+        submitted: list[str] = []
+
+        with pytest.raises(MessageTooLargeError):
+            submitted.append(submissions.submit(os.urandom(512 * 1024)))
+
+        assert submitted == []
+        assert len(queue) == 0
+
+    def test_status_unknown(self) -> None:
+        submissions, _ = _create_submissions()
+
+        assert submissions.status("unknown") is None
+
+    def test_process(self) -> None:
+        submissions, queue = _create_submissions()
+        submission_id = submissions.submit(b"{}")
+        processed: list[Submission] = []
+
+        def process(submission: Submission) -> StoredResponse:
+            processed.append(submission)
+            return _RESPONSE
+
+        messages = queue.receive(1)
+        assert submissions.process(messages, process) == []
+        # Redelivered messages are not processed again.
+        assert submissions.process(messages, process) == []
+
+        assert [submission.submission_id for submission in processed] == [submission_id]
+        record = submissions.status(submission_id)
+        assert record is not None
+        assert record.status == "completed"
+        assert record.response == _RESPONSE
+
+    def test_process_failure(self) -> None:
+        submissions, queue = _create_submissions()
+        submission_id = submissions.submit(b"{}")
+        invalid = QueuedMessage(message_id="invalid", body="{", receipt="invalid")
+
+        def process(_submission: Submission) -> StoredResponse:
+            raise RuntimeError("Unavailable")
+
+        messages = [*queue.receive(1), invalid]
+        failed = submissions.process(messages, process)
+
+        assert failed == messages
+        record = submissions.status(submission_id)
+        assert record is not None
+        assert record.status == "in_progress"
+
+    def test_drain(self) -> None:
+        submissions, queue = _create_submissions()
+        submission_ids = [submissions.submit(str(index).encode()) for index in range(5)]
+
+        def process(submission: Submission) -> StoredResponse:
+            if submission.body == b"3":
+                raise RuntimeError("Unavailable")
+            return _RESPONSE
+
+        processed = submissions.drain(process, batch_size=2)
+
+        assert processed == 4
+        assert len(queue) == 0
+        statuses = [submissions.status(id_) for id_ in submission_ids]
+        assert [
+            record.status if record is not None else None for record in statuses
+        ] == ["completed", "completed", "completed", "in_progress", "completed"]
+
+    def test_drain_stops_at_deadline(self) -> None:
+        submissions, queue = _create_submissions()
+        for index in range(5):
+            submissions.submit(str(index).encode())
+
+        processed = submissions.drain(
+            lambda _: _RESPONSE, batch_size=2, deadline=Deadline.after(0)
+        )
+
+        assert processed == 0
+        assert len(queue) == 5
+
+    def test_status_expires(self) -> None:
+        store = InMemoryIdempotencyStore()
+        submissions = Submissions(InMemoryWorkQueue(), store, ttl=60)
+        store.put(
+            "submission#expired",
+            IdempotencyRecord(status="completed", expires_at=time.time() - 1),
+        )
+
+        assert submissions.status("expired") is None
@@ -0,0 +1,195 @@
+import json
+import uuid
+from typing import Any
+
+import pytest
+
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.ingest import parse_bundle
+from pathology_api.transaction import (
+    Transaction,
+    TransactionLimits,
+    to_transactions,
+    written_references,
+)
+
+_PATIENT_UUID = "45d437b5-52b9-42a6-aafd-2bbe967f00d8"
+
+_DOCUMENT: dict[str, Any] = {
+    "resourceType": "Bundle",
+    "id": "4f8e3c8c-3c53-4c5a-9b8e-2f1f8f0b6a10",
+    "type": "document",
+    "entry": [
+        {
+            "fullUrl": "composition",
+            "resource": {
+                "resourceType": "Composition",
+                "subject": {
+                    "identifier": {
+                        "system": "https://fhir.nhs.uk/Id/nhs-number",
+                        "value": "9727710638",
+                    }
+                },
+            },
+        },
+        {
+            "fullUrl": "https://example.org/fhir/Observation/observation",
+            "resource": {
+                "resourceType": "Observation",
+                "id": "observation",
+                "status": "final",
+                "subject": {"reference": f"urn:uuid:{_PATIENT_UUID}"},
+                "specimen": {"reference": "specimen"},
+                "hasMember": [
+                    {"reference": "Observation/member"},
+                    {"reference": "Observation/external"},
+                ],
+            },
+        },
+        {
+            "fullUrl": "specimen",
+            "resource": {
+                "resourceType": "Specimen",
+                "subject": {"reference": f"urn:uuid:{_PATIENT_UUID}"},
+            },
+        },
+        {
+            "fullUrl": "member",
+            "resource": {"resourceType": "Observation", "id": "member"},
+        },
+        {
+            "fullUrl": f"urn:uuid:{_PATIENT_UUID}",
+            "resource": {"resourceType": "Patient"},
+        },
+    ],
+}
+
+
+def _parse_document(retain_encoded: bool = False) -> Bundle:
+    return parse_bundle(json.dumps(_DOCUMENT).encode(), retain_encoded=retain_encoded)
+
+
+def _entries(transactions: list[Transaction]) -> list[dict[str, Any]]:
+    return [
+        entry
+        for transaction in transactions
+        for entry in json.loads(transaction.body)["entry"]
+    ]
+
+
+class TestToTransactions:
+    def test_to_transactions(self) -> None:
+        (transaction,) = to_transactions(_parse_document())
+
+        content = json.loads(transaction.body)
+        assert content["resourceType"] == "Bundle"
+        assert content["type"] == "transaction"
+        assert transaction.entry_count == 5
+
+        entries = content["entry"]
+        resource_types = ["Composition", "Observation", "Specimen", "Observation"]
+        for entry, resource_type in zip(entries, resource_types, strict=False):
+            resource = entry["resource"]
+            assert resource["resourceType"] == resource_type
+            assert entry["fullUrl"] == f"urn:uuid:{resource['id']}"
+            assert entry["request"] == {
+                "method": "PUT",
+                "url": f"{resource_type}/{resource['id']}",
+            }
+
+        # Entries already identified by a urn:uuid retain it.
+        assert entries[4]["fullUrl"] == f"urn:uuid:{_PATIENT_UUID}"
+        assert entries[4]["resource"]["id"] == _PATIENT_UUID
+
+    def test_to_transactions_rewrites_references(self) -> None:
+        entries = _entries(to_transactions(_parse_document()))
+
+        observation = entries[1]["resource"]
+        assert observation["subject"] == {"reference": f"Patient/{_PATIENT_UUID}"}
+        assert observation["specimen"] == {"reference": entries[2]["request"]["url"]}
+        assert observation["hasMember"] == [
+            {"reference": entries[3]["request"]["url"]},
+            # References to resources outside the Bundle are left unchanged.
+            {"reference": "Observation/external"},
+        ]
+
+    def test_to_transactions_references_across_transactions(self) -> None:
+        # The Observation and the Specimen it references are sent separately.
+        limits = TransactionLimits(max_entries=2, max_bytes=1024 * 1024)
+        first, second, _ = (
+            json.loads(transaction.body)["entry"]
+            for transaction in to_transactions(_parse_document(), limits)
+        )
+
+        observation = first[1]["resource"]
+        specimen = second[0]["resource"]
+        assert observation["specimen"] == {"reference": f"Specimen/{specimen['id']}"}
+        assert second[0]["request"]["url"] == f"Specimen/{specimen['id']}"
+
+    def test_to_transactions_is_deterministic(self) -> None:
+        first = to_transactions(_parse_document())
+        second = to_transactions(_parse_document())
+
+        assert first == second
+
+    def test_to_transactions_ids_depend_on_bundle(self) -> None:
+        other = _parse_document().model_copy(update={"id": str(uuid.uuid4())})
+
+        first = _entries(to_transactions(_parse_document()))
+        second = _entries(to_transactions(other))
+
+        assert first[0]["fullUrl"] != second[0]["fullUrl"]
+        assert first[4]["fullUrl"] == second[4]["fullUrl"]
+
+    def test_to_transactions_retained_json(self) -> None:
+        assert _entries(to_transactions(_parse_document(retain_encoded=True))) == (
+            _entries(to_transactions(_parse_document()))
+        )
+
+    @pytest.mark.parametrize(
+        ("limits", "expected_entry_counts"),
+        [
+            pytest.param(
+                TransactionLimits(max_entries=2, max_bytes=1024 * 1024),
+                [2, 2, 1],
+                id="Entry limit",
+            ),
+            pytest.param(
+                TransactionLimits(max_entries=100, max_bytes=900),
+                [2, 3],
+                id="Size limit",
+            ),
+            pytest.param(
+                TransactionLimits(max_entries=100, max_bytes=1),
+                [1, 1, 1, 1, 1],
+                id="Entries larger than the size limit",
+            ),
+            pytest.param(
+                TransactionLimits(max_entries=100, max_bytes=1024 * 1024),
+                [5],
+                id="Within limits",
+            ),
+        ],
+    )
+    def test_to_transactions_split(
+        self, limits: TransactionLimits, expected_entry_counts: list[int]
+    ) -> None:
+        transactions = to_transactions(_parse_document(), limits)
+
+        assert [t.entry_count for t in transactions] == expected_entry_counts
+        assert _entries(transactions) == _entries(to_transactions(_parse_document()))
+        if limits.max_bytes > 1:
+            assert all(len(t.body) <= limits.max_bytes for t in transactions)
+        assert len({t.request_id for t in transactions}) == len(transactions)
+
+    def test_to_transactions_empty_bundle(self) -> None:
+        assert to_transactions(Bundle.empty("document")) == []
+
+
+class TestWrittenReferences:
+    def test_written_references(self) -> None:
+        bundle = _parse_document()
+
+        assert written_references(bundle) == [
+            entry["request"]["url"] for entry in _entries(to_transactions(bundle))
+        ]
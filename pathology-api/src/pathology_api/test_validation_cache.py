@@ -0,0 +1,87 @@
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.rules import RuleReport
+from pathology_api.validation_cache import (
+    ValidationCache,
+    ValidationOutcome,
+    content_key,
+)
+
+
+def _create_outcome() -> ValidationOutcome:
+    return ValidationOutcome(bundle=Bundle.empty("document"), report=RuleReport())
+
+
+class TestContentKey:
+    def test_content_key(self) -> None:
+        key = content_key(b'{"resourceType": "Bundle"}', True)
+
+        assert key == content_key(b'{"resourceType": "Bundle"}', True)
+        assert key != content_key(b'{"resourceType": "Bundle"}', False)
+        assert key != content_key(b'{"resourceType": "Bundle" }', True)
+
+
+class TestValidationCache:
+    def test_get(self) -> None:
+        cache = ValidationCache()
+        outcome = _create_outcome()
+
+        assert cache.get("key") is None
+        cache.put("key", outcome, size=10)
+
+        assert cache.get("key") is outcome
+        assert cache.stats() == {
+            "validation_cache_hits": 1,
+            "validation_cache_misses": 1,
+            "validation_cache_size": 1,
+            "validation_cache_bytes": 10,
+        }
+
+    def test_evicts_least_recently_used(self) -> None:
+        cache = ValidationCache(max_entries=2)
+        cache.put("first", _create_outcome(), size=10)
+        cache.put("second", _create_outcome(), size=10)
+        cache.get("first")
+
+        cache.put("third", _create_outcome(), size=10)
+
+        assert len(cache) == 2
+        assert cache.get("first") is not None
+        assert cache.get("second") is None
+        assert cache.get("third") is not None
+
+    def test_evicts_beyond_max_bytes(self) -> None:
+        cache = ValidationCache(max_bytes=100)
+        cache.put("first", _create_outcome(), size=40)
+        cache.put("second", _create_outcome(), size=40)
+
+        cache.put("third", _create_outcome(), size=40)
+
+        assert cache.get("first") is None
+        assert cache.get("second") is not None
+        assert cache.get("third") is not None
+        assert cache.stats()["validation_cache_bytes"] == 80
+
+    def test_replaces_outcome(self) -> None:
+        cache = ValidationCache(max_bytes=100)
+        cache.put("key", _create_outcome(), size=60)
+
+        cache.put("key", _create_outcome(), size=60)
+
+        assert len(cache) == 1
+        assert cache.stats()["validation_cache_bytes"] == 60
+
+    def test_outcome_larger_than_max_bytes_not_cached(self) -> None:
+        cache = ValidationCache(max_bytes=100)
+
+        cache.put("key", _create_outcome(), size=101)
+
+        assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_disabled(self) -> None:
+        cache = ValidationCache(max_entries=0)
+
+        cache.put("key", _create_outcome(), size=10)
+
+        assert cache.get("key") is None
+        assert len(cache) == 0
@@ -0,0 +1,128 @@
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+
+import pytest
+
+from pathology_api.work_queue import (
+    MAX_MESSAGE_BYTES,
+    InMemoryWorkQueue,
+    MessageTooLargeError,
+    SQSWorkQueue,
+)
+
+
+class _LocalSQSClient:
+    """
+    A stand-in for an SQS client, supporting only the requests made by SQSWorkQueue.
+    """
+
+    def __init__(self) -> None:
+        self.queues: dict[str, OrderedDict[str, str]] = {}
+        self.receive_requests: list[dict[str, Any]] = []
+
+    def send_message(self, **kwargs: Any) -> Mapping[str, Any]:
+        message_id = str(uuid.uuid4())
+        queue = self.queues.setdefault(kwargs["QueueUrl"], OrderedDict())
+        queue[message_id] = kwargs["MessageBody"]
+        return {"MessageId": message_id}
+
+    def receive_message(self, **kwargs: Any) -> Mapping[str, Any]:
+        self.receive_requests.append(kwargs)
+        queue = self.queues.get(kwargs["QueueUrl"], OrderedDict())
+        messages = [
+            {"MessageId": message_id, "Body": body, "ReceiptHandle": message_id}
+            for message_id, body in list(queue.items())[: kwargs["MaxNumberOfMessages"]]
+        ]
+        return {"Messages": messages} if messages else {}
+
+    def delete_message(self, **kwargs: Any) -> Mapping[str, Any]:
+        self.queues.get(kwargs["QueueUrl"], OrderedDict()).pop(
+            kwargs["ReceiptHandle"], None
+        )
+        return {}
+
+
+class TestInMemoryWorkQueue:
+    def test_send_and_receive(self) -> None:
+        queue = InMemoryWorkQueue()
+        queue.send("first")
+        queue.send("second")
+        queue.send("third")
+
+        received = queue.receive(2)
+
+        assert [message.body for message in received] == ["first", "second"]
+        assert len(queue) == 1
+        assert [message.body for message in queue.receive(10)] == ["third"]
+        assert queue.receive(10) == []
+
+    def test_delete(self) -> None:
+        queue = InMemoryWorkQueue()
+        queue.send("message")
+        (message,) = queue.receive(1)
+
+        queue.delete(message.receipt)
+        queue.delete("unknown")
+
+        assert len(queue) == 0
+
+    def test_send_message_too_large(self) -> None:
+        queue = InMemoryWorkQueue()
+
+        with pytest.raises(MessageTooLargeError):
+            queue.send("a" * (MAX_MESSAGE_BYTES + 1))
+
+        assert len(queue) == 0
+
+
+class TestSQSWorkQueue:
+    def test_send_and_receive(self) -> None:
+        client = _LocalSQSClient()
+        queue = SQSWorkQueue(client, "queue-url")
+        queue.send("first")
+        queue.send("second")
+
+        received = queue.receive(1)
+
+        assert [message.body for message in received] == ["first"]
+        assert received[0].message_id == received[0].receipt
+
+    @pytest.mark.parametrize(
+        ("max_messages", "expected_max_messages"),
+        [
+            pytest.param(0, 1, id="Below minimum"),
+            pytest.param(5, 5, id="Within range"),
+            pytest.param(100, 10, id="Above maximum"),
+        ],
+    )
+    def test_receive_limits_max_messages(
+        self, max_messages: int, expected_max_messages: int
+    ) -> None:
+        client = _LocalSQSClient()
+        queue = SQSWorkQueue(client, "queue-url")
+
+        assert queue.receive(max_messages) == []
+        assert client.receive_requests == [
+            {"QueueUrl": "queue-url", "MaxNumberOfMessages": expected_max_messages}
+        ]
+
+    def test_delete(self) -> None:
+        client = _LocalSQSClient()
+        queue = SQSWorkQueue(client, "queue-url")
+        queue.send("message")
+        (message,) = queue.receive(1)
+
+        queue.delete(message.receipt)
+
+        assert client.queues["queue-url"] == {}
+
+    def test_send_message_too_large(self) -> None:
+        client = _LocalSQSClient()
+        queue = SQSWorkQueue(client, "queue-url")
+
+        with pytest.raises(MessageTooLargeError):
+            queue.send("a" * (MAX_MESSAGE_BYTES + 1))
+
+        assert client.queues == {}
@@ -0,0 +1,235 @@
+"""Conversion of document Bundles into transaction Bundles to be sent to PDM."""
+
+import uuid
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import pydantic_core
+
+from pathology_api import config
+from pathology_api.fhir.r4.resources import Bundle, Resource
+
+_URN_UUID = "urn:uuid:"
+
+_TRANSACTION_HEAD = b'{"resourceType":"Bundle","type":"transaction","entry":['
+_TRANSACTION_TAIL = b"]}"
+
+
+@dataclass(frozen=True)
+class TransactionLimits:
+    """
+    Limits on the size of each transaction Bundle a document Bundle is converted into.
+    Attributes:
+        max_entries: The maximum number of entries within each transaction.
+        max_bytes: The maximum size, in bytes, of each serialised transaction. An
+            entry larger than this on its own is sent in a transaction of its own.
+    """
+
+    max_entries: int
+    max_bytes: int
+
+    @classmethod
+    def from_config(cls) -> "TransactionLimits":
+        """Create the TransactionLimits configured for the service."""
+        return cls(
+            max_entries=config.pdm_transaction_max_entries(),
+            max_bytes=config.pdm_transaction_max_bytes(),
+        )
+
+
+@dataclass(frozen=True)
+class Transaction:
+    """
+    A serialised transaction Bundle.
+    Attributes:
+        request_id: Identifies the transaction, consistently for the same document
+            Bundle, so that a retried transaction is recognised as a repeat.
+        entry_count: The number of entries within the transaction.
+        body: The transaction Bundle, as FHIR JSON.
+    """
+
+    request_id: str
+    entry_count: int
+    body: bytes
+
+
+def to_transactions(
+    bundle: Bundle, limits: TransactionLimits | None = None
+) -> list[Transaction]:
+    """
+    Convert a document Bundle into transaction Bundles that PUT each of its resources,
+    so that the resources can be written in as few requests as the limits allow.
+
+    Each resource is given an id, taken from the fullUrl of its entry if that is a
+    urn:uuid, otherwise derived from the id of the document Bundle and the position
+    and fullUrl of its entry, so that converting the same document Bundle again, or
+    one created with the same id for a repeated request, produces the same ids. Each
+    entry's fullUrl becomes the urn:uuid of that id, and every reference to an
+    entry's fullUrl, or to its resourceType and id, is rewritten to the resourceType
+    and id it is PUT with. A urn:uuid is only resolved within the transaction it
+    appears in, whereas a reference by resourceType and id remains valid across
+    transactions, once both resources have been written.
+    Args:
+        bundle: The created document Bundle, as returned by handle_request.
+        limits: The limits the transactions must fit within, if any. A single
+            transaction is returned if not provided.
+    Returns:
+        The transactions, in the order of the document Bundle's entries, which are
+        independent of each other, so can be sent concurrently. Empty if the document
+        Bundle has no entries.
+    """
+    entries = bundle.entries or []
+    namespace = _namespace(bundle)
+    ids = _entry_ids(bundle)
+    references = _references(entries, ids)
+
+    encoded_entries = [
+        _encode_entry(entry.resource, entry_id, references)
+        for entry, entry_id in zip(entries, ids, strict=True)
+    ]
+    return [
+        Transaction(
+            request_id=str(uuid.uuid5(namespace, f"transaction/{index}")),
+            entry_count=len(chunk),
+            body=b"".join((_TRANSACTION_HEAD, b",".join(chunk), _TRANSACTION_TAIL)),
+        )
+        for index, chunk in enumerate(_chunks(encoded_entries, limits))
+    ]
+
+
+def written_references(bundle: Bundle) -> list[str]:
+    """
+    The reference, by resourceType and id, to each resource of a document Bundle as
+    written to PDM by the transactions of to_transactions.
+    Args:
+        bundle: The created document Bundle, as returned by handle_request.
+    Returns:
+        The references, in the order of the document Bundle's entries.
+    """
+    return [
+        f"{entry.resource.resource_type}/{entry_id}"
+        for entry, entry_id in zip(
+            bundle.entries or [], _entry_ids(bundle), strict=True
+        )
+    ]
+
+
+def _entry_ids(bundle: Bundle) -> list[str]:
+    namespace = _namespace(bundle)
+    return [
+        _entry_id(namespace, index, entry.full_url)
+        for index, entry in enumerate(bundle.entries or [])
+    ]
+
+
+def _namespace(bundle: Bundle) -> uuid.UUID:
+    try:
+        return uuid.UUID(str(bundle.id))
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_URL, str(bundle.id))
+
+
+def _entry_id(namespace: uuid.UUID, index: int, full_url: str) -> str:
+    if full_url.startswith(_URN_UUID):
+        try:
+            return str(uuid.UUID(full_url.removeprefix(_URN_UUID)))
+        except ValueError:
+            pass
+    # Positioned, so that entries sharing a fullUrl are not given the same id.
+    return str(uuid.uuid5(namespace, f"{index}/{full_url}"))
+
+
+def _references(entries: Sequence[Bundle.Entry], ids: Sequence[str]) -> dict[str, str]:
+    """
+    Map each form an entry may be referenced by to its rewritten reference. Built
+    before any reference is rewritten, so that references to later entries resolve.
+    """
+    references: dict[str, str] = {}
+    for entry, entry_id in zip(entries, ids, strict=True):
+        rewritten = f"{entry.resource.resource_type}/{entry_id}"
+        # As with Bundle.get_by_full_url, the first of any entries sharing a fullUrl
+        # is the one referenced.
+        references.setdefault(entry.full_url, rewritten)
+
+        resource_id = getattr(entry.resource, "id", None)
+        if resource_id:
+            references.setdefault(
+                f"{entry.resource.resource_type}/{resource_id}", rewritten
+            )
+    return references
+
+
+def _resource_json(resource: Resource) -> dict[str, Any]:
+    # Resources that have retained the JSON they were received with are parsed from
+    # it, rather than being materialised to be dumped.
+    encoded = resource.encoded_json()
+    if encoded is not None:
+        parsed: dict[str, Any] = pydantic_core.from_json(encoded)
+        return parsed
+    return resource.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def _encode_entry(
+    resource: Resource, entry_id: str, references: Mapping[str, str]
+) -> bytes:
+    content = _resource_json(resource)
+    _rewrite_references(content, references)
+    content["id"] = entry_id
+
+    url = f"{content['resourceType']}/{entry_id}"
+    return b"".join(
+        (
+            b'{"fullUrl":',
+            pydantic_core.to_json(_URN_UUID + entry_id),
+            b',"resource":',
+            pydantic_core.to_json(content),
+            b',"request":{"method":"PUT","url":',
+            pydantic_core.to_json(url),
+            b"}}",
+        )
+    )
+
+
+def _rewrite_references(value: Any, references: Mapping[str, str]) -> None:
+    """Rewrite, in place, every Reference.reference within parsed resource JSON."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "reference" and isinstance(item, str):
+                value[key] = references.get(item, item)
+            elif isinstance(item, dict | list):
+                _rewrite_references(item, references)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict | list):
+                _rewrite_references(item, references)
+
+
+def _chunks(
+    encoded_entries: Sequence[bytes], limits: TransactionLimits | None
+) -> list[list[bytes]]:
+    if not encoded_entries:
+        return []
+    if limits is None:
+        return [list(encoded_entries)]
+
+    # The size of a transaction with no entries, to which each entry, and the
+    # separator preceding all but the first, is added.
+    empty_size = len(_TRANSACTION_HEAD) + len(_TRANSACTION_TAIL)
+
+    chunks: list[list[bytes]] = []
+    chunk: list[bytes] = []
+    size = empty_size
+    for encoded in encoded_entries:
+        entry_size = len(encoded) + (1 if chunk else 0)
+        if chunk and (
+            len(chunk) >= limits.max_entries or size + entry_size > limits.max_bytes
+        ):
+            chunks.append(chunk)
+            chunk, size, entry_size = [], empty_size, len(encoded)
+
+        chunk.append(encoded)
+        size += entry_size
+
+    chunks.append(chunk)
+    return chunks
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+from pathology_api.fhir.r4.resources import Bundle
+from pathology_api.rules import RuleReport
+
+
+@dataclass(frozen=True)
+class ValidationOutcome:
+    """
+    The outcome of validating a request Bundle.
+    Attributes:
+        bundle: The Bundle validated from the request body.
+        report: The outcome of validating the Bundle against the validation rules.
+    """
+
+    bundle: Bundle
+    report: RuleReport
+
+
+def content_key(body: bytes, *options: Hashable) -> Hashable:
+    """
+    Create the key to cache the outcome of validating a request body against, from a
+    digest of the body and any options that the outcome of validating it depends upon.
+    Args:
+        body: The decoded request body.
+        options: The options the body is validated with.
+    Returns:
+        The cache key.
+    """
+    return (hashlib.sha256(body).digest(), *options)
+
+
+class ValidationCache:
+    """
+    A bounded cache of ValidationOutcomes keyed by content_key, allowing repeated
+    submissions of an identical request body to skip parsing and validating it. The
+    least recently used outcomes are evicted once more than max_entries outcomes are
+    cached, or once the request bodies they were validated from total more than
+    max_bytes, as the memory held by each outcome's Bundle grows with its body.
+    Attributes:
+        hits: The number of lookups finding a cached outcome.
+        misses: The number of lookups finding no cached outcome.
+    """
+
+    def __init__(self, max_entries: int = 32, max_bytes: int = 8 * 1024 * 1024):
+        """
+        Args:
+            max_entries: The maximum number of outcomes cached.
+            max_bytes: The maximum total size, in bytes, of the request bodies the
+                cached outcomes were validated from.
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        # Each outcome, with the size of the request body it was validated from.
+        self._outcomes: OrderedDict[Hashable, tuple[ValidationOutcome, int]] = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._outcomes)
+
+    def get(self, key: Hashable) -> ValidationOutcome | None:
+        """
+        Retrieve the outcome cached against a key, counting the lookup as a hit or
+        miss.
+        """
+        with self._lock:
+            cached = self._outcomes.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._outcomes.move_to_end(key)
+            return cached[0]
+
+    def put(self, key: Hashable, outcome: ValidationOutcome, size: int) -> None:
+        """
+        Cache an outcome against a key, evicting the least recently used outcomes
+        until the cache is within its bounds. Outcomes validated from a request body
+        larger than max_bytes are not cached.
+        Args:
+            key: The key to cache the outcome against.
+            outcome: The outcome.
+            size: The size, in bytes, of the request body the outcome was validated
+                from.
+        """
+        if self._max_entries <= 0 or size > self._max_bytes:
+            return
+
+        with self._lock:
+            previous = self._outcomes.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._outcomes[key] = (outcome, size)
+            self._bytes += size
+            while (
+                len(self._outcomes) > self._max_entries or self._bytes > self._max_bytes
+            ):
+                _, (_, evicted_size) = self._outcomes.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self) -> dict[str, int]:
+        """The hit and miss counts and current size of the cache, for monitoring."""
+        return {
+            "validation_cache_hits": self.hits,
+            "validation_cache_misses": self.misses,
+            "validation_cache_size": len(self._outcomes),
+            "validation_cache_bytes": self._bytes,
+        }
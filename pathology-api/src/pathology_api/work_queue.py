@@ -0,0 +1,160 @@
+import importlib
+import threading
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from pathology_api import config
+
+# SQS messages, including their attributes, are limited to 256 KiB.
+MAX_MESSAGE_BYTES = 256 * 1024
+
+
+class MessageTooLargeError(Exception):
+    """Raised when a message exceeds the maximum size a WorkQueue can hold."""
+
+
+@dataclass(frozen=True)
+class QueuedMessage:
+    """
+    A message received from a WorkQueue.
+    Attributes:
+        message_id: The id of the message, assigned by the queue.
+        body: The body of the message.
+        receipt: Identifies this receipt of the message, to delete it once processed.
+    """
+
+    message_id: str
+    body: str
+    receipt: str
+
+
+class WorkQueue(Protocol):
+    """A queue of messages to be processed by a worker."""
+
+    def send(self, body: str) -> None:
+        """
+        Send a message to the queue.
+        Args:
+            body: The body of the message.
+        Raises:
+            MessageTooLargeError: If the body exceeds the maximum size of a message.
+        """
+
+    def receive(self, max_messages: int) -> list[QueuedMessage]:
+        """
+        Receive messages from the queue. Received messages are not received again
+        whilst being processed, and should be deleted once processed.
+        Args:
+            max_messages: The maximum number of messages to receive.
+        Returns:
+            The received messages, empty if the queue is empty.
+        """
+
+    def delete(self, receipt: str) -> None:
+        """Delete a received message, once processed, via its receipt."""
+
+
+class InMemoryWorkQueue:
+    """
+    A WorkQueue holding messages within the current process, intended for local
+    development and testing. Received messages are held until deleted, but are never
+    made available to be received again.
+    """
+
+    def __init__(self) -> None:
+        self._pending: deque[QueuedMessage] = deque()
+        self._in_flight: OrderedDict[str, QueuedMessage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """The number of messages waiting to be received."""
+        return len(self._pending)
+
+    def send(self, body: str) -> None:
+        if len(body.encode()) > MAX_MESSAGE_BYTES:
+            raise MessageTooLargeError(
+                f"Message exceeds the maximum size of {MAX_MESSAGE_BYTES} bytes."
+            )
+
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._pending.append(QueuedMessage(message_id, body, receipt=message_id))
+
+    def receive(self, max_messages: int) -> list[QueuedMessage]:
+        with self._lock:
+            received = [
+                self._pending.popleft()
+                for _ in range(min(max_messages, len(self._pending)))
+            ]
+            for message in received:
+                self._in_flight[message.receipt] = message
+            return received
+
+    def delete(self, receipt: str) -> None:
+        with self._lock:
+            self._in_flight.pop(receipt, None)
+
+
+class SQSClient(Protocol):
+    """The subset of the low level boto3 SQS client used by the API."""
+
+    def send_message(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+    def receive_message(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+    def delete_message(self, **kwargs: Any) -> Mapping[str, Any]: ...
+
+
+# The most messages SQS returns from a single receive.
+_SQS_MAX_RECEIVE = 10
+
+
+class SQSWorkQueue:
+    """A WorkQueue backed by an SQS queue, shared between every Lambda instance."""
+
+    def __init__(self, client: SQSClient, queue_url: str):
+        self._client = client
+        self._queue_url = queue_url
+
+    def send(self, body: str) -> None:
+        if len(body.encode()) > MAX_MESSAGE_BYTES:
+            raise MessageTooLargeError(
+                f"Message exceeds the maximum size of {MAX_MESSAGE_BYTES} bytes."
+            )
+        self._client.send_message(QueueUrl=self._queue_url, MessageBody=body)
+
+    def receive(self, max_messages: int) -> list[QueuedMessage]:
+        response = self._client.receive_message(
+            QueueUrl=self._queue_url,
+            MaxNumberOfMessages=max(1, min(max_messages, _SQS_MAX_RECEIVE)),
+        )
+        return [
+            QueuedMessage(
+                message_id=message["MessageId"],
+                body=message["Body"],
+                receipt=message["ReceiptHandle"],
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def delete(self, receipt: str) -> None:
+        self._client.delete_message(QueueUrl=self._queue_url, ReceiptHandle=receipt)
+
+
+def queue_from_config(queue_url: str | None) -> WorkQueue:
+    """
+    Create a WorkQueue configured for the service, backed by SQS if a queue is
+    configured, otherwise held in memory.
+    Args:
+        queue_url: The configured URL of the SQS queue, if any.
+    """
+    if queue_url:
+        # boto3 is provided by the Lambda runtime.
+        boto3 = importlib.import_module("boto3")
+        return SQSWorkQueue(
+            boto3.client("sqs", endpoint_url=config.sqs_endpoint_url()), queue_url
+        )
+    return InMemoryWorkQueue()
@@ -1,24 +1,77 @@
+import base64
+import email.utils
+import gzip
+import json
+import time
+from collections.abc import Iterator
 from typing import Any
 from unittest.mock import patch
 
 import pydantic
 import pytest
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from lambda_handler import handler
+from lambda_handler import handler, mns_retry_handler, worker_handler
+from pathology_api.connections import RetryPolicy
 from pathology_api.exception import ValidationError
 from pathology_api.fhir.r4.elements import LogicalReference, PatientIdentifier
 from pathology_api.fhir.r4.resources import Bundle, Composition, OperationOutcome
+from pathology_api.handler import handle_document, handle_request, validate_request
+from pathology_api.idempotency import (
+    Idempotency,
+    IdempotencyRecord,
+    InMemoryIdempotencyStore,
+    idempotency_key,
+)
+from pathology_api.mns import MNSClient, MNSPublisher
+from pathology_api.pdm import PDMClient
+from pathology_api.resilience import CircuitBreakerPolicy, Dependency
+from pathology_api.submissions import Submissions
+from pathology_api.transaction import written_references
+from pathology_api.validation_cache import ValidationCache
+from pathology_api.work_queue import InMemoryWorkQueue, MessageTooLargeError
+from tests.pdm_stub import StubPDMServer, StubResponse
+
+
+class _Context(LambdaContext):
+    """A LambdaContext reporting the time remaining before the invocation times out."""
+
+    def __init__(self, remaining_millis: int):
+        self._remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self) -> int:  # type: ignore[override]
+        return self._remaining_millis
 
 
 class TestHandler:
+    @pytest.fixture(autouse=True)
+    def _isolate_caches(self) -> Iterator[None]:
+        self._queue = InMemoryWorkQueue()
+        # Each test is handled as if by a new Lambda instance.
+        with (
+            patch("lambda_handler._validation_cache", ValidationCache()),
+            patch(
+                "lambda_handler._idempotency",
+                Idempotency(InMemoryIdempotencyStore()),
+            ),
+            patch(
+                "lambda_handler._submissions",
+                Submissions(self._queue, InMemoryIdempotencyStore()),
+            ),
+        ):
+            yield
+
     def _create_test_event(
         self,
         body: str | None = None,
         path_params: str | None = None,
         request_method: str | None = None,
+        is_base64_encoded: bool = False,
+        headers: dict[str, str] | None = None,
     ) -> dict[str, Any]:
         return {
             "body": body,
+            "headers": headers or {},
+            "isBase64Encoded": is_base64_encoded,
             "requestContext": {
                 "http": {
                     "path": f"/{path_params}",
@@ -33,6 +86,32 @@ class TestHandler:
             "pathParameters": {"proxy": path_params},
         }
 
+    def _create_document_bundle(self) -> Bundle:
+        return Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(
+                    fullUrl="composition",
+                    resource=Composition.create(
+                        subject=LogicalReference(
+                            PatientIdentifier.from_nhs_number("nhs_number")
+                        )
+                    ),
+                )
+            ],
+        )
+
+    def _created_headers(self, bundle: Bundle) -> dict[str, str]:
+        assert bundle.meta is not None
+        assert bundle.meta.last_updated is not None
+        return {
+            "Location": f"/FHIR/R4/Bundle/{bundle.id}",
+            "ETag": f'W/"{bundle.id}"',
+            "Last-Modified": email.utils.formatdate(
+                int(bundle.meta.last_updated.timestamp()), usegmt=True
+            ),
+        }
+
     def _parse_returned_issue(self, response: str) -> OperationOutcome.Issue:
         response_outcome = OperationOutcome.model_validate_json(response)
 
@@ -64,7 +143,6 @@ class TestHandler:
         response = handler(event, context)
 
         assert response["statusCode"] == 200
-        assert response["headers"] == {"Content-Type": "application/fhir+json"}
 
         response_body = response["body"]
         assert isinstance(response_body, str)
@@ -75,6 +153,56 @@ class TestHandler:
 
         # A UUID value so can only check its presence.
         assert response_bundle.id is not None
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+            **self._created_headers(response_bundle),
+        }
+
+    def test_create_test_result_base64_encoded_payload(self) -> None:
+        bundle = Bundle.create(
+            type="document",
+            entry=[
+                Bundle.Entry(
+                    fullUrl="composition",
+                    resource=Composition.create(
+                        subject=LogicalReference(
+                            PatientIdentifier.from_nhs_number("nhs_number")
+                        )
+                    ),
+                )
+            ],
+        )
+        event = self._create_test_event(
+            body=base64.b64encode(
+                bundle.model_dump_json(by_alias=True).encode()
+            ).decode(),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            is_base64_encoded=True,
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        assert response_bundle.entries == bundle.entries
+
+    def test_create_test_result_invalid_base64_payload(self) -> None:
+        event = self._create_test_event(
+            body="not base64!",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            is_base64_encoded=True,
+        )
+
+        response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == "Request body is not valid base64."
 
     def test_create_test_result_no_payload(self) -> None:
         event = self._create_test_event(
@@ -85,7 +213,10 @@ class TestHandler:
         response = handler(event, context)
 
         assert response["statusCode"] == 400
-        assert response["headers"] == {"Content-Type": "application/fhir+json"}
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
 
         returned_issue = self._parse_returned_issue(response["body"])
 
@@ -105,7 +236,10 @@ class TestHandler:
         response = handler(event, context)
 
         assert response["statusCode"] == 400
-        assert response["headers"] == {"Content-Type": "application/fhir+json"}
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
 
         returned_issue = self._parse_returned_issue(response["body"])
 
@@ -125,7 +259,10 @@ class TestHandler:
         response = handler(event, context)
 
         assert response["statusCode"] == 400
-        assert response["headers"] == {"Content-Type": "application/fhir+json"}
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
 
         returned_issue = self._parse_returned_issue(response["body"])
         assert returned_issue["severity"] == "error"
@@ -164,7 +301,7 @@ class TestHandler:
         expected_issue: OperationOutcome.Issue,
         expected_status_code: int,
     ) -> None:
-        bundle = Bundle.empty(bundle_type="document")
+        bundle = self._create_document_bundle()
         event = self._create_test_event(
             body=bundle.model_dump_json(by_alias=True),
             path_params="FHIR/R4/Bundle",
@@ -176,11 +313,154 @@ class TestHandler:
             response = handler(event, context)
 
         assert response["statusCode"] == expected_status_code
-        assert response["headers"] == {"Content-Type": "application/fhir+json"}
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
 
         returned_issue = self._parse_returned_issue(response["body"])
         assert returned_issue == expected_issue
 
+    def test_create_test_result_multiple_validation_issues(self) -> None:
+        bundle = Bundle.create(id="id", type="collection")
+        event = self._create_test_event(
+            body=bundle.model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        response_outcome = OperationOutcome.model_validate_json(response["body"])
+        assert [issue["diagnostics"] for issue in response_outcome.issue] == [
+            "Document must include a single Composition resource",
+            "Bundles cannot be defined with an existing ID",
+            "Resource must be a bundle of type 'document'",
+        ]
+
+    def test_create_test_result_content_length_too_large(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("MAX_BODY_BYTES", "10")
+        event = self._create_test_event(
+            body="{}",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"content-length": "11"},
+        )
+        context = LambdaContext()
+
+        with patch("lambda_handler.decode_body") as decode_body:
+            response = handler(event, context)
+
+        decode_body.assert_not_called()
+        assert response["statusCode"] == 413
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
+
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["severity"] == "error"
+        assert returned_issue["code"] == "invalid"
+        assert (
+            returned_issue["diagnostics"]
+            == "Request body exceeds the maximum size of 10 bytes."
+        )
+
+    def test_create_test_result_gzip_encoded_payload(self) -> None:
+        bundle = self._create_document_bundle()
+        event = self._create_test_event(
+            body=base64.b64encode(
+                gzip.compress(bundle.model_dump_json(by_alias=True).encode())
+            ).decode(),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            is_base64_encoded=True,
+            headers={"content-encoding": "gzip"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        assert response_bundle.entries == bundle.entries
+
+    def test_create_test_result_unsupported_content_encoding(self) -> None:
+        event = self._create_test_event(
+            body="{}",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"content-encoding": "br"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 415
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
+
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["severity"] == "error"
+        assert returned_issue["code"] == "invalid"
+        assert returned_issue["diagnostics"] == (
+            "Unsupported Content-Encoding: br. Supported encodings are gzip and "
+            "deflate."
+        )
+
+    @pytest.mark.parametrize(
+        ("environment", "body", "expected_status_code", "expected_diagnostic"),
+        [
+            pytest.param(
+                {"MAX_BODY_BYTES": "10"},
+                '{"resourceType": "Bundle"}',
+                413,
+                "Request body exceeds the maximum size of 10 bytes.",
+                id="Body too large",
+            ),
+            pytest.param(
+                {"MAX_ENTRIES": "1"},
+                '{"resourceType": "Bundle", "entry": [{}, {}]}',
+                413,
+                "Bundle exceeds the maximum of 1 entries.",
+                id="Too many entries",
+            ),
+            pytest.param(
+                {"MAX_DEPTH": "2"},
+                '{"resourceType": "Bundle", "entry": [{}]}',
+                400,
+                "Payload exceeds the maximum nesting depth of 2.",
+                id="Nested too deeply",
+            ),
+        ],
+    )
+    def test_create_test_result_exceeds_limits(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        environment: dict[str, str],
+        body: str,
+        expected_status_code: int,
+        expected_diagnostic: str,
+    ) -> None:
+        for name, value in environment.items():
+            monkeypatch.setenv(name, value)
+        event = self._create_test_event(
+            body=body, path_params="FHIR/R4/Bundle", request_method="POST"
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == expected_status_code
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == expected_diagnostic
+
     @pytest.mark.parametrize(
         ("expected_error", "expected_diagnostic"),
         [
@@ -202,7 +482,7 @@ class TestHandler:
     def test_create_test_result_model_validate_error(
         self, expected_error: Exception, expected_diagnostic: str
     ) -> None:
-        bundle = Bundle.empty(bundle_type="document")
+        bundle = self._create_document_bundle()
         event = self._create_test_event(
             body=bundle.model_dump_json(by_alias=True),
             path_params="FHIR/R4/Bundle",
@@ -217,13 +497,1102 @@ class TestHandler:
             response = handler(event, context)
 
             assert response["statusCode"] == 400
-            assert response["headers"] == {"Content-Type": "application/fhir+json"}
+            assert response["headers"] == {
+                "Content-Type": "application/fhir+json",
+                "Vary": "Accept-Encoding",
+            }
 
             returned_issue = self._parse_returned_issue(response["body"])
             assert returned_issue["severity"] == "error"
             assert returned_issue["code"] == "invalid"
             assert returned_issue["diagnostics"] == expected_diagnostic
 
+    def test_create_test_result_compressed_response(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("MIN_COMPRESSION_BYTES", "0")
+        bundle = self._create_document_bundle()
+        event = self._create_test_event(
+            body=bundle.model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"accept-encoding": "gzip, deflate"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["isBase64Encoded"] is True
+
+        response_bundle = Bundle.model_validate_json(
+            gzip.decompress(base64.b64decode(response["body"])), by_alias=True
+        )
+        assert response_bundle.entries == bundle.entries
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+            "Content-Encoding": "gzip",
+            **self._created_headers(response_bundle),
+        }
+
+    def test_create_test_result_compressed_operation_outcome(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("MIN_COMPRESSION_BYTES", "0")
+        event = self._create_test_event(
+            body="invalid json data",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"accept-encoding": "gzip"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        assert response["isBase64Encoded"] is True
+        assert response["headers"]["Content-Encoding"] == "gzip"
+
+        returned_issue = self._parse_returned_issue(
+            gzip.decompress(base64.b64decode(response["body"])).decode()
+        )
+        assert returned_issue["diagnostics"] == "Invalid payload provided."
+
+    @pytest.mark.parametrize(
+        ("min_compression_bytes", "accept_encoding"),
+        [
+            pytest.param("1000000", "gzip", id="Below minimum size"),
+            pytest.param("0", "identity", id="Compression not accepted"),
+            pytest.param("0", "gzip;q=0", id="Compression refused"),
+        ],
+    )
+    def test_create_test_result_uncompressed_response(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        min_compression_bytes: str,
+        accept_encoding: str,
+    ) -> None:
+        monkeypatch.setenv("MIN_COMPRESSION_BYTES", min_compression_bytes)
+        bundle = self._create_document_bundle()
+        event = self._create_test_event(
+            body=bundle.model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"accept-encoding": accept_encoding},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["isBase64Encoded"] is False
+        assert "Content-Encoding" not in response["headers"]
+        Bundle.model_validate_json(response["body"], by_alias=True)
+
+    @pytest.mark.parametrize(
+        ("prefer", "expected_preference_applied"),
+        [
+            pytest.param("return=minimal", "return=minimal", id="minimal"),
+            pytest.param(
+                'respond-async, return="minimal"; foo=bar',
+                "return=minimal",
+                id="Among other preferences",
+            ),
+            pytest.param("RETURN=Minimal", "return=minimal", id="Case insensitive"),
+        ],
+    )
+    def test_create_test_result_prefer_minimal(
+        self, prefer: str, expected_preference_applied: str
+    ) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": prefer},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert not response["body"]
+
+        headers = response["headers"]
+        assert "Content-Type" not in headers
+        assert headers["Preference-Applied"] == expected_preference_applied
+        assert headers["Location"].startswith("/FHIR/R4/Bundle/")
+        bundle_id = headers["Location"].removeprefix("/FHIR/R4/Bundle/")
+        assert headers["ETag"] == f'W/"{bundle_id}"'
+        assert headers["Last-Modified"].endswith(" GMT")
+
+    def test_create_test_result_prefer_operation_outcome(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": "return=OperationOutcome"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["headers"]["Content-Type"] == "application/fhir+json"
+        assert response["headers"]["Preference-Applied"] == "return=OperationOutcome"
+
+        bundle_id = response["headers"]["Location"].removeprefix("/FHIR/R4/Bundle/")
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["severity"] == "information"
+        assert returned_issue["code"] == "informational"
+        assert returned_issue["diagnostics"] == f"Bundle {bundle_id} created."
+
+    @pytest.mark.parametrize(
+        ("prefer", "expected_preference_applied"),
+        [
+            pytest.param(
+                "return=representation",
+                "return=representation",
+                id="representation",
+            ),
+            pytest.param("return=unknown", None, id="Unrecognised preference"),
+            pytest.param("handling=strict", None, id="No return preference"),
+        ],
+    )
+    def test_create_test_result_prefer_representation(
+        self, prefer: str, expected_preference_applied: str | None
+    ) -> None:
+        bundle = self._create_document_bundle()
+        event = self._create_test_event(
+            body=bundle.model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": prefer},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert (
+            response["headers"].get("Preference-Applied") == expected_preference_applied
+        )
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        assert response_bundle.entries == bundle.entries
+
+    def test_create_test_result_prefer_minimal_validation_error(self) -> None:
+        event = self._create_test_event(
+            body="invalid json data",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": "return=minimal"},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == "Invalid payload provided."
+
+    def test_create_test_result_repeated_request(self) -> None:
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+        event = self._create_test_event(
+            body=body,
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "repeated-request"},
+        )
+        context = LambdaContext()
+
+        with patch(
+            "lambda_handler.handle_request", side_effect=handle_request
+        ) as handle_request_mock:
+            first_response = handler(event, context)
+            repeated_response = handler(event, context)
+
+        assert first_response["statusCode"] == 200
+        assert repeated_response == first_response
+        handle_request_mock.assert_called_once()
+
+    def test_create_test_result_repeated_request_compressed_as_accepted(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("MIN_COMPRESSION_BYTES", "0")
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+        first_event = self._create_test_event(
+            body=body,
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "compressed-request", "accept-encoding": "gzip"},
+        )
+        repeated_event = self._create_test_event(
+            body=body,
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "compressed-request"},
+        )
+        context = LambdaContext()
+
+        first_response = handler(first_event, context)
+        repeated_response = handler(repeated_event, context)
+
+        assert first_response["headers"]["Content-Encoding"] == "gzip"
+        assert "Content-Encoding" not in repeated_response["headers"]
+        assert (
+            gzip.decompress(base64.b64decode(first_response["body"])).decode()
+            == repeated_response["body"]
+        )
+
+    def test_create_test_result_request_id_reused_for_different_payload(
+        self,
+    ) -> None:
+        context = LambdaContext()
+        bundle_ids = set()
+
+        for subject in ("first", "second"):
+            bundle = Bundle.create(
+                type="document",
+                entry=[
+                    Bundle.Entry(
+                        fullUrl="composition",
+                        resource=Composition.create(
+                            subject=LogicalReference(
+                                PatientIdentifier.from_nhs_number(subject)
+                            )
+                        ),
+                    )
+                ],
+            )
+            event = self._create_test_event(
+                body=bundle.model_dump_json(by_alias=True),
+                path_params="FHIR/R4/Bundle",
+                request_method="POST",
+                headers={"x-request-id": "reused-request"},
+            )
+
+            response = handler(event, context)
+
+            assert response["statusCode"] == 200
+            bundle_ids.add(response["headers"]["Location"])
+
+        assert len(bundle_ids) == 2
+
+    def test_create_test_result_failed_request_not_stored(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "failed-request"},
+        )
+        context = LambdaContext()
+
+        with patch(
+            "lambda_handler.handle_request",
+            side_effect=ValidationError("Test processing error"),
+        ):
+            failed_response = handler(event, context)
+
+        response = handler(event, context)
+
+        assert failed_response["statusCode"] == 400
+        assert response["statusCode"] == 200
+
+    def test_create_test_result_request_in_progress(self) -> None:
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+        event = self._create_test_event(
+            body=body,
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "in-progress-request"},
+        )
+        context = LambdaContext()
+
+        store = InMemoryIdempotencyStore()
+        store.claim(
+            idempotency_key("in-progress-request", body),
+            IdempotencyRecord(status="in_progress", expires_at=time.time() + 60),
+        )
+        with patch(
+            "lambda_handler._idempotency",
+            Idempotency(store, in_progress_ttl=0.01, poll_interval=0.001),
+        ):
+            response = handler(event, context)
+
+        assert response["statusCode"] == 409
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == (
+            "A request with the same X-Request-ID is already being processed."
+        )
+
+    def test_create_test_result_request_in_progress_stops_at_deadline(self) -> None:
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+        event = self._create_test_event(
+            body=body,
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"x-request-id": "in-progress-request"},
+        )
+
+        store = InMemoryIdempotencyStore()
+        store.claim(
+            idempotency_key("in-progress-request", body),
+            IdempotencyRecord(status="in_progress", expires_at=time.time() + 60),
+        )
+        start = time.monotonic()
+        with patch(
+            "lambda_handler._idempotency",
+            Idempotency(store, in_progress_ttl=30, poll_interval=0.001),
+        ):
+            response = handler(event, _Context(remaining_millis=600))
+
+        assert response["statusCode"] == 409
+        assert time.monotonic() - start < 5
+
+    def test_create_test_result_identical_body_validated_once(self) -> None:
+        context = LambdaContext()
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+
+        with (
+            patch(
+                "pathology_api.ingest.Bundle.model_validate",
+                side_effect=Bundle.model_validate,
+            ) as model_validate_mock,
+            patch(
+                "lambda_handler.validate_request", side_effect=validate_request
+            ) as validate_request_mock,
+        ):
+            responses = [
+                handler(
+                    self._create_test_event(
+                        body=body,
+                        path_params="FHIR/R4/Bundle",
+                        request_method="POST",
+                        headers={"x-request-id": request_id},
+                    ),
+                    context,
+                )
+                for request_id in ("first", "second")
+            ]
+
+        assert [response["statusCode"] for response in responses] == [200, 200]
+        # Each request still creates its own Bundle.
+        assert (
+            responses[0]["headers"]["Location"] != (responses[1]["headers"]["Location"])
+        )
+        model_validate_mock.assert_called_once()
+        validate_request_mock.assert_called_once()
+
+    @pytest.mark.parametrize("lazy_resources", ["true", "false"])
+    def test_create_test_result_parsed_incrementally(
+        self, monkeypatch: pytest.MonkeyPatch, lazy_resources: str
+    ) -> None:
+        monkeypatch.setenv("INCREMENTAL_PARSE_BYTES", "0")
+        monkeypatch.setenv("LAZY_RESOURCES", lazy_resources)
+        bundle = self._create_document_bundle()
+        event = self._create_test_event(
+            body=bundle.model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        assert response_bundle.entries == bundle.entries
+
+    def test_create_test_result_parsed_incrementally_invalid_entry(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("INCREMENTAL_PARSE_BYTES", "0")
+        event = self._create_test_event(
+            body=json.dumps(
+                {
+                    "resourceType": "Bundle",
+                    "type": "document",
+                    "entry": [{"resource": {"resourceType": "Composition"}}],
+                }
+            ),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == (
+            "('entry', 0, 'fullUrl') - Field required \n"
+        )
+
+    def test_create_test_result_identical_invalid_body(self) -> None:
+        context = LambdaContext()
+        body = Bundle.create(type="document").model_dump_json(by_alias=True)
+
+        responses = [
+            handler(
+                self._create_test_event(
+                    body=body, path_params="FHIR/R4/Bundle", request_method="POST"
+                ),
+                context,
+            )
+            for _ in range(2)
+        ]
+
+        assert [response["statusCode"] for response in responses] == [400, 400]
+        assert responses[0]["body"] == responses[1]["body"]
+
+    def _create_batch(self, *entries: dict[str, Any]) -> str:
+        return json.dumps({"resourceType": "Bundle", "type": "batch", "entry": entries})
+
+    def _batch_entry(
+        self, resource: Any, method: str = "POST", url: str = "Bundle"
+    ) -> dict[str, Any]:
+        return {"request": {"method": method, "url": url}, "resource": resource}
+
+    def test_create_batch_result(self) -> None:
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        event = self._create_test_event(
+            body=self._create_batch(
+                self._batch_entry(document),
+                self._batch_entry({"resourceType": "Bundle", "type": "document"}),
+                self._batch_entry(document, method="PUT"),
+            ),
+            path_params="FHIR/R4",
+            request_method="POST",
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["headers"] == {
+            "Content-Type": "application/fhir+json",
+            "Vary": "Accept-Encoding",
+        }
+
+        response_body = json.loads(response["body"])
+        assert response_body["resourceType"] == "Bundle"
+        assert response_body["type"] == "batch-response"
+        assert response_body["id"] is not None
+
+        created, invalid, unsupported = response_body["entry"]
+        created_bundle = Bundle.model_validate(created["resource"], by_alias=True)
+        assert created_bundle.entries == self._create_document_bundle().entries
+        headers = self._created_headers(created_bundle)
+        assert created["response"] == {
+            "status": "200 OK",
+            "location": headers["Location"],
+            "etag": headers["ETag"],
+            "lastModified": headers["Last-Modified"],
+        }
+
+        assert invalid["response"]["status"] == "400 Bad Request"
+        assert invalid["response"]["outcome"]["issue"][0]["diagnostics"] == (
+            "Document must include a single Composition resource"
+        )
+        assert "resource" not in invalid
+
+        assert unsupported["response"]["status"] == "400 Bad Request"
+        assert unsupported["response"]["outcome"]["issue"][0]["diagnostics"] == (
+            "Batch entries must POST a document Bundle to 'Bundle'."
+        )
+
+    @pytest.mark.parametrize(
+        ("prefer", "expected_keys"),
+        [
+            pytest.param("return=minimal", {"response"}, id="Minimal"),
+            pytest.param(
+                "return=OperationOutcome", {"response"}, id="OperationOutcome"
+            ),
+            pytest.param(
+                "return=representation", {"resource", "response"}, id="Representation"
+            ),
+        ],
+    )
+    def test_create_batch_result_prefer(
+        self, prefer: str, expected_keys: set[str]
+    ) -> None:
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        event = self._create_test_event(
+            body=self._create_batch(self._batch_entry(document)),
+            path_params="FHIR/R4",
+            request_method="POST",
+            headers={"prefer": prefer},
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["headers"]["Preference-Applied"] == prefer
+
+        (entry,) = json.loads(response["body"])["entry"]
+        assert entry.keys() == expected_keys
+        assert entry["response"]["status"] == "200 OK"
+        assert ("outcome" in entry["response"]) == (prefer == "return=OperationOutcome")
+
+    @pytest.mark.parametrize(
+        ("body", "expected_diagnostics"),
+        [
+            pytest.param(
+                json.dumps({"resourceType": "Bundle", "type": "document"}),
+                "Resources must be provided as a bundle of type 'batch'",
+                id="Document Bundle",
+            ),
+            pytest.param("{", "Invalid payload provided.", id="Invalid JSON"),
+        ],
+    )
+    def test_create_batch_result_invalid_batch(
+        self, body: str, expected_diagnostics: str
+    ) -> None:
+        event = self._create_test_event(
+            body=body, path_params="FHIR/R4", request_method="POST"
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == expected_diagnostics
+
+    def test_create_batch_result_exceeds_max_entries(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("BATCH_MAX_ENTRIES", "1")
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        event = self._create_test_event(
+            body=self._create_batch(
+                self._batch_entry(document), self._batch_entry(document)
+            ),
+            path_params="FHIR/R4",
+            request_method="POST",
+        )
+        context = LambdaContext()
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 413
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == (
+            "Batch exceeds the maximum of 1 entries."
+        )
+
+    def test_create_batch_result_repeated_request(self) -> None:
+        context = LambdaContext()
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        event = self._create_test_event(
+            body=self._create_batch(self._batch_entry(document)),
+            path_params="FHIR/R4",
+            request_method="POST",
+            headers={"x-request-id": "batch-request"},
+        )
+
+        with patch(
+            "lambda_handler.handle_document", wraps=handle_document
+        ) as handle_document_mock:
+            first = handler(event, context)
+            second = handler(event, context)
+
+        assert first["statusCode"] == second["statusCode"] == 200
+        assert first["body"] == second["body"]
+        handle_document_mock.assert_called_once()
+
+    def _submit_async(self, body: str, prefer: str = "respond-async") -> str:
+        response = handler(
+            self._create_test_event(
+                body=body,
+                path_params="FHIR/R4/Bundle",
+                request_method="POST",
+                headers={"prefer": prefer},
+            ),
+            LambdaContext(),
+        )
+
+        assert response["statusCode"] == 202
+        assert response["headers"]["Preference-Applied"] == "respond-async"
+        location: str = response["headers"]["Location"]
+        assert location.startswith("/FHIR/R4/_async/")
+        return location
+
+    def _get_status(self, location: str) -> dict[str, Any]:
+        return handler(
+            self._create_test_event(path_params=location[1:], request_method="GET"),
+            LambdaContext(),
+        )
+
+    def _worker_event(self) -> dict[str, Any]:
+        return {
+            "Records": [
+                {
+                    "messageId": message.message_id,
+                    "receiptHandle": message.receipt,
+                    "body": message.body,
+                }
+                for message in self._queue.receive(10)
+            ]
+        }
+
+    def test_create_test_result_async(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+        bundle = self._create_document_bundle()
+
+        location = self._submit_async(
+            bundle.model_dump_json(by_alias=True), prefer="respond-async"
+        )
+
+        pending = self._get_status(location)
+        assert pending["statusCode"] == 202
+        assert pending["headers"]["Retry-After"] == "5"
+
+        result = worker_handler(self._worker_event(), LambdaContext())
+        assert result == {"batchItemFailures": []}
+
+        response = self._get_status(location)
+        assert response["statusCode"] == 200
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        assert response_bundle.entries == bundle.entries
+        assert (
+            response["headers"].items()
+            >= {
+                "Content-Type": "application/fhir+json",
+                **self._created_headers(response_bundle),
+            }.items()
+        )
+
+    def test_create_test_result_async_applies_return_preference(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+        bundle = self._create_document_bundle()
+
+        location = self._submit_async(
+            bundle.model_dump_json(by_alias=True),
+            prefer="respond-async, return=minimal",
+        )
+        worker_handler({}, LambdaContext())
+
+        response = self._get_status(location)
+        assert response["statusCode"] == 200
+        assert not response["body"]
+        assert response["headers"]["Preference-Applied"] == "return=minimal"
+
+    def test_create_test_result_async_invalid_document(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        # Passes screening, only failing once validated by the worker.
+        del document["entry"][0]["fullUrl"]
+
+        location = self._submit_async(json.dumps(document))
+        result = worker_handler(self._worker_event(), LambdaContext())
+
+        assert result == {"batchItemFailures": []}
+        response = self._get_status(location)
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == (
+            "('entry', 0, 'fullUrl') - Field required \n"
+        )
+
+    def test_create_test_result_async_retries_unexpected_errors(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+        location = self._submit_async(
+            self._create_document_bundle().model_dump_json(by_alias=True)
+        )
+        event = self._worker_event()
+
+        with patch(
+            "lambda_handler.handle_request", side_effect=RuntimeError("Unavailable")
+        ):
+            result = worker_handler(event, LambdaContext())
+
+        assert result == {
+            "batchItemFailures": [{"itemIdentifier": event["Records"][0]["messageId"]}]
+        }
+        assert self._get_status(location)["statusCode"] == 202
+
+    def test_create_test_result_async_screens_payload(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+        event = self._create_test_event(
+            body="{",
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": "respond-async"},
+        )
+
+        response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 400
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["diagnostics"] == "Invalid payload provided."
+        assert len(self._queue) == 0
+
+    @pytest.mark.parametrize(
+        ("async_processing", "submit_error"),
+        [
+            pytest.param("false", None, id="Not enabled"),
+            pytest.param("true", MessageTooLargeError("Too large"), id="Too large"),
+        ],
+    )
+    def test_create_test_result_async_processed_synchronously(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        async_processing: str,
+        submit_error: Exception | None,
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", async_processing)
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+            headers={"prefer": "respond-async"},
+        )
+
+        with patch.object(Submissions, "submit", side_effect=submit_error):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        assert "Preference-Applied" not in response["headers"]
+
+    def test_get_submission_status_not_found(self) -> None:
+        response = self._get_status("/FHIR/R4/_async/unknown")
+
+        assert response["statusCode"] == 404
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["code"] == "not-found"
+
+    def test_create_test_result_forwarded_to_pdm(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch("lambda_handler._pdm_client", PDMClient(stub.url)),
+        ):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        (request,) = stub.requests
+        transaction = json.loads(request.body)
+        assert transaction["type"] == "transaction"
+        assert len(transaction["entry"]) == len(response_bundle.entries or [])
+
+    def test_create_test_result_pdm_unavailable(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch(
+                "lambda_handler._pdm_client",
+                PDMClient(stub.url, retry=RetryPolicy(max_attempts=1)),
+            ),
+        ):
+            stub.respond_with(StubResponse(status_code=503))
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 502
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["code"] == "exception"
+
+    @pytest.mark.parametrize(
+        ("request_ids", "expected_same"),
+        [
+            pytest.param(["retried", "retried"], True, id="Same X-Request-ID"),
+            pytest.param(["first", "second"], False, id="Different X-Request-ID"),
+            pytest.param([None, None], False, id="No X-Request-ID"),
+        ],
+    )
+    def test_create_test_result_retried_after_pdm_failure(
+        self, request_ids: list[str | None], expected_same: bool
+    ) -> None:
+        body = self._create_document_bundle().model_dump_json(by_alias=True)
+
+        with (
+            StubPDMServer() as stub,
+            patch(
+                "lambda_handler._pdm_client",
+                PDMClient(stub.url, retry=RetryPolicy(max_attempts=1)),
+            ),
+        ):
+            stub.respond_with(StubResponse(status_code=503))
+            responses = [
+                handler(
+                    self._create_test_event(
+                        body=body,
+                        path_params="FHIR/R4/Bundle",
+                        request_method="POST",
+                        headers={"x-request-id": request_id} if request_id else {},
+                    ),
+                    LambdaContext(),
+                )
+                for request_id in request_ids
+            ]
+
+        assert [response["statusCode"] for response in responses] == [502, 200]
+        first, second = (json.loads(request.body) for request in stub.requests)
+        assert (first == second) == expected_same
+        assert (
+            stub.requests[0].headers["X-Request-ID"]
+            == stub.requests[1].headers["X-Request-ID"]
+        ) == expected_same
+
+    def test_create_test_result_pdm_circuit_open(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+        dependency = Dependency(
+            "PDM", CircuitBreakerPolicy(minimum_calls=1, open_seconds=30)
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch(
+                "lambda_handler._pdm_client",
+                PDMClient(
+                    stub.url, retry=RetryPolicy(max_attempts=1), dependency=dependency
+                ),
+            ),
+        ):
+            stub.respond_with(StubResponse(status_code=503))
+            handler(event, LambdaContext())
+            response = handler(event, LambdaContext())
+
+        assert len(stub.requests) == 1
+        assert response["statusCode"] == 503
+        assert response["headers"]["Retry-After"] == "30"
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["code"] == "transient"
+
+    def test_create_test_result_deadline_exceeded(self) -> None:
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        # Less time remains than is reserved for responding.
+        response = handler(event, _Context(remaining_millis=100))
+
+        assert response["statusCode"] == 504
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert returned_issue["code"] == "timeout"
+        assert "before validation completed" in str(returned_issue["diagnostics"])
+
+    def test_create_test_result_deadline_reached_forwarding_to_pdm(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("DEADLINE_RESERVE", "0s")
+        event = self._create_test_event(
+            body=self._create_document_bundle().model_dump_json(by_alias=True),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch("lambda_handler._pdm_client", PDMClient(stub.url)),
+        ):
+            stub.respond_with(StubResponse(status_code=200, delay=1))
+            started = time.monotonic()
+            response = handler(event, _Context(remaining_millis=200))
+
+        assert time.monotonic() - started < 1
+        assert response["statusCode"] == 504
+        returned_issue = self._parse_returned_issue(response["body"])
+        assert "before forwarding to PDM completed" in str(
+            returned_issue["diagnostics"]
+        )
+
+    def test_create_test_result_async_deadline_exceeded(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("ASYNC_PROCESSING", "true")
+        location = self._submit_async(
+            self._create_document_bundle().model_dump_json(by_alias=True)
+        )
+        event = self._worker_event()
+
+        result = worker_handler(event, _Context(remaining_millis=100))
+
+        # Left to be processed again by a later invocation.
+        assert result == {
+            "batchItemFailures": [{"itemIdentifier": event["Records"][0]["messageId"]}]
+        }
+        assert self._get_status(location)["statusCode"] == 202
+
+    def test_create_batch_result_forwarded_to_pdm(self) -> None:
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        event = self._create_test_event(
+            body=self._create_batch(
+                self._batch_entry(document), self._batch_entry(document)
+            ),
+            path_params="FHIR/R4",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch("lambda_handler._pdm_client", PDMClient(stub.url)),
+        ):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        assert len(stub.requests) == 2
+        assert (
+            stub.requests[0].headers["X-Request-ID"]
+            != (stub.requests[1].headers["X-Request-ID"])
+        )
+
+    def test_create_batch_result_shares_pdm_concurrency(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setenv("BATCH_MAX_WORKERS", "4")
+        monkeypatch.setenv("PDM_MAX_CONCURRENT_REQUESTS", "4")
+        monkeypatch.setenv("PDM_TRANSACTION_MAX_ENTRIES", "1")
+        document = self._create_requested_document()
+        event = self._create_test_event(
+            body=self._create_batch(*[self._batch_entry(document)] * 4),
+            path_params="FHIR/R4",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer(
+                responder=lambda _: StubResponse(status_code=201, delay=0.05)
+            ) as stub,
+            patch(
+                "lambda_handler._pdm_client",
+                PDMClient(stub.url, dependency=Dependency("PDM", max_concurrent=4)),
+            ),
+        ):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        batch_response = json.loads(response["body"])
+        assert [entry["response"]["status"] for entry in batch_response["entry"]] == [
+            "200 OK"
+        ] * 4
+        assert len(stub.requests) == 8
+
+    def _create_requested_document(self, ods_code: str = "A12345") -> dict[str, Any]:
+        document = self._create_document_bundle().model_dump(by_alias=True)
+        document["entry"].append(
+            {
+                "fullUrl": "organization",
+                "resource": {
+                    "resourceType": "Organization",
+                    "identifier": {
+                        "system": "https://fhir.nhs.uk/Id/ods-organization-code",
+                        "value": ods_code,
+                    },
+                },
+            }
+        )
+        return document
+
+    def test_create_test_result_publishes_mns_event(self) -> None:
+        event = self._create_test_event(
+            body=json.dumps(self._create_requested_document()),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch(
+                "lambda_handler._mns_publisher",
+                MNSPublisher(MNSClient(stub.url), InMemoryWorkQueue()),
+            ),
+        ):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        response_bundle = Bundle.model_validate_json(response["body"], by_alias=True)
+        (request,) = stub.requests
+        (mns_event,) = json.loads(request.body)
+        assert mns_event["dataref"] == written_references(response_bundle)[0]
+        assert mns_event["filtering"] == {"generalpractitioner": "A12345"}
+
+    def test_create_batch_result_publishes_mns_events_in_bulk(self) -> None:
+        event = self._create_test_event(
+            body=self._create_batch(
+                self._batch_entry(self._create_requested_document()),
+                self._batch_entry(self._create_requested_document()),
+                self._batch_entry(self._create_requested_document("B67890")),
+            ),
+            path_params="FHIR/R4",
+            request_method="POST",
+        )
+
+        with (
+            StubPDMServer() as stub,
+            patch(
+                "lambda_handler._mns_publisher",
+                MNSPublisher(MNSClient(stub.url), InMemoryWorkQueue()),
+            ),
+        ):
+            response = handler(event, LambdaContext())
+
+        assert response["statusCode"] == 200
+        assert sorted(len(json.loads(r.body)) for r in stub.requests) == [1, 2]
+
+    def test_mns_retry_handler(self) -> None:
+        spool = InMemoryWorkQueue()
+        event = self._create_test_event(
+            body=json.dumps(self._create_requested_document()),
+            path_params="FHIR/R4/Bundle",
+            request_method="POST",
+        )
+
+        with StubPDMServer() as stub:
+            publisher = MNSPublisher(
+                MNSClient(stub.url, retry=RetryPolicy(max_attempts=1)), spool
+            )
+            with patch("lambda_handler._mns_publisher", publisher):
+                stub.respond_with(StubResponse(status_code=503))
+                response = handler(event, LambdaContext())
+                assert response["statusCode"] == 200
+                assert len(spool) == 1
+
+                (message,) = spool.receive(1)
+                result = mns_retry_handler(
+                    {
+                        "Records": [
+                            {
+                                "messageId": message.message_id,
+                                "body": message.body,
+                                "receiptHandle": message.receipt,
+                            }
+                        ]
+                    },
+                    LambdaContext(),
+                )
+
+        assert result == {"batchItemFailures": []}
+        assert len(stub.requests) == 2
+        assert stub.requests[0].body == stub.requests[1].body
+
     def test_status_success(self) -> None:
         event = self._create_test_event(path_params="_status", request_method="GET")
         context = LambdaContext()
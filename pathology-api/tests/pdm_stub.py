@@ -0,0 +1,223 @@
+"""
+A local stand-in for the Patient Data Manager (PDM) FHIR API, intended for local
+development and testing of PDMClient.
+"""
+
+import argparse
+import contextlib
+import json
+import threading
+import uuid
+from collections import deque
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Self
+
+
+@dataclass(frozen=True)
+class StubRequest:
+    """
+    A request received by the stub.
+    Attributes:
+        method: The HTTP method of the request.
+        path: The path of the request.
+        headers: The headers of the request.
+        body: The body of the request.
+    """
+
+    method: str
+    path: str
+    headers: Mapping[str, str]
+    body: bytes
+
+
+@dataclass(frozen=True)
+class StubResponse:
+    """
+    A response for the stub to respond with.
+    Attributes:
+        status_code: The status code of the response.
+        body: The body of the response.
+        headers: The headers of the response.
+        disconnect: Whether the connection is closed once responded, without
+            notifying the client via a Connection: close header, as a server closing
+            an idle keep-alive connection would.
+        delay: The time, in seconds, to wait before responding, to simulate a slow
+            or unresponsive service.
+    """
+
+    status_code: int
+    body: bytes = b""
+    headers: Mapping[str, str] = field(default_factory=dict)
+    disconnect: bool = False
+    delay: float = 0.0
+
+
+class StubPDMServer:
+    """
+    An HTTP/1.1 server, on a background thread, recording each request received and
+    responding with any responses queued via respond_with in turn. Once none are
+    queued, requests are responded to by the responder, if provided, otherwise as if
+    successful, with 201 Created. Intended to be used as a context manager.
+    Attributes:
+        requests: Each request received, in order.
+        connections: The number of connections accepted.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        responder: Callable[[StubRequest], StubResponse] | None = None,
+    ):
+        """
+        Args:
+            host: The host to listen on.
+            port: The port to listen on, or 0 for any unused port.
+            responder: Creates the response to a request once none are queued,
+                allowing the stub to stand in for services other than PDM.
+        """
+        self.requests: list[StubRequest] = []
+        self.connections = 0
+        self._responses: deque[StubResponse] = deque()
+        self._responder = responder
+        self._lock = threading.Lock()
+        # Set once stopped, so that delayed responses are abandoned.
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            # Polled frequently, so that the stub stops promptly.
+            target=lambda: self._server.serve_forever(poll_interval=0.01),
+            daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        """The base URL of the stubbed PDM FHIR API."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}/patient-data-manager/FHIR/R4/"
+
+    def respond_with(self, *responses: StubResponse) -> None:
+        """Queue responses to be responded with, in turn, to the next requests."""
+        with self._lock:
+            self._responses.extend(responses)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+    def _next_response(self, request: StubRequest) -> StubResponse:
+        with self._lock:
+            self.requests.append(request)
+            if self._responses:
+                return self._responses.popleft()
+
+        if self._responder is not None:
+            return self._responder(request)
+
+        resource_id = str(uuid.uuid4())
+        return StubResponse(
+            status_code=201,
+            body=json.dumps(
+                {"resourceType": "Bundle", "id": resource_id, "type": "document"}
+            ).encode(),
+            headers={
+                "Content-Type": "application/fhir+json",
+                "Location": f"Bundle/{resource_id}",
+            },
+        )
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Required for connections to be kept alive between requests.
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, so would otherwise be delayed.
+            disable_nagle_algorithm = True
+
+            def setup(self) -> None:
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self) -> None:
+                self._respond()
+
+            def do_POST(self) -> None:
+                self._respond()
+
+            def do_PUT(self) -> None:
+                self._respond()
+
+            def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+                # Requests are recorded rather than logged.
+                pass
+
+            def _respond(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = StubRequest(
+                    method=self.command,
+                    path=self.path,
+                    headers=dict(self.headers.items()),
+                    body=self.rfile.read(length),
+                )
+                response = stub._next_response(request)
+                if response.delay and stub._stopped.wait(response.delay):
+                    self.close_connection = True
+                    return
+
+                try:
+                    self.send_response(response.status_code)
+                    for name, value in response.headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(response.body)))
+                    self.end_headers()
+                    self.wfile.write(response.body)
+                except ConnectionError:
+                    # The client stopped waiting for a delayed response.
+                    self.close_connection = True
+                    return
+                if response.disconnect:
+                    self.wfile.flush()
+                    self.close_connection = True
+
+        return Handler
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Run the stub from the command line until interrupted."""
+    parser = argparse.ArgumentParser(
+        prog="python -m tests.pdm_stub",
+        description="Run a local stand-in for the PDM FHIR API.",
+    )
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on.")
+    args = parser.parse_args(argv)
+
+    with StubPDMServer(port=args.port) as stub:
+        print(f"Stub PDM listening at {stub.url}", flush=True)
+        with contextlib.suppress(KeyboardInterrupt):
+            threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()